@@ -3,19 +3,26 @@ import numpy as np
 import folium
 from folium.plugins import MarkerCluster, HeatMap
 from sklearn.cluster import KMeans
-from geopy.distance import geodesic
+from distance_utils import distance_matrix, pairwise_distance, point_distance
+from ingest_utils import load_trips
+from route_improvement import ROUTE_IMPROVEMENT_MAX_MOVES, improve_route, percent_saved
 import os
 import json
 import requests
 from collections import defaultdict
 
+# Trip columns the simulation reads; load_trips skips the rest of the export
+SIMULATION_COLUMNS = [
+    "PhlebotomistID.1", "ScheduledDtm", "PatientLatitude", "PatientLongitude",
+    "PhlebotomistLatitude", "PhlebotomistLongitude",
+]
+
 def main():
     # 1. Load and prepare data
     # 1. Load and prepare data
     try:
         # Load trips data
-        trips_df = pd.read_csv("trips.csv")
-        trips_df['ScheduledDtm'] = pd.to_datetime(trips_df['ScheduledDtm'])
+        trips_df = load_trips("trips.csv", columns=SIMULATION_COLUMNS)
         
         # Load phlebotomist locations with city information
         phleb_df = pd.read_csv("phlebotomists_with_city.csv")
@@ -161,15 +168,11 @@ def calculate_distance(route_coords=None, start=None, end=None):
     """Calculate distance between points"""
     if route_coords and len(route_coords) > 1:
         # Calculate distance along the route
-        distance = 0
-        for i in range(len(route_coords) - 1):
-            point1 = (route_coords[i][1], route_coords[i][0])  # Convert [lon,lat] to [lat,lon]
-            point2 = (route_coords[i+1][1], route_coords[i+1][0])
-            distance += geodesic(point1, point2).kilometers
-        return distance
+        points = np.asarray(route_coords, dtype=float)[:, ::-1]  # Convert [lon,lat] to [lat,lon]
+        return float(pairwise_distance(points[:-1], points[1:], unit="km").sum())
     elif start and end:
         # Calculate straight-line distance
-        return geodesic(start, end).kilometers
+        return point_distance(start, end, unit="km")
     return 0
 
 def find_optimal_service_point(patient_locations):
@@ -215,12 +218,19 @@ def find_nearest_phlebotomist(optimal_point, phleb_df, current_phleb_id, selecte
         trips_df['PhlebotomistID.1'] == current_phleb_id
     ]['ScheduledDtm']).dt.strftime('%H:%M').tolist())
     
-    for _, row in phleb_df.iterrows():
+    # Calculate distance from the optimal point to every phlebotomist at once
+    phleb_distances = distance_matrix(
+        optimal_point,
+        phleb_df[['PhlebotomistLatitude', 'PhlebotomistLongitude']].to_numpy(),
+        unit="km"
+    )[0]
+    
+    for row_pos, (_, row) in enumerate(phleb_df.iterrows()):
         phleb_id = str(row['PhlebotomistID.1'])
         location = (row['PhlebotomistLatitude'], row['PhlebotomistLongitude'])
         
-        # Calculate distance to optimal point
-        distance = geodesic(optimal_point, location).kilometers
+        # Distance to optimal point
+        distance = phleb_distances[row_pos]
         
         # Initialize analysis dictionary for this phlebotomist
         analysis = {
@@ -525,33 +535,33 @@ def plot_suggested_route(m, start_location, patient_locations, api_key):
     print(f"📏 Suggested route total distance: {total_distance:.2f} km")
     return total_distance
 
-def optimize_patient_order(start_location, patient_locations):
+def optimize_patient_order(start_location, patient_locations, max_moves=ROUTE_IMPROVEMENT_MAX_MOVES):
     """
-    Implements a simple greedy algorithm to optimize the order of patient visits
-    Always selects the nearest unvisited patient
+    Optimize the order of patient visits: a nearest-unvisited-patient tour,
+    then up to max_moves 2-opt / Or-opt improvements
     """
-    remaining = patient_locations.copy()
-    current_location = start_location
+    if not patient_locations:
+        return []
+    
+    # Distances between every pair of stops (position 0 is the start location)
+    dist = distance_matrix([start_location] + list(patient_locations), unit="km")
+    
+    unvisited = np.ones(len(patient_locations) + 1, dtype=bool)
+    unvisited[0] = False
+    current = 0
     optimized_order = []
     
-    while remaining:
-        # Find nearest patient to current location
-        nearest_idx = -1
-        min_distance = float('inf')
-        
-        for i, patient in enumerate(remaining):
-            dist = geodesic(current_location, patient).kilometers
-            if dist < min_distance:
-                min_distance = dist
-                nearest_idx = i
-        
-        # Add the nearest patient to the optimized order
-        if nearest_idx >= 0:
-            nearest_patient = remaining.pop(nearest_idx)
-            optimized_order.append(nearest_patient)
-            current_location = nearest_patient
+    while unvisited.any():
+        # Find nearest unvisited patient to current location
+        candidates = np.where(unvisited, dist[current], np.inf)
+        current = int(np.argmin(candidates))
+        unvisited[current] = False
+        optimized_order.append(current)
+    
+    route, initial_km, improved_km = improve_route(dist, [0] + optimized_order, max_moves=max_moves)
+    print(f"Route improvement: {initial_km:.2f} -> {improved_km:.2f} km ({percent_saved(initial_km, improved_km)}% saved)")
     
-    return optimized_order
+    return [patient_locations[stop - 1] for stop in route[1:]]
 
 def create_enhanced_legend(m, current_phleb_id, nearest_phleb_id, 
                          original_distance, suggested_distance,
@@ -7,10 +7,9 @@ import folium
 from streamlit_folium import st_folium
 from LogHandler import setup_logger
 import final_utils_upd as utils
+from assignment_jobs import follow_assignment_job, submit_assignment_job
 from redis_utils import initialize_redis, initialize_ors_client
-import json
-import pickle
-import base64
+from history_store import HISTORY_PAGE_SIZE, clear_history, list_history, load_history, load_history_map, save_history
 import uuid
 
 load_dotenv()
@@ -42,17 +41,17 @@ def clear_cache():
     """Clear Redis cache for this application"""
     if 'redis_conn' in st.session_state and st.session_state.redis_conn is not None:
         try:
-            # Get all keys with the prefix 'history:'
-            history_keys = st.session_state.redis_conn.keys('history:*')
-            if history_keys:
-                # Delete all history keys
-                st.session_state.redis_conn.delete(*history_keys)
-                logger.info(f"Cleared {len(history_keys)} history entries from Redis cache")
+            # Unlink history items in batches without blocking Redis
+            cleared = clear_history(st.session_state.redis_conn)
+            if cleared:
+                logger.info(f"Cleared {cleared} history entries from Redis cache")
             else:
                 logger.info("No history entries found to clear in Redis cache")
                 
             # Clear session state history list
             st.session_state.history_items = []
+            st.session_state.history_total = 0
+            st.session_state.history_page = 0
             
             return True
         except Exception as e:
@@ -60,26 +59,13 @@ def clear_cache():
             return False
     return False
 
-def get_history_items():
-    """Get all history items from Redis"""
+def get_history_items(page=0):
+    """Get one page of history items from the Redis history index"""
     if 'redis_conn' in st.session_state and st.session_state.redis_conn is not None:
         try:
-            # Get all keys with the prefix 'history:'
-            history_keys = st.session_state.redis_conn.keys('history:*')
-            
-            # Extract date-city pairs from keys
-            history_items = []
-            for key in history_keys:
-                key_str = key.decode('utf-8') if isinstance(key, bytes) else key
-                # Format: history:<date>:<city>
-                parts = key_str.split(':', 2)
-                if len(parts) == 3:
-                    history_items.append({
-                        'date': parts[1],
-                        'city': parts[2],
-                        'key': key_str
-                    })
-            
+            history_items, total = list_history(st.session_state.redis_conn,
+                                                offset=page * HISTORY_PAGE_SIZE, limit=HISTORY_PAGE_SIZE)
+            st.session_state.history_total = total
             return history_items
         except Exception as e:
             logger.error(f"Failed to get history items from Redis: {e}")
@@ -93,43 +79,15 @@ def save_to_cache(date, city, assignment_map, assigned_phlebs, assigned_patients
             key = f"history:{date_str}:{city}"
             
             # Convert folium map to HTML string
-            map_html = assignment_map.get_root().render()
-            
-            # Create a cache object
-            cache_data = {
-                'date': date_str,
-                'city': city,
-                'map_html': map_html,
-                'assigned_phlebs': base64.b64encode(pickle.dumps(assigned_phlebs)).decode('utf-8'),
-                'assigned_patients': base64.b64encode(pickle.dumps(assigned_patients)).decode('utf-8'),
-                'use_scheduled_time': use_scheduled_time,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            # Save to Redis
-            st.session_state.redis_conn.set(key, json.dumps(cache_data, default=str), ex=86400)  # expire in 24 hours
+            map_html = utils.render_map_html(assignment_map)
             
-            # Update history items in session state
-            if 'history_items' not in st.session_state:
-                st.session_state.history_items = []
+            # Save to Redis as compressed Arrow frames and map HTML (expire in 24 hours)
+            save_history(st.session_state.redis_conn, date_str, city, map_html,
+                         assigned_phlebs, assigned_patients, use_scheduled_time)
             
-            # Log current history items BEFORE adding
-            logger.info(f"History items before update: {st.session_state.history_items}")
-            
-            # Check if this item already exists
-            existing_item = next((item for item in st.session_state.history_items 
-                                if item['date'] == date_str and item['city'] == city), None)
-            
-            if not existing_item:
-                # Add to history items
-                st.session_state.history_items.append({
-                    'date': date_str,
-                    'city': city,
-                    'key': key
-                })
-                
-                # Log updated history items AFTER adding
-                logger.info(f"History items after update: {st.session_state.history_items}")
+            # Refresh the sidebar page this item is on
+            st.session_state.history_items = get_history_items(st.session_state.get('history_page', 0))
+            logger.info(f"History items after update: {st.session_state.history_items}")
             
             logger.info(f"Saved assignment results to Redis cache: {key}")
             return True
@@ -150,6 +108,8 @@ def initialize_session_state():
     # Basic data state
     if 'trips_df' not in st.session_state:
         st.session_state.trips_df = None
+    if 'trip_store' not in st.session_state:
+        st.session_state.trip_store = None
     if 'phleb_df' not in st.session_state:
         st.session_state.phleb_df = None
     if 'workload_df' not in st.session_state:
@@ -160,8 +120,10 @@ def initialize_session_state():
         st.session_state.date_city_map = {}
     
     # History/cache state
+    if 'history_page' not in st.session_state:
+        st.session_state.history_page = 0
     if 'history_items' not in st.session_state:
-        st.session_state.history_items = get_history_items()
+        st.session_state.history_items = get_history_items(st.session_state.history_page)
     if 'results_from_cache' not in st.session_state:
         st.session_state.results_from_cache = False
 
@@ -247,7 +209,7 @@ def display_results():
         else:
             # Display newly generated map with timestamp comment
             if 'assignment_map' in st.session_state and st.session_state.assignment_map:
-                html_temp = st.session_state.assignment_map.get_root().render() + f"<!-- timestamp: {timestamp} -->"
+                html_temp = utils.render_map_html(st.session_state.assignment_map) + f"<!-- timestamp: {timestamp} -->"
                 st.components.v1.html(html_temp, height=800)
             else:
                 st.warning("Map data is not available.")
@@ -416,6 +378,11 @@ def display_history_sidebar():
     """Display the history items in the sidebar"""
     st.sidebar.header("History")
     
+    # A later page can empty out as items expire; fall back to the first page
+    if not st.session_state.history_items and st.session_state.history_page > 0:
+        st.session_state.history_page = 0
+        st.session_state.history_items = get_history_items(0)
+    
     if not st.session_state.history_items:
         st.sidebar.info("No history items available")
         return
@@ -435,6 +402,22 @@ def display_history_sidebar():
                     # Force rerun - critical for UI update without duplicating elements
                     st.rerun()
     
+    # Page through the history index instead of listing it all
+    total = st.session_state.get('history_total', len(st.session_state.history_items))
+    page = st.session_state.history_page
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    if pages > 1:
+        st.sidebar.caption(f"Page {page + 1} of {pages} ({total} items)")
+        prev_col, next_col = st.sidebar.columns(2)
+        if prev_col.button("Previous", disabled=page == 0, key="history_prev"):
+            st.session_state.history_page = page - 1
+            st.session_state.history_items = get_history_items(page - 1)
+            st.rerun()
+        if next_col.button("Next", disabled=page >= pages - 1, key="history_next"):
+            st.session_state.history_page = page + 1
+            st.session_state.history_items = get_history_items(page + 1)
+            st.rerun()
+    
     # Add a clear history button
     if st.sidebar.button("Clear History"):
         if clear_cache():
@@ -449,21 +432,16 @@ def load_from_cache(date, city):
             date_str = date.strftime('%Y-%m-%d') if isinstance(date, datetime) else date
             key = f"history:{date_str}:{city}"
             
-            if not st.session_state.redis_conn.exists(key):
+            cached_data = load_history(st.session_state.redis_conn, date_str, city)
+            if cached_data is None:
                 logger.info(f"Cache miss for {key}")
                 return None
 
-            cached_data_str = st.session_state.redis_conn.get(key)
-            if not cached_data_str:
-                return None
-
-            cached_data = json.loads(cached_data_str)
-
             # Set session state values to override current UI
-            st.session_state.assigned_phlebs = pickle.loads(base64.b64decode(cached_data['assigned_phlebs'].encode()))
-            st.session_state.assigned_patients = pickle.loads(base64.b64decode(cached_data['assigned_patients'].encode()))
+            st.session_state.assigned_phlebs = cached_data['assigned_phlebs']
+            st.session_state.assigned_patients = cached_data['assigned_patients']
             st.session_state.assignment_map = folium.Map()  # Dummy, if needed to avoid crash
-            st.session_state.cached_map_html = cached_data.get('map_html')
+            st.session_state.cached_map_html = load_history_map(st.session_state.redis_conn, date_str, city)
             st.session_state.use_scheduled_time = cached_data.get('use_scheduled_time', True)
 
             # Critical: Set selected date and city to match the cached data
@@ -481,6 +459,32 @@ def load_from_cache(date, city):
     return None
 
 
+def store_assignment_result(assignment_map, assigned_phlebs, assigned_patients, selected_date, selected_city,
+                            use_scheduled_time):
+    """Save a finished assignment and keep it in session state"""
+    # Save the results to files and cache
+    saved_files = save_assignment_results_with_cache(
+        assignment_map,
+        assigned_phlebs,
+        assigned_patients,
+        selected_date,
+        selected_city,
+        use_scheduled_time
+    )
+    
+    # Store results in session state
+    st.session_state.assignment_map = assignment_map
+    st.session_state.assigned_phlebs = assigned_phlebs
+    st.session_state.assigned_patients = assigned_patients
+    st.session_state.saved_files = saved_files
+    st.session_state.use_scheduled_time = use_scheduled_time
+    st.session_state.results_from_cache = True  # Mark as having results
+    
+    # Set loaded history key
+    st.session_state.loaded_history_key = f"history:{selected_date.strftime('%Y-%m-%d')}:{selected_city}"
+    
+    st.success(f"Successfully assigned {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists!")
+
 # Modify main() to ensure results always show below parameters
 def main():
     """Main application flow - with results displayed BELOW parameters"""
@@ -500,10 +504,12 @@ def main():
         )
         
         if st.session_state.trips_df is not None:
-            st.session_state.dates = utils.get_available_dates(st.session_state.trips_df)
+            # Index trips by (date, city) once so per-selection lookups are O(1)
+            st.session_state.trip_store = utils.TripStore(st.session_state.trips_df)
+            st.session_state.dates = utils.get_available_dates(st.session_state.trip_store)
             logger.info(f"Found {len(st.session_state.dates)} available dates in data")
             
-            st.session_state.date_city_map = utils.get_cities_by_date(st.session_state.trips_df)
+            st.session_state.date_city_map = utils.get_cities_by_date(st.session_state.trip_store)
             logger.info(f"Mapped {len(st.session_state.date_city_map)} dates to their respective cities")
             
             logger.info("Data loaded successfully")
@@ -716,7 +722,7 @@ def main():
         # Calculate phlebotomists needed
         phlebs_needed = utils.phlebs_required_asper_workload(
             st.session_state.workload_df,
-            st.session_state.trips_df,
+            st.session_state.trip_store,
             selected_date,
             selected_city
         )
@@ -830,55 +836,29 @@ def main():
                     st.session_state.phleb_df["PhlebotomistID.1"].astype(str).isin(st.session_state.selected_phlebs)
                 ]
                 
-                with st.spinner("Optimizing assignments and routes..."):
-                    
-                    phleb_df_to_consider = selected_phleb_df if len(selected_phleb_df) > 0 else st.session_state.phleb_df
-                    
-                    if len(phleb_df_to_consider) != len(selected_phleb_df):
-                        st.write("No Phlebotomist was found with same city. Nearest Phleb will be considered by default.")
-                        st.write("Prefer selecting phlebs to consider them for this order(s)")
-                    
-                    # Process the assignments with the selected routing approach
-                    assignment_map, assigned_phlebs, assigned_patients = utils.process_city_assignments(
-                        st.session_state.trips_df,
-                        phleb_df_to_consider,
-                        st.session_state.workload_df,
-                        selected_date,
-                        selected_city,
-                        api_key,
-                        use_scheduled_time,
-                        redis_host=redis_host,
-                        redis_port=redis_port
-                    )
-                    
-                    if assignment_map is None:
-                        logger.error(f"Failed to generate assignments for {selected_city} on {selected_date.strftime('%Y-%m-%d')}")
-                        st.error("Failed to generate assignments. Please check the data.")
-                    else:
-                        logger.info(f"Successfully generated assignments: {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists")
-                        
-                        # Save the results to files and cache
-                        saved_files = save_assignment_results_with_cache(
-                            assignment_map,
-                            assigned_phlebs,
-                            assigned_patients,
-                            selected_date,
-                            selected_city,
-                            use_scheduled_time
-                        )
-                        
-                        # Store results in session state
-                        st.session_state.assignment_map = assignment_map
-                        st.session_state.assigned_phlebs = assigned_phlebs
-                        st.session_state.assigned_patients = assigned_patients
-                        st.session_state.saved_files = saved_files
-                        st.session_state.use_scheduled_time = use_scheduled_time
-                        st.session_state.results_from_cache = True  # Mark as having results
-                        
-                        # Set loaded history key
-                        st.session_state.loaded_history_key = f"history:{selected_date.strftime('%Y-%m-%d')}:{selected_city}"
-                        
-                        st.success(f"Successfully assigned {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists!")
+                phleb_df_to_consider = selected_phleb_df if len(selected_phleb_df) > 0 else st.session_state.phleb_df
+                
+                if len(phleb_df_to_consider) != len(selected_phleb_df):
+                    st.write("No Phlebotomist was found with same city. Nearest Phleb will be considered by default.")
+                    st.write("Prefer selecting phlebs to consider them for this order(s)")
+
+                # Run the assignment in the background so the session stays responsive;
+                # an identical request that is already running or finished is joined instead
+                job = submit_assignment_job(
+                    st.session_state.trip_store,
+                    phleb_df_to_consider,
+                    st.session_state.workload_df,
+                    selected_date,
+                    selected_city,
+                    api_key,
+                    use_scheduled_time,
+                    phleb_ids=st.session_state.selected_phlebs,
+                    redis_host=redis_host,
+                    redis_port=redis_port
+                )
+                st.session_state.assignment_job_id = job.job_id
+                # A retried failed job reuses its dedupe ID, so forget which job was applied
+                st.session_state.applied_job_id = None
                         
             else:
                 # Only log warning once per date-city combination
@@ -888,6 +868,9 @@ def main():
                 
                 st.warning(f"Could not determine the number of phlebotomists needed for {selected_city} on {selected_date}.")
     
+    # Follow the background assignment job, and apply its result once it finishes
+    follow_assignment_job(store_assignment_result, logger)
+    
     # IMPORTANT: Always show results AFTER all parameters UI
     # By moving this to the end, we ensure it always appears below the parameter selection
     if ('results_from_cache' in st.session_state and st.session_state.results_from_cache and 
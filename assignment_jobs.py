@@ -0,0 +1,284 @@
+import hashlib
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+import final_utils_upd as utils
+from assignment_utils import collect_user_messages
+
+# Assignment runs executing at once; more are queued
+ASSIGNMENT_WORKERS = 2
+
+# Finished jobs are kept this long so identical requests get their result instantly
+JOB_RESULT_TTL_SECONDS = 3600
+
+# Finished jobs kept at most (each holds a map and two DataFrames)
+JOB_RESULT_LIMIT = 32
+
+# How often the UI re-reads the status of a running job
+JOB_POLL_SECONDS = 1.0
+
+
+def frame_fingerprint(df):
+    """
+    Compute a content fingerprint of a DataFrame.
+
+    Args:
+        df: DataFrame to fingerprint
+
+    Returns:
+        Hex digest that changes whenever a column name or value changes
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    columns = "|".join(str(col) for col in df.columns)
+    return hashlib.sha256(columns.encode("utf-8") + row_hashes.tobytes()).hexdigest()
+
+
+def assignment_job_id(target_date, target_city, use_scheduled_time, phleb_ids, assignment_mode="greedy",
+                      inputs=()):
+    """
+    Deduplication key for an assignment run.
+
+    Args:
+        target_date: Date of the run
+        target_city: City of the run
+        use_scheduled_time: Routing mode
+        phleb_ids: Selected phlebotomist IDs (empty for all)
+        assignment_mode: Assignment mode passed to process_city_assignments
+        inputs: Further values the result depends on, e.g. data fingerprints and connection settings
+
+    Returns:
+        Hex digest identifying the job
+    """
+    date_str = target_date.strftime('%Y-%m-%d') if hasattr(target_date, "strftime") else str(target_date)
+    phlebs = ",".join(sorted(str(phleb_id) for phleb_id in phleb_ids)) or "*"
+    raw = "|".join([date_str, str(target_city), str(int(bool(use_scheduled_time))), assignment_mode, phlebs,
+                    *(str(value) for value in inputs)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class AssignmentJob:
+    """Status, progress and result of one background assignment run."""
+
+    def __init__(self, job_id, params):
+        self.job_id = job_id
+        self.params = params
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Waiting for a free worker"
+        self.result = None
+        self.error = None
+        self.messages = []
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - (self.started_at or self.submitted_at)
+
+    def update(self, fraction, message):
+        """Progress callback handed to process_city_assignments."""
+        self.progress = min(1.0, max(self.progress, float(fraction)))
+        self.message = message
+
+
+class AssignmentJobQueue:
+    """
+    Runs assignment jobs on a local worker pool, one job per distinct request.
+
+    Submitting a request that is already queued, running or recently finished returns
+    the existing job, so reruns of a Streamlit script and other sessions asking for
+    the same run on the same data share one run and its result. Failed jobs
+    are retried on the next submit.
+    """
+
+    def __init__(self, max_workers=ASSIGNMENT_WORKERS, result_ttl_seconds=JOB_RESULT_TTL_SECONDS,
+                 result_limit=JOB_RESULT_LIMIT):
+        self.result_ttl_seconds = result_ttl_seconds
+        self.result_limit = result_limit
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="assignment")
+
+    def _prune(self):
+        """Drop expired finished jobs, then the oldest ones beyond the limit. Caller holds the lock."""
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in finished:
+            if now - job.finished_at > self.result_ttl_seconds:
+                del self._jobs[job.job_id]
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in finished[:max(0, len(finished) - self.result_limit)]:
+            del self._jobs[job.job_id]
+
+    def submit(self, job_id, func, params, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs, progress_callback=...) unless an equivalent job exists.
+
+        Returns:
+            The AssignmentJob for job_id
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            if job is not None and job.status != "failed":
+                self._jobs.move_to_end(job_id)
+                return job
+            job = AssignmentJob(job_id, params)
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, func, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        job.message = "Starting"
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⏳ Assignment job {job.job_id} started: {job.params}")
+        try:
+            # Errors and warnings the run would show in the app are kept for the session that applies the job
+            with collect_user_messages() as job.messages:
+                job.result = func(*args, progress_callback=job.update, **kwargs)
+            job.status = "done"
+            job.progress = 1.0
+        except Exception as e:
+            traceback.print_exc()
+            job.error = f"{e.__class__.__name__}: {e}"
+            job.status = "failed"
+        job.finished_at = time.time()
+        icon = "✅" if job.status == "done" else "❌"
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {icon} Assignment job {job.job_id} {job.status} "
+              f"in {job.elapsed:.1f}s")
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue shared by every Streamlit session."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = AssignmentJobQueue()
+    return _job_queue
+
+
+def submit_assignment_job(patient_df, phleb_df, workload_df, target_date, target_city, api_key=None,
+                          use_scheduled_time=True, phleb_ids=(), **kwargs):
+    """
+    Run process_city_assignments in the background, or join an identical run.
+
+    Args:
+        patient_df: DataFrame or TripStore with patient orders
+        phleb_df: DataFrame with the phlebotomists to consider
+        workload_df: DataFrame with city workload information
+        target_date: Date to analyze
+        target_city: City to analyze
+        api_key: OpenRouteService API key (optional)
+        use_scheduled_time: Routing mode
+        phleb_ids: Phlebotomist IDs the user selected, used for deduplication
+        **kwargs: Further process_city_assignments arguments (redis_host, assignment_mode, ...)
+
+    Returns:
+        AssignmentJob; its result is the (map, assigned_phlebs, assigned_patients) tuple
+    """
+    # Sessions share the queue, so the key covers the data itself and every setting
+    # the result depends on, not just the selection
+    inputs = [
+        frame_fingerprint(utils.select_trips(patient_df, target_date, target_city)),
+        frame_fingerprint(phleb_df),
+        frame_fingerprint(workload_df),
+        hashlib.sha256((api_key or "").encode("utf-8")).hexdigest(),
+        *(f"{name}={value!r}" for name, value in sorted(kwargs.items())),
+    ]
+    job_id = assignment_job_id(target_date, target_city, use_scheduled_time, phleb_ids,
+                               kwargs.get("assignment_mode", "greedy"), inputs)
+    params = {"date": target_date, "city": target_city, "use_scheduled_time": use_scheduled_time}
+    return get_job_queue().submit(
+        job_id, utils.process_city_assignments, params,
+        patient_df, phleb_df, workload_df, target_date, target_city, api_key, use_scheduled_time, **kwargs
+    )
+
+
+def get_assignment_job(job_id):
+    """Look up a submitted job by ID, or None if it is unknown or has expired."""
+    return get_job_queue().get(job_id) if job_id else None
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_assignment_job_progress():
+    """Poll the running assignment job and rerun the whole app once it has finished"""
+    job = get_assignment_job(st.session_state.get('assignment_job_id'))
+    if job is None:
+        return
+    if job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.message} ({job.elapsed:.0f}s)")
+
+
+def apply_assignment_job(job, store_result, logger):
+    """
+    Show the outcome of a finished assignment job and hand a successful result to the app.
+
+    Args:
+        job: Finished AssignmentJob
+        store_result: Callable(assignment_map, assigned_phlebs, assigned_patients, date, city,
+            use_scheduled_time) that saves the result and keeps it in session state
+        logger: Logger of the app
+    """
+    selected_date = job.params["date"]
+    selected_city = job.params["city"]
+    date_str = selected_date.strftime('%Y-%m-%d')
+
+    for level, message in job.messages:
+        getattr(logger, level)(f"Assignment for {selected_city} on {date_str}: {message}")
+        getattr(st, level)(message)
+
+    if job.status == "failed":
+        logger.error(f"Assignment job failed for {selected_city} on {date_str}: {job.error}")
+        st.error(f"Failed to generate assignments: {job.error}")
+        return
+
+    assignment_map, assigned_phlebs, assigned_patients = job.result
+    if assignment_map is None:
+        logger.error(f"Failed to generate assignments for {selected_city} on {date_str}")
+        st.error("Failed to generate assignments. Please check the data.")
+        return
+
+    logger.info(f"Successfully generated assignments: {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists")
+    store_result(assignment_map, assigned_phlebs, assigned_patients, selected_date, selected_city,
+                 job.params["use_scheduled_time"])
+
+
+def follow_assignment_job(store_result, logger):
+    """
+    Follow this session's assignment job: show its progress, then apply its result once.
+
+    Args:
+        store_result: Passed to apply_assignment_job
+        logger: Logger of the app
+    """
+    job = get_assignment_job(st.session_state.get('assignment_job_id'))
+    if job is None or st.session_state.get('applied_job_id') == job.job_id:
+        return
+    if job.done:
+        st.session_state.applied_job_id = job.job_id
+        apply_assignment_job(job, store_result, logger)
+    else:
+        show_assignment_job_progress()
@@ -1,19 +1,76 @@
 import pandas as pd
+import contextvars
 import logging
 import os
+import time
 import streamlit as st
 import numpy as np
-from geopy.geocoders import Nominatim
+from contextlib import contextmanager
 from datetime import timedelta, datetime
 from copy import deepcopy
 
 from route_utils import calculate_distance
+from distance_utils import distance_matrix, pairwise_distance, point_distance
+from spatial_index import get_phleb_index
+from dropoff_index import get_dropoff_index, load_dropoffs
+from geocode_cache import geocode_city
+from route_cache import attach_shared_route_cache, get_route_cache
+from trip_store import select_trips
 from workload_utils import phlebs_required_asper_workload
 from map_utils import create_assignment_map
+from optimal_assignment import solve_capacitated_assignment, compare_assignment_miles
+from route_improvement import ROUTE_IMPROVEMENT_MAX_MOVES, improve_route, percent_saved
+from vrptw import solve_vrptw, time_windows
+from profiling_utils import not_covered, profile_run, span, traced
 from final_utils_upd import calculate_route_distance
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+# Patient columns route optimization reads; only these are shipped to route workers
+ROUTE_COLUMNS = [
+    "PatientLatitude", "PatientLongitude", "ScheduledDtm", "PlannedDtm", "TripOrderInDay",
+    "DropOffLocation", "PatientState", "PatientZip", "City", "PatientSysID",
+]
+
+# Levels used to narrow a patient's dropoff clinic before taking the nearest site:
+# assignment matches by state and zip, route optimization also narrows by city
+ASSIGNMENT_DROPOFF_LEVELS = ("state", "zip")
+ROUTE_DROPOFF_LEVELS = ("state", "city", "zip")
+
+# Errors and warnings for the user, collected instead of shown while a background job
+# runs the assignment: its worker thread has no Streamlit script context to show them in
+_user_messages = contextvars.ContextVar("user_messages", default=None)
+
+def notify_user(level, message):
+    """
+    Show an error or warning in the app, or keep it for the background job running this assignment.
+    
+    Args:
+        level: "error" or "warning"
+        message: Text to show
+    """
+    messages = _user_messages.get()
+    if messages is None:
+        getattr(st, level)(message)
+    else:
+        messages.append((level, message))
+
+@contextmanager
+def collect_user_messages():
+    """
+    Collect the notify_user messages raised in this context instead of showing them.
+    
+    Yields:
+        List of (level, message) tuples, filled as the messages are raised
+    """
+    messages = []
+    token = _user_messages.set(messages)
+    try:
+        yield messages
+    finally:
+        _user_messages.reset(token)
+
+@traced()
 def get_available_phlebotomists(phleb_df, target_city, num_phlebs_needed, redis_conn=None, ors_api_key=None):
     """
     Get available phlebotomists in the target city.
@@ -29,22 +86,19 @@ def get_available_phlebotomists(phleb_df, target_city, num_phlebs_needed, redis_
     Returns:
         DataFrame with available phlebotomists
     """
-    from geopy.geocoders import Nominatim
     import pandas as pd
     
     # Import Redis and ORS utility functions if Redis connection is provided
     if redis_conn is not None:
         from redis_utils import load_phlebotomists_to_redis, get_nearby_phlebotomists, initialize_ors_client
     
-    # Geocode the target city
-    geolocator = Nominatim(user_agent="phleb_locator")
-    location = geolocator.geocode(target_city)
+    # Geocode the target city (local cache first, Nominatim only on a miss)
+    target_coords = geocode_city(target_city)
     
-    if location is None:
-        st.error(f"Could not find coordinates for {target_city}.")
+    if target_coords is None:
+        notify_user("error", f"Could not find coordinates for {target_city}.")
         return pd.DataFrame()  # Return empty DataFrame if city is not found
     
-    target_coords = (location.latitude, location.longitude)
     print(f"Target Coords --> {target_coords}")
     
     # If Redis connection is provided, use geospatial indexing
@@ -55,12 +109,12 @@ def get_available_phlebotomists(phleb_df, target_city, num_phlebs_needed, redis_
         # Find nearby phlebotomists using Redis geospatial index
         # Start with a reasonable radius (30 miles)
         search_radius = 30  # miles
-        nearby_phlebs = get_nearby_phlebotomists(redis_conn, location.latitude, location.longitude, search_radius)
+        nearby_phlebs = get_nearby_phlebotomists(redis_conn, target_coords[0], target_coords[1], search_radius)
         
         # If not enough phlebotomists found, increase radius
         while len(nearby_phlebs) < num_phlebs_needed and search_radius < 100:
             search_radius += 20
-            nearby_phlebs = get_nearby_phlebotomists(redis_conn, location.latitude, location.longitude, search_radius)
+            nearby_phlebs = get_nearby_phlebotomists(redis_conn, target_coords[0], target_coords[1], search_radius)
         
         # Extract phlebotomist IDs and create a new DataFrame
         nearby_phleb_ids = [phleb_id for phleb_id, _, _ in nearby_phlebs]
@@ -87,25 +141,34 @@ def get_available_phlebotomists(phleb_df, target_city, num_phlebs_needed, redis_
             available_phlebs = city_phlebs.copy()
         
     else:
-        # Fall back to original method if Redis is not available
-        # Compute distances for all phlebotomists using geodesic
-        from geopy.distance import geodesic
-        
+        # Fall back to the in-process spatial index if Redis is not available
         print(f"Finding distance to target from target : ({target_coords})")
-        phleb_df["distance_to_target"] = phleb_df.apply(
-            lambda x: geodesic(target_coords, (x["PhlebotomistLatitude"], x["PhlebotomistLongitude"])).miles,
-            axis=1
-        )
+        phleb_index = get_phleb_index(phleb_df)
         
-        # Sort by distance to target city
-        phleb_df = phleb_df.sort_values(by="distance_to_target")
+        # Select phlebotomists in the target city, nearest first
+        positions, distances = phleb_index.query_city(target_city, *target_coords)
+        missing_positions = phleb_index.city_missing_positions(target_city)
         
-        # Select phlebotomists in the target city
-        available_phlebs = phleb_df[phleb_df['City'] == target_city].copy()
-        
-        if available_phlebs.empty:
-            st.warning(f"No phlebotomists found in {target_city}. Returning nearby phlebotomists.")
-            available_phlebs = phleb_df.copy()
+        if len(positions) == 0 and len(missing_positions) == 0:
+            notify_user("warning", f"No phlebotomists found in {target_city}. Returning nearby phlebotomists.")
+            
+            # Same radius expansion as the Redis path, topped up to the number needed
+            search_radius = 30  # miles
+            positions, distances = phleb_index.query_radius(*target_coords, search_radius)
+            while len(positions) < num_phlebs_needed and search_radius < 100:
+                search_radius += 20
+                positions, distances = phleb_index.query_radius(*target_coords, search_radius)
+            if len(positions) < num_phlebs_needed:
+                positions, distances = phleb_index.query_nearest(*target_coords, num_phlebs_needed)
+            missing_positions = []
+        
+        available_phlebs = phleb_df.iloc[positions].copy()
+        available_phlebs["distance_to_target"] = distances
+        if len(missing_positions):
+            # Phlebotomists without coordinates sort last, as with a full scan
+            unlocated_phlebs = phleb_df.iloc[missing_positions].copy()
+            unlocated_phlebs["distance_to_target"] = np.nan
+            available_phlebs = pd.concat([available_phlebs, unlocated_phlebs])
     
     # Initialize workload tracking columns
     available_phlebs["current_workload"] = 0
@@ -154,19 +217,27 @@ def estimate_draw_time(workload_points):
     
     return base_time + additional_time
 
+@traced()
 def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_date, target_city, 
-                             api_key=None, redis_conn=None):
+                             api_key=None, redis_conn=None, assignment_mode="greedy",
+                             road_distances=False, use_scheduled_time=True):
     """
     Assign patients to phlebotomists while optimizing workload, distance, and dropoff locations.
     
     Args:
-        patient_df: DataFrame with patient orders
+        patient_df: DataFrame or TripStore with patient orders
         phleb_df: DataFrame with phlebotomist information
         workload_df: DataFrame with city workload information
         target_date: Date to analyze
         target_city: City to analyze
         api_key: OpenRouteService API key (optional)
         redis_conn: Redis connection (optional)
+        assignment_mode: "greedy" for nearest-first assignment, "optimal" to solve
+            the whole day as a capacity-constrained min-cost assignment, or "vrptw" to
+            assign and sequence patients within time windows around ScheduledDtm
+        road_distances: Score candidates by the road miles prefetch_route_distances stored
+            in the route cache instead of straight-line miles
+        use_scheduled_time: Routing mode whose cached road distances are read
         
     Returns:
         Tuple of (assigned_phlebs_df, assigned_patients_df)
@@ -174,19 +245,11 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     import pandas as pd
     from collections import defaultdict
     
-    # Import ORS utilities if API key is provided
-    if api_key:
-        from redis_utils import initialize_ors_client, calculate_route_distance
-        ors_client = initialize_ors_client(api_key)
-    
     # Convert target_date to datetime.date
     target_date = pd.to_datetime(target_date).date()
     
     # Filter patients for target city and date
-    filtered_patients = patient_df[
-        (patient_df["City"] == target_city) &
-        (patient_df["ScheduledDtm"].dt.date == target_date)
-    ].copy()
+    filtered_patients = select_trips(patient_df, target_date, target_city).copy()
     
     # If no patients, return empty DataFrames
     if filtered_patients.empty:
@@ -195,7 +258,7 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     # Calculate number of phlebotomists needed
     num_phlebs_needed = phlebs_required_asper_workload(workload_df, patient_df, target_date, target_city)
     if not num_phlebs_needed:
-        st.error(f"Could not determine phlebotomists needed for {target_city} on {target_date}")
+        notify_user("error", f"Could not determine phlebotomists needed for {target_city} on {target_date}")
         return pd.DataFrame(), pd.DataFrame()
     
     # Get available phlebotomists using Redis geospatial if available
@@ -207,7 +270,7 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     print(available_phlebs)
     
     if available_phlebs.empty:
-        st.error(f"No phlebotomists available in {target_city}")
+        notify_user("error", f"No phlebotomists available in {target_city}")
         return pd.DataFrame(), pd.DataFrame()
     
     # Get the average workload per phlebotomist for the city
@@ -231,24 +294,29 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     filtered_patients["TripOrderInDay"] = None
     filtered_patients["PreferredTime"] = filtered_patients["ScheduledDtm"].copy()  # Initialize with scheduled time
     
-    # Define distance calculation function based on available APIs
-    def get_distance(point1, point2, use_ors = False):
-        """Calculate distance between two points using ORS or fallback to geodesic."""
-        if api_key and ors_client and use_ors:
-            # Use ORS for routing distance
-            return calculate_route_distance(ors_client, point1, point2)
-        else:
-            # Fallback to geodesic distance
-            from geopy.distance import geodesic
-            return geodesic(point1, point2).miles
+    # Per-patient lookups used by the assignment engine
+    patient_lats = filtered_patients["PatientLatitude"].to_numpy()
+    patient_lons = filtered_patients["PatientLongitude"].to_numpy()
+    patient_locations = {idx: (patient_lats[pos], patient_lons[pos]) for pos, idx in enumerate(filtered_patients.index)}
+    patient_workloads = dict(zip(filtered_patients.index, filtered_patients["WorkloadPoints"].to_numpy()))
+    patient_scheduled = dict(zip(filtered_patients.index, filtered_patients["ScheduledDtm"]))
     
-    # Cache for route distances to avoid redundant API calls
-    distance_cache = {}
+    # Precompute distances between every phlebotomist and patient location in a single
+    # call: rows 0..num_phlebs-1 are phlebotomist start points, followed by one row per patient
+    num_phlebs = len(available_phlebs)
+    locations = list(available_phlebs["current_location"]) + list(zip(patient_lats, patient_lons))
+    if road_distances:
+        from prefetch_utils import road_distance_matrix
+        location_distances = road_distance_matrix(locations, use_scheduled_time=use_scheduled_time)
+    else:
+        location_distances = distance_matrix(locations)
+    patient_rows = {idx: num_phlebs + pos for pos, idx in enumerate(filtered_patients.index)}
+    phleb_location_rows = np.arange(num_phlebs)
     
     # IMPROVED: Pre-process patients to identify dropoff locations and group by clinic
     # Load dropoff locations
     try:
-        dropoffs = pd.read_csv("All_Dropoffs.csv")
+        dropoffs = load_dropoffs()
         has_dropoff_data = True
     except:
         print("Warning: All_Dropoffs.csv not found, skipping dropoff optimization")
@@ -261,60 +329,126 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     if has_dropoff_data:
         print("Pre-processing patients to determine dropoff locations...")
         
-        for idx, patient in filtered_patients.iterrows():
-            if isinstance(patient["DropOffLocation"], str):
-                patient_location = (patient["PatientLatitude"], patient["PatientLongitude"])
-                clinic = patient["DropOffLocation"].lower()
-                
-                # Filter dropoffs by clinic and state
-                filtered_dropoffs = dropoffs[dropoffs['Clinic'].str.lower() == clinic]
-                
-                if len(filtered_dropoffs) > 0:
-                    # Further filter by state
-                    state_dropoffs = filtered_dropoffs[filtered_dropoffs['State'].str.lower() == patient['PatientState'].lower()]
-                    if not state_dropoffs.empty:
-                        filtered_dropoffs = state_dropoffs
-                    
-                    # Try to filter by zipcode if possible
-                    zipcode_dropoffs = filtered_dropoffs[filtered_dropoffs['Zipcode'] == patient['PatientZip']]
-                    if not zipcode_dropoffs.empty:
-                        filtered_dropoffs = zipcode_dropoffs
-                    
-                    if not filtered_dropoffs.empty:
-                        # Find nearest dropoff
-                        nearest_dropoff = None
-                        min_distance = float('inf')
-                        
-                        for _, dropoff in filtered_dropoffs.iterrows():
-                            dropoff_location = (dropoff["Latitude"], dropoff["Longitude"])
-                            
-                            # Check cache for distance
-                            location_pair = (str(patient_location), str(dropoff_location))
-                            if location_pair in distance_cache:
-                                dist_to_dropoff = distance_cache[location_pair]
-                            else:
-                                # Calculate distance
-                                dist_to_dropoff = get_distance(patient_location, dropoff_location)
-                                distance_cache[location_pair] = dist_to_dropoff
-                            
-                            if dist_to_dropoff < min_distance:
-                                min_distance = dist_to_dropoff
-                                nearest_dropoff = dropoff
-                        
-                        if nearest_dropoff is not None:
-                            # Create a unique key for this dropoff location
-                            dropoff_key = f"{nearest_dropoff['LabID']}_{nearest_dropoff['Clinic']}"
-                            
-                            # Add to mapping
-                            dropoff_patient_map[dropoff_key].append(idx)
-                            patient_dropoff_map[idx] = {
-                                'key': dropoff_key,
-                                'location': (nearest_dropoff["Latitude"], nearest_dropoff["Longitude"]),
-                                'lab_id': nearest_dropoff["LabID"],
-                                'clinic_name': nearest_dropoff["Clinic"]
-                            }
-                            
-                            print(f"Patient {idx} mapped to dropoff {dropoff_key}")
+        # Resolve every patient's nearest dropoff (clinic -> state -> zip) in one batch
+        dropoff_positions, _ = get_dropoff_index(dropoffs).nearest(filtered_patients, ASSIGNMENT_DROPOFF_LEVELS)
+        for idx, dropoff_pos in zip(filtered_patients.index, dropoff_positions):
+            if dropoff_pos < 0:
+                continue
+            nearest_dropoff = dropoffs.iloc[dropoff_pos]
+            
+            # Create a unique key for this dropoff location
+            dropoff_key = f"{nearest_dropoff['LabID']}_{nearest_dropoff['Clinic']}"
+            
+            # Add to mapping
+            dropoff_patient_map[dropoff_key].append(idx)
+            patient_dropoff_map[idx] = {
+                'key': dropoff_key,
+                'location': (nearest_dropoff["Latitude"], nearest_dropoff["Longitude"]),
+                'lab_id': nearest_dropoff["LabID"],
+                'clinic_name': nearest_dropoff["Clinic"]
+            }
+            
+            print(f"Patient {idx} mapped to dropoff {dropoff_key}")
+    
+    # Array-based assignment engine. Phlebotomist state lives in NumPy arrays indexed
+    # by position in available_phlebs; locations are rows of location_distances.
+    workload_cap = avg_workload_per_phleb * 4  # Allow 4x average
+    assigned_lists = list(available_phlebs["assigned_patients"])
+    current_locations = list(available_phlebs["current_location"])
+    phleb_ids = available_phlebs["PhlebotomistID.1"].tolist()
+    phleb_workloads = available_phlebs["current_workload"].to_numpy().astype(
+        np.result_type(available_phlebs["current_workload"].dtype, filtered_patients["WorkloadPoints"].dtype)
+    )
+    phleb_distances = available_phlebs["total_distance"].to_numpy(dtype=float)
+    phleb_dropoff_keys = [set() for _ in range(num_phlebs)]
+    
+    assigned_phleb_ids = {}
+    trip_orders = {}
+    
+    def nearest_phleb(distances, eligible):
+        """Position of the first eligible phlebotomist with the smallest distance, or None."""
+        candidates = eligible & (distances < np.inf)
+        if not candidates.any():
+            return None
+        return int(np.argmin(np.where(candidates, distances, np.inf)))
+    
+    def assign_patient(phleb_pos, patient_idx, trip_order):
+        """Record a patient assignment in the engine state."""
+        assigned_phleb_ids[patient_idx] = phleb_ids[phleb_pos]
+        trip_orders[patient_idx] = trip_order
+        assigned_lists[phleb_pos].append(patient_idx)
+        phleb_workloads[phleb_pos] += patient_workloads[patient_idx]
+        if patient_idx in patient_dropoff_map:
+            phleb_dropoff_keys[phleb_pos].add(patient_dropoff_map[patient_idx]['key'])
+    
+    def move_phleb(phleb_pos, patient_idx, distance):
+        """Move a phlebotomist to a patient's location and add the travelled distance."""
+        phleb_location_rows[phleb_pos] = patient_rows[patient_idx]
+        current_locations[phleb_pos] = patient_locations[patient_idx]
+        phleb_distances[phleb_pos] += distance
+    
+    processed_patients = set()
+    
+    if assignment_mode == "optimal":
+        # Solve the whole day at once for the fewest chained route miles, visiting
+        # patients in scheduled order. Patients the solver cannot place within
+        # capacity stay unprocessed and fall through to the greedy passes below.
+        patient_positions = {idx: pos for pos, idx in enumerate(filtered_patients.index)}
+        solved_positions = solve_capacitated_assignment(
+            location_distances[:num_phlebs, num_phlebs:].T,
+            location_distances[num_phlebs:, num_phlebs:],
+            filtered_patients["WorkloadPoints"].to_numpy(dtype=float),
+            workload_cap,
+            dropoff_groups=[
+                [patient_positions[idx] for idx in patient_indices]
+                for patient_indices in dropoff_patient_map.values()
+            ],
+        )
+        
+        # Walk patients in scheduled order so each route is chained home -> first -> ... -> last
+        for patient_idx, phleb_pos in zip(filtered_patients.index, solved_positions):
+            if phleb_pos < 0:
+                continue
+            distance = location_distances[phleb_location_rows[phleb_pos], patient_rows[patient_idx]]
+            assign_patient(phleb_pos, patient_idx, len(assigned_lists[phleb_pos]) + 1)
+            move_phleb(phleb_pos, patient_idx, distance)
+            processed_patients.add(patient_idx)
+        
+        print(f"Optimal assignment placed {len(processed_patients)} of {len(filtered_patients)} patients")
+    
+    if assignment_mode == "vrptw":
+        # Build each route in visiting order, checking that every visit can start within
+        # its window given draw times and travel between patients. PlannedDtm records
+        # the planned start, which optimize_routes follows in scheduled-time mode. No shift
+        # start is passed, since trips without a time of day are scheduled at midnight.
+        day_start, window_start, window_end = time_windows(filtered_patients["ScheduledDtm"])
+        routes, start_minutes, late_minutes, unserved = solve_vrptw(
+            location_distances[:num_phlebs, num_phlebs:],
+            location_distances[num_phlebs:, num_phlebs:],
+            window_start,
+            window_end,
+            estimate_draw_time(filtered_patients["WorkloadPoints"].to_numpy(dtype=float)),
+            estimate_travel_time(1),
+            workloads=filtered_patients["WorkloadPoints"].to_numpy(dtype=float),
+            capacity=workload_cap,
+        )
+        
+        patient_order = list(filtered_patients.index)
+        for phleb_pos, route in enumerate(routes):
+            for patient_pos in route:
+                patient_idx = patient_order[patient_pos]
+                distance = location_distances[phleb_location_rows[phleb_pos], patient_rows[patient_idx]]
+                assign_patient(phleb_pos, patient_idx, len(assigned_lists[phleb_pos]) + 1)
+                move_phleb(phleb_pos, patient_idx, distance)
+                processed_patients.add(patient_idx)
+        
+        filtered_patients["PlannedDtm"] = day_start + pd.to_timedelta(start_minutes, unit="min")
+        filtered_patients["LateMinutes"] = late_minutes
+        
+        print(f"Time-window routing placed {len(processed_patients)} of {len(filtered_patients)} patients")
+        if unserved:
+            print(f"Warning: {len(unserved)} patients cannot be reached within their time window; "
+                  f"scheduled with the least lateness instead")
     
     # IMPROVED: Patient assignment strategy
     # First sort dropoff groups by size (descending) to prioritize larger groups
@@ -325,8 +459,6 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     ) if has_dropoff_data else []
     
     # Process patients in dropoff groups first
-    processed_patients = set()
-    
     for dropoff_key, patient_indices in sorted_dropoff_groups:
         # Skip small groups (only 1 patient) for the first pass
         if len(patient_indices) <= 1:
@@ -341,85 +473,38 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
         print(f"Processing dropoff group {dropoff_key} with {len(group_patients)} patients")
         
         # Calculate total workload for this group
-        group_workload = sum(filtered_patients.loc[idx, "WorkloadPoints"] for idx in group_patients)
+        group_workload = sum(patient_workloads[idx] for idx in group_patients)
         
-        # Find the best phlebotomist for this group
-        best_phleb_idx = None
-        min_total_distance = float('inf')
+        # Total distance from every phlebotomist to all patients in this group
+        total_distances = np.zeros(num_phlebs)
+        for patient_idx in group_patients:
+            total_distances += location_distances[phleb_location_rows, patient_rows[patient_idx]]
         
-        for phleb_idx, phleb in available_phlebs.iterrows():
-            current_location = phleb["current_location"]
-            current_workload = phleb["current_workload"]
-            
-            # Skip if workload would exceed limit
-            if current_workload + group_workload > avg_workload_per_phleb * 4:  # Allow 4x average
-                continue
-                
-            # Calculate total distance from phlebotomist to all patients in this group
-            total_distance = 0
-            
-            for patient_idx in group_patients:
-                patient_location = (
-                    filtered_patients.loc[patient_idx, "PatientLatitude"],
-                    filtered_patients.loc[patient_idx, "PatientLongitude"]
-                )
-                
-                # Check cache for distance
-                location_pair = (str(current_location), str(patient_location))
-                if location_pair in distance_cache:
-                    distance = distance_cache[location_pair]
-                else:
-                    distance = get_distance(current_location, patient_location)
-                    distance_cache[location_pair] = distance
-                    
-                total_distance += distance
-                
-            # Factor in the benefit of keeping patients with the same dropoff together
-            # by giving a discount to the total distance
-            adjusted_distance = total_distance * 0.8  # 20% discount for shared dropoff
-                
-            # If this is the best phlebotomist so far, update
-            if adjusted_distance < min_total_distance:
-                min_total_distance = adjusted_distance
-                best_phleb_idx = phleb_idx
+        # Factor in the benefit of keeping patients with the same dropoff together
+        # by giving a discount to the total distance
+        adjusted_distances = total_distances * 0.8  # 20% discount for shared dropoff
+        
+        # Find the best phlebotomist for this group, skipping any whose workload would exceed the limit
+        best_phleb_pos = nearest_phleb(adjusted_distances, ~(phleb_workloads + group_workload > workload_cap))
         
         # If found a suitable phlebotomist, assign all patients in this group
-        if best_phleb_idx is not None:
-            phleb_id = available_phlebs.loc[best_phleb_idx, "PhlebotomistID.1"]
+        if best_phleb_pos is not None:
+            phleb_id = phleb_ids[best_phleb_pos]
             
             print(f"Assigned dropoff group {dropoff_key} to phlebotomist {phleb_id}")
             
             # Sort patients by scheduled time for this phlebotomist
-            group_patients.sort(key=lambda idx: filtered_patients.loc[idx, "ScheduledDtm"])
+            group_patients.sort(key=lambda idx: patient_scheduled[idx])
             
             # Update each patient in the group
             for i, patient_idx in enumerate(group_patients, start=1):
-                # Add to the phlebotomist's assigned patients in order
-                trip_order = len(available_phlebs.loc[best_phleb_idx, "assigned_patients"]) + i
-                
-                # Update the patient record
-                filtered_patients.at[patient_idx, "AssignedPhlebID"] = phleb_id
-                filtered_patients.at[patient_idx, "TripOrderInDay"] = trip_order
-                
-                # Add to processed set
+                trip_order = len(assigned_lists[best_phleb_pos]) + i
+                assign_patient(best_phleb_pos, patient_idx, trip_order)
                 processed_patients.add(patient_idx)
-                
-                # Add to phlebotomist's assigned patients list
-                available_phlebs.at[best_phleb_idx, "assigned_patients"].append(patient_idx)
-                
-                # Update phlebotomist workload
-                available_phlebs.at[best_phleb_idx, "current_workload"] += filtered_patients.loc[patient_idx, "WorkloadPoints"]
             
             # Update phlebotomist location to the last patient in the group
-            last_patient_idx = group_patients[-1]
-            last_patient_location = (
-                filtered_patients.loc[last_patient_idx, "PatientLatitude"],
-                filtered_patients.loc[last_patient_idx, "PatientLongitude"]
-            )
-            available_phlebs.at[best_phleb_idx, "current_location"] = last_patient_location
-            
-            # Update total distance (approximate)
-            available_phlebs.at[best_phleb_idx, "total_distance"] += min_total_distance
+            # and the total distance (approximate)
+            move_phleb(best_phleb_pos, group_patients[-1], adjusted_distances[best_phleb_pos])
     
     # Now process remaining patients (ungrouped or from small groups)
     remaining_patients = [idx for idx in filtered_patients.index if idx not in processed_patients]
@@ -440,162 +525,61 @@ def assign_patients_to_phlebotomists(patient_df, phleb_df, workload_df, target_d
     # Process remaining patients with dropoffs first, trying to assign to phlebotomists
     # who already handle that dropoff location if possible
     for patient_idx in remaining_with_dropoff:
-        dropoff_info = patient_dropoff_map[patient_idx]
-        dropoff_key = dropoff_info['key']
-        patient_location = (
-            filtered_patients.loc[patient_idx, "PatientLatitude"],
-            filtered_patients.loc[patient_idx, "PatientLongitude"]
-        )
-        patient_workload = filtered_patients.loc[patient_idx, "WorkloadPoints"]
-        
-        # Find phlebotomists who already handle this dropoff location
-        matching_phlebs = []
-        
-        for phleb_idx, phleb in available_phlebs.iterrows():
-            assigned_patients = phleb["assigned_patients"]
-            if any(idx in patient_dropoff_map and patient_dropoff_map[idx]['key'] == dropoff_key 
-                  for idx in assigned_patients):
-                matching_phlebs.append(phleb_idx)
-        
-        best_phleb_idx = None
-        min_distance = float('inf')
-        
-        # First try phlebotomists who already handle this dropoff
-        for phleb_idx in matching_phlebs:
-            phleb = available_phlebs.loc[phleb_idx]
-            current_location = phleb["current_location"]
-            current_workload = phleb["current_workload"]
-            
-            # Skip if workload would exceed limit
-            if current_workload + patient_workload > avg_workload_per_phleb * 4:
-                continue
-                
-            # Check cache for distance
-            location_pair = (str(current_location), str(patient_location))
-            if location_pair in distance_cache:
-                distance = distance_cache[location_pair]
-            else:
-                distance = get_distance(current_location, patient_location)
-                distance_cache[location_pair] = distance
-                
-            # Give preference to phlebotomists with this dropoff (20% discount)
-            adjusted_distance = distance * 0.8
-                
-            if adjusted_distance < min_distance:
-                min_distance = adjusted_distance
-                best_phleb_idx = phleb_idx
-        
-        # If no matching phlebotomist found, try any available phlebotomist
-        if best_phleb_idx is None:
-            for phleb_idx, phleb in available_phlebs.iterrows():
-                current_location = phleb["current_location"]
-                current_workload = phleb["current_workload"]
-                
-                # Skip if workload would exceed limit
-                if current_workload + patient_workload > avg_workload_per_phleb * 4:
-                    continue
-                    
-                # Check cache for distance
-                location_pair = (str(current_location), str(patient_location))
-                if location_pair in distance_cache:
-                    distance = distance_cache[location_pair]
-                else:
-                    distance = get_distance(current_location, patient_location)
-                    distance_cache[location_pair] = distance
-                    
-                if distance < min_distance:
-                    min_distance = distance
-                    best_phleb_idx = phleb_idx
+        dropoff_key = patient_dropoff_map[patient_idx]['key']
+        distances = location_distances[phleb_location_rows, patient_rows[patient_idx]]
+        has_capacity = ~(phleb_workloads + patient_workloads[patient_idx] > workload_cap)
+        
+        # First try phlebotomists who already handle this dropoff (20% discount)
+        handles_dropoff = np.array([dropoff_key in keys for keys in phleb_dropoff_keys], dtype=bool)
+        adjusted_distances = distances * 0.8
+        best_phleb_pos = nearest_phleb(adjusted_distances, handles_dropoff & has_capacity)
+        if best_phleb_pos is not None:
+            min_distance = adjusted_distances[best_phleb_pos]
+        else:
+            # If no matching phlebotomist found, try any available phlebotomist
+            best_phleb_pos = nearest_phleb(distances, has_capacity)
+            if best_phleb_pos is not None:
+                min_distance = distances[best_phleb_pos]
         
         # If still no phlebotomist has capacity, assign to the one with the least workload
-        if best_phleb_idx is None:
-            best_phleb_idx = available_phlebs["current_workload"].idxmin()
-            
-            # Get the distance
-            pheb_location = available_phlebs.loc[best_phleb_idx, "current_location"]
-            location_pair = (str(pheb_location), str(patient_location))
-            
-            if location_pair in distance_cache:
-                min_distance = distance_cache[location_pair]
-            else:
-                min_distance = get_distance(pheb_location, patient_location)
-                distance_cache[location_pair] = min_distance
-        
-        # Assign the patient to the selected phlebotomist
-        phleb_id = available_phlebs.loc[best_phleb_idx, "PhlebotomistID.1"]
+        if best_phleb_pos is None:
+            best_phleb_pos = int(np.argmin(phleb_workloads))
+            min_distance = distances[best_phleb_pos]
         
-        # Update the patient with the assigned phlebotomist
-        filtered_patients.at[patient_idx, "AssignedPhlebID"] = phleb_id
-        filtered_patients.at[patient_idx, "TripOrderInDay"] = len(available_phlebs.loc[best_phleb_idx, "assigned_patients"]) + 1
-        
-        # Update the phlebotomist's workload and location
-        available_phlebs.at[best_phleb_idx, "current_workload"] += patient_workload
-        available_phlebs.at[best_phleb_idx, "total_distance"] += min_distance
-        available_phlebs.at[best_phleb_idx, "current_location"] = patient_location
-        available_phlebs.at[best_phleb_idx, "assigned_patients"].append(patient_idx)
+        # Assign the patient to the selected phlebotomist and move them there
+        assign_patient(best_phleb_pos, patient_idx, len(assigned_lists[best_phleb_pos]) + 1)
+        move_phleb(best_phleb_pos, patient_idx, min_distance)
         
         # Mark as processed
         processed_patients.add(patient_idx)
     
     # Finally, process remaining patients without dropoff locations (original approach)
     for patient_idx in remaining_without_dropoff:
-        patient_location = (
-            filtered_patients.loc[patient_idx, "PatientLatitude"],
-            filtered_patients.loc[patient_idx, "PatientLongitude"]
-        )
-        patient_workload = filtered_patients.loc[patient_idx, "WorkloadPoints"]
-        
-        # Track best phlebotomist assignment
-        best_phleb_idx = None
-        min_distance = float('inf')
+        distances = location_distances[phleb_location_rows, patient_rows[patient_idx]]
+        has_capacity = ~(phleb_workloads + patient_workloads[patient_idx] > workload_cap)
         
         # Find the nearest phlebotomist with capacity
-        for phleb_idx, phleb in available_phlebs.iterrows():
-            current_location = phleb["current_location"]
-            current_workload = phleb["current_workload"]
-            
-            # Skip if workload would exceed limit
-            if current_workload + patient_workload > avg_workload_per_phleb * 4:
-                continue
-                
-            # Check cache for distance
-            location_pair = (str(current_location), str(patient_location))
-            if location_pair in distance_cache:
-                distance = distance_cache[location_pair]
-            else:
-                distance = get_distance(current_location, patient_location)
-                distance_cache[location_pair] = distance
-                
-            if distance < min_distance:
-                min_distance = distance
-                best_phleb_idx = phleb_idx
+        best_phleb_pos = nearest_phleb(distances, has_capacity)
         
         # If no phlebotomist has capacity, assign to the one with the least workload
-        if best_phleb_idx is None:
-            best_phleb_idx = available_phlebs["current_workload"].idxmin()
-            
-            # Get the distance
-            pheb_location = available_phlebs.loc[best_phleb_idx, "current_location"]
-            location_pair = (str(pheb_location), str(patient_location))
-            
-            if location_pair in distance_cache:
-                min_distance = distance_cache[location_pair]
-            else:
-                min_distance = get_distance(pheb_location, patient_location)
-                distance_cache[location_pair] = min_distance
-        
-        # Assign the patient to the selected phlebotomist
-        phleb_id = available_phlebs.loc[best_phleb_idx, "PhlebotomistID.1"]
-        
-        # Update the patient with the assigned phlebotomist
-        filtered_patients.at[patient_idx, "AssignedPhlebID"] = phleb_id
-        filtered_patients.at[patient_idx, "TripOrderInDay"] = len(available_phlebs.loc[best_phleb_idx, "assigned_patients"]) + 1
+        if best_phleb_pos is None:
+            best_phleb_pos = int(np.argmin(phleb_workloads))
+        min_distance = distances[best_phleb_pos]
         
-        # Update the phlebotomist's workload and location
-        available_phlebs.at[best_phleb_idx, "current_workload"] += patient_workload
-        available_phlebs.at[best_phleb_idx, "total_distance"] += min_distance
-        available_phlebs.at[best_phleb_idx, "current_location"] = patient_location
-        available_phlebs.at[best_phleb_idx, "assigned_patients"].append(patient_idx)
+        # Assign the patient to the selected phlebotomist and move them there
+        assign_patient(best_phleb_pos, patient_idx, len(assigned_lists[best_phleb_pos]) + 1)
+        move_phleb(best_phleb_pos, patient_idx, min_distance)
+    
+    # Write the engine state back to the DataFrames in one pass
+    filtered_patients["AssignedPhlebID"] = pd.Series(
+        [assigned_phleb_ids.get(idx) for idx in filtered_patients.index], index=filtered_patients.index, dtype=object
+    )
+    filtered_patients["TripOrderInDay"] = pd.Series(
+        [trip_orders.get(idx) for idx in filtered_patients.index], index=filtered_patients.index, dtype=object
+    )
+    available_phlebs["current_workload"] = phleb_workloads
+    available_phlebs["total_distance"] = phleb_distances
+    available_phlebs["current_location"] = current_locations
     
     # Filter to only phlebotomists with assigned patients
     available_phlebs = available_phlebs[available_phlebs['assigned_patients'].map(lambda x: len(x) > 0)]
@@ -614,12 +598,13 @@ def parse_coordinates(coord_str):
 
 
 def process_city_assignments(patient_df, phleb_df, workload_df, target_date, target_city, 
-                        api_key=None, use_scheduled_time=True, redis_host='localhost', redis_port=6379):
+                        api_key=None, use_scheduled_time=True, redis_host='localhost', redis_port=6379,
+                        assignment_mode="greedy", progress_callback=None, profile=None, route_workers=None):
     """
     Main function to process patient assignments for a city and date.
 
     Args:
-        patient_df: DataFrame with patient orders
+        patient_df: DataFrame or TripStore with patient orders
         phleb_df: DataFrame with phlebotomist information
         workload_df: DataFrame with city workload information
         target_date: Date to analyze
@@ -628,21 +613,77 @@ def process_city_assignments(patient_df, phleb_df, workload_df, target_date, tar
         use_scheduled_time: Whether to use scheduled time for routing (True) or optimize by proximity (False)
         redis_host: Redis host (default: localhost)
         redis_port: Redis port (default: 6379)
+        assignment_mode: "greedy" (default), "optimal" min-cost assignment, or "vrptw"
+            time-window routing. The vrptw mode has no shift start: each phlebotomist is
+            assumed to leave home in time to reach their first patient as its window opens,
+            so only the legs between patients are checked against the windows. In optimal
+            mode the greedy baseline is also run for the report: the mileage comparison is
+            printed and stored in assigned_phlebs.attrs["assignment_report"]
+        progress_callback: Optional callable(fraction, message) told as each stage starts,
+            e.g. by a background job reporting progress to the UI
+        profile: Write a per-run profile to profiles/: True or "spans" for stage timings and
+            counters as JSON, "cprofile" or "pyinstrument" to also write a call profile.
+            None (default) follows the ASSIGNMENT_PROFILE environment variable
+        route_workers: Optimize phlebotomist routes in a pool of this many processes
+            (default: serial); results are the same either way
 
     Returns:
         Tuple of (map, assigned_phlebs_df, assigned_patients_df)
     """
+    if assignment_mode not in ("greedy", "optimal", "vrptw"):
+        raise ValueError(f"Unknown assignment_mode: {assignment_mode}")
+
+    meta = {
+        "date": str(target_date),
+        "city": target_city,
+        "use_scheduled_time": use_scheduled_time,
+        "assignment_mode": assignment_mode,
+        "ors": bool(api_key),
+        "route_workers": route_workers,
+    }
+    with profile_run("process_city_assignments", meta, mode=profile, stats_sources=_profile_stats_sources()):
+        return _process_city_assignments(patient_df, phleb_df, workload_df, target_date, target_city,
+                                         api_key, use_scheduled_time, redis_host, redis_port,
+                                         assignment_mode, progress_callback, route_workers)
+
+
+def _profile_stats_sources():
+    """Process-wide statistics whose change over a run is recorded as profile counters."""
+    from geocode_cache import get_geocode_cache
+    from routing_client import routing_stats
+
+    return {
+        "route_cache": lambda: get_route_cache().stats,
+        "geocode_cache": lambda: get_geocode_cache().stats,
+        "ors_directions": routing_stats,
+    }
+
+
+def _process_city_assignments(patient_df, phleb_df, workload_df, target_date, target_city,
+                              api_key, use_scheduled_time, redis_host, redis_port,
+                              assignment_mode, progress_callback, route_workers):
+    """Body of process_city_assignments, run inside its profile."""
+    def report_progress(fraction, message):
+        if progress_callback is not None:
+            progress_callback(fraction, message)
+
+    report_progress(0.0, "Connecting to Redis and OpenRouteService")
+
     # Initialize Redis connection if possible
-    try:
-        from redis_utils import initialize_redis, initialize_ors_client
-        redis_conn = initialize_redis(host=redis_host, port=redis_port)
+    with span("connect_redis"):
+        try:
+            from redis_utils import initialize_redis, initialize_ors_client
+            redis_conn = initialize_redis(host=redis_host, port=redis_port)
 
-        # Test Redis connection
-        redis_conn.ping()
-        print("Successfully connected to Redis")
-    except Exception as e:
-        print(f"Warning: Redis connection failed - {e}. Using fallback method.")
-        redis_conn = None
+            # Test Redis connection
+            redis_conn.ping()
+            print("Successfully connected to Redis")
+
+            # Share fetched routes and road distances with every other app instance on this Redis
+            attach_shared_route_cache(redis_conn)
+        except Exception as e:
+            print(f"Warning: Redis connection failed - {e}. Using fallback method.")
+            redis_conn = None
 
     # Initialize ORS client if API key is provided
     ors_client = None
@@ -654,11 +695,41 @@ def process_city_assignments(patient_df, phleb_df, workload_df, target_date, tar
         except Exception as e:
             print(f"Warning: OpenRouteService initialization failed - {e}. Using fallback method.")
 
+        # Prefetch road distances between every location in this run with batched matrix
+        # requests; the assignment then scores candidates in road miles
+        report_progress(0.1, "Prefetching road distances")
+        try:
+            from prefetch_utils import collect_run_coordinates, prefetch_route_distances
+            run_locations = collect_run_coordinates(patient_df, phleb_df, target_date, target_city)
+            prefetch_stats = prefetch_route_distances(run_locations, api_key, use_scheduled_time=use_scheduled_time)
+            road_distances = prefetch_stats["pairs_fetched"] + prefetch_stats["pairs_cached"] > 0
+        except Exception as e:
+            print(f"Warning: Route distance prefetch failed - {e}. Assigning by straight-line distance.")
+            road_distances = False
+    else:
+        road_distances = False
+
     # Step 1: Assign patients to phlebotomists
+    report_progress(0.3, "Assigning patients to phlebotomists")
     assigned_phlebs, assigned_patients = assign_patients_to_phlebotomists(
         patient_df, phleb_df, workload_df, target_date, target_city, 
-        api_key=api_key, redis_conn=redis_conn
+        api_key=api_key, redis_conn=redis_conn, assignment_mode=assignment_mode,
+        road_distances=road_distances, use_scheduled_time=use_scheduled_time
     )
+    
+    # Score the optimal assignment against the greedy baseline on the same mileage metric
+    assignment_report = None
+    if assignment_mode == "optimal" and not assigned_patients.empty:
+        greedy_phlebs, greedy_patients = assign_patients_to_phlebotomists(
+            patient_df, phleb_df, workload_df, target_date, target_city, 
+            api_key=api_key, redis_conn=redis_conn, assignment_mode="greedy",
+            road_distances=road_distances, use_scheduled_time=use_scheduled_time
+        )
+        assignment_report = compare_assignment_miles(
+            (greedy_phlebs, greedy_patients), (assigned_phlebs, assigned_patients)
+        )
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 📏 Fleet miles - greedy: {assignment_report['greedy_miles']}, "
+              f"optimal: {assignment_report['optimal_miles']} ({assignment_report['percent_saved']}% saved)")
     print("="*30)
     print("Assigned Phlebs:")
     print(assigned_phlebs)
@@ -667,26 +738,31 @@ def process_city_assignments(patient_df, phleb_df, workload_df, target_date, tar
         return None, pd.DataFrame(), pd.DataFrame()
 
     # Step 2: Optimize routes based on the selected approach
+    report_progress(0.5, "Optimizing routes")
     optimized_patients = optimize_routes(
         assigned_phlebs, 
         assigned_patients, 
         use_scheduled_time=use_scheduled_time,
-        ors_client=ors_client
+        ors_client=ors_client,
+        max_workers=route_workers
     )
     
     print("Optimized Patients : ")
     print(optimized_patients)
 
-    # Step 3: Re-order the trip order based on preferred time
-    for phleb_id in optimized_patients["AssignedPhlebID"].unique():
-        phleb_patients = optimized_patients[optimized_patients["AssignedPhlebID"] == phleb_id].copy()
-        # Sort by PreferredTime
-        phleb_patients = phleb_patients.sort_values("PreferredTime")
-        # Reassign TripOrderInDay based on PreferredTime order
-        for trip_order, patient_idx in enumerate(phleb_patients.index, 1):
-            optimized_patients.at[patient_idx, "TripOrderInDay"] = trip_order
+    # Step 3: Re-order the trip order based on preferred time. Proximity routes keep
+    # the visiting order from optimize_routes, since PreferredTime is still the scheduled time.
+    if use_scheduled_time:
+        for phleb_id in optimized_patients["AssignedPhlebID"].unique():
+            phleb_patients = optimized_patients[optimized_patients["AssignedPhlebID"] == phleb_id].copy()
+            # Sort by PreferredTime
+            phleb_patients = phleb_patients.sort_values("PreferredTime")
+            # Reassign TripOrderInDay based on PreferredTime order
+            for trip_order, patient_idx in enumerate(phleb_patients.index, 1):
+                optimized_patients.at[patient_idx, "TripOrderInDay"] = trip_order
 
     # Step 4: Create the assignment map with OpenRouteService for routing if available
+    report_progress(0.75, "Routing legs and building the map")
     assignment_map, route_distances = create_assignment_map(
         assigned_phlebs, optimized_patients, target_date, target_city, 
         api_key=api_key, return_distances=True, use_scheduled_time=use_scheduled_time,
@@ -700,10 +776,17 @@ def process_city_assignments(patient_df, phleb_df, workload_df, target_date, tar
         if phleb_indices:
             assigned_phlebs.at[phleb_indices[0], "total_distance"] = distance
 
+    route_stats = get_route_cache().stats
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🧮 Route cache: {route_stats['hits']} local hits, "
+          f"{route_stats['shared_hits']} shared hits, {route_stats['misses']} misses")
+
     # Reset indices for return
     assigned_phlebs = assigned_phlebs.reset_index()
     optimized_patients = optimized_patients.reset_index()
+    if assignment_report is not None:
+        assigned_phlebs.attrs["assignment_report"] = assignment_report
 
+    report_progress(1.0, "Done")
     return assignment_map, assigned_phlebs, optimized_patients
 
 
@@ -1138,7 +1221,300 @@ def process_city_assignments(patient_df, phleb_df, workload_df, target_date, tar
 #     return updated_patients
 
 
-def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True, ors_client=None):
+@traced()
+def _optimize_phleb_route(phleb_id, phleb_name, phleb_location, phleb_patients, dropoffs_df,
+                          use_scheduled_time=True, route_max_moves=ROUTE_IMPROVEMENT_MAX_MOVES,
+                          dropoff_positions=None):
+    """
+    Optimize one phlebotomist's route. Used by optimize_routes, serially or in a worker process.
+
+    Routes are independent, so this works on the phlebotomist's own patients only. Each
+    cell update is applied to a local copy and also recorded, in order, so the caller
+    can replay the updates onto the full patient DataFrame.
+
+    Args:
+        phleb_id: Phlebotomist ID
+        phleb_name: Phlebotomist name used in log messages
+        phleb_location: (latitude, longitude) of the phlebotomist's base
+        phleb_patients: DataFrame of the patients assigned to this phlebotomist
+        dropoffs_df: DataFrame of dropoff locations
+        use_scheduled_time: Whether to sort by scheduled time or use nearest neighbor
+        route_max_moves: Most 2-opt / Or-opt moves applied to the route in proximity mode
+        dropoff_positions: Nearest dropoff row per patient from DropoffIndex.nearest, aligned
+            with phleb_patients (-1 for none); looked up here when not given
+
+    Returns:
+        Tuple of (updates, improvement): a list of (index, column, value) cell updates and
+        the route improvement summary (None in scheduled-time mode)
+    """
+    from collections import defaultdict
+
+    route_patients = phleb_patients.copy()
+    updates = []
+    improvement = None
+
+    def set_value(index, column, value):
+        route_patients.at[index, column] = value
+        updates.append((index, column, value))
+
+
+    # Process dropoff locations using LabID from DropOffLocation field
+    dropoff_dict = {}  # Map LabID to dropoff info
+    patient_to_dropoff = {}  # Map patient index to LabID
+    clinic_to_dropoffs = defaultdict(list)  # Map clinic name to list of dropoff IDs
+    
+    # Nearest dropoff per patient (clinic -> state -> city -> zip), resolved in one batch
+    if dropoff_positions is None:
+        dropoff_positions, _ = get_dropoff_index(dropoffs_df).nearest(phleb_patients, ROUTE_DROPOFF_LEVELS)
+    
+    # First, map patients to dropoff locations using DropOffLocation field
+    for (pat_idx, patient), dropoff_pos in zip(phleb_patients.iterrows(), dropoff_positions):
+        if 'DropOffLocation' in patient and pd.notna(patient['DropOffLocation']):
+            clinic_name = patient['DropOffLocation']
+            if dropoff_pos >= 0:
+                dropoff = dropoffs_df.iloc[dropoff_pos]
+                
+                # Get key fields
+                lab_id = dropoff['LabID']
+                lat = dropoff['Latitude']
+                lon = dropoff['Longitude']
+                
+                # Store in dropoff dict if not already there
+                if lab_id not in dropoff_dict:
+                    dropoff_dict[lab_id] = {
+                        'location': (lat, lon),
+                        'lab_id': lab_id,
+                        'clinic_name': dropoff['Clinic'],
+                        'address': dropoff['Address'],
+                        'city': dropoff.get('City', ''),
+                        'state': dropoff.get('State', ''),
+                        'zipcode': dropoff.get('Zipcode', ''),
+                        'patients': []
+                    }
+                    # Add to clinic-to-dropoffs mapping
+                    clinic_to_dropoffs[dropoff['Clinic']].append(lab_id)
+                
+                # Map this patient to this dropoff
+                dropoff_dict[lab_id]['patients'].append(pat_idx)
+                patient_to_dropoff[pat_idx] = lab_id
+                
+                # Update patient record with dropoff information
+                set_value(pat_idx, 'DropOffClinicLoc', f"{lat},{lon}")
+                set_value(pat_idx, 'DropOffLabID', lab_id)
+                set_value(pat_idx, 'DropOffClinicName', dropoff['Clinic'])
+                
+                # Print diagnostic info
+                patient_id = patient.get('PatientSysID', pat_idx)
+                print(f"Patient {patient_id} mapped to dropoff {lab_id}_{dropoff['Clinic']}")
+            else:
+                print(f"Warning: No matching dropoff found for patient {pat_idx} with clinic {clinic_name}")
+    
+    # Log dropoff locations found
+    print(f"Found {len(dropoff_dict)} unique dropoff locations")
+    for lab_id, info in dropoff_dict.items():
+        patient_ids = [str(idx) for idx in info['patients']]
+        print(f"  - Dropoff {info['clinic_name']} (LabID: {lab_id}): Patients {', '.join(patient_ids)}")
+        print(f"    Location: {info['location'][0]}, {info['location'][1]}")
+        if 'city' in info and 'state' in info:
+            print(f"    Address: {info.get('address', 'Unknown')}, {info.get('city', '')}, {info.get('state', '')} {info.get('zipcode', '')}")
+
+    # Sort patients by scheduled time or optimize by proximity
+    if use_scheduled_time:
+        # Sort by scheduled time (or the planned start from time-window routing), then assign trip order
+        time_column = "ScheduledDtm"
+        if "PlannedDtm" in phleb_patients.columns and phleb_patients["PlannedDtm"].notna().all():
+            time_column = "PlannedDtm"
+        sorted_patients = phleb_patients.sort_values(time_column)
+        for trip_order, (idx, _) in enumerate(sorted_patients.iterrows(), 1):
+            set_value(idx, "TripOrderInDay", trip_order)
+            set_value(idx, "PreferredTime", sorted_patients.at[idx, time_column])
+    else:
+        # Use nearest neighbor algorithm over a precomputed distance matrix
+        # (position 0 is the phlebotomist base, positions 1..n are the patients)
+        patient_indices = list(phleb_patients.index)
+        route_matrix = distance_matrix(
+            [phleb_location] +
+            list(zip(phleb_patients["PatientLatitude"], phleb_patients["PatientLongitude"]))
+        )
+        current_pos = 0
+        unvisited = list(range(1, len(patient_indices) + 1))
+        trip_order = 1
+        
+        while unvisited:
+            # Find closest patient
+            next_pos = min(unvisited, key=lambda pos: route_matrix[current_pos, pos])
+            
+            # Assign order
+            set_value(patient_indices[next_pos - 1], "TripOrderInDay", trip_order)
+            trip_order += 1
+            
+            # Update location and remove from unvisited
+            current_pos = next_pos
+            unvisited.remove(next_pos)
+    
+    # CRITICAL CHANGE: Now add dropoffs after all patients
+    # First, consolidate dropoffs for the same clinic if applicable
+    consolidated_dropoffs = {}  # Will store the best dropoff for each clinic
+    
+    # Go through all clinics with multiple dropoffs
+    for clinic_name, lab_ids in clinic_to_dropoffs.items():
+        if len(lab_ids) > 1:
+            print(f"DROPOFF CONSOLIDATION: Found {len(lab_ids)} dropoffs for clinic '{clinic_name}'")
+            print(f"  Options: {', '.join(lab_ids)}")
+            
+            # Calculate the last patient location (after all patients are visited)
+            last_patient_idx = route_patients["TripOrderInDay"].idxmax()
+            if pd.isna(last_patient_idx):
+                # If no valid TripOrderInDay, use phlebotomist location as reference
+                last_location = phleb_location
+            else:
+                last_location = (
+                    phleb_patients.at[last_patient_idx, "PatientLatitude"],
+                    phleb_patients.at[last_patient_idx, "PatientLongitude"]
+                )
+            
+            # Find the best (closest) dropoff location for this clinic
+            best_lab_id = None
+            min_distance = float('inf')
+            distances = {}
+            
+            # Calculate all distances first for comparison
+            for lab_id in lab_ids:
+                dropoff_location = dropoff_dict[lab_id]['location']
+                distance = point_distance(last_location, dropoff_location)
+                distances[lab_id] = distance
+                if distance < min_distance:
+                    min_distance = distance
+                    best_lab_id = lab_id
+            
+            # Log the calculations
+            print(f"  Calculating distances from last patient location {last_location}:")
+            for lab_id, distance in distances.items():
+                print(f"    - {lab_id}: {distance:.2f} miles {' (SELECTED as closest)' if lab_id == best_lab_id else ''}")
+            
+            # Now we have the best dropoff for this clinic
+            consolidated_dropoffs[clinic_name] = best_lab_id
+            
+            # Reassign all patients to this best dropoff
+            all_patients_for_clinic = []
+            for lab_id in lab_ids:
+                if lab_id != best_lab_id:  # Skip the best one as it's already correctly assigned
+                    # Move patients from other dropoffs to the best one
+                    patients_to_move = dropoff_dict[lab_id]['patients']
+                    for pat_idx in patients_to_move:
+                        print(f"  Reassigning patient {pat_idx} from dropoff {lab_id} to {best_lab_id}")
+                        
+                        # Update patient's dropoff information
+                        best_dropoff = dropoff_dict[best_lab_id]
+                        set_value(pat_idx, 'DropOffClinicLoc', f"{best_dropoff['location'][0]},{best_dropoff['location'][1]}")
+                        set_value(pat_idx, 'DropOffLabID', best_lab_id)
+                        
+                        # Add to the best dropoff's patient list
+                        dropoff_dict[best_lab_id]['patients'].append(pat_idx)
+                        
+                        # Update patient_to_dropoff mapping
+                        patient_to_dropoff[pat_idx] = best_lab_id
+                        
+                        all_patients_for_clinic.append(pat_idx)
+                    
+                    # Remove patients from original dropoff
+                    dropoff_dict[lab_id]['patients'] = []
+                else:
+                    # Add patients from best dropoff to the list
+                    all_patients_for_clinic.extend(dropoff_dict[lab_id]['patients'])
+            
+            print(f"  CONSOLIDATED: All {len(all_patients_for_clinic)} patients for {clinic_name} will use dropoff {best_lab_id}")
+        
+        else:
+            # Only one dropoff for this clinic, no consolidation needed
+            consolidated_dropoffs[clinic_name] = lab_ids[0]
+    
+    # Remove empty dropoffs after consolidation
+    dropoff_dict = {lab_id: info for lab_id, info in dropoff_dict.items() if info['patients']}
+    
+    # Now assign dropoff sequences after consolidation
+    drop_sequence = max(route_patients["TripOrderInDay"].max() + 1, 1)
+    
+    # Handle each unique dropoff location
+    for lab_id, dropoff_info in dropoff_dict.items():
+        # Assign the same sequence number to all patients that share this dropoff
+        for patient_idx in dropoff_info['patients']:
+            set_value(patient_idx, 'DropOffSequence', drop_sequence)
+        
+        print(f"Assigned dropoff sequence {drop_sequence} to {len(dropoff_info['patients'])} patients for {dropoff_info['clinic_name']} (LabID: {lab_id})")
+        drop_sequence += 1
+    
+    # Proximity mode: improve the nearest-neighbour tour with 2-opt / Or-opt.
+    # Dropoffs join the tour as stops that may sit anywhere after their patients.
+    if not use_scheduled_time:
+        patient_order = sorted(phleb_patients.index, key=lambda i: route_patients.at[i, "TripOrderInDay"])
+        lab_ids = list(dropoff_dict)
+        stop_of_patient = {pat_idx: stop for stop, pat_idx in enumerate(patient_order, 1)}
+        stop_locations = (
+            [phleb_location] +
+            [(phleb_patients.at[i, "PatientLatitude"], phleb_patients.at[i, "PatientLongitude"]) for i in patient_order] +
+            [dropoff_dict[lab_id]['location'] for lab_id in lab_ids]
+        )
+        precedence = {
+            len(patient_order) + 1 + pos: [stop_of_patient[i] for i in dropoff_dict[lab_id]['patients']]
+            for pos, lab_id in enumerate(lab_ids)
+        }
+        route, initial_miles, improved_miles = improve_route(
+            distance_matrix(stop_locations), range(len(stop_locations)),
+            precedence=precedence, max_moves=route_max_moves
+        )
+        
+        # Patients are numbered in visiting order. Each dropoff records how many patients
+        # precede it: the map draws a dropoff at DropOffSequence + 0.5, so dropoffs after
+        # patient k get sequences in (k - 0.5, k + 0.5) and trailing ones keep n+1, n+2, ...
+        patients_visited = 0
+        dropoffs_after = defaultdict(list)
+        for stop in route[1:]:
+            if stop <= len(patient_order):
+                patients_visited += 1
+                set_value(patient_order[stop - 1], "TripOrderInDay", patients_visited)
+            else:
+                dropoffs_after[patients_visited].append(lab_ids[stop - len(patient_order) - 1])
+        for visited, stop_lab_ids in dropoffs_after.items():
+            for pos, lab_id in enumerate(stop_lab_ids):
+                if visited == len(patient_order):
+                    sequence = visited + 1 + pos
+                else:
+                    sequence = visited - 0.5 + (pos + 1) / (len(stop_lab_ids) + 1)
+                for patient_idx in dropoff_dict[lab_id]['patients']:
+                    set_value(patient_idx, 'DropOffSequence', sequence)
+        
+        improvement = {
+            "initial_miles": round(initial_miles, 2),
+            "improved_miles": round(improved_miles, 2),
+            "percent_saved": percent_saved(initial_miles, improved_miles),
+        }
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔀 Route for {phleb_name}: {initial_miles:.2f} -> "
+              f"{improved_miles:.2f} miles ({improvement['percent_saved']}% saved)")
+
+    return updates, improvement
+
+
+_route_worker_dropoffs = None
+
+
+def _init_route_worker(dropoffs_df):
+    """Process pool initializer: receive the dropoff table once per worker instead of once per route."""
+    global _route_worker_dropoffs
+    _route_worker_dropoffs = dropoffs_df
+
+
+def _optimize_phleb_route_task(args):
+    """Process pool task: optimize one route using the worker's dropoff table."""
+    phleb_id, phleb_name, phleb_location, phleb_patients, use_scheduled_time, route_max_moves, dropoff_positions = args
+    return _optimize_phleb_route(phleb_id, phleb_name, phleb_location, phleb_patients, _route_worker_dropoffs,
+                                 use_scheduled_time, route_max_moves, dropoff_positions)
+
+
+
+@traced()
+def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True, ors_client=None,
+                    route_max_moves=ROUTE_IMPROVEMENT_MAX_MOVES, max_workers=None):
     """
     Optimize routes for each phlebotomist using either scheduled time or nearest neighbor algorithm,
     with improved patient clustering and smarter specimen drop-off logic.
@@ -1151,18 +1527,22 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
         assigned_patients (pd.DataFrame): DataFrame with assigned patients
         use_scheduled_time (bool): Whether to sort by scheduled time or use nearest neighbor
         ors_client: OpenRouteService client (optional)
+        route_max_moves (int): Most 2-opt / Or-opt moves applied per route in proximity mode
+        max_workers (int): Optimize routes in a pool of this many processes (default: serial)
 
     Returns:
-        pd.DataFrame: Updated patient DataFrame with optimized route information
+        pd.DataFrame: Updated patient DataFrame with optimized route information. In proximity
+            mode, attrs["route_improvement"] maps each phlebotomist to their route miles before
+            and after improvement
     """
     import pandas as pd
     from datetime import timedelta, datetime
     import numpy as np
     from collections import defaultdict
-    from geopy.distance import geodesic
 
     # Create a copy of the patients DataFrame to modify
     updated_patients = assigned_patients.copy()
+    route_improvement = {}
 
     # Initialize dropoff information columns if they don't exist
     if 'DropOffSequence' not in updated_patients.columns:
@@ -1170,7 +1550,7 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
 
     # Load dropoff locations from CSV
     try:
-        dropoffs_df = pd.read_csv("All_Dropoffs.csv")
+        dropoffs_df = load_dropoffs()
         print(f"Loaded dropoffs data: {len(dropoffs_df)} locations")
         
         # Print a sample to verify structure
@@ -1190,9 +1570,9 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
         return max(5, int(workload_points * 10))  # Example: 10 mins per point
 
     def calculate_distance(point1, point2, ors=None, use_ors=False):
-        """Calculate distance between two points using ORS or geodesic."""
+        """Calculate distance between two points using ORS or haversine."""
         if not use_ors:
-            return geodesic(point1, point2).miles
+            return point_distance(point1, point2)
         
         # Try ORS if use_ors is True
         if ors is not None:
@@ -1219,8 +1599,8 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
             except Exception as e:
                 print(f"Error calculating ORS distance: {e}, falling back to geodesic")
         
-        # Fallback to geodesic distance
-        return geodesic(point1, point2).miles
+        # Fallback to straight-line distance
+        return point_distance(point1, point2)
 
     # Debug patient data
     print("*" * 50)
@@ -1231,254 +1611,57 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
         print("DropOffLocation values:", updated_patients['DropOffLocation'].unique())
     print("*" * 50)
 
-    # Process each phlebotomist
+    # Partition patients by phlebotomist once; each route only needs its own rows and these columns
+    route_columns = [column for column in ROUTE_COLUMNS if column in updated_patients.columns]
+    patients_by_phleb = {
+        phleb_id: phleb_patients[route_columns]
+        for phleb_id, phleb_patients in updated_patients.groupby("AssignedPhlebID", sort=False)
+    }
+    
+    # Resolve every patient's nearest dropoff in one batch and hand each route its share
+    dropoff_positions = get_dropoff_index(dropoffs_df).nearest(updated_patients, ROUTE_DROPOFF_LEVELS)[0]
+    dropoffs_by_phleb = {
+        phleb_id: dropoff_positions[rows]
+        for phleb_id, rows in updated_patients.groupby("AssignedPhlebID", sort=False).indices.items()
+    }
+    route_tasks = []
     for idx, phleb in assigned_phlebs.iterrows():
         phleb_id = phleb["PhlebotomistID.1"]
         phleb_name = phleb.get('PhlebotomistName', f'Phlebotomist {phleb_id}')
         phleb_location = (phleb["PhlebotomistLatitude"], phleb["PhlebotomistLongitude"])
-        phleb_patients = updated_patients[updated_patients["AssignedPhlebID"] == phleb_id].copy()
+        phleb_patients = patients_by_phleb.get(phleb_id)
         
-        print(f"Processing routes for {phleb_name} with {len(phleb_patients)} patients")
+        print(f"Processing routes for {phleb_name} with {0 if phleb_patients is None else len(phleb_patients)} patients")
         
-        if phleb_patients.empty:
+        if phleb_patients is None or phleb_patients.empty:
             continue
+        route_tasks.append((phleb_id, phleb_name, phleb_location, phleb_patients, use_scheduled_time, route_max_moves,
+                            dropoffs_by_phleb[phleb_id]))
+    
+    # Optimize routes serially or across a process pool. Results come back in roster
+    # order either way, and their cell updates are replayed in that order.
+    if max_workers and max_workers > 1 and len(route_tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        not_covered("optimize_routes/improve_route",
+                    f"ran in {min(max_workers, len(route_tasks))} route worker processes; "
+                    "only the optimize_routes total is timed")
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(route_tasks)),
+                                 initializer=_init_route_worker, initargs=(dropoffs_df,)) as executor:
+            route_results = list(executor.map(_optimize_phleb_route_task, route_tasks))
+    else:
+        route_results = [
+            _optimize_phleb_route(phleb_id, phleb_name, phleb_location, phleb_patients, dropoffs_df,
+                                  task_use_scheduled_time, task_max_moves, task_dropoff_positions)
+            for (phleb_id, phleb_name, phleb_location, phleb_patients, task_use_scheduled_time, task_max_moves,
+                 task_dropoff_positions) in route_tasks
+        ]
+    
+    for task, (updates, improvement) in zip(route_tasks, route_results):
+        for index, column, value in updates:
+            updated_patients.at[index, column] = value
+        if improvement is not None:
+            route_improvement[task[0]] = improvement
 
-        # Process dropoff locations using LabID from DropOffLocation field
-        dropoff_dict = {}  # Map LabID to dropoff info
-        patient_to_dropoff = {}  # Map patient index to LabID
-        clinic_to_dropoffs = defaultdict(list)  # Map clinic name to list of dropoff IDs
-        
-        # First, map patients to dropoff locations using DropOffLocation field
-        for pat_idx, patient in phleb_patients.iterrows():
-            if 'DropOffLocation' in patient and pd.notna(patient['DropOffLocation']):
-                # Get patient location
-                patient_location = (patient["PatientLatitude"], patient["PatientLongitude"])
-                
-                # Find matching dropoff in dropoffs_df
-                clinic_name = patient['DropOffLocation']
-                matching_dropoffs = dropoffs_df[dropoffs_df['Clinic'].str.lower() == clinic_name.lower()]
-                
-                # Further filter by state if available
-                if 'PatientState' in patient and pd.notna(patient['PatientState']) and not matching_dropoffs.empty:
-                    state_dropoffs = matching_dropoffs[matching_dropoffs['State'] == patient['PatientState']]
-                    if not state_dropoffs.empty:
-                        matching_dropoffs = state_dropoffs
-                
-                # Further filter by city if available
-                if 'City' in patient and pd.notna(patient['City']) and not matching_dropoffs.empty:
-                    city_dropoffs = matching_dropoffs[matching_dropoffs['City'] == patient['City']]
-                    if not city_dropoffs.empty:
-                        matching_dropoffs = city_dropoffs
-                
-                # Further filter by zipcode if available
-                if 'PatientZip' in patient and pd.notna(patient['PatientZip']) and not matching_dropoffs.empty:
-                    try:
-                        zip_dropoffs = matching_dropoffs[matching_dropoffs['Zipcode'] == int(patient['PatientZip'])]
-                        if not zip_dropoffs.empty:
-                            matching_dropoffs = zip_dropoffs
-                    except (ValueError, TypeError):
-                        # Handle case where PatientZip isn't convertible to int
-                        pass
-                
-                # Find nearest dropoff if multiple matches
-                if not matching_dropoffs.empty:
-                    if len(matching_dropoffs) > 1:
-                        # Find the closest dropoff location
-                        min_distance = float('inf')
-                        nearest_dropoff = None
-                        
-                        print(f"Checking {len(matching_dropoffs)} dropoffs")
-                        print(matching_dropoffs[['LabID', 'Clinic', 'Address', 'City', 'State', 'Zipcode', 'Latitude', 'Longitude']])
-                        
-                        for _, dropoff in matching_dropoffs.iterrows():
-                            dropoff_location = (dropoff['Latitude'], dropoff['Longitude'])
-                            dist = calculate_distance(patient_location, dropoff_location, ors_client, use_ors=False)
-                            if dist < min_distance:
-                                min_distance = dist
-                                nearest_dropoff = dropoff
-                        
-                        if nearest_dropoff is not None:
-                            dropoff = nearest_dropoff
-                            print(f"Multiple dropoffs found for patient {pat_idx}. Selected nearest: {dropoff['LabID']} at {min_distance:.2f} miles")
-                        else:
-                            # If calculation fails, just use the first one
-                            dropoff = matching_dropoffs.iloc[0]
-                    else:
-                        # Only one match found
-                        dropoff = matching_dropoffs.iloc[0]
-                    
-                    # Get key fields
-                    lab_id = dropoff['LabID']
-                    lat = dropoff['Latitude']
-                    lon = dropoff['Longitude']
-                    
-                    # Store in dropoff dict if not already there
-                    if lab_id not in dropoff_dict:
-                        dropoff_dict[lab_id] = {
-                            'location': (lat, lon),
-                            'lab_id': lab_id,
-                            'clinic_name': dropoff['Clinic'],
-                            'address': dropoff['Address'],
-                            'city': dropoff.get('City', ''),
-                            'state': dropoff.get('State', ''),
-                            'zipcode': dropoff.get('Zipcode', ''),
-                            'patients': []
-                        }
-                        # Add to clinic-to-dropoffs mapping
-                        clinic_to_dropoffs[dropoff['Clinic']].append(lab_id)
-                    
-                    # Map this patient to this dropoff
-                    dropoff_dict[lab_id]['patients'].append(pat_idx)
-                    patient_to_dropoff[pat_idx] = lab_id
-                    
-                    # Update patient record with dropoff information
-                    updated_patients.at[pat_idx, 'DropOffClinicLoc'] = f"{lat},{lon}"
-                    updated_patients.at[pat_idx, 'DropOffLabID'] = lab_id
-                    updated_patients.at[pat_idx, 'DropOffClinicName'] = dropoff['Clinic']
-                    
-                    # Print diagnostic info
-                    patient_id = patient.get('PatientSysID', pat_idx)
-                    print(f"Patient {patient_id} mapped to dropoff {lab_id}_{dropoff['Clinic']}")
-                else:
-                    print(f"Warning: No matching dropoff found for patient {pat_idx} with clinic {clinic_name}")
-        
-        # Log dropoff locations found
-        print(f"Found {len(dropoff_dict)} unique dropoff locations")
-        for lab_id, info in dropoff_dict.items():
-            patient_ids = [str(idx) for idx in info['patients']]
-            print(f"  - Dropoff {info['clinic_name']} (LabID: {lab_id}): Patients {', '.join(patient_ids)}")
-            print(f"    Location: {info['location'][0]}, {info['location'][1]}")
-            if 'city' in info and 'state' in info:
-                print(f"    Address: {info.get('address', 'Unknown')}, {info.get('city', '')}, {info.get('state', '')} {info.get('zipcode', '')}")
-
-        # Sort patients by scheduled time or optimize by proximity
-        if use_scheduled_time:
-            # Sort by scheduled time, then assign trip order
-            sorted_patients = phleb_patients.sort_values("ScheduledDtm")
-            for trip_order, (idx, _) in enumerate(sorted_patients.iterrows(), 1):
-                updated_patients.at[idx, "TripOrderInDay"] = trip_order
-                updated_patients.at[idx, "PreferredTime"] = sorted_patients.at[idx, "ScheduledDtm"]
-        else:
-            # Use nearest neighbor algorithm
-            current_location = phleb_location
-            unvisited = list(phleb_patients.index)
-            trip_order = 1
-            
-            while unvisited:
-                # Find closest patient
-                next_patient_idx = min(
-                    unvisited,
-                    key=lambda idx: calculate_distance(
-                        current_location,
-                        (phleb_patients.at[idx, "PatientLatitude"], phleb_patients.at[idx, "PatientLongitude"]),
-                        ors_client
-                    )
-                )
-                
-                # Assign order
-                updated_patients.at[next_patient_idx, "TripOrderInDay"] = trip_order
-                trip_order += 1
-                
-                # Update location
-                current_location = (
-                    phleb_patients.at[next_patient_idx, "PatientLatitude"],
-                    phleb_patients.at[next_patient_idx, "PatientLongitude"]
-                )
-                
-                # Remove from unvisited
-                unvisited.remove(next_patient_idx)
-        
-        # CRITICAL CHANGE: Now add dropoffs after all patients
-        # First, consolidate dropoffs for the same clinic if applicable
-        consolidated_dropoffs = {}  # Will store the best dropoff for each clinic
-        
-        # Go through all clinics with multiple dropoffs
-        for clinic_name, lab_ids in clinic_to_dropoffs.items():
-            if len(lab_ids) > 1:
-                print(f"DROPOFF CONSOLIDATION: Found {len(lab_ids)} dropoffs for clinic '{clinic_name}'")
-                print(f"  Options: {', '.join(lab_ids)}")
-                
-                # Calculate the last patient location (after all patients are visited)
-                last_patient_idx = updated_patients.loc[phleb_patients.index, "TripOrderInDay"].idxmax()
-                if pd.isna(last_patient_idx):
-                    # If no valid TripOrderInDay, use phlebotomist location as reference
-                    last_location = phleb_location
-                else:
-                    last_location = (
-                        phleb_patients.at[last_patient_idx, "PatientLatitude"],
-                        phleb_patients.at[last_patient_idx, "PatientLongitude"]
-                    )
-                
-                # Find the best (closest) dropoff location for this clinic
-                best_lab_id = None
-                min_distance = float('inf')
-                distances = {}
-                
-                # Calculate all distances first for comparison
-                for lab_id in lab_ids:
-                    dropoff_location = dropoff_dict[lab_id]['location']
-                    distance = calculate_distance(last_location, dropoff_location, ors_client, use_ors=False)
-                    distances[lab_id] = distance
-                    if distance < min_distance:
-                        min_distance = distance
-                        best_lab_id = lab_id
-                
-                # Log the calculations
-                print(f"  Calculating distances from last patient location {last_location}:")
-                for lab_id, distance in distances.items():
-                    print(f"    - {lab_id}: {distance:.2f} miles {' (SELECTED as closest)' if lab_id == best_lab_id else ''}")
-                
-                # Now we have the best dropoff for this clinic
-                consolidated_dropoffs[clinic_name] = best_lab_id
-                
-                # Reassign all patients to this best dropoff
-                all_patients_for_clinic = []
-                for lab_id in lab_ids:
-                    if lab_id != best_lab_id:  # Skip the best one as it's already correctly assigned
-                        # Move patients from other dropoffs to the best one
-                        patients_to_move = dropoff_dict[lab_id]['patients']
-                        for pat_idx in patients_to_move:
-                            print(f"  Reassigning patient {pat_idx} from dropoff {lab_id} to {best_lab_id}")
-                            
-                            # Update patient's dropoff information
-                            best_dropoff = dropoff_dict[best_lab_id]
-                            updated_patients.at[pat_idx, 'DropOffClinicLoc'] = f"{best_dropoff['location'][0]},{best_dropoff['location'][1]}"
-                            updated_patients.at[pat_idx, 'DropOffLabID'] = best_lab_id
-                            
-                            # Add to the best dropoff's patient list
-                            dropoff_dict[best_lab_id]['patients'].append(pat_idx)
-                            
-                            # Update patient_to_dropoff mapping
-                            patient_to_dropoff[pat_idx] = best_lab_id
-                            
-                            all_patients_for_clinic.append(pat_idx)
-                        
-                        # Remove patients from original dropoff
-                        dropoff_dict[lab_id]['patients'] = []
-                    else:
-                        # Add patients from best dropoff to the list
-                        all_patients_for_clinic.extend(dropoff_dict[lab_id]['patients'])
-                
-                print(f"  CONSOLIDATED: All {len(all_patients_for_clinic)} patients for {clinic_name} will use dropoff {best_lab_id}")
-            
-            else:
-                # Only one dropoff for this clinic, no consolidation needed
-                consolidated_dropoffs[clinic_name] = lab_ids[0]
-        
-        # Remove empty dropoffs after consolidation
-        dropoff_dict = {lab_id: info for lab_id, info in dropoff_dict.items() if info['patients']}
-        
-        # Now assign dropoff sequences after consolidation
-        drop_sequence = max(updated_patients.loc[phleb_patients.index, "TripOrderInDay"].max() + 1, 1)
-        
-        # Handle each unique dropoff location
-        for lab_id, dropoff_info in dropoff_dict.items():
-            # Assign the same sequence number to all patients that share this dropoff
-            for patient_idx in dropoff_info['patients']:
-                updated_patients.at[patient_idx, 'DropOffSequence'] = drop_sequence
-            
-            print(f"Assigned dropoff sequence {drop_sequence} to {len(dropoff_info['patients'])} patients for {dropoff_info['clinic_name']} (LabID: {lab_id})")
-            drop_sequence += 1
 
     # Add detailed logging of the final routes
     print("\n" + "="*80)
@@ -1600,9 +1783,8 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
                             'sequence': patient['DropOffSequence']
                         })
         
-        # Sort stops - patients by trip order, then dropoffs
-        # This ensures we visit all patients first, then do dropoffs
-        stops.sort(key=lambda x: float('inf') if x['type'] == 'dropoff' else phleb_patients.at[x['idx'], 'TripOrderInDay'])
+        # Sort stops - patients by trip order, dropoffs right after the patient their sequence follows
+        stops.sort(key=lambda x: x['sequence'] + 0.5 if x['type'] == 'dropoff' else phleb_patients.at[x['idx'], 'TripOrderInDay'])
         
         # Now print the route
         for i, stop in enumerate(stops, start=2):  # Start at 2 (after phlebotomist base)
@@ -1649,9 +1831,186 @@ def optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=True,
     
     print("\n" + "="*80)
     
+    if not use_scheduled_time:
+        updated_patients.attrs["route_improvement"] = route_improvement
+    
     return updated_patients
 
 
+def _route_miles(home_location, route_patients):
+    """Straight-line miles from home through a route's patients and dropoffs, in visiting order."""
+    stops = [
+        (float(order), (lat, lon))
+        for order, lat, lon in zip(route_patients["TripOrderInDay"], route_patients["PatientLatitude"], route_patients["PatientLongitude"])
+    ]
+    if "DropOffSequence" in route_patients.columns and "DropOffClinicLoc" in route_patients.columns:
+        dropoffs = route_patients[route_patients["DropOffSequence"].notna() & route_patients["DropOffClinicLoc"].notna()]
+        for sequence, location in dropoffs.drop_duplicates("DropOffSequence")[["DropOffSequence", "DropOffClinicLoc"]].itertuples(index=False):
+            stops.append((float(sequence) + 0.5, parse_coordinates(location)))
+    locations = [home_location] + [location for _, location in sorted(stops, key=lambda stop: stop[0])]
+    return float(np.nansum(pairwise_distance(locations[:-1], locations[1:]))) if len(locations) > 1 else 0.0
+
+
+def apply_assignment_delta(assigned_phlebs, assigned_patients, added_patients=None, removed_ids=None,
+                           rescheduled=None, use_scheduled_time=True, workload_cap=None,
+                           id_column="PatientSysID", dropoffs_df=None,
+                           route_max_moves=ROUTE_IMPROVEMENT_MAX_MOVES):
+    """
+    Update an existing assignment for added, cancelled or rescheduled patients without re-planning the city.
+
+    Only the routes touched by the change are rebuilt. Cancelled patients leave their
+    route. Added and rescheduled patients are placed by cheapest insertion: each is
+    tried in every assigned phlebotomist's route that has spare capacity, and goes
+    where it adds the fewest straight-line miles. In scheduled-time mode the insertion
+    point is fixed by the patient's time; in proximity mode every position is tried.
+    Each affected route is then re-optimized with the same per-route step as
+    optimize_routes, including dropoff mapping and local search.
+
+    The map is not rebuilt, and total_distance for affected routes is recomputed as
+    straight-line miles. Call create_assignment_map on the result if a map is needed.
+    Added patients have no trip label, so their "index" is left missing.
+
+    Args:
+        assigned_phlebs: DataFrame of phlebotomists from process_city_assignments
+        assigned_patients: DataFrame of patients from process_city_assignments
+        added_patients: DataFrame of new patient orders to place
+        removed_ids: IDs of cancelled patients
+        rescheduled: Dict mapping patient ID to the new scheduled datetime
+        use_scheduled_time: Routing mode the assignment was planned with
+        workload_cap: Workload cap per phlebotomist (default: no cap)
+        id_column: Column identifying patients in removed_ids and rescheduled
+        dropoffs_df: Dropoff locations (default: read All_Dropoffs.csv)
+        route_max_moves: Most 2-opt / Or-opt moves applied per affected route
+
+    Returns:
+        Tuple of (assigned_phlebs_df, assigned_patients_df)
+    """
+    start = time.perf_counter()
+    patients = assigned_patients.copy()
+    phlebs = assigned_phlebs.copy()
+    removed_ids = set(removed_ids or [])
+    rescheduled = {patient_id: when for patient_id, when in (rescheduled or {}).items() if patient_id not in removed_ids}
+    workload_cap = np.inf if workload_cap is None else workload_cap
+    affected = set()
+
+    if dropoffs_df is None:
+        try:
+            dropoffs_df = load_dropoffs()
+        except Exception as e:
+            print(f"Error loading dropoffs: {e}")
+            dropoffs_df = pd.DataFrame(columns=["LabID", "Clinic", "Address", "City", "State", "Zipcode", "Latitude", "Longitude"])
+
+    # Cancelled and rescheduled patients leave their current routes
+    leaving = patients[id_column].isin(removed_ids | set(rescheduled))
+    affected.update(patients.loc[leaving, "AssignedPhlebID"].dropna())
+    moved = patients[patients[id_column].isin(set(rescheduled))].copy()
+    moved["ScheduledDtm"] = pd.to_datetime(moved[id_column].map(rescheduled))
+    patients = patients[~leaving]
+
+    # Rescheduled and new patients are (re)inserted in scheduled order. Their row labels
+    # come from different frames, so the incoming rows are addressed by position only.
+    incoming = [moved]
+    if added_patients is not None and not added_patients.empty:
+        new_rows = added_patients.copy()
+        new_rows["ScheduledDtm"] = pd.to_datetime(new_rows["ScheduledDtm"])
+        incoming.append(new_rows)
+    incoming = pd.concat(incoming, ignore_index=True).sort_values("ScheduledDtm", kind="stable", ignore_index=True)
+    incoming["AssignedPhlebID"] = None
+    incoming["TripOrderInDay"] = None
+    incoming["PreferredTime"] = incoming["ScheduledDtm"]
+    for column, empty in (("PlannedDtm", pd.NaT), ("LateMinutes", np.nan)):
+        if column in patients.columns:
+            incoming[column] = empty
+
+    # Current routes in visiting order: home first, then each patient
+    homes = {
+        phleb["PhlebotomistID.1"]: (phleb["PhlebotomistLatitude"], phleb["PhlebotomistLongitude"])
+        for _, phleb in phlebs.iterrows()
+    }
+    routes = {phleb_id: {"points": [home], "times": []} for phleb_id, home in homes.items()}
+    for phleb_id, route_patients in patients.sort_values("TripOrderInDay", kind="stable").groupby("AssignedPhlebID", sort=False):
+        if phleb_id in routes:
+            routes[phleb_id]["points"] += list(zip(route_patients["PatientLatitude"], route_patients["PatientLongitude"]))
+            routes[phleb_id]["times"] += list(route_patients["ScheduledDtm"])
+    workloads = patients.groupby("AssignedPhlebID")["WorkloadPoints"].sum().reindex(list(homes), fill_value=0).to_dict()
+
+    assigned_ids = []
+    for _, patient in incoming.iterrows():
+        location = (patient["PatientLatitude"], patient["PatientLongitude"])
+        best = None
+        for phleb_id, route in routes.items():
+            if workloads[phleb_id] + patient["WorkloadPoints"] > workload_cap:
+                continue
+            points = route["points"]
+            to_new = distance_matrix(location, points)[0]
+            legs = pairwise_distance(points[:-1], points[1:]) if len(points) > 1 else np.empty(0)
+            # Inserting after points[k] costs the two new legs minus the leg they replace
+            costs = to_new.copy()
+            costs[:-1] += to_new[1:] - legs
+            if use_scheduled_time:
+                position = int(np.searchsorted(np.array(route["times"], dtype="datetime64[ns]"),
+                                               np.datetime64(patient["ScheduledDtm"]), side="right"))
+            else:
+                if np.isnan(costs).all():
+                    continue
+                position = int(np.nanargmin(costs))
+            if np.isnan(costs[position]):
+                continue
+            if best is None or costs[position] < best[0]:
+                best = (costs[position], phleb_id, position)
+
+        if best is None:
+            # No phlebotomist has capacity (or the patient has no coordinates): least workload
+            phleb_id = min(workloads, key=workloads.get)
+            position = len(routes[phleb_id]["times"])
+        else:
+            _, phleb_id, position = best
+
+        routes[phleb_id]["points"].insert(position + 1, location)
+        routes[phleb_id]["times"].insert(position, patient["ScheduledDtm"])
+        workloads[phleb_id] += patient["WorkloadPoints"]
+        assigned_ids.append(phleb_id)
+        affected.add(phleb_id)
+    incoming["AssignedPhlebID"] = pd.Series(assigned_ids, index=incoming.index, dtype=object)
+
+    patients = pd.concat([patients, incoming], ignore_index=True)
+    if "index" in patients.columns and pd.api.types.is_numeric_dtype(patients["index"]):
+        # Trip labels stay integers next to the missing labels of added patients
+        patients["index"] = patients["index"].astype("Int64")
+
+    # Re-optimize only the affected routes, then refresh those phlebotomists' totals
+    route_columns = [column for column in ROUTE_COLUMNS if column in patients.columns]
+    for phleb_pos, phleb in phlebs.iterrows():
+        phleb_id = phleb["PhlebotomistID.1"]
+        if phleb_id not in affected:
+            continue
+        route_patients = patients[patients["AssignedPhlebID"] == phleb_id]
+        if route_patients.empty:
+            continue
+        phleb_name = phleb.get('PhlebotomistName', f'Phlebotomist {phleb_id}')
+        updates, _ = _optimize_phleb_route(phleb_id, phleb_name, homes[phleb_id], route_patients[route_columns],
+                                           dropoffs_df, use_scheduled_time, route_max_moves)
+        for index, column, value in updates:
+            patients.at[index, column] = value
+
+        route_patients = patients[patients["AssignedPhlebID"] == phleb_id].sort_values("TripOrderInDay")
+        labels = route_patients["index"] if "index" in route_patients.columns else route_patients.index
+        phlebs.at[phleb_pos, "assigned_patients"] = list(labels)
+        phlebs.at[phleb_pos, "current_workload"] = route_patients["WorkloadPoints"].sum()
+        phlebs.at[phleb_pos, "current_location"] = (
+            route_patients["PatientLatitude"].iloc[-1], route_patients["PatientLongitude"].iloc[-1]
+        )
+        phlebs.at[phleb_pos, "total_distance"] = _route_miles(homes[phleb_id], route_patients)
+
+    # Phlebotomists whose last patient was cancelled or moved away drop out, as in a full run
+    phlebs = phlebs[phlebs["PhlebotomistID.1"].isin(set(patients["AssignedPhlebID"].dropna()))]
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚡ Applied assignment delta: {len(removed_ids)} removed, "
+          f"{len(rescheduled)} rescheduled, {len(incoming) - len(moved)} added; {len(affected)} routes rebuilt "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+    return phlebs, patients
+
+
 def save_assignment_results(
     assignment_map,
     assigned_phlebs,
@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+import final_utils_upd as utils
+
+DEFAULT_TRIPS_PATH = "patient_geocoded_data_202506041041.csv"
+DEFAULT_PHLEBS_PATH = "phlebotomists_with_city.csv"
+DEFAULT_WORKLOAD_PATH = "avg_workload_per_city_per_phleb.csv"
+
+# Read-only data shared by every task in a worker process
+_worker_data = {}
+
+
+def _init_worker(trip_store, phleb_df, workload_df, options):
+    """Process pool initializer: keep the shared data for all tasks run by this worker."""
+    _worker_data.update(trip_store=trip_store, phleb_df=phleb_df, workload_df=workload_df, options=options)
+
+
+def select_pairs(trip_store, start_date=None, end_date=None, cities=None):
+    """
+    List the (date, city) pairs to plan, largest first so long runs start early.
+
+    Args:
+        trip_store: TripStore of all trips
+        start_date: First date to include (default: earliest)
+        end_date: Last date to include (default: latest)
+        cities: Cities to include (default: every city with trips on each date)
+
+    Returns:
+        List of (date string, city) tuples
+    """
+    start_date = pd.to_datetime(start_date).date() if start_date else None
+    end_date = pd.to_datetime(end_date).date() if end_date else None
+    cities = set(cities) if cities else None
+
+    pairs = []
+    for date_str, date_cities in utils.get_cities_by_date(trip_store).items():
+        date = pd.to_datetime(date_str).date()
+        if (start_date and date < start_date) or (end_date and date > end_date):
+            continue
+        pairs.extend((date_str, city) for city in date_cities if cities is None or city in cities)
+
+    return sorted(pairs, key=lambda pair: len(trip_store.get(*pair)), reverse=True)
+
+
+def run_pair(target_date, target_city):
+    """
+    Plan and save one (date, city) pair using the worker's shared data.
+
+    Returns:
+        Dict with the pair, patient and phlebotomist counts, elapsed seconds,
+        saved file paths and any error message
+    """
+    options = _worker_data["options"]
+    result = {"date": target_date, "city": target_city, "patients": 0, "phlebs": 0, "files": None, "error": None}
+    start = time.perf_counter()
+    output = contextlib.nullcontext() if options["verbose"] else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            assignment_map, assigned_phlebs, assigned_patients = utils.process_city_assignments(
+                _worker_data["trip_store"], _worker_data["phleb_df"], _worker_data["workload_df"],
+                target_date, target_city,
+                api_key=options["api_key"],
+                use_scheduled_time=options["use_scheduled_time"],
+                redis_host=options["redis_host"],
+                redis_port=options["redis_port"],
+                assignment_mode=options["assignment_mode"],
+                route_workers=options["route_workers"],
+            )
+            if assignment_map is not None and not assigned_patients.empty:
+                result["files"] = utils.save_assignment_results(
+                    assignment_map, assigned_phlebs, assigned_patients, target_date, target_city,
+                    options["use_scheduled_time"], phleb_df=_worker_data["phleb_df"],
+                )
+                result["patients"] = len(assigned_patients)
+                result["phlebs"] = len(assigned_phlebs)
+            else:
+                result["error"] = "no assignment produced"
+    except Exception as e:
+        result["error"] = f"{e.__class__.__name__}: {e}"
+        if options["verbose"]:
+            traceback.print_exc()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def print_summary(results, wall_seconds, workers):
+    """Print the batch throughput summary."""
+    succeeded = [result for result in results if result["error"] is None]
+    failed = [result for result in results if result["error"] is not None]
+    patients = sum(result["patients"] for result in succeeded)
+    busy_seconds = sum(result["seconds"] for result in results)
+
+    print("\n" + "=" * 60)
+    print("BATCH ASSIGNMENT SUMMARY")
+    print("=" * 60)
+    print(f"Pairs planned:      {len(succeeded)} of {len(results)} ({len(failed)} failed)")
+    print(f"Patients assigned:  {patients}")
+    print(f"Wall time:          {wall_seconds:.1f}s with {workers} worker(s)")
+    if wall_seconds > 0:
+        print(f"Throughput:         {len(results) / wall_seconds * 60:.1f} pairs/min, {patients / wall_seconds:.1f} patients/s")
+        print(f"Concurrency:        {busy_seconds / wall_seconds:.2f}x (sum of pair times / wall time)")
+
+    slowest = sorted(results, key=lambda result: result["seconds"], reverse=True)[:5]
+    if slowest:
+        print("Slowest pairs:")
+        for result in slowest:
+            print(f"  {result['date']} {result['city']}: {result['seconds']:.1f}s, {result['patients']} patients")
+    if failed:
+        print("Failed pairs:")
+        for result in failed:
+            print(f"  {result['date']} {result['city']}: {result['error']}")
+
+
+def run_batch(pairs, trip_store, phleb_df, workload_df, options, workers=None):
+    """
+    Plan every pair, in a process pool when workers > 1.
+
+    Returns:
+        List of per-pair result dicts, in completion order
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    initargs = (trip_store, phleb_df, workload_df, options)
+    results = []
+    start = time.perf_counter()
+
+    def report(result):
+        results.append(result)
+        status = "✅" if result["error"] is None else f"❌ {result['error']}"
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ({len(results)}/{len(pairs)}) {result['date']} "
+              f"{result['city']}: {result['patients']} patients in {result['seconds']:.1f}s {status}")
+
+    if workers == 1:
+        _init_worker(*initargs)
+        for pair in pairs:
+            report(run_pair(*pair))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            futures = [executor.submit(run_pair, *pair) for pair in pairs]
+            for future in as_completed(futures):
+                report(future.result())
+
+    print_summary(results, time.perf_counter() - start, workers)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Plan phlebotomist assignments for many dates and cities, without the UI.",
+        epilog='Example: python batch_assign.py --trips req8425.csv --start-date 2025-04-08 '
+               '--end-date 2025-04-10 --cities "Los Angeles" "Santa Clara" --workers 4',
+    )
+    parser.add_argument("--trips", default=DEFAULT_TRIPS_PATH, help="Trips CSV export or Parquet dataset")
+    parser.add_argument("--phlebs", default=DEFAULT_PHLEBS_PATH, help="Phlebotomist roster CSV")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD_PATH, help="Average workload per city CSV")
+    parser.add_argument("--start-date", help="First date to plan (default: earliest in the data)")
+    parser.add_argument("--end-date", help="Last date to plan (default: latest in the data)")
+    parser.add_argument("--cities", nargs="+", help="Cities to plan (default: all cities on each date)")
+    parser.add_argument("--routing", choices=["scheduled", "optimized"], default="scheduled",
+                        help="Route by scheduled time or optimize by proximity")
+    parser.add_argument("--assignment-mode", choices=["greedy", "optimal", "vrptw"], default="greedy")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--route-workers", type=int, default=None,
+                        help="Processes optimizing one pair's routes (default: serial); "
+                             "useful with few, large pairs and --workers 1")
+    parser.add_argument("--redis-host", default="localhost")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    parser.add_argument("--verbose", action="store_true", help="Show the full per-pair assignment logs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Read only the date partitions and cities being planned
+    dates = pd.date_range(args.start_date, args.end_date) if args.start_date and args.end_date else None
+    trips_df, phleb_df, workload_df = utils.load_data(args.trips, args.phlebs, args.workload,
+                                                      dates=dates, cities=args.cities)
+    if trips_df is None:
+        raise SystemExit(f"Could not load data from {args.trips}")
+    trip_store = utils.TripStore(trips_df)
+
+    pairs = select_pairs(trip_store, args.start_date, args.end_date, args.cities)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 📋 Planning {len(pairs)} (date, city) pairs")
+    if not pairs:
+        return []
+
+    options = {
+        "api_key": os.getenv("KEY"),
+        "use_scheduled_time": args.routing == "scheduled",
+        "assignment_mode": args.assignment_mode,
+        "route_workers": args.route_workers,
+        "redis_host": args.redis_host,
+        "redis_port": args.redis_port,
+        "verbose": args.verbose,
+    }
+    return run_batch(pairs, trip_store, phleb_df, workload_df, options, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
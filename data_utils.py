@@ -1,22 +1,35 @@
 import pandas as pd
 import streamlit as st
 
-def load_data(trips_path, phlebs_path, workload_path):
+from ingest_utils import load_trips
+from trip_store import TripStore
+
+# Trip columns used by assignment planning, route maps, saved results and the apps;
+# load_data reads only these (optional ones missing from an export are skipped)
+TRIP_COLUMNS = [
+    "UserReqID", "PatientID", "PatientSysID", "PatientFirstName", "PatientLastName", "PatientAddress",
+    "PatientLatitude", "PatientLongitude", "PatientState", "PatientZip", "City", "ScheduledDtm",
+    "DropOffLocation", "WorkloadPoints", "PhlebotomistID", "PhlebotomistID.1", "PhlebotomistName",
+    "PhlebotomistLatitude", "PhlebotomistLongitude",
+]
+
+def load_data(trips_path, phlebs_path, workload_path, dates=None, cities=None):
     """
     Load and prepare all required data.
     
     Args:
-        trips_path: Path to the trips CSV file
+        trips_path: Path to the trips CSV file or its Parquet dataset directory
         phlebs_path: Path to the phlebotomists CSV file
         workload_path: Path to the workload CSV file
+        dates: Date or list of dates to load trips for (defaults to all)
+        cities: City or list of cities to load trips for (defaults to all)
         
     Returns:
         Tuple of (trips_df, phleb_df, workload_df)
     """
     try:
-        # Load trips data
-        trips_df = pd.read_csv(trips_path)
-        trips_df['ScheduledDtm'] = pd.to_datetime(trips_df['ScheduledDtm'])
+        # Load trips data (converted to a typed Parquet dataset on first use)
+        trips_df = load_trips(trips_path, columns=TRIP_COLUMNS, dates=dates, cities=cities)
         
         # Load phlebotomist locations
         phleb_df = pd.read_csv(phlebs_path)
@@ -31,13 +44,17 @@ def load_data(trips_path, phlebs_path, workload_path):
         return None, None, None
 
 def get_available_dates(trips_df):
-    """Get unique dates from the trips dataframe"""
+    """Get unique dates from the trips dataframe or TripStore"""
+    if isinstance(trips_df, TripStore):
+        return trips_df.dates()
     if trips_df is not None and 'ScheduledDtm' in trips_df.columns:
         return sorted(trips_df['ScheduledDtm'].dt.date.unique())
     return []
 
 def get_available_cities(trips_df):
-    """Get unique cities from the trips dataframe"""
+    """Get unique cities from the trips dataframe or TripStore"""
+    if isinstance(trips_df, TripStore):
+        return trips_df.cities()
     if trips_df is not None and 'City' in trips_df.columns:
         return sorted(trips_df['City'].unique())
     return []
@@ -47,18 +64,22 @@ def get_cities_by_date(trips_df):
     Create a mapping of dates to available cities in the trips data
     
     Args:
-        trips_df (pandas.DataFrame): DataFrame containing trip data
+        trips_df (pandas.DataFrame or TripStore): Trip data
         
     Returns:
         dict: Mapping of date strings to lists of cities
     """
-    date_city_map = {}
+    if isinstance(trips_df, TripStore):
+        return trips_df.cities_by_date()
     
     # Ensure the ScheduledDtm column is in datetime format
     trips_df['ScheduledDtm'] = pd.to_datetime(trips_df['ScheduledDtm'])
     
-    # Group by date and get unique cities for each date
-    for date, group in trips_df.groupby(trips_df['ScheduledDtm'].dt.date.astype(str)):
-        date_city_map[date] = sorted(group['City'].unique().tolist())
+    # Unique (date, city) pairs, grouped once into sorted city lists
+    pairs = pd.DataFrame({
+        'date': trips_df['ScheduledDtm'].dt.strftime('%Y-%m-%d'),
+        'City': trips_df['City'].astype(object)
+    }).dropna().drop_duplicates()
+    pairs = pairs.sort_values(['date', 'City'])
     
-    return date_city_map
+    return pairs.groupby('date')['City'].agg(list).to_dict()
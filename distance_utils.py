@@ -0,0 +1,181 @@
+import numpy as np
+
+# Mean earth radius (IUGG) used by the haversine formula
+EARTH_RADIUS_MILES = 3958.7613
+EARTH_RADIUS_KM = 6371.0088
+
+# WGS-84 ellipsoid parameters used by the Vincenty formula
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+METERS_PER_UNIT = {
+    "miles": 1609.344,
+    "km": 1000.0,
+    "m": 1.0,
+}
+
+
+def _as_coords(points):
+    """Convert a (lat, lon) tuple or a sequence of them into an (N, 2) float array."""
+    coords = np.asarray(points, dtype=float)
+    if coords.ndim == 1:
+        coords = coords.reshape(1, 2)
+    if coords.ndim != 2 or coords.shape[1] != 2:
+        raise ValueError(f"Expected (lat, lon) pairs, got array of shape {coords.shape}")
+    return coords
+
+
+def _check_unit(unit):
+    if unit not in METERS_PER_UNIT:
+        raise ValueError(f"Unsupported unit '{unit}'. Use one of {sorted(METERS_PER_UNIT)}")
+
+
+def _haversine(lat1, lon1, lat2, lon2, unit):
+    """Haversine distance on broadcastable arrays of radians."""
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    central_angle = 2 * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    radius_m = EARTH_RADIUS_KM * 1000.0
+    return central_angle * radius_m / METERS_PER_UNIT[unit]
+
+
+def _vincenty(lat1, lon1, lat2, lon2, unit, max_iter=200, tol=1e-12):
+    """
+    Vincenty inverse formula on broadcastable arrays of radians.
+
+    Pairs that fail to converge (nearly antipodal points) fall back to haversine.
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(lat1, lon1, lat2, lon2)
+    a, b, f = WGS84_A, WGS84_B, WGS84_F
+
+    L = lon2 - lon1
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    sin_sigma = np.zeros(L.shape)
+    cos_sigma = np.ones(L.shape)
+    sigma = np.zeros(L.shape)
+    cos_sq_alpha = np.ones(L.shape)
+    cos_2sigma_m = np.zeros(L.shape)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cosU2 * sin_lam) ** 2 +
+                                (cosU1 * sinU2 - sinU1 * cosU2 * cos_lam) ** 2)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos_sq_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos_sq_alpha == 0, 0.0,
+                                    cos_sigma - 2 * sinU1 * sinU2 / cos_sq_alpha)
+            C = f / 16 * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            converged = np.abs(lam - lam_prev) < tol
+            if converged.all():
+                break
+
+        u_sq = cos_sq_alpha * (a ** 2 - b ** 2) / b ** 2
+        A = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        B = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        ))
+        meters = b * A * (sigma - delta_sigma)
+
+    distances = meters / METERS_PER_UNIT[unit]
+    distances = np.where(sin_sigma == 0, 0.0, distances)
+
+    failed = ~converged | ~np.isfinite(distances)
+    if failed.any():
+        distances = np.where(failed, _haversine(lat1, lon1, lat2, lon2, unit), distances)
+    return distances
+
+
+_METHODS = {
+    "haversine": _haversine,
+    "vincenty": _vincenty,
+}
+
+
+def _get_method(method):
+    try:
+        return _METHODS[method]
+    except KeyError:
+        raise ValueError(f"Unsupported distance method '{method}'. Use one of {sorted(_METHODS)}")
+
+
+def distance_matrix(origins, destinations=None, unit="miles", method="haversine"):
+    """
+    Compute the full distance matrix between two sets of points in one vectorized call.
+
+    Args:
+        origins: (lat, lon) pair or sequence/array of N pairs
+        destinations: Sequence/array of M pairs (defaults to origins)
+        unit: "miles", "km" or "m"
+        method: "haversine" (fast, spherical) or "vincenty" (WGS-84 ellipsoid)
+
+    Returns:
+        numpy array of shape (N, M) with distances in the requested unit
+    """
+    _check_unit(unit)
+    func = _get_method(method)
+
+    origin_rad = np.radians(_as_coords(origins))
+    dest_rad = origin_rad if destinations is None else np.radians(_as_coords(destinations))
+
+    return func(
+        origin_rad[:, 0][:, None], origin_rad[:, 1][:, None],
+        dest_rad[:, 0][None, :], dest_rad[:, 1][None, :],
+        unit,
+    )
+
+
+def pairwise_distance(origins, destinations, unit="miles", method="haversine"):
+    """
+    Compute element-wise distances between two aligned sets of points.
+
+    Args:
+        origins: Sequence/array of N (lat, lon) pairs
+        destinations: Sequence/array of N (lat, lon) pairs
+        unit: "miles", "km" or "m"
+        method: "haversine" or "vincenty"
+
+    Returns:
+        numpy array of shape (N,) where element i is the distance origins[i] -> destinations[i]
+    """
+    _check_unit(unit)
+    func = _get_method(method)
+
+    origin_rad = np.radians(_as_coords(origins))
+    dest_rad = np.radians(_as_coords(destinations))
+    if origin_rad.shape != dest_rad.shape:
+        raise ValueError(f"Shape mismatch: {origin_rad.shape} vs {dest_rad.shape}")
+
+    return func(origin_rad[:, 0], origin_rad[:, 1], dest_rad[:, 0], dest_rad[:, 1], unit)
+
+
+def point_distance(point1, point2, unit="miles", method="haversine"):
+    """
+    Distance between two (lat, lon) points.
+
+    Args:
+        point1: (latitude, longitude) of first point
+        point2: (latitude, longitude) of second point
+        unit: "miles", "km" or "m"
+        method: "haversine" or "vincenty"
+
+    Returns:
+        Distance as a float in the requested unit
+    """
+    return float(pairwise_distance([point1], [point2], unit=unit, method=method)[0])
@@ -0,0 +1,191 @@
+import os
+import threading
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from distance_utils import distance_matrix
+from profiling_utils import traced
+
+DROPOFFS_PATH = "All_Dropoffs.csv"
+DROPOFF_COLUMNS = ["LabID", "Clinic", "Address", "City", "State", "Zipcode", "Latitude", "Longitude"]
+
+# Patient column and dropoff column compared at each narrowing level
+MATCH_LEVELS = {
+    "state": ("PatientState", "State"),
+    "city": ("City", "City"),
+    "zip": ("PatientZip", "Zipcode"),
+}
+
+
+def _normalize_text(values):
+    """Lower-cased, stripped strings, with None for anything that is not a non-empty string."""
+    return [(value.strip().lower() or None) if isinstance(value, str) else None for value in values]
+
+
+def _normalize_zip(values):
+    """Zip codes as ints, with None where a value is missing or not numeric."""
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    return [int(value) if pd.notna(value) else None for value in numbers]
+
+
+def _normalize(level, values):
+    return _normalize_zip(values) if level == "zip" else _normalize_text(values)
+
+
+class DropoffIndex:
+    """
+    Clinic -> state -> city -> zip buckets over the dropoff table.
+
+    Every bucket holds the row positions and coordinates of its dropoffs. A
+    patient is resolved by starting at its clinic's bucket and narrowing one
+    level at a time, skipping any level that would leave no dropoffs, then
+    taking the nearest dropoff in the final bucket. This is the same rule the
+    per-patient DataFrame filters applied, but the buckets are built once and
+    all patients sharing a bucket get their nearest dropoff from one distance
+    matrix call.
+
+    Results are row positions into the DataFrame the index was built from, for
+    use with ``iloc``, and -1 where a patient has no matching dropoff.
+    """
+
+    def __init__(self, dropoffs_df):
+        self.size = len(dropoffs_df)
+        coords = dropoffs_df[["Latitude", "Longitude"]].to_numpy(dtype=float) if self.size else np.empty((0, 2))
+
+        keys = pd.DataFrame({"clinic": _normalize_text(dropoffs_df["Clinic"]) if self.size else []})
+        for level, (_, dropoff_column) in MATCH_LEVELS.items():
+            keys[level] = _normalize(level, dropoffs_df[dropoff_column]) if self.size else []
+
+        # One bucket per clinic and per combination of narrowing levels that can be reached
+        # by skipping levels, e.g. (clinic, state, zip) when the city had no match
+        self._buckets = {}
+        levels = list(MATCH_LEVELS)
+        for count in range(len(levels) + 1):
+            for subset in combinations(levels, count):
+                columns = ["clinic", *subset]
+                valid = keys[columns].notna().all(axis=1)
+                for values, positions in keys[valid].groupby(columns, sort=False).indices.items():
+                    values = values if isinstance(values, tuple) else (values,)
+                    positions = np.flatnonzero(valid)[positions]
+                    self._buckets[self._bucket_key(values[0], zip(subset, values[1:]))] = (positions, coords[positions])
+
+    @staticmethod
+    def _bucket_key(clinic, level_values):
+        return (clinic, *level_values)
+
+    def _resolve_bucket(self, clinic, level_values):
+        """Narrow from the clinic bucket through each level, skipping levels with no dropoffs."""
+        key = self._bucket_key(clinic, [])
+        if key not in self._buckets:
+            return None
+        for level, value in level_values:
+            if value is None:
+                continue
+            candidate = key + ((level, value),)
+            if candidate in self._buckets:
+                key = candidate
+        return key
+
+    @traced("dropoff_matching")
+    def nearest(self, patients, levels=("state", "zip")):
+        """
+        Find the nearest matching dropoff for every patient in one batch.
+
+        Args:
+            patients: DataFrame with DropOffLocation, PatientLatitude and PatientLongitude,
+                plus the patient columns for each narrowing level that should apply
+            levels: Narrowing levels to apply after the clinic, in order
+                ("state", "city" and/or "zip")
+
+        Returns:
+            Tuple of (positions, distances_miles) arrays aligned with patients' rows;
+            positions are -1 and distances NaN where no dropoff matches
+        """
+        num_patients = len(patients)
+        positions = np.full(num_patients, -1, dtype=int)
+        distances = np.full(num_patients, np.nan)
+        if num_patients == 0 or not self._buckets or "DropOffLocation" not in patients.columns:
+            return positions, distances
+
+        # Levels always narrow in clinic -> state -> city -> zip order, matching the bucket keys
+        clinics = _normalize_text(patients["DropOffLocation"])
+        level_values = [
+            list(zip([level] * num_patients, _normalize(level, patients[patient_column])))
+            for level, (patient_column, _) in MATCH_LEVELS.items()
+            if level in levels and patient_column in patients.columns
+        ]
+
+        # Group patients by the bucket they resolve to
+        bucket_patients = {}
+        for patient_pos, clinic in enumerate(clinics):
+            if clinic is None:
+                continue
+            key = self._resolve_bucket(clinic, [values[patient_pos] for values in level_values])
+            if key is not None:
+                bucket_patients.setdefault(key, []).append(patient_pos)
+
+        # One distance matrix per bucket: every patient in it against the bucket's dropoffs
+        patient_coords = patients[["PatientLatitude", "PatientLongitude"]].to_numpy(dtype=float)
+        for key, members in bucket_patients.items():
+            bucket_positions, bucket_coords = self._buckets[key]
+            bucket_distances = distance_matrix(patient_coords[members], bucket_coords)
+            nearest = np.argmin(bucket_distances, axis=1)
+            positions[members] = bucket_positions[nearest]
+            distances[members] = bucket_distances[np.arange(len(members)), nearest]
+        return positions, distances
+
+
+_dropoff_tables = {}
+_dropoff_indexes = {}
+_dropoff_lock = threading.Lock()
+
+
+@traced()
+def load_dropoffs(path=DROPOFFS_PATH):
+    """
+    Read the dropoff table, only re-reading the file when it changes.
+
+    Args:
+        path: Path to the dropoffs CSV
+
+    Returns:
+        DataFrame of dropoff locations (treat as read-only; it is shared between callers)
+    """
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    with _dropoff_lock:
+        if key not in _dropoff_tables:
+            _dropoff_tables[key] = pd.read_csv(path)
+        return _dropoff_tables[key]
+
+
+def _table_fingerprint(dropoffs_df):
+    """Hash the matching and coordinate columns so an edited table gets a fresh index."""
+    columns = [column for column in DROPOFF_COLUMNS if column in dropoffs_df.columns]
+    return int(pd.util.hash_pandas_object(dropoffs_df[columns], index=False).sum())
+
+
+@traced()
+def get_dropoff_index(dropoffs_df):
+    """
+    Return the lookup index for a dropoff table, building it only the first time.
+
+    Like the phlebotomist spatial index, it is cached by table contents, so copies of
+    the same table (or the same table sent to a worker process) reuse one index.
+
+    Args:
+        dropoffs_df: DataFrame of dropoff locations
+
+    Returns:
+        DropoffIndex for the table
+    """
+    key = (len(dropoffs_df), _table_fingerprint(dropoffs_df)) if len(dropoffs_df) else (0, 0)
+    index = _dropoff_indexes.get(key)
+    if index is None:
+        with _dropoff_lock:
+            index = _dropoff_indexes.get(key)
+            if index is None:
+                index = DropoffIndex(dropoffs_df)
+                _dropoff_indexes[key] = index
+    return index
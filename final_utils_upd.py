@@ -23,6 +23,7 @@ from assignment_utils import (
 
 from map_utils import (
     create_assignment_map,
+    render_map_html,
     add_sequence_label,
     create_assignment_legend
 )
@@ -34,6 +35,11 @@ from data_utils import (
     get_cities_by_date
 )
 
+from trip_store import (
+    TripStore,
+    select_trips
+)
+
 from clustering_utils import (
     cluster_patients
 )
@@ -66,6 +72,7 @@ __all__ = [
     
     # Map utilities
     'create_assignment_map',
+    'render_map_html',
     'add_sequence_label',
     'create_assignment_legend',
     
@@ -74,6 +81,8 @@ __all__ = [
     'get_available_dates',
     'get_available_cities',
     'get_cities_by_date',
+    'TripStore',
+    'select_trips',
     
     # Clustering utilities
     'cluster_patients',
@@ -0,0 +1,221 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from profiling_utils import traced
+
+GEOCODE_CACHE_FILE = "geocode_cache.sqlite"
+
+# (path, city column, latitude column, longitude column) used to seed city centroids
+GEOCODE_SEED_SOURCES = [
+    ("req8425.csv", "City", "PatientLatitude", "PatientLongitude"),
+    ("trip0804.csv", "City", "PatientLatitude", "PatientLongitude"),
+    ("phlebotomists_with_city.csv", "City", "PhlebotomistLatitude", "PhlebotomistLongitude"),
+]
+
+GEOCODE_LRU_SIZE = 1024
+
+_MISS = object()
+
+
+def normalize_query(query):
+    """Normalize a place name so "Los Angeles " and "los angeles" share a cache entry."""
+    return " ".join(str(query).split()).lower()
+
+
+def compute_city_centroids(sources=GEOCODE_SEED_SOURCES):
+    """
+    Compute a mean coordinate per city from the bundled trip and phlebotomist files.
+
+    Args:
+        sources: List of (path, city column, latitude column, longitude column)
+
+    Returns:
+        Dict mapping normalized city name to (latitude, longitude)
+    """
+    frames = []
+    for path, city_col, lat_col, lon_col in sources:
+        if not os.path.exists(path):
+            continue
+        try:
+            df = pd.read_csv(path, usecols=[city_col, lat_col, lon_col], low_memory=False)
+        except (ValueError, pd.errors.ParserError) as e:
+            print(f"Warning: Could not read {path} for geocode seeding - {e}")
+            continue
+        df = df.rename(columns={city_col: "City", lat_col: "Latitude", lon_col: "Longitude"})
+        df["Latitude"] = pd.to_numeric(df["Latitude"], errors="coerce")
+        df["Longitude"] = pd.to_numeric(df["Longitude"], errors="coerce")
+        frames.append(df[["City", "Latitude", "Longitude"]])
+
+    if not frames:
+        return {}
+
+    points = pd.concat(frames, ignore_index=True).dropna()
+    points = points[points["City"].astype(str).str.strip() != ""]
+    points["City"] = points["City"].map(normalize_query)
+    centroids = points.groupby("City")[["Latitude", "Longitude"]].mean()
+    return {city: (float(row.Latitude), float(row.Longitude)) for city, row in centroids.iterrows()}
+
+
+class GeocodeCache:
+    """
+    Persistent place-name geocoder backed by SQLite with an in-memory LRU in front.
+
+    Lookups try the LRU first, then the on-disk store, and go to Nominatim only on
+    a true miss. A new store is seeded with city centroids from the bundled data,
+    so every city in the trip files resolves without network access.
+    """
+
+    def __init__(self, db_path=GEOCODE_CACHE_FILE, seed_sources=GEOCODE_SEED_SOURCES,
+                 lru_size=GEOCODE_LRU_SIZE, user_agent="phleb_locator", allow_network=True):
+        self.db_path = db_path
+        self.lru_size = lru_size
+        self.user_agent = user_agent
+        self.allow_network = allow_network
+        self.stats = {"lru_hits": 0, "disk_hits": 0, "network_lookups": 0}
+        self._lru = OrderedDict()
+        self._geolocator = None
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            "query TEXT PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL, source TEXT)"
+        )
+        self._conn.commit()
+
+        if seed_sources and len(self) == 0:
+            self.seed(seed_sources)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0]
+
+    def seed(self, sources=GEOCODE_SEED_SOURCES, overwrite=False):
+        """
+        Store city centroids computed from local data files.
+
+        Args:
+            sources: List of (path, city column, latitude column, longitude column)
+            overwrite: Replace entries that already exist (including geocoder results)
+
+        Returns:
+            Number of cities written
+        """
+        centroids = compute_city_centroids(sources)
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        with self._lock:
+            cursor = self._conn.executemany(
+                f"{verb} INTO geocodes (query, latitude, longitude, source) VALUES (?, ?, ?, 'centroid')",
+                [(city, lat, lon) for city, (lat, lon) in centroids.items()]
+            )
+            self._conn.commit()
+            self._lru.clear()
+        print(f"Seeded geocode cache with {cursor.rowcount} city centroids")
+        return cursor.rowcount
+
+    def _remember(self, key, coords):
+        self._lru[key] = coords
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _geocode_online(self, query):
+        """Resolve a place name with Nominatim, returning (lat, lon) or None."""
+        from geopy.geocoders import Nominatim
+
+        if self._geolocator is None:
+            self._geolocator = Nominatim(user_agent=self.user_agent)
+        self.stats["network_lookups"] += 1
+        try:
+            location = self._geolocator.geocode(query)
+        except Exception as e:
+            print(f"Warning: Geocoding {query} failed - {e}")
+            return _MISS
+        return (location.latitude, location.longitude) if location is not None else None
+
+    def get(self, query):
+        """
+        Resolve a place name to coordinates.
+
+        Args:
+            query: Place name, e.g. a city
+
+        Returns:
+            (latitude, longitude) tuple, or None if the place cannot be resolved
+        """
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats["lru_hits"] += 1
+                return self._lru[key]
+
+            row = self._conn.execute(
+                "SELECT latitude, longitude FROM geocodes WHERE query = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.stats["disk_hits"] += 1
+                self._remember(key, (row[0], row[1]))
+                return self._lru[key]
+
+        if not self.allow_network:
+            return None
+
+        coords = self._geocode_online(query)
+        if coords is _MISS:
+            # Network error: don't cache, so the next call can retry
+            return None
+
+        with self._lock:
+            if coords is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO geocodes (query, latitude, longitude, source) VALUES (?, ?, ?, 'nominatim')",
+                    (key, coords[0], coords[1])
+                )
+                self._conn.commit()
+            # Unknown places are remembered in memory only, so a later fix to the name can still resolve
+            self._remember(key, coords)
+        return coords
+
+    def put(self, query, latitude, longitude, source="manual"):
+        """Store coordinates for a place name, replacing any existing entry."""
+        key = normalize_query(query)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocodes (query, latitude, longitude, source) VALUES (?, ?, ?, ?)",
+                (key, float(latitude), float(longitude), source)
+            )
+            self._conn.commit()
+            self._remember(key, (float(latitude), float(longitude)))
+
+
+_geocode_cache = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    """Return the process-wide GeocodeCache, creating it on first use."""
+    global _geocode_cache
+    if _geocode_cache is None:
+        with _geocode_cache_lock:
+            if _geocode_cache is None:
+                _geocode_cache = GeocodeCache()
+    return _geocode_cache
+
+
+@traced()
+def geocode_city(city):
+    """
+    Resolve a city name to (latitude, longitude) using the shared geocode cache.
+
+    Args:
+        city: City name
+
+    Returns:
+        (latitude, longitude) tuple, or None if the city cannot be resolved
+    """
+    return get_geocode_cache().get(city)
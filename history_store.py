@@ -0,0 +1,335 @@
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from redis_utils import binary_redis
+
+# Metadata hash per saved assignment: history:<date>:<city>
+HISTORY_PREFIX = "history:"
+
+# Frame and map payloads live under their own prefix so history:* only matches metadata
+HISTORY_DATA_PREFIX = "history-data:"
+
+# Sorted set of "<date>:<city>" members scored by date, so listing never walks the keyspace
+HISTORY_INDEX_KEY = "history-index"
+
+# Saved assignments expire after a day
+HISTORY_TTL_SECONDS = 86400
+
+# Sidebar page size
+HISTORY_PAGE_SIZE = 20
+
+# Keys removed per UNLINK round trip when clearing history
+HISTORY_UNLINK_BATCH = 500
+
+HISTORY_CODEC = "zstd"
+
+# Schema metadata keys used to restore what Arrow does not round-trip on its own
+_COLUMN_KINDS_KEY = b"history_column_kinds"
+_ATTRS_KEY = b"history_attrs_json"
+
+# Arrow stream errors for values it cannot type, e.g. a column mixing strings and numbers
+_ARROW_ERRORS = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+
+
+def history_key(date_str, city):
+    return f"{HISTORY_PREFIX}{date_str}:{city}"
+
+
+def history_data_key(date_str, city, part):
+    return f"{HISTORY_DATA_PREFIX}{date_str}:{city}:{part}"
+
+
+def _index_member(date_str, city):
+    return f"{date_str}:{city}"
+
+
+def _index_score(date_str):
+    """Dates sort as YYYYMMDD integers, newest highest."""
+    return int(date_str.replace("-", ""))
+
+
+def _item_keys(member):
+    date_str, city = member.split(":", 1)
+    return [history_key(date_str, city)] + [history_data_key(date_str, city, part) for part in ("phlebs", "patients", "map")]
+
+
+def _text(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _column_kinds(df):
+    """Object columns and what their values are: "list", "tuple" or plain "object"."""
+    kinds = {}
+    for column in df.columns[df.dtypes == object]:
+        values = df[column].dropna()
+        first = values.iloc[0] if len(values) else None
+        kinds[str(column)] = "tuple" if isinstance(first, tuple) else "list" if isinstance(first, list) else "object"
+    return kinds
+
+
+def _coerce_mixed_columns(df):
+    """Copy of df with the object columns Arrow cannot type stored as strings (missing values kept)."""
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        try:
+            pa.array(df[column], from_pandas=True)
+        except _ARROW_ERRORS:
+            values = df[column]
+            df[column] = values.astype(str).where(values.notna(), None)
+    return df
+
+
+def _json_default(value):
+    """Let json.dumps write NumPy scalars (e.g. counts in a route report) as plain numbers."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} in DataFrame.attrs cannot be saved to history")
+
+
+def encode_frame(df):
+    """
+    Serialize a DataFrame as a zstd-compressed Arrow IPC stream.
+
+    List and tuple cells and object dtypes are recorded in the schema metadata so
+    ``decode_frame`` gives back the same values the app used before saving.
+    ``df.attrs`` is stored as JSON. Columns mixing unrelated types (e.g. IDs that
+    are sometimes numbers) are saved as strings.
+
+    Returns:
+        Tuple of (format, bytes); format is always "arrow"
+
+    Raises:
+        ValueError: If the frame still cannot be stored as Arrow
+        TypeError: If df.attrs holds values JSON cannot represent
+    """
+    attrs = df.attrs
+    # Arrow would also try to keep attrs in its pandas metadata; they are stored once, below
+    df = df.copy(deep=False)
+    df.attrs = {}
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=True)
+    except _ARROW_ERRORS:
+        df = _coerce_mixed_columns(df)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        except _ARROW_ERRORS as e:
+            raise ValueError(f"Cannot save frame to history: {e}") from e
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[_COLUMN_KINDS_KEY] = json.dumps(_column_kinds(df)).encode()
+    if attrs:
+        metadata[_ATTRS_KEY] = json.dumps(attrs, default=_json_default).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression=HISTORY_CODEC)
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return "arrow", sink.getvalue().to_pybytes()
+
+
+def decode_frame(data):
+    """Inverse of ``encode_frame``."""
+    table = pa.ipc.open_stream(pa.py_buffer(data)).read_all()
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    for column, kind in json.loads(metadata.get(_COLUMN_KINDS_KEY, b"{}")).items():
+        if column not in df.columns:
+            continue
+        if kind in ("list", "tuple"):
+            convert = list if kind == "list" else tuple
+            df[column] = pd.Series(
+                [convert(value.tolist()) if isinstance(value, np.ndarray) else value for value in df[column]],
+                index=df.index, dtype=object,
+            )
+        else:
+            df[column] = df[column].astype(object)
+    if _ATTRS_KEY in metadata:
+        df.attrs = json.loads(metadata[_ATTRS_KEY])
+    return df
+
+
+def save_history(redis_conn, date_str, city, map_html, assigned_phlebs, assigned_patients, use_scheduled_time,
+                 ttl_seconds=HISTORY_TTL_SECONDS):
+    """
+    Store one assignment as a small metadata hash plus compressed frame and map payloads.
+
+    Args:
+        redis_conn: Redis connection from ``initialize_redis``
+        date_str: Assignment date as YYYY-MM-DD
+        city: Assignment city
+        map_html: Rendered map HTML
+        assigned_phlebs: DataFrame of assigned phlebotomists
+        assigned_patients: DataFrame of assigned patients
+        use_scheduled_time: Routing mode the assignment used
+        ttl_seconds: Expiry for every key of the item
+
+    Returns:
+        Dict with the metadata key and the stored payload sizes in bytes
+    """
+    start = time.perf_counter()
+    client = binary_redis(redis_conn)
+    phlebs_format, phlebs_data = encode_frame(assigned_phlebs)
+    patients_format, patients_data = encode_frame(assigned_patients)
+    map_bytes = map_html.encode("utf-8")
+    map_data = pa.compress(map_bytes, codec=HISTORY_CODEC, asbytes=True)
+
+    key = history_key(date_str, city)
+    metadata = {
+        "date": date_str,
+        "city": city,
+        "use_scheduled_time": int(bool(use_scheduled_time)),
+        "timestamp": datetime.now().isoformat(),
+        "patients": len(assigned_patients),
+        "phlebs": len(assigned_phlebs),
+        "phlebs_format": phlebs_format,
+        "patients_format": patients_format,
+        "map_size": len(map_bytes),
+    }
+
+    payloads = {"phlebs": phlebs_data, "patients": patients_data, "map": map_data}
+    pipe = client.pipeline()
+    pipe.delete(key)
+    pipe.hset(key, mapping=metadata)
+    pipe.expire(key, ttl_seconds)
+    for part, data in payloads.items():
+        pipe.set(history_data_key(date_str, city, part), data, ex=ttl_seconds)
+    pipe.zadd(HISTORY_INDEX_KEY, {_index_member(date_str, city): _index_score(date_str)})
+    pipe.execute()
+
+    sizes = {part: len(data) for part, data in payloads.items()}
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 💾 Saved {key}: frames {sizes['phlebs'] + sizes['patients']} B, "
+          f"map {sizes['map']} B compressed in {time.perf_counter() - start:.3f}s")
+    return {"key": key, "sizes": sizes}
+
+
+def _decode_metadata(fields):
+    metadata = {key.decode(): value.decode() for key, value in fields.items()}
+    metadata["use_scheduled_time"] = metadata.get("use_scheduled_time") == "1"
+    for name in ("patients", "phlebs", "map_size"):
+        if name in metadata:
+            metadata[name] = int(metadata[name])
+    return metadata
+
+
+def load_history(redis_conn, date_str, city):
+    """
+    Load one saved assignment's metadata and frames, without the map.
+
+    Returns:
+        Dict of the metadata fields plus "assigned_phlebs" and "assigned_patients",
+        or None if the item does not exist
+    """
+    client = binary_redis(redis_conn)
+    pipe = client.pipeline(transaction=False)
+    pipe.hgetall(history_key(date_str, city))
+    pipe.get(history_data_key(date_str, city, "phlebs"))
+    pipe.get(history_data_key(date_str, city, "patients"))
+    fields, phlebs_data, patients_data = pipe.execute(raise_on_error=False)
+    if isinstance(fields, Exception):
+        # A history entry written in the old single-JSON-string format; it expires within a day
+        return None
+    if not fields or phlebs_data is None or patients_data is None:
+        return None
+
+    history = _decode_metadata(fields)
+    if history.get("phlebs_format", "arrow") != "arrow" or history.get("patients_format", "arrow") != "arrow":
+        # Saved as a pickle by older code; never unpickled, since anyone with access to Redis could write one
+        return None
+    history["assigned_phlebs"] = decode_frame(phlebs_data)
+    history["assigned_patients"] = decode_frame(patients_data)
+    return history
+
+
+def load_history_map(redis_conn, date_str, city):
+    """Load and decompress the map HTML of a saved assignment, or None if it is gone."""
+    client = binary_redis(redis_conn)
+    pipe = client.pipeline(transaction=False)
+    pipe.hget(history_key(date_str, city), "map_size")
+    pipe.get(history_data_key(date_str, city, "map"))
+    map_size, map_data = pipe.execute(raise_on_error=False)
+    if isinstance(map_size, Exception) or map_size is None or map_data is None:
+        return None
+    return pa.decompress(map_data, decompressed_size=int(map_size), codec=HISTORY_CODEC, asbytes=True).decode("utf-8")
+
+
+def list_history(redis_conn, offset=0, limit=HISTORY_PAGE_SIZE):
+    """
+    One page of saved assignments, newest date first, read from the history index.
+
+    Members whose items have expired are dropped from the index as they are met,
+    so the cost stays proportional to the page size rather than the keyspace.
+
+    Args:
+        redis_conn: Redis connection
+        offset: Index of the first item of the page
+        limit: Page size
+
+    Returns:
+        Tuple of (list of {"date", "city", "key"} dicts, total items in the index)
+    """
+    items = []
+    start = offset
+    while len(items) < limit:
+        stop = start + limit - len(items) - 1
+        members = [_text(member) for member in redis_conn.zrevrange(HISTORY_INDEX_KEY, start, stop)]
+        if not members:
+            break
+        pipe = redis_conn.pipeline(transaction=False)
+        for member in members:
+            pipe.exists(HISTORY_PREFIX + member)
+        live = pipe.execute()
+
+        stale = [member for member, exists in zip(members, live) if not exists]
+        if stale:
+            redis_conn.zrem(HISTORY_INDEX_KEY, *stale)
+        for member, exists in zip(members, live):
+            if exists:
+                date_str, city = member.split(":", 1)
+                items.append({"date": date_str, "city": city, "key": HISTORY_PREFIX + member})
+        # Removing stale members shifts the ranks after them down
+        start += len(members) - len(stale)
+
+    return items, redis_conn.zcard(HISTORY_INDEX_KEY)
+
+
+def _unlink_batches(redis_conn, keys, batch_size):
+    """UNLINK keys (freed in the background by Redis) in batches; returns how many existed."""
+    removed = 0
+    for offset in range(0, len(keys), batch_size):
+        removed += redis_conn.unlink(*keys[offset:offset + batch_size])
+    return removed
+
+
+def clear_history(redis_conn, batch_size=HISTORY_UNLINK_BATCH):
+    """
+    Remove every saved assignment without blocking the server.
+
+    Indexed items are unlinked batch by batch. A SCAN sweep then removes any history
+    keys the index does not know about, e.g. entries saved before it existed.
+
+    Returns:
+        Number of history items removed
+    """
+    cleared = 0
+    while True:
+        members = [_text(member) for member in redis_conn.zrange(HISTORY_INDEX_KEY, 0, batch_size - 1)]
+        if not members:
+            break
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.unlink(*[key for member in members for key in _item_keys(member)])
+        pipe.zrem(HISTORY_INDEX_KEY, *members)
+        pipe.execute()
+        cleared += len(members)
+
+    # Items saved before the index existed, and payloads left behind by expired metadata
+    stray = [_text(key) for key in redis_conn.scan_iter(match=f"{HISTORY_PREFIX}*", count=batch_size)]
+    cleared += _unlink_batches(redis_conn, stray, batch_size)
+    stray_data = [_text(key) for key in redis_conn.scan_iter(match=f"{HISTORY_DATA_PREFIX}*", count=batch_size)]
+    _unlink_batches(redis_conn, stray_data, batch_size)
+    return cleared
@@ -0,0 +1,183 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Partition column derived from ScheduledDtm, stored as YYYY-MM-DD
+PARTITION_COLUMN = "ScheduledDate"
+
+DATETIME_COLUMNS = ["ScheduledDtm", "CollectedDtm", "CreatedDtm", "CreatedWhenDtm"]
+
+# Low-cardinality string columns stored as dictionary-encoded categoricals
+CATEGORICAL_COLUMNS = [
+    "City", "PatientCity", "PatientState", "PatientCountry", "DropOffLocation",
+    "ServiceAreaCode", "ServiceAreaDescription", "BillingLab", "CollectionCenter",
+    "OwnerID", "CreatedBy", "PhlebotomistID.1",
+]
+
+# Coordinates stay float64: float32 turns 40.7128 into 40.71279907, which changes 5-decimal route IDs
+COORDINATE_COLUMNS = ["PatientLatitude", "PatientLongitude", "PhlebotomistLatitude", "PhlebotomistLongitude"]
+
+# Identifier-like columns that pandas would otherwise infer as int or float per file
+STRING_COLUMNS = ["PatientSysID", "ParentID", "DoctorID", "OrderingClinicID"]
+
+MANIFEST_FILE = "_source.json"
+
+# Bumped whenever the stored schema changes, so datasets written by older code are converted again
+SCHEMA_VERSION = 2
+
+
+def trips_dataset_path(csv_path):
+    """Return the Parquet dataset directory used for a trips CSV export."""
+    stem, _ = os.path.splitext(csv_path)
+    return f"{stem}_parquet"
+
+
+def apply_trip_schema(trips_df):
+    """
+    Coerce a raw trips export to the fixed ingest schema.
+
+    Datetime columns are parsed, coordinates become float64, low-cardinality
+    strings become categoricals and identifier columns become strings, so every
+    export produces the same column types.
+
+    Args:
+        trips_df: DataFrame read from a trips CSV export
+
+    Returns:
+        DataFrame with typed columns and the ScheduledDate partition column
+    """
+    for col in DATETIME_COLUMNS:
+        if col in trips_df.columns:
+            trips_df[col] = pd.to_datetime(trips_df[col], errors="coerce")
+
+    for col in COORDINATE_COLUMNS:
+        if col in trips_df.columns:
+            trips_df[col] = pd.to_numeric(trips_df[col], errors="coerce").astype("float64")
+
+    for col in STRING_COLUMNS:
+        if col in trips_df.columns:
+            trips_df[col] = trips_df[col].astype("string")
+
+    for col in CATEGORICAL_COLUMNS:
+        if col in trips_df.columns:
+            trips_df[col] = trips_df[col].astype("string").astype("category")
+
+    trips_df[PARTITION_COLUMN] = trips_df["ScheduledDtm"].dt.strftime("%Y-%m-%d")
+    return trips_df
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"source": os.path.abspath(csv_path), "size": stat.st_size, "mtime": stat.st_mtime,
+            "schema_version": SCHEMA_VERSION}
+
+
+def _is_current(csv_path, dataset_dir):
+    """Check whether dataset_dir was converted from the current version of csv_path."""
+    manifest_path = os.path.join(dataset_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return False
+    try:
+        with open(manifest_path, "r") as file:
+            return json.load(file) == _source_signature(csv_path)
+    except (json.JSONDecodeError, OSError):
+        return False
+
+
+def convert_trips_to_parquet(csv_path, dataset_dir=None):
+    """
+    Convert a trips CSV export into a Parquet dataset partitioned by scheduled date.
+
+    The dataset is written to a temporary directory and swapped in when
+    complete, so readers never see a half-written dataset.
+
+    Args:
+        csv_path: Path to the trips CSV export
+        dataset_dir: Output directory (defaults to "<csv stem>_parquet")
+
+    Returns:
+        Path to the dataset directory
+    """
+    dataset_dir = dataset_dir or trips_dataset_path(csv_path)
+    print(f"Converting {csv_path} to Parquet dataset {dataset_dir}...")
+
+    trips_df = apply_trip_schema(pd.read_csv(csv_path, low_memory=False))
+    table = pa.Table.from_pandas(trips_df, preserve_index=False)
+
+    tmp_dir = f"{dataset_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    ds.write_dataset(
+        table,
+        tmp_dir,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive"),
+        existing_data_behavior="error",
+    )
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as file:
+        json.dump(_source_signature(csv_path), file)
+
+    shutil.rmtree(dataset_dir, ignore_errors=True)
+    os.replace(tmp_dir, dataset_dir)
+
+    print(f"✅ Wrote {len(trips_df)} trips across {trips_df[PARTITION_COLUMN].nunique()} date partitions")
+    return dataset_dir
+
+
+def _normalize_dates(dates):
+    if dates is None:
+        return None
+    if isinstance(dates, (str, pd.Timestamp)) or not hasattr(dates, "__iter__"):
+        dates = [dates]
+    return [pd.to_datetime(date).strftime("%Y-%m-%d") for date in dates]
+
+
+def load_trips(source, columns=None, dates=None, cities=None):
+    """
+    Load trips from a Parquet dataset, reading only the requested columns and date partitions.
+
+    A CSV path is converted to Parquet on first use, and again whenever the CSV
+    changes. After that, loads read the dataset directly.
+
+    Args:
+        source: Trips CSV export or Parquet dataset directory
+        columns: Columns to load (defaults to all); columns missing from the dataset are skipped
+        dates: Date or list of dates to load (defaults to all)
+        cities: City or list of cities to load (defaults to all)
+
+    Returns:
+        DataFrame of trips
+    """
+    if os.path.isdir(source):
+        dataset_dir = source
+    else:
+        dataset_dir = trips_dataset_path(source)
+        if not _is_current(source, dataset_dir):
+            convert_trips_to_parquet(source, dataset_dir)
+
+    dataset = ds.dataset(
+        dataset_dir,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, pa.string())]), flavor="hive"),
+    )
+
+    filters = []
+    date_keys = _normalize_dates(dates)
+    if date_keys is not None:
+        filters.append(ds.field(PARTITION_COLUMN).isin(date_keys))
+    if cities is not None:
+        cities = [cities] if isinstance(cities, str) else list(cities)
+        filters.append(ds.field("City").isin(cities))
+
+    expression = None
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+
+    stored = [name for name in dataset.schema.names if name != PARTITION_COLUMN]
+    # Exports differ in their optional columns (e.g. "PhlebotomistID.1"), so callers list every column they can use
+    columns = stored if columns is None else [name for name in columns if name in stored]
+
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
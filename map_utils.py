@@ -1,11 +1,658 @@
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
 import folium
+import numpy as np
+import pandas as pd
+from folium.elements import JSCSSMixin
+from folium.map import Layer
+from folium.plugins import MarkerCluster
+from jinja2 import Template
+
+from distance_utils import pairwise_distance
+from dropoff_index import load_dropoffs
+from polyline_utils import simplify_polyline
+from profiling_utils import traced
+from routing_client import fetch_routes
+
+# Rendered per-phlebotomist route fragments kept in memory, least recently used evicted first
+ROUTE_FRAGMENT_CACHE_SIZE = 256
+
+# Patient columns that affect a route fragment; any change to them re-renders that route only
+FRAGMENT_PATIENT_COLUMNS = [
+    "AssignedPhlebID", "TripOrderInDay", "PatientLatitude", "PatientLongitude", "ScheduledDtm",
+    "UserReqID", "PatientID", "PatientAddress", "PatientFirstName", "PatientLastName", "WorkloadPoints",
+    "DropOffSequence", "DropOffClinicLoc", "DropOffLabID", "DropOffClinicName",
+]
+
+# Maps with at least this many patients use the compact GeoJSON rendering unless told otherwise
+COMPACT_MAP_MIN_PATIENTS = 300
+
+# Compact maps simplify route geometry to about this many screen pixels at this zoom level
+COMPACT_SIMPLIFY_ZOOM = 15
+COMPACT_SIMPLIFY_PIXELS = 1.0
+
+# Decimal places kept for coordinates in compact maps (5 places is about 1 m)
+COMPACT_COORDINATE_DECIMALS = 5
+
+# Builds one route layer from its fragment: route lines and sequence labels go in the
+# layer, markers go in the shared patient / phlebotomist / dropoff clusters
+ROUTE_FRAGMENT_JS = """
+function renderRouteFragment(layer, clusters, fragment) {
+    fragment.lines.forEach(function (line) {
+        L.polyline(line.points, {color: fragment.color, weight: 3, opacity: line.opacity})
+            .bindTooltip("<div>" + line.tooltip + "</div>", {sticky: true})
+            .addTo(layer);
+    });
+    fragment.labels.forEach(function (label) {
+        L.marker(label.location, {
+            icon: L.divIcon({html: label.html, iconSize: [20, 20], iconAnchor: [10, 10], className: "empty"})
+        }).bindTooltip("<div>" + label.tooltip + "</div>", {sticky: true}).addTo(layer);
+    });
+    fragment.markers.forEach(function (marker) {
+        L.marker(marker.location, {
+            icon: L.AwesomeMarkers.icon({
+                markerColor: marker.color, iconColor: "white", icon: marker.icon,
+                prefix: "fa", extraClasses: "fa-rotate-0"
+            })
+        }).bindPopup(L.popup({maxWidth: 300}).setContent(marker.popup)).addTo(clusters[marker.cluster]);
+    });
+}
+"""
+
+# Compact rendering: one GeoJSON layer per entity type, styled and given popups from
+# feature properties in the browser instead of one folium element per marker
+COMPACT_LAYER_JS = """
+function compactPopupHtml(properties) {
+    var html = '<div style="font-family: Arial, sans-serif; margin: 0; padding: 0;">' +
+        '<div style="font-weight: bold; font-size: 16px; margin-bottom: 8px; border-bottom: 1px solid #e0e0e0; padding-bottom: 5px;">' +
+        properties.title + '</div><div style="font-size: 13px;">';
+    properties.rows.forEach(function (row) {
+        html += '<div style="margin-bottom: 4px;"><span style="font-weight: 500;">' + row[0] + ':</span> ' + row[1] + '</div>';
+    });
+    return html + '</div></div>';
+}
+
+function compactSequenceLabel(properties) {
+    return '<div style="background-color: ' + properties.color + '; color: white; border-radius: 50%; ' +
+        'width: 24px; height: 20px; display: flex; align-items: center; justify-content: center; ' +
+        'font-weight: bold; font-size: 12px; border: 2px solid white; box-shadow: 0 0 4px rgba(0,0,0,0.5);">' +
+        properties.label + '</div>';
+}
+
+function compactLayer(kind, data) {
+    if (kind === "routes") {
+        return L.geoJSON(data, {
+            style: function (feature) {
+                return {color: feature.properties.color, weight: 3, opacity: feature.properties.opacity};
+            },
+            pointToLayer: function (feature, latlng) {
+                return L.marker(latlng, {icon: L.divIcon({
+                    html: compactSequenceLabel(feature.properties), iconSize: [20, 20], iconAnchor: [10, 10], className: "empty"
+                })});
+            },
+            onEachFeature: function (feature, layer) {
+                layer.bindTooltip("<div>" + feature.properties.tooltip + "</div>", {sticky: true});
+            }
+        });
+    }
+    var cluster = L.markerClusterGroup();
+    L.geoJSON(data, {
+        pointToLayer: function (feature, latlng) {
+            return L.marker(latlng, {icon: L.AwesomeMarkers.icon({
+                markerColor: feature.properties.color, iconColor: "white", icon: feature.properties.icon,
+                prefix: "fa", extraClasses: "fa-rotate-0"
+            })});
+        },
+        onEachFeature: function (feature, layer) {
+            layer.bindPopup(compactPopupHtml(feature.properties), {maxWidth: 300});
+        }
+    }).addTo(cluster);
+    return cluster;
+}
+"""
+
+_route_fragments = OrderedDict()
+_route_fragments_lock = threading.Lock()
+
+
+class RouteLayer(Layer):
+    """
+    A toggleable map layer drawn from a pre-rendered route fragment.
+
+    The fragment is a JSON string (lines, sequence labels and markers) built once per
+    route content and cached, so rendering the map only pastes it into the page
+    instead of rendering a folium element per marker and line segment.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.featureGroup({});
+            renderRouteFragment({{ this.get_name() }}, {
+                patients: {{ this.clusters.patients.get_name() }},
+                phlebs: {{ this.clusters.phlebs.get_name() }},
+                dropoffs: {{ this.clusters.dropoffs.get_name() }}
+            }, {{ this.fragment }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, fragment, clusters, name=None, control=True):
+        super().__init__(name=name, overlay=True, control=control)
+        self._name = "RouteLayer"
+        # Keep "</script>" inside popup or tooltip text from closing the page's script block
+        self.fragment = fragment.replace("</", "<\\/")
+        self.clusters = clusters
+
+
+class FeatureCollectionLayer(JSCSSMixin, Layer):
+    """
+    One GeoJSON FeatureCollection drawn as a single layer (compact map rendering).
+
+    Point layers ("patients", "phlebs", "dropoffs") are clustered, with marker colour,
+    icon and popup taken from each feature's properties. The "routes" layer holds
+    route lines and sequence labels.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = compactLayer("{{ this.kind }}", {{ this.data }});
+        {% endmacro %}
+    """)
+
+    # L.markerClusterGroup comes from the same plugin folium's MarkerCluster loads
+    default_js = MarkerCluster.default_js
+    default_css = MarkerCluster.default_css
+
+    def __init__(self, kind, features, name=None):
+        super().__init__(name=name, overlay=True, control=True)
+        self._name = "FeatureCollectionLayer"
+        self.kind = kind
+        data = json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":"))
+        self.data = data.replace("</", "<\\/")
+
+
+def zoom_tolerance_degrees(latitude, zoom=COMPACT_SIMPLIFY_ZOOM, pixels=COMPACT_SIMPLIFY_PIXELS):
+    """Ground size of a few screen pixels at a zoom level, in degrees of latitude."""
+    meters_per_pixel = 156543.03392 * np.cos(np.radians(latitude)) / 2 ** zoom
+    return float(pixels * meters_per_pixel / 111320.0)
+
+
+def _popup_html(title, content_lines, width=250, height=150):
+    """Render a consistent popup (title plus "label: value" lines) as the iframe HTML folium would embed."""
+    # Start with popup title in bold
+    html = f"""
+        <div style="font-family: Arial, sans-serif; margin: 0; padding: 0;">
+            <div style="font-weight: bold; font-size: 16px; margin-bottom: 8px; border-bottom: 1px solid #e0e0e0; padding-bottom: 5px;">
+                {title}
+            </div>
+            <div style="font-size: 13px;">
+        """
+
+    # Add each content line
+    for line in content_lines:
+        if line[0] and line[1]:  # Both label and value exist
+            html += f"""
+                <div style="margin-bottom: 4px;">
+                    <span style="font-weight: 500;">{line[0]}:</span> {line[1]}
+                </div>
+                """
+
+    # Close the HTML
+    html += """
+            </div>
+        </div>
+        """
+    return folium.IFrame(html=html, width=width, height=height).render()
+
+
+def _sequence_label_html(sequence_num, color):
+    """HTML for the circular sequence number shown on each route segment."""
+    return f'''
+        <div style="
+            background-color: {color};
+            color: white;
+            border-radius: 50%;
+            width: 24px;
+            height: 20px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            font-weight: bold;
+            font-size: 12px;
+            border: 2px solid white;
+            box-shadow: 0 0 4px rgba(0,0,0,0.5);
+        ">
+            {sequence_num}
+        </div>
+    '''
+
+
+def _fragment_value(value):
+    """JSON-safe form of a coordinate or label value (NaN becomes null)."""
+    if isinstance(value, float) and value != value:
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def _route_fragment_key(phleb, phleb_color, phleb_patients, dropoff_addresses, use_ors, compact=False):
+    """Hash everything a route fragment is built from: the phlebotomist, their patients and the routing source."""
+    columns = [column for column in FRAGMENT_PATIENT_COLUMNS if column in phleb_patients.columns]
+    patient_hash = pd.util.hash_pandas_object(phleb_patients[columns].astype(str), index=True).to_numpy().tobytes()
+    lab_ids = phleb_patients["DropOffLabID"].dropna().unique() if "DropOffLabID" in phleb_patients.columns else []
+    spec = {
+        "phleb": [str(phleb.get(field)) for field in
+                  ["PhlebotomistID.1", "Name", "PhlebotomistName", "PhlebotomistLatitude", "PhlebotomistLongitude",
+                   "City", "Address"]],
+        "color": phleb_color,
+        "columns": columns,
+        "dropoffs": sorted((str(lab_id), str(dropoff_addresses.get(lab_id))) for lab_id in lab_ids),
+        "ors": use_ors,
+        "compact": compact,
+    }
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode())
+    digest.update(patient_hash)
+    return digest.hexdigest()
+
+
+def _get_route_fragment(key):
+    with _route_fragments_lock:
+        fragment = _route_fragments.get(key)
+        if fragment is not None:
+            _route_fragments.move_to_end(key)
+        return fragment
+
+
+def _store_route_fragment(key, fragment):
+    with _route_fragments_lock:
+        _route_fragments[key] = fragment
+        _route_fragments.move_to_end(key)
+        while len(_route_fragments) > ROUTE_FRAGMENT_CACHE_SIZE:
+            _route_fragments.popitem(last=False)
+
+
+def _full_fragment(color, lines, labels, markers):
+    """JSON fragment for RouteLayer, with each marker's popup rendered to folium's iframe HTML."""
+    markers = [
+        {**{key: value for key, value in marker.items() if key not in ("title", "rows")},
+         "popup": _popup_html(marker["title"], marker["rows"])}
+        for marker in markers
+    ]
+    return json.dumps({"color": color, "lines": lines, "labels": labels, "markers": markers})
+
+
+def _compact_coordinates(lat, lon):
+    """GeoJSON [lon, lat] position rounded for compact maps (None for missing values)."""
+    return [None if value is None else round(value, COMPACT_COORDINATE_DECIMALS)
+            for value in (_fragment_value(lon), _fragment_value(lat))]
+
+
+def _compact_features(color, lines, labels, markers, tolerance):
+    """
+    GeoJSON features for compact maps, grouped by layer.
+
+    Route lines are simplified with Douglas-Peucker to the given tolerance. Popups are
+    sent as a title plus "label: value" rows and rendered in the browser.
+
+    Returns:
+        Dict mapping "patients", "phlebs", "dropoffs" and "routes" to lists of features
+    """
+    features = {"patients": [], "phlebs": [], "dropoffs": [], "routes": []}
+    for marker in markers:
+        features[marker["cluster"]].append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": _compact_coordinates(*marker["location"])},
+            "properties": {
+                "color": marker["color"],
+                "icon": marker["icon"],
+                "title": marker["title"],
+                "rows": [[str(label), str(value)] for label, value in marker["rows"] if label and value],
+            },
+        })
+    for line in lines:
+        points = simplify_polyline(line["points"], tolerance)
+        features["routes"].append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [_compact_coordinates(lat, lon) for lat, lon in points]},
+            "properties": {"color": color, "opacity": line["opacity"], "tooltip": line["tooltip"]},
+        })
+    for label in labels:
+        features["routes"].append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": _compact_coordinates(*label["location"])},
+            "properties": {"color": color, "label": label["sequence"], "tooltip": label["tooltip"]},
+        })
+    return features
+
+
+def _marker_fragments(patients, phleb_colors, dropoff_map, dropoff_addresses):
+    """Patient and dropoff marker entries for a set of patients."""
+    markers = []
+
+    # Patient markers
+    for idx, patient in patients.iterrows():
+        patient_id = patient.get('UserReqID', idx)
+        phleb_id = patient['AssignedPhlebID']
+        trip_order = patient['TripOrderInDay']
+        workload = patient.get('WorkloadPoints', 'N/A')
+        patient_name = patient.get("PatientFirstName", '') + patient.get("PatientLastName", '')
+
+        # Format scheduled time
+        scheduled_time = patient['ScheduledDtm'].strftime('%H:%M') if 'ScheduledDtm' in patient and pd.notna(patient['ScheduledDtm']) else 'Unknown'
+
+        popup_content = [
+            ["ID", patient_id],
+            ["Name", patient_name],
+            ["Phlebotomist", phleb_id],
+            ["Order", trip_order],
+            ["Time", scheduled_time],
+            ["Workload", workload]
+        ]
+        markers.append({
+            "cluster": "patients",
+            "location": [_fragment_value(patient['PatientLatitude']), _fragment_value(patient['PatientLongitude'])],
+            "color": phleb_colors.get(phleb_id, 'gray'),
+            "icon": "user",
+            "title": "Patient",
+            "rows": popup_content,
+        })
+
+    # Dropoff markers
+    for idx, patient in patients.iterrows():
+        if idx not in dropoff_map:
+            continue
+        info = dropoff_map[idx]
+        phleb_id = patient['AssignedPhlebID']
+        dropoff_lab_id = info['lab_id']
+
+        popup_content = [
+            ["Lab ID", dropoff_lab_id],
+            ["Clinic", info['clinic_name']],
+            ["Address", dropoff_addresses.get(dropoff_lab_id, "Unknown Address")],
+            ["For Patient", patient.get('PatientID', idx)],
+            ["Sequence", info['sequence'] if pd.notna(info['sequence']) else 'Unknown'],
+            ["Phlebotomist", phleb_id]
+        ]
+        markers.append({
+            "cluster": "dropoffs",
+            "location": [_fragment_value(value) for value in info['location']],
+            "color": phleb_colors.get(phleb_id, 'gray'),
+            "icon": "flask",
+            "title": "Dropoff Location",
+            "rows": popup_content,
+        })
+
+    return markers
+
+
+def _route_stops(phleb, phleb_name, phleb_patients, dropoff_map, dropoff_addresses, has_dropoff_sequence):
+    """
+    List a phlebotomist's stops in visiting order.
+
+    Returns:
+        Tuple of (stops sorted by visiting order, trip panel entries for the stops after the start)
+    """
+    # Create a list of all stops (patients and dropoffs) based on the optimization results
+    all_stops = []
+    trip_stops = []
+
+    # Start with phlebotomist home location
+    all_stops.append({
+        'type': 'start',
+        'location': (phleb['PhlebotomistLatitude'], phleb['PhlebotomistLongitude']),
+        'label': f"Start: {phleb_name}",
+        'order': 0
+    })
+
+    # Add patients based on their TripOrderInDay
+    for idx, patient in phleb_patients.sort_values('TripOrderInDay').iterrows():
+        patient_id = patient.get('UserReqID', idx)
+        patient_order = patient['TripOrderInDay']
+        patient_location = (patient['PatientLatitude'], patient['PatientLongitude'])
+        scheduled_time = patient['ScheduledDtm'].strftime('%H:%M') if pd.notna(patient['ScheduledDtm']) else 'Unknown'
+
+        # Add patient to stops
+        all_stops.append({
+            'type': 'patient',
+            'location': patient_location,
+            'label': f"Patient {patient_id}",
+            'order': patient_order,
+            'patient_idx': idx,
+            'patient_id': patient_id,
+            'time': scheduled_time,
+            'address': patient.get('PatientAddress', 'Unknown Address')
+        })
+
+        # Add to trip details
+        trip_stops.append({
+            "type": "patient",
+            "name": f"Patient {patient_id}",
+            "address": patient.get("PatientAddress", "Patient Address"),
+            "lat": patient_location[0],
+            "lon": patient_location[1],
+            "order": patient_order,
+            "distance": 0,  # Will be updated later
+            "cumulative_distance": 0,  # Will be updated later
+            "time": scheduled_time
+        })
+
+    # Now add dropoffs based on DropOffSequence if available
+    if has_dropoff_sequence:
+        # Group patients by dropoff sequence
+        dropoff_groups = defaultdict(list)
+        for idx, patient in phleb_patients.iterrows():
+            if pd.notna(patient.get('DropOffSequence')):
+                dropoff_groups[patient['DropOffSequence']].append(idx)
+
+        # Add dropoffs in sequence order
+        for seq in sorted(dropoff_groups.keys()):
+            # Get the first patient in this group to get the dropoff info
+            patient_idx = dropoff_groups[seq][0]
+            if patient_idx in dropoff_map:
+                dropoff_info = dropoff_map[patient_idx]
+
+                # Get the patient IDs in this group
+                patient_ids = [phleb_patients.loc[idx].get('PatientID', idx) for idx in dropoff_groups[seq]]
+                patients_str = ", ".join(str(pid) for pid in patient_ids)
+
+                # Add dropoff to stops
+                all_stops.append({
+                    'type': 'dropoff',
+                    'location': dropoff_info['location'],
+                    'label': f"Dropoff: {dropoff_info['clinic_name']}",
+                    'order': float(seq) + 0.5,  # Place after patient but keep sequence order
+                    'patients': patients_str,
+                    'lab_id': dropoff_info['lab_id'],
+                    'clinic_name': dropoff_info['clinic_name']
+                })
+
+                # Add to trip details
+                trip_stops.append({
+                    "type": "dropoff",
+                    "name": f"Dropoff: {dropoff_info['clinic_name']}",
+                    "address": dropoff_addresses.get(dropoff_info['lab_id'], "Unknown Address"),
+                    "lat": dropoff_info['location'][0],
+                    "lon": dropoff_info['location'][1],
+                    "order": float(seq) + 0.5,
+                    "distance": 0,  # Will be updated later
+                    "cumulative_distance": 0,  # Will be updated later
+                    "for_patients": patients_str,
+                    "lab_id": dropoff_info['lab_id'],
+                    "time": ""
+                })
+
+    # Sort all stops by order
+    all_stops.sort(key=lambda x: x['order'])
+    return all_stops, trip_stops
+
+
+def _build_route_fragment(phleb, phleb_name, phleb_color, phleb_patients, phleb_colors, dropoff_map,
+                          dropoff_addresses, has_dropoff_sequence, leg_routes=None, compact=False, stops=None):
+    """
+    Build one phlebotomist's route: its map fragment, legend summary and trip panel details.
+
+    Legs are drawn from leg_routes (ORS results keyed by (start, end) location) when given,
+    otherwise as straight lines. stops can pass in a precomputed ``_route_stops`` result.
+
+    Returns:
+        Dict with "route" (legend entry), "trip" (trip panel entry), "fallback_legs" (legs
+        ORS was asked for but did not route, drawn as straight lines) and either "fragment"
+        (JSON string for RouteLayer) or, when compact, "features" (GeoJSON features by layer)
+    """
+    phleb_id = phleb['PhlebotomistID.1']
+    phleb_lat = phleb['PhlebotomistLatitude']
+    phleb_lon = phleb['PhlebotomistLongitude']
+    lines = []
+    labels = []
+
+    # Phlebotomist marker
+    popup_content = [
+        ["Name", phleb_name],
+        ["ID", phleb_id],
+        ["City", phleb.get("City", "Unknown")]
+    ]
+    markers = [{
+        "cluster": "phlebs",
+        "location": [_fragment_value(phleb_lat), _fragment_value(phleb_lon)],
+        "color": phleb_color,
+        "icon": "home",
+        "title": "Phlebotomist",
+        "rows": popup_content,
+    }]
+
+    # Initialize route info
+    route_info = {
+        "color": phleb_color,
+        "distance": 0,
+        "patients": len(phleb_patients),
+        "workload": phleb_patients['WorkloadPoints'].sum() if 'WorkloadPoints' in phleb_patients.columns else len(phleb_patients),
+        "name": phleb_name
+    }
+
+    # Initialize trip details for this phlebotomist
+    trip = {
+        "name": phleb_name,
+        "color": phleb_color,
+        "stops": [{
+            "type": "start",
+            "name": f"{phleb_name} Starting Point",
+            "address": phleb.get("Address", "Home Base"),
+            "lat": phleb_lat,
+            "lon": phleb_lon,
+            "order": 0,
+            "distance": 0,
+            "cumulative_distance": 0,
+            "time": "Start"
+        }]
+    }
+
+    fallback_legs = 0
+
+    def fragment_result():
+        route_markers = markers + _marker_fragments(phleb_patients, phleb_colors, dropoff_map, dropoff_addresses)
+        result = {"route": route_info, "trip": trip, "fallback_legs": fallback_legs}
+        if compact:
+            tolerance = zoom_tolerance_degrees(phleb_lat if pd.notna(phleb_lat) else 0.0)
+            result["features"] = _compact_features(phleb_color, lines, labels, route_markers, tolerance)
+        else:
+            result["fragment"] = _full_fragment(phleb_color, lines, labels, route_markers)
+        return result
+
+    # Skip routing if no patients assigned
+    if phleb_patients.empty:
+        return fragment_result()
 
-def create_assignment_map(assigned_phlebs, assigned_patients, target_date, target_city, 
-                     api_key=None, return_distances=False, use_scheduled_time=True, ors_client=None):
+    all_stops, trip_stops = stops if stops is not None else _route_stops(
+        phleb, phleb_name, phleb_patients, dropoff_map, dropoff_addresses, has_dropoff_sequence
+    )
+    trip["stops"].extend(trip_stops)
+
+    # Calculate routes between stops
+    total_distance = 0
+
+    # Straight-line distance of every leg, computed in one vectorized call
+    stop_locations = [stop['location'] for stop in all_stops]
+    straight_line_distances = pairwise_distance(stop_locations[:-1], stop_locations[1:]) if len(all_stops) > 1 else []
+
+    def add_leg(points, opacity, tooltip, midpoint, sequence_num):
+        lines.append({"points": [[_fragment_value(lat), _fragment_value(lon)] for lat, lon in points],
+                      "opacity": opacity, "tooltip": tooltip})
+        labels.append({"location": [_fragment_value(value) for value in midpoint],
+                       "html": _sequence_label_html(sequence_num, phleb_color),
+                       "sequence": sequence_num,
+                       "tooltip": f"Route #{sequence_num}"})
+
+    for i in range(1, len(all_stops)):
+        start = all_stops[i-1]['location']
+        end = all_stops[i]['location']
+        start_label = all_stops[i-1]['label']
+        end_label = all_stops[i]['label']
+
+        # Use the ORS route if the leg was routed, otherwise geodesic
+        if leg_routes is not None and leg_routes.get((start, end)):
+            route_geom, segment_distance = leg_routes[(start, end)]
+
+            # Convert coordinates for Folium and add route line and sequence label
+            route_points = [[coord[1], coord[0]] for coord in route_geom]
+            add_leg(route_points, 0.8, f'{start_label} to {end_label}: {segment_distance:.2f} miles',
+                    route_points[len(route_points) // 2], i)
+        elif leg_routes is not None:
+            print(f"Error calculating ORS route: no route for {start_label} to {end_label}")
+            if (start, end) in leg_routes:
+                # Requested but not routed (e.g. a 429 or timeout), so worth retrying next time
+                fallback_legs += 1
+
+            # Fallback to straight-line distance
+            segment_distance = straight_line_distances[i-1]
+            add_leg([start, end], 0.5, f'{start_label} to {end_label}: {segment_distance:.2f} miles (geodesic)',
+                    [(start[0] + end[0])/2, (start[1] + end[1])/2], i)
+        else:
+            # Use straight-line distance
+            segment_distance = straight_line_distances[i-1]
+            add_leg([start, end], 0.5, f'{start_label} to {end_label}: {segment_distance:.2f} miles (geodesic)',
+                    [(start[0] + end[0])/2, (start[1] + end[1])/2], i)
+
+        # Update distances in trip details
+        if i < len(trip['stops']):
+            trip['stops'][i]['distance'] = segment_distance
+
+        # Add to total distance
+        total_distance += segment_distance
+
+    # Store total distance
+    route_info["distance"] = total_distance
+
+    # Calculate cumulative distances for trip details
+    cumulative_distance = 0
+    for i in range(len(trip['stops'])):
+        if i > 0:
+            cumulative_distance += trip['stops'][i]['distance']
+        trip['stops'][i]['cumulative_distance'] = cumulative_distance
+
+    return fragment_result()
+
+
+@traced()
+def create_assignment_map(assigned_phlebs, assigned_patients, target_date, target_city,
+                     api_key=None, return_distances=False, use_scheduled_time=True, ors_client=None,
+                     compact=None):
     """
     Create a map visualization of phlebotomist assignments with proper ordering of patients and dropoffs.
 
+    Each phlebotomist's route, markers and trip details are built as one fragment and
+    cached by a hash of the route's contents. Rebuilding the map after a change only
+    re-renders (and re-routes) the phlebotomists whose routes changed. Fragments with
+    legs ORS failed to route are not cached, so the next build routes them again.
+
+    The compact rendering draws one GeoJSON layer each for patients, phlebotomists,
+    dropoffs and routes. Popups and styling are built in the browser from feature
+    properties, and route geometry is simplified with Douglas-Peucker, so large cities
+    give a much smaller page. It has one "Routes" layer instead of a layer per
+    phlebotomist.
+
     Args:
         assigned_phlebs: DataFrame with assigned phlebotomists
         assigned_patients: DataFrame with assigned patients
@@ -14,18 +661,15 @@ def create_assignment_map(assigned_phlebs, assigned_patients, target_date, targe
         api_key: OpenRouteService API key (optional)
         return_distances: Whether to return route distances
         use_scheduled_time: Whether to use scheduled time for routing
-        ors_client: Pre-initialized OpenRouteService client (optional)
+        ors_client: Pre-initialized OpenRouteService client (optional; only its API key is used)
+        compact: Use the compact GeoJSON rendering (default: only for maps with at least
+            COMPACT_MAP_MIN_PATIENTS patients)
 
     Returns:
         Map visualization and optionally a dictionary of route distances
     """
-    import folium
-    from folium.plugins import MarkerCluster
-    import pandas as pd
-    from geopy.distance import geodesic
-    import time
-    import json
-    from collections import defaultdict
+    if compact is None:
+        compact = len(assigned_patients) >= COMPACT_MAP_MIN_PATIENTS
 
     # Debug the input data
     print("\n" + "="*50)
@@ -40,46 +684,45 @@ def create_assignment_map(assigned_phlebs, assigned_patients, target_date, targe
         print(f"DropOffSequence values: {seq_values}")
         print(f"Number of patients with dropoff sequences: {assigned_patients['DropOffSequence'].notna().sum()}")
     print("="*50)
-    
+
     # Get dropoff locations data
     try:
-        # Check if dropoffs is already defined
-        dropoffs
-    except NameError:
-        # Load dropoffs data if not already loaded
-        try:
-            dropoffs = pd.read_csv("All_Dropoffs.csv")
-            print("Loaded dropoffs data successfully")
-        except Exception as e:
-            print(f"Error loading dropoffs data: {e}")
-            # Create an empty DataFrame as fallback
-            dropoffs = pd.DataFrame(columns=['LabID', 'Address'])
-
-    # If API key is provided but client isn't, initialize it
-    if api_key and not ors_client:
-        from redis_utils import initialize_ors_client
-        ors_client = initialize_ors_client(api_key)
-        if ors_client:
-            print("ORS Client initialized for creating map")
-        else:
-            print("ORS Client initialization FAILED for creating map")
+        dropoffs = load_dropoffs()
+        print("Loaded dropoffs data successfully")
+    except Exception as e:
+        print(f"Error loading dropoffs data: {e}")
+        # Create an empty DataFrame as fallback
+        dropoffs = pd.DataFrame(columns=['LabID', 'Address'])
+    dropoff_addresses = dict(zip(dropoffs['LabID'][::-1], dropoffs['Address'][::-1]))  # first match wins
+
+    # Route legs through ORS when a key is available, from api_key or the client passed in
+    routing_key = api_key or getattr(ors_client, "_key", None)
+    if routing_key:
+        print("ORS routing enabled for creating map")
 
     # Create a map centered at the mean coordinates of patients
     mean_lat = assigned_patients['PatientLatitude'].mean()
     mean_lon = assigned_patients['PatientLongitude'].mean()
     m = folium.Map(location=[mean_lat, mean_lon], zoom_start=12)
-    
+
     # Save the use_scheduled_time parameter in the map for legend reference
     m.get_root().script.add_child(folium.Element(f"var use_scheduled_time = {str(use_scheduled_time).lower()};"))
+    if compact:
+        m.get_root().script.add_child(folium.Element(COMPACT_LAYER_JS), name="compact_layer")
+        compact_features = defaultdict(list)
+    else:
+        m.get_root().script.add_child(folium.Element(ROUTE_FRAGMENT_JS), name="render_route_fragment")
 
-    # Create marker clusters for patients, phlebotomists, and dropoff locations
-    patient_cluster = MarkerCluster(name="Patients").add_to(m)
-    phleb_cluster = MarkerCluster(name="Phlebotomists").add_to(m)
-    dropoff_cluster = MarkerCluster(name="Dropoff Locations").add_to(m)
+        # Create marker clusters for patients, phlebotomists, and dropoff locations
+        clusters = {
+            "patients": MarkerCluster(name="Patients").add_to(m),
+            "phlebs": MarkerCluster(name="Phlebotomists").add_to(m),
+            "dropoffs": MarkerCluster(name="Dropoff Locations").add_to(m),
+        }
 
     # Create color map for phlebotomists
     phleb_colors = {}
-    colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightblue', 
+    colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred', 'lightblue',
               'darkblue', 'darkgreen', 'cadetblue', 'darkpurple', 'pink', 'lightgreen']
 
     for i, phleb_id in enumerate(assigned_patients['AssignedPhlebID'].unique()):
@@ -87,13 +730,13 @@ def create_assignment_map(assigned_phlebs, assigned_patients, target_date, targe
 
     # Store route information by phlebotomist
     phleb_routes = {}
-    
+
     # Dictionary to store trip details for each phlebotomist
     trip_details = {}
 
     # Process dropoff information before building routes
     dropoff_map = {}  # Maps patient index to dropoff info
-    
+
     for idx, patient in assigned_patients.iterrows():
         if pd.notna(patient.get('DropOffClinicLoc')) and patient['DropOffClinicLoc'] is not None:
             # Parse the DropOffClinicLoc which could be in various formats
@@ -104,7 +747,7 @@ def create_assignment_map(assigned_phlebs, assigned_patients, target_date, targe
                     dropoff_lat, dropoff_lon = patient['DropOffClinicLoc']
                 else:
                     continue
-                
+
                 # Store in dropoff map
                 dropoff_map[idx] = {
                     'location': (dropoff_lat, dropoff_lon),
@@ -115,399 +758,83 @@ def create_assignment_map(assigned_phlebs, assigned_patients, target_date, targe
             except (ValueError, TypeError) as e:
                 print(f"Warning: Error parsing dropoff location for patient {idx}: {e}")
 
-    # Helper function to create consistent popups
-    def create_popup(title, content_lines, width=250, height=150):
-        """Creates a consistent popup with title and content lines"""
-        
-        # Start with popup title in bold
-        html = f"""
-        <div style="font-family: Arial, sans-serif; margin: 0; padding: 0;">
-            <div style="font-weight: bold; font-size: 16px; margin-bottom: 8px; border-bottom: 1px solid #e0e0e0; padding-bottom: 5px;">
-                {title}
-            </div>
-            <div style="font-size: 13px;">
-        """
-        
-        # Add each content line
-        for line in content_lines:
-            if line[0] and line[1]:  # Both label and value exist
-                html += f"""
-                <div style="margin-bottom: 4px;">
-                    <span style="font-weight: 500;">{line[0]}:</span> {line[1]}
-                </div>
-                """
-        
-        # Close the HTML
-        html += """
-            </div>
-        </div>
-        """
-        
-        # Create the popup with iframe
-        iframe = folium.IFrame(html=html, width=width, height=height)
-        return folium.Popup(iframe, max_width=300)
+    # Partition patients by phlebotomist once
+    patients_by_phleb = dict(list(assigned_patients.groupby('AssignedPhlebID', sort=False)))
+    has_dropoff_sequence = 'DropOffSequence' in assigned_patients.columns
+    build_start = time.perf_counter()
+    reused = 0
 
-    # Add phlebotomists to the map
+    # Find the phlebotomists whose route fragments have to be rendered
+    pending = []
     for _, phleb in assigned_phlebs.iterrows():
         phleb_id = phleb['PhlebotomistID.1']
         phleb_name = phleb.get('Name', f'Phlebotomist {phleb_id}')
         if 'PhlebotomistName' in phleb:
             phleb_name = phleb['PhlebotomistName']
-        phleb_lat = phleb['PhlebotomistLatitude']
-        phleb_lon = phleb['PhlebotomistLongitude']
         phleb_color = phleb_colors.get(phleb_id, 'gray')
+        phleb_patients = patients_by_phleb.get(phleb_id, assigned_patients.iloc[0:0])
 
-        # Create popup content
-        popup_content = [
-            ["Name", phleb_name],
-            ["ID", phleb_id],
-            ["City", phleb.get("City", "Unknown")]
-        ]
-        
-        # Add phlebotomist marker with consistent popup
-        folium.Marker(
-            [phleb_lat, phleb_lon],
-            popup=create_popup("Phlebotomist", popup_content),
-            icon=folium.Icon(color=phleb_color, icon='home', prefix='fa')
-        ).add_to(phleb_cluster)
-
-        # Initialize route feature group for this phlebotomist
-        route_feature_group = folium.FeatureGroup(name=f"Route: {phleb_name}").add_to(m)
-
-        # Get patients assigned to this phlebotomist
-        phleb_patients = assigned_patients[assigned_patients['AssignedPhlebID'] == phleb_id].copy()
-        
-        # Initialize route info
-        phleb_routes[phleb_id] = {
-            "color": phleb_color,
-            "distance": 0,
-            "patients": len(phleb_patients),
-            "workload": phleb_patients['WorkloadPoints'].sum() if 'WorkloadPoints' in phleb_patients.columns else len(phleb_patients),
-            "name": phleb_name
-        }
-        
-        # Initialize trip details for this phlebotomist
-        trip_details[phleb_id] = {
-            "name": phleb_name,
-            "color": phleb_color,
-            "stops": [{
-                "type": "start",
-                "name": f"{phleb_name} Starting Point",
-                "address": phleb.get("Address", "Home Base"),
-                "lat": phleb_lat,
-                "lon": phleb_lon,
-                "order": 0,
-                "distance": 0,
-                "cumulative_distance": 0,
-                "time": "Start"
-            }]
-        }
+        key = _route_fragment_key(phleb, phleb_color, phleb_patients, dropoff_addresses, bool(routing_key), compact)
+        route_fragment = _get_route_fragment(key)
+        stops = None
+        if route_fragment is None and not phleb_patients.empty:
+            stops = _route_stops(phleb, phleb_name, phleb_patients, dropoff_map, dropoff_addresses, has_dropoff_sequence)
+        pending.append((phleb, phleb_id, phleb_name, phleb_color, phleb_patients, key, route_fragment, stops))
 
-        # Skip if no patients assigned
-        if phleb_patients.empty:
-            continue
+    # Route every leg of every re-rendered route in one concurrent batch
+    leg_routes = None
+    if routing_key:
+        legs = []
+        for *_, stops in pending:
+            locations = [stop['location'] for stop in stops[0]] if stops is not None else []
+            legs.extend(zip(locations[:-1], locations[1:]))
+        legs = [leg for leg in dict.fromkeys(legs) if np.isfinite(np.asarray(leg, dtype=float)).all()]
+        leg_routes = dict(zip(legs, fetch_routes(legs, routing_key, use_scheduled_time)))
+
+    # Add each phlebotomist's route layer, reusing cached fragments for unchanged routes
+    for phleb, phleb_id, phleb_name, phleb_color, phleb_patients, key, route_fragment, stops in pending:
+        if route_fragment is None:
+            route_fragment = _build_route_fragment(
+                phleb, phleb_name, phleb_color, phleb_patients, phleb_colors, dropoff_map,
+                dropoff_addresses, has_dropoff_sequence, leg_routes, compact, stops
+            )
+            # A fragment with straight-line stand-ins for failed ORS legs is used once, not cached
+            if not route_fragment["fallback_legs"]:
+                _store_route_fragment(key, route_fragment)
+        else:
+            reused += 1
+
+        if compact:
+            for kind, features in route_fragment["features"].items():
+                compact_features[kind].extend(features)
+        else:
+            RouteLayer(route_fragment["fragment"], clusters, name=f"Route: {phleb_name}").add_to(m)
+        phleb_routes[phleb_id] = route_fragment["route"]
+        trip_details[phleb_id] = route_fragment["trip"]
+
+    # Patients whose phlebotomist is not in assigned_phlebs still get markers
+    unrouted = assigned_patients[~assigned_patients['AssignedPhlebID'].isin(assigned_phlebs['PhlebotomistID.1'])]
+    if not unrouted.empty:
+        markers = _marker_fragments(unrouted, phleb_colors, dropoff_map, dropoff_addresses)
+        if compact:
+            for kind, features in _compact_features("gray", [], [], markers, 0).items():
+                compact_features[kind].extend(features)
+        else:
+            RouteLayer(_full_fragment("gray", [], [], markers), clusters, control=False).add_to(m)
+
+    if compact:
+        for kind, name in [("patients", "Patients"), ("phlebs", "Phlebotomists"),
+                           ("dropoffs", "Dropoff Locations"), ("routes", "Routes")]:
+            FeatureCollectionLayer(kind, compact_features[kind], name=name).add_to(m)
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🗺️ Route layers ({'compact' if compact else 'full'}): "
+          f"{reused} reused, {len(assigned_phlebs) - reused} rendered in {time.perf_counter() - build_start:.2f}s")
 
-        # Create a list of all stops (patients and dropoffs) based on the optimization results
-        all_stops = []
-        
-        # Start with phlebotomist home location
-        all_stops.append({
-            'type': 'start',
-            'location': (phleb_lat, phleb_lon),
-            'label': f"Start: {phleb_name}",
-            'order': 0
-        })
-        
-        # Add patients based on their TripOrderInDay
-        for idx, patient in phleb_patients.sort_values('TripOrderInDay').iterrows():
-            patient_id = patient.get('UserReqID', idx)
-            patient_order = patient['TripOrderInDay']
-            patient_location = (patient['PatientLatitude'], patient['PatientLongitude'])
-            scheduled_time = patient['ScheduledDtm'].strftime('%H:%M') if pd.notna(patient['ScheduledDtm']) else 'Unknown'
-            
-            # Add patient to stops
-            all_stops.append({
-                'type': 'patient',
-                'location': patient_location,
-                'label': f"Patient {patient_id}",
-                'order': patient_order,
-                'patient_idx': idx,
-                'patient_id': patient_id,
-                'time': scheduled_time,
-                'address': patient.get('PatientAddress', 'Unknown Address')
-            })
-            
-            # Add to trip details
-            trip_details[phleb_id]["stops"].append({
-                "type": "patient",
-                "name": f"Patient {patient_id}",
-                "address": patient.get("PatientAddress", "Patient Address"),
-                "lat": patient_location[0],
-                "lon": patient_location[1],
-                "order": patient_order,
-                "distance": 0,  # Will be updated later
-                "cumulative_distance": 0,  # Will be updated later
-                "time": scheduled_time
-            })
-        
-        # Now add dropoffs based on DropOffSequence if available
-        if 'DropOffSequence' in assigned_patients.columns:
-            # Group patients by dropoff sequence
-            dropoff_groups = defaultdict(list)
-            for idx, patient in phleb_patients.iterrows():
-                if pd.notna(patient.get('DropOffSequence')):
-                    dropoff_groups[patient['DropOffSequence']].append(idx)
-            
-            # Add dropoffs in sequence order
-            for seq in sorted(dropoff_groups.keys()):
-                # Get the first patient in this group to get the dropoff info
-                patient_idx = dropoff_groups[seq][0]
-                if patient_idx in dropoff_map:
-                    dropoff_info = dropoff_map[patient_idx]
-                    
-                    # Get the patient IDs in this group
-                    patient_ids = [phleb_patients.loc[idx].get('PatientID', idx) for idx in dropoff_groups[seq]]
-                    patients_str = ", ".join(str(pid) for pid in patient_ids)
-                    
-                    # Add dropoff to stops
-                    all_stops.append({
-                        'type': 'dropoff',
-                        'location': dropoff_info['location'],
-                        'label': f"Dropoff: {dropoff_info['clinic_name']}",
-                        'order': float(seq) + 0.5,  # Place after patient but keep sequence order
-                        'patients': patients_str,
-                        'lab_id': dropoff_info['lab_id'],
-                        'clinic_name': dropoff_info['clinic_name']
-                    })
-                    
-                    # Get address from dropoffs DataFrame if available
-                    dropoff_address = "Unknown Address"
-                    if dropoff_info['lab_id'] != 'Unknown':
-                        matching_dropoffs = dropoffs[dropoffs['LabID'] == dropoff_info['lab_id']]
-                        if not matching_dropoffs.empty:
-                            dropoff_address = matching_dropoffs.iloc[0]['Address']
-                    
-                    # Add to trip details
-                    trip_details[phleb_id]["stops"].append({
-                        "type": "dropoff",
-                        "name": f"Dropoff: {dropoff_info['clinic_name']}",
-                        "address": dropoff_address,
-                        "lat": dropoff_info['location'][0],
-                        "lon": dropoff_info['location'][1],
-                        "order": float(seq) + 0.5,
-                        "distance": 0,  # Will be updated later
-                        "cumulative_distance": 0,  # Will be updated later
-                        "for_patients": patients_str,
-                        "lab_id": dropoff_info['lab_id'],
-                        "time": ""
-                    })
-        
-        # Sort all stops by order
-        all_stops.sort(key=lambda x: x['order'])
-        
-        # Calculate routes between stops
-        total_distance = 0
-        current_location = (phleb_lat, phleb_lon)
-        
-        for i in range(1, len(all_stops)):
-            start = all_stops[i-1]['location']
-            end = all_stops[i]['location']
-            start_label = all_stops[i-1]['label']
-            end_label = all_stops[i]['label']
-            
-            # Calculate distance using ORS if available, otherwise use geodesic
-            if ors_client:
-                try:
-                    # Format for ORS API: [lon, lat]
-                    coords_for_ors = [[start[1], start[0]], [end[1], end[0]]]
-                    
-                    # Get route from ORS
-                    route = ors_client.directions(
-                        coordinates=coords_for_ors,
-                        profile='driving-car',
-                        format='geojson',
-                        units='mi',
-                        instructions=False
-                    )
-                    
-                    # Extract route geometry and distance
-                    if 'features' in route and len(route['features']) > 0:
-                        route_geom = route['features'][0]['geometry']['coordinates']
-                        
-                        # Extract distance
-                        segment_distance = None
-                        if 'properties' in route['features'][0]:
-                            props = route['features'][0]['properties']
-                            
-                            if 'segments' in props and len(props['segments']) > 0:
-                                segment_distance = props['segments'][0].get('distance', 0)
-                            elif 'summary' in props:
-                                segment_distance = props['summary'].get('distance', 0)
-                            elif 'distance' in props:
-                                segment_distance = props['distance']
-                        
-                        if segment_distance is None:
-                            if 'summary' in route and 'distance' in route['summary']:
-                                segment_distance = route['summary']['distance']
-                            else:
-                                # Fall back to geodesic as last resort
-                                segment_distance = geodesic(start, end).miles
-                        
-                        # Convert coordinates for Folium
-                        route_points = [[coord[1], coord[0]] for coord in route_geom]
-                        
-                        # Add route line to map
-                        folium.PolyLine(
-                            route_points,
-                            color=phleb_color,
-                            weight=3,
-                            opacity=0.8,
-                            tooltip=f'{start_label} to {end_label}: {segment_distance:.2f} miles'
-                        ).add_to(route_feature_group)
-                        
-                        # Add sequence label
-                        if len(route_points) > 0:
-                            midpoint_idx = len(route_points) // 2
-                            midpoint = route_points[midpoint_idx]
-                            add_sequence_label(route_feature_group, midpoint, i, phleb_color)
-                    else:
-                        raise Exception("No features found in route response")
-                    
-                    # Rate limiting
-                    time.sleep(0.5)
-                    
-                except Exception as e:
-                    print(f"Error calculating ORS route: {e}")
-                    
-                    # Fallback to geodesic
-                    segment_distance = geodesic(start, end).miles
-                    
-                    # Add simple line
-                    folium.PolyLine(
-                        [start, end],
-                        color=phleb_color,
-                        weight=3,
-                        opacity=0.5,
-                        tooltip=f'{start_label} to {end_label}: {segment_distance:.2f} miles (geodesic)'
-                    ).add_to(route_feature_group)
-                    
-                    # Calculate midpoint for sequence label
-                    midpoint = [(start[0] + end[0])/2, (start[1] + end[1])/2]
-                    # Add sequence label
-                    add_sequence_label(route_feature_group, midpoint, i, phleb_color)
-            else:
-                # Use geodesic distance
-                segment_distance = geodesic(start, end).miles
-                
-                # Add line to map
-                folium.PolyLine(
-                    [start, end],
-                    color=phleb_color,
-                    weight=3, 
-                    opacity=0.5,
-                    tooltip=f'{start_label} to {end_label}: {segment_distance:.2f} miles (geodesic)'
-                ).add_to(route_feature_group)
-                
-                # Calculate midpoint for sequence label
-                midpoint = [(start[0] + end[0])/2, (start[1] + end[1])/2]
-                # Add sequence label
-                add_sequence_label(route_feature_group, midpoint, i, phleb_color)
-            
-            # Update distances in trip details
-            if i < len(trip_details[phleb_id]['stops']):
-                trip_details[phleb_id]['stops'][i]['distance'] = segment_distance
-            
-            # Add to total distance
-            total_distance += segment_distance
-            current_location = end
-        
-        # Store total distance
-        phleb_routes[phleb_id]["distance"] = total_distance
-        
-        # Calculate cumulative distances for trip details
-        cumulative_distance = 0
-        for i in range(len(trip_details[phleb_id]['stops'])):
-            if i > 0:
-                cumulative_distance += trip_details[phleb_id]['stops'][i]['distance']
-            trip_details[phleb_id]['stops'][i]['cumulative_distance'] = cumulative_distance
-
-    # Add patient markers
-    for idx, patient in assigned_patients.iterrows():
-        patient_id = patient.get('UserReqID', idx)
-        phleb_id = patient['AssignedPhlebID']
-        trip_order = patient['TripOrderInDay']
-        patient_lat = patient['PatientLatitude']
-        patient_lon = patient['PatientLongitude']
-        workload = patient.get('WorkloadPoints', 'N/A')
-        patient_name = patient.get("PatientFirstName", '') + patient.get("PatientLastName", '')
-        
-        # Get color from assigned phlebotomist
-        patient_color = phleb_colors.get(phleb_id, 'gray')
-        
-        # Format scheduled time
-        scheduled_time = patient['ScheduledDtm'].strftime('%H:%M') if 'ScheduledDtm' in patient and pd.notna(patient['ScheduledDtm']) else 'Unknown'
-        
-        # Create popup content
-        popup_content = [
-            ["ID", patient_id],
-            ["Name", patient_name],
-            ["Phlebotomist", phleb_id],
-            ["Order", trip_order],
-            ["Time", scheduled_time],
-            ["Workload", workload]
-        ]
-        
-        # Add patient marker with consistent popup
-        folium.Marker(
-            [patient_lat, patient_lon],
-            popup=create_popup("Patient", popup_content),
-            icon=folium.Icon(color=patient_color, icon='user', prefix='fa')
-        ).add_to(patient_cluster)
-    
-    # Add dropoff markers
-    for idx, info in dropoff_map.items():
-        if idx in assigned_patients.index:
-            patient = assigned_patients.loc[idx]
-            phleb_id = patient['AssignedPhlebID']
-            patient_id = patient.get('PatientID', idx)
-            
-            # Get color from assigned phlebotomist
-            patient_color = phleb_colors.get(phleb_id, 'gray')
-            
-            # Get dropoff info
-            dropoff_lat, dropoff_lon = info['location']
-            dropoff_lab_id = info['lab_id'] 
-            dropoff_clinic_name = info['clinic_name']
-            
-            # Get address from dropoffs DataFrame if available
-            dropoff_address = "Unknown Address"
-            if dropoff_lab_id != 'Unknown':
-                matching_dropoffs = dropoffs[dropoffs['LabID'] == dropoff_lab_id]
-                if not matching_dropoffs.empty:
-                    dropoff_address = matching_dropoffs.iloc[0]['Address']
-            
-            # Create popup content
-            popup_content = [
-                ["Lab ID", dropoff_lab_id],
-                ["Clinic", dropoff_clinic_name],
-                ["Address", dropoff_address],
-                ["For Patient", patient_id],
-                ["Sequence", info['sequence'] if pd.notna(info['sequence']) else 'Unknown'],
-                ["Phlebotomist", phleb_id]
-            ]
-            
-            # Add dropoff marker with consistent popup
-            folium.Marker(
-                [dropoff_lat, dropoff_lon],
-                popup=create_popup("Dropoff Location", popup_content),
-                icon=folium.Icon(color=patient_color, icon='flask', prefix='fa')
-            ).add_to(dropoff_cluster)
-    
     # Add layer control and trip panel
     folium.LayerControl().add_to(m)
     create_trip_panel(m, trip_details)
     create_assignment_legend(m, phleb_routes, target_date, target_city)
-    
+
     # Print route summary
     print("\n" + "="*50)
     print("ROUTE SUMMARY")
@@ -519,45 +846,48 @@ def create_assignment_map(assigned_phlebs, assigned_patients, target_date, targe
         print(f"  - Workload: {route['workload']:.1f}")
         print("-"*30)
     print("="*50)
-    
+
     if return_distances:
         return m, {phleb_id: route["distance"] for phleb_id, route in phleb_routes.items()}
     else:
         return m
 
+
+@traced()
+def render_map_html(m):
+    """
+    Render a finished map to HTML, once.
+
+    Streamlit reruns display the same map many times; the HTML is kept on the map
+    object so only the first display pays for rendering.
+
+    Args:
+        m: Folium map from create_assignment_map
+
+    Returns:
+        Full HTML page for the map
+    """
+    html = getattr(m, "_rendered_html", None)
+    if html is None:
+        html = m.get_root().render()
+        m._rendered_html = html
+    return html
+
+
 def add_sequence_label(feature_group, midpoint, sequence_num, color):
     """Add a circular marker with sequence number at the given point"""
-    # Create custom HTML for the circular label
-    circle_html = f'''
-        <div style="
-            background-color: {color};
-            color: white;
-            border-radius: 50%;
-            width: 24px;
-            height: 20px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-weight: bold;
-            font-size: 12px;
-            border: 2px solid white;
-            box-shadow: 0 0 4px rgba(0,0,0,0.5);
-        ">
-            {sequence_num}
-        </div>
-    '''
-    
     # Add the custom HTML marker
     folium.Marker(
         location=midpoint,
         icon=folium.DivIcon(
-            html=circle_html,
+            html=_sequence_label_html(sequence_num, color),
             icon_size=(20, 20),
             icon_anchor=(10, 10)
         ),
         tooltip=f"Route #{sequence_num}"
     ).add_to(feature_group)
-    
+
+
 def create_assignment_legend(m, phleb_routes, target_date, target_city):
     """Create a legend for the assignment map with dropoff information"""
     total_distance = sum(route["distance"] for route in phleb_routes.values())
@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
 from LogHandler import setup_logger
+from ingest_utils import load_trips
 
 es_config = {
     "es_host": "localhost",
@@ -423,18 +424,24 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Trip columns the dashboard charts and maps; load_data reads only these
+DASHBOARD_COLUMNS = [
+    'ScheduledDtm', 'City', 'ServiceAreaDescription', 'PhlebotomistName',
+    'PatientLatitude', 'PatientLongitude', 'PhlebotomistLatitude', 'PhlebotomistLongitude',
+]
+
 # Load the data
 @st.cache_data
 def load_data():
     logger.info("Loading data...")
-    data = pd.read_csv('Req.csv')
-
-    # Convert date columns to datetime
-    logger.debug("Converting date columns to datetime format")
-    data['ScheduledDtm'] = pd.to_datetime(data['ScheduledDtm'])
+    # Typed Parquet dataset, converted from the CSV export on first use
+    data = load_trips('Req.csv', columns=DASHBOARD_COLUMNS)
 
     # Handle NaN values
     logger.debug("Handling missing values in dataset")
+    for col in ['ServiceAreaDescription', 'City', 'PhlebotomistName']:
+        if isinstance(data[col].dtype, pd.CategoricalDtype) and 'Unknown' not in data[col].cat.categories:
+            data[col] = data[col].cat.add_categories('Unknown')
     data.fillna({
         'ServiceAreaDescription': 'Unknown',
         'City': 'Unknown',
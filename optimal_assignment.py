@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+from distance_utils import pairwise_distance
+from profiling_utils import traced
+
+# Candidate predecessors per patient in the sparse cost graph: this many nearest
+# phlebotomist homes and this many nearest earlier patients
+DEFAULT_CANDIDATES = 10
+
+# Cost multiplier on legs that keep a dropoff group together: from the group's preferred
+# phlebotomist's home, or between two patients of the group (same discount as greedy)
+DROPOFF_AFFINITY_DISCOUNT = 0.8
+
+# Added to every real edge so zero-distance edges are not dropped from the sparse matrix
+EDGE_EPSILON = 1e-6
+
+
+def _preferred_group_phlebs(distances, dropoff_groups):
+    """Phlebotomist with the smallest total distance to each dropoff group's patients."""
+    preferred = {}
+    for group in dropoff_groups:
+        if len(group) > 1:
+            totals = np.nan_to_num(distances[group], nan=np.inf).sum(axis=0)
+            preferred[tuple(group)] = int(np.argmin(totals))
+    return preferred
+
+
+def _nearest(costs, k):
+    """Positions of the k smallest finite costs."""
+    finite = np.flatnonzero(np.isfinite(costs))
+    if len(finite) > k:
+        finite = finite[np.argpartition(costs[finite], k - 1)[:k]]
+    return finite
+
+
+@traced()
+def solve_capacitated_assignment(home_distances, patient_distances, workloads, capacity, dropoff_groups=None,
+                                 k=DEFAULT_CANDIDATES, affinity_discount=DROPOFF_AFFINITY_DISCOUNT):
+    """
+    Assign patients to phlebotomists at minimum total route miles under workload capacity.
+
+    Patients are given in visiting (scheduled) order and each route visits its
+    patients in that order, so a route is a chain home -> first -> ... -> last.
+    Every patient is entered from exactly one predecessor: a phlebotomist's home
+    or an earlier patient, and every home and patient is left at most once. The
+    cheapest such set of legs is a min-weight full bipartite matching of patients
+    to predecessors, whose total is exactly the chained route miles that
+    compare_assignment_miles scores. scipy solves it with LAPJVsp on a sparse
+    graph where each patient connects to its k nearest homes and k nearest
+    earlier patients, in roughly O(E log V).
+
+    Each patient also gets a private overflow edge with a prohibitive cost, so
+    the matching always exists. Patients that are only reachable through
+    overflow come back as -1 for the caller to handle. Workload capacity is a
+    per-route limit, which the matching cannot express, so it is enforced
+    afterwards: a chain that exceeds capacity is cut, and the rest of it moves
+    to the nearest unused phlebotomist (or comes back as -1 if there is none).
+
+    Args:
+        home_distances: (P, F) array of miles from each phlebotomist's home to each patient
+        patient_distances: (P, P) array of miles between patients, [i, j] from i to j
+        workloads: (P,) array of patient workload points
+        capacity: Workload cap per phlebotomist (scalar or (F,) array)
+        dropoff_groups: Lists of patient positions sharing a dropoff location
+        k: Number of nearest homes and of nearest earlier patients considered per patient
+        affinity_discount: Cost multiplier on legs that keep a dropoff group together
+
+    Returns:
+        (P,) integer array of phlebotomist positions, -1 where unassigned
+    """
+    home_distances = np.asarray(home_distances, dtype=float)
+    patient_distances = np.asarray(patient_distances, dtype=float)
+    workloads = np.asarray(workloads, dtype=float)
+    num_patients, num_phlebs = home_distances.shape
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=float), (num_phlebs,))
+    if num_patients == 0 or num_phlebs == 0:
+        return np.full(num_patients, -1, dtype=int)
+
+    home_costs = np.where(np.isfinite(home_distances), home_distances, np.inf)
+    leg_costs = np.where(np.isfinite(patient_distances), patient_distances, np.inf)
+
+    # Legs that keep a dropoff group on one route are discounted
+    home_factors = {}
+    group_of = np.full(num_patients, -1)
+    preferred = _preferred_group_phlebs(home_costs, dropoff_groups or [])
+    for group_id, (group, phleb_pos) in enumerate(preferred.items()):
+        for patient_pos in group:
+            home_factors[(patient_pos, phleb_pos)] = affinity_discount
+            group_of[patient_pos] = group_id
+
+    # Columns: phlebotomist homes, then "after patient i", then one overflow column per patient
+    rows, cols, data = [], [], []
+    finite_costs = np.concatenate((home_costs[np.isfinite(home_costs)], leg_costs[np.isfinite(leg_costs)]))
+    overflow_cost = (finite_costs.max() if finite_costs.size else 1.0) * num_patients + 1.0
+    for patient_pos in range(num_patients):
+        for phleb_pos in _nearest(home_costs[patient_pos], k):
+            factor = home_factors.get((patient_pos, phleb_pos), 1.0)
+            rows.append(patient_pos)
+            cols.append(phleb_pos)
+            data.append(home_costs[patient_pos, phleb_pos] * factor + EDGE_EPSILON)
+        for prev_pos in _nearest(leg_costs[:patient_pos, patient_pos], k):
+            same_group = group_of[patient_pos] >= 0 and group_of[prev_pos] == group_of[patient_pos]
+            rows.append(patient_pos)
+            cols.append(num_phlebs + prev_pos)
+            data.append(leg_costs[prev_pos, patient_pos] * (affinity_discount if same_group else 1.0) + EDGE_EPSILON)
+        rows.append(patient_pos)
+        cols.append(num_phlebs + num_patients + patient_pos)
+        data.append(overflow_cost)
+
+    graph = csr_matrix((data, (rows, cols)), shape=(num_patients, num_phlebs + 2 * num_patients))
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+    predecessor = np.empty(num_patients, dtype=int)
+    predecessor[row_ind] = col_ind
+
+    # Chains: the patient entered from each home, and the patient entered from each patient
+    first_patient = np.full(num_phlebs, -1)
+    next_patient = np.full(num_patients, -1)
+    for patient_pos, column in enumerate(predecessor):
+        if column < num_phlebs:
+            first_patient[column] = patient_pos
+        elif column < num_phlebs + num_patients:
+            next_patient[column - num_phlebs] = patient_pos
+
+    # Walk each chain from its home; cut it where it exceeds capacity and hand the
+    # rest to the nearest phlebotomist without a route
+    assignment = np.full(num_patients, -1, dtype=int)
+    unused = first_patient < 0
+    pending = [(phleb_pos, first_patient[phleb_pos]) for phleb_pos in np.flatnonzero(~unused)]
+    while pending:
+        phleb_pos, patient_pos = pending.pop()
+        load = 0.0
+        while patient_pos >= 0:
+            if load > 0 and load + workloads[patient_pos] > capacity[phleb_pos]:
+                free = np.flatnonzero(unused & np.isfinite(home_costs[patient_pos]))
+                if len(free):
+                    new_phleb = int(free[np.argmin(home_costs[patient_pos, free])])
+                    unused[new_phleb] = False
+                    pending.append((new_phleb, patient_pos))
+                break
+            assignment[patient_pos] = phleb_pos
+            load += workloads[patient_pos]
+            patient_pos = next_patient[patient_pos]
+
+    return assignment
+
+
+def assignment_route_miles(assigned_phlebs, assigned_patients):
+    """
+    Straight-line miles each phlebotomist drives from home through their patients in scheduled order.
+
+    Both assignment modes are scored with this same metric, so the totals can be compared directly.
+
+    Args:
+        assigned_phlebs: DataFrame of phlebotomists with home coordinates
+        assigned_patients: DataFrame of patients with AssignedPhlebID and ScheduledDtm
+
+    Returns:
+        Dict mapping phlebotomist ID to miles
+    """
+    homes = {
+        str(phleb["PhlebotomistID.1"]): (phleb["PhlebotomistLatitude"], phleb["PhlebotomistLongitude"])
+        for _, phleb in assigned_phlebs.iterrows()
+    }
+    route_miles = {}
+    for phleb_id, patients in assigned_patients.groupby(assigned_patients["AssignedPhlebID"].astype(str)):
+        if phleb_id not in homes:
+            continue
+        patients = patients.sort_values("ScheduledDtm", kind="stable")
+        stops = [homes[phleb_id]] + list(zip(patients["PatientLatitude"], patients["PatientLongitude"]))
+        route_miles[phleb_id] = float(np.nansum(pairwise_distance(stops[:-1], stops[1:])))
+    return route_miles
+
+
+def compare_assignment_miles(baseline, candidate):
+    """
+    Compare total route miles of two assignments.
+
+    Args:
+        baseline: (assigned_phlebs, assigned_patients) from the greedy mode
+        candidate: (assigned_phlebs, assigned_patients) from the optimal mode
+
+    Returns:
+        Dict with total miles, phlebotomists used and the saving
+    """
+    baseline_miles = sum(assignment_route_miles(*baseline).values())
+    candidate_miles = sum(assignment_route_miles(*candidate).values())
+    saved = baseline_miles - candidate_miles
+    return {
+        "greedy_miles": round(baseline_miles, 2),
+        "optimal_miles": round(candidate_miles, 2),
+        "miles_saved": round(saved, 2),
+        "percent_saved": round(100 * saved / baseline_miles, 2) if baseline_miles else 0.0,
+        "greedy_phlebs_used": int(pd.Series(baseline[1]["AssignedPhlebID"]).nunique()),
+        "optimal_phlebs_used": int(pd.Series(candidate[1]["AssignedPhlebID"]).nunique()),
+    }
@@ -0,0 +1,105 @@
+import numpy as np
+
+# Decimal places kept when encoding; 6 places is about 11 cm, well below ORS geometry accuracy
+POLYLINE_PRECISION = 6
+
+
+def encode_polyline(coordinates, precision=POLYLINE_PRECISION):
+    """
+    Encode a route geometry with the Google encoded polyline algorithm.
+
+    Points are quantized to the given number of decimal places and stored as
+    variable-length deltas, latitude first, so a typical ORS geometry shrinks to
+    a few bytes per point.
+
+    Args:
+        coordinates: Sequence of [lon, lat] points
+        precision: Decimal places to keep
+
+    Returns:
+        Encoded polyline string ("" for an empty geometry)
+    """
+    coords = np.asarray(coordinates, dtype=float).reshape(-1, 2)
+    if len(coords) == 0:
+        return ""
+
+    quantized = np.round(coords[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zig-zag encode so small negative deltas also stay short
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).tolist()
+
+    chunks = []
+    for value in values:
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return "".join(chunks)
+
+
+def decode_polyline(encoded, precision=POLYLINE_PRECISION):
+    """
+    Decode a polyline produced by ``encode_polyline``.
+
+    Args:
+        encoded: Encoded polyline string
+        precision: Decimal places the polyline was encoded with
+
+    Returns:
+        List of [lon, lat] points
+    """
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1F) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+
+    if not values:
+        return []
+    lat_lon = np.cumsum(np.asarray(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return np.round(lat_lon[:, ::-1], precision).tolist()
+
+
+def simplify_polyline(points, tolerance):
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm.
+
+    Offsets are measured on a local equirectangular projection (longitude scaled by
+    the cosine of the mean latitude), so the tolerance is in degrees of latitude.
+
+    Args:
+        points: Sequence of [lat, lon] points
+        tolerance: Largest allowed deviation from the original line, in degrees
+
+    Returns:
+        List of the kept [lat, lon] points, always including both ends
+    """
+    coords = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(coords) < 3 or not tolerance > 0:
+        return coords.tolist()
+
+    xy = np.column_stack((coords[:, 1] * np.cos(np.radians(np.nanmean(coords[:, 0]))), coords[:, 0]))
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = xy[last] - xy[first]
+        offsets = xy[first + 1:last] - xy[first]
+        length = np.hypot(segment[0], segment[1])
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.extend([(first, split), (split, last)])
+    return coords[keep].tolist()
@@ -0,0 +1,270 @@
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import requests
+
+from distance_utils import distance_matrix
+from dropoff_index import DROPOFFS_PATH, load_dropoffs
+from profiling_utils import count, traced
+from route_cache import get_route_cache
+from route_utils import generate_route_id, ORS_BASE_URL
+from trip_store import select_trips
+
+# ORS standard plan: sources x destinations per matrix request
+ORS_MATRIX_MAX_ELEMENTS = 3500
+
+# ORS standard plan allows 40 matrix requests per minute
+ORS_MATRIX_REQUEST_INTERVAL = 1.5
+
+METERS_TO_MILES = 0.000621371
+
+
+@traced()
+def collect_run_coordinates(patient_df, phleb_df, target_date, target_city,
+                            dropoffs_path=DROPOFFS_PATH, max_nearby_phlebs=10):
+    """
+    Collect every phlebotomist, patient and dropoff coordinate an assignment run can touch.
+
+    Args:
+        patient_df: DataFrame or TripStore with patient orders
+        phleb_df: DataFrame with phlebotomist information
+        target_date: Date to analyze
+        target_city: City to analyze
+        dropoffs_path: Path to the dropoff locations CSV
+        max_nearby_phlebs: Phlebotomists to include when none are based in the target city
+
+    Returns:
+        List of unique (latitude, longitude) tuples
+    """
+    patients = select_trips(patient_df, target_date, target_city).dropna(
+        subset=["PatientLatitude", "PatientLongitude"]
+    )
+
+    if patients.empty:
+        return []
+
+    patient_coords = patients[["PatientLatitude", "PatientLongitude"]].to_numpy()
+
+    # Phlebotomists based in the city, or the nearest ones to the patients if there are none
+    phlebs = phleb_df.dropna(subset=["PhlebotomistLatitude", "PhlebotomistLongitude"])
+    city_phlebs = phlebs[phlebs["City"] == target_city]
+    if city_phlebs.empty and not phlebs.empty:
+        centroid = patient_coords.mean(axis=0)
+        distances = distance_matrix(centroid, phlebs[["PhlebotomistLatitude", "PhlebotomistLongitude"]].to_numpy())[0]
+        city_phlebs = phlebs.iloc[np.argsort(distances)[:max_nearby_phlebs]]
+    phleb_coords = city_phlebs[["PhlebotomistLatitude", "PhlebotomistLongitude"]].to_numpy()
+
+    # Dropoffs for the clinics these patients use, limited to the patients' states
+    dropoff_coords = np.empty((0, 2))
+    try:
+        dropoffs = load_dropoffs(dropoffs_path)
+        clinics = patients["DropOffLocation"].dropna().astype(str).str.lower().unique()
+        states = patients["PatientState"].dropna().astype(str).str.lower().unique()
+        matching = dropoffs[
+            dropoffs["Clinic"].str.lower().isin(clinics) &
+            dropoffs["State"].str.lower().isin(states)
+        ].dropna(subset=["Latitude", "Longitude"])
+        dropoff_coords = matching[["Latitude", "Longitude"]].to_numpy()
+    except Exception as e:
+        print(f"Warning: Could not load dropoffs for prefetch - {e}")
+
+    all_coords = np.vstack([phleb_coords, patient_coords, dropoff_coords])
+
+    # Deduplicate at route_id precision (5 decimals)
+    unique_coords = {}
+    for lat, lon in all_coords:
+        unique_coords.setdefault((round(float(lat), 5), round(float(lon), 5)), (float(lat), float(lon)))
+    return list(unique_coords.values())
+
+
+def matrix_tiles(num_locations, max_elements=ORS_MATRIX_MAX_ELEMENTS):
+    """
+    Split the upper triangle of an N x N matrix into tiles of at most max_elements.
+
+    Route IDs ignore direction, so tiles strictly below the diagonal are skipped.
+
+    Args:
+        num_locations: Number of locations N
+        max_elements: Provider limit on sources x destinations per request
+
+    Returns:
+        List of (source_indices, destination_indices) tuples
+    """
+    block = max(1, int(math.isqrt(max_elements)))
+    starts = range(0, num_locations, block)
+    return [
+        (list(range(i, min(i + block, num_locations))), list(range(j, min(j + block, num_locations))))
+        for i in starts
+        for j in starts
+        if j >= i
+    ]
+
+
+def fetch_matrix_tile(api_key, locations, sources, destinations, base_url=ORS_BASE_URL, profile="driving-car"):
+    """
+    Fetch one many-to-many distance matrix tile from ORS.
+
+    Args:
+        api_key: OpenRouteService API key
+        locations: List of (latitude, longitude) tuples
+        sources: Indices into locations used as origins
+        destinations: Indices into locations used as destinations
+        base_url: ORS API base URL
+        profile: ORS routing profile
+
+    Returns:
+        len(sources) x len(destinations) list of distances in meters (None where unroutable),
+        or None if the request failed
+    """
+    # Only send the locations this tile needs; ORS expects [longitude, latitude]
+    tile_indices = list(dict.fromkeys(sources + destinations))
+    position = {idx: pos for pos, idx in enumerate(tile_indices)}
+    body = {
+        "locations": [[float(locations[idx][1]), float(locations[idx][0])] for idx in tile_indices],
+        "sources": [position[idx] for idx in sources],
+        "destinations": [position[idx] for idx in destinations],
+        "metrics": ["distance"],
+        "units": "m"
+    }
+    headers = {
+        "Authorization": api_key,
+        "Content-Type": "application/json"
+    }
+
+    count("http.ors_matrix")
+    response = requests.post(f"{base_url}/v2/matrix/{profile}", json=body, headers=headers)
+    if response.status_code != 200:
+        print(f"⚠ Distance Matrix API request failed: {response.status_code} {response.reason}")
+        print(f"Response content: {response.text[:500]}...")
+        return None
+
+    return response.json().get("distances")
+
+
+@traced()
+def prefetch_route_distances(locations, api_key, use_scheduled_time=True, route_cache=None,
+                             max_elements=ORS_MATRIX_MAX_ELEMENTS, base_url=ORS_BASE_URL,
+                             request_interval=ORS_MATRIX_REQUEST_INTERVAL):
+    """
+    Fill the route cache with road distances between every pair of locations.
+
+    Each tile needs one many-to-many matrix request, so provider calls drop from
+    O(N^2) to O(N^2 / max_elements). Pairs that already have a cached distance
+    (locally or in the shared Redis tier) are not requested again, and tiles whose
+    pairs are all cached are skipped.
+
+    Args:
+        locations: List of (latitude, longitude) tuples
+        api_key: OpenRouteService API key
+        use_scheduled_time: Routing mode used in route ID generation
+        route_cache: RouteCache to fill (defaults to the shared cache)
+        max_elements: Provider limit on sources x destinations per request
+        base_url: ORS API base URL
+        request_interval: Minimum seconds between matrix requests
+
+    Returns:
+        Dict with prefetch statistics
+    """
+    route_cache = route_cache if route_cache is not None else get_route_cache()
+    stats = {"locations": len(locations), "requests": 0, "pairs_cached": 0, "pairs_shared": 0, "pairs_fetched": 0, "failed_tiles": 0}
+
+    if not api_key or len(locations) < 2:
+        return stats
+
+    route_ids = {}
+    for i in range(len(locations)):
+        for j in range(i + 1, len(locations)):
+            route_ids[(i, j)] = generate_route_id(locations[i], locations[j], use_scheduled_time)
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] Prefetching road distances for {len(locations)} locations...")
+    # Pull pairs another app instance already fetched from the shared tier in a few round trips
+    stats["pairs_shared"] = route_cache.warm(route_ids.values())
+    last_request = None
+
+    for sources, destinations in matrix_tiles(len(locations), max_elements):
+        missing = [
+            (i, j) for i in sources for j in destinations
+            if i < j and route_cache.get_distance(route_ids[(i, j)]) is None
+        ]
+        stats["pairs_cached"] += sum(1 for i in sources for j in destinations if i < j) - len(missing)
+        if not missing:
+            continue
+
+        if last_request is not None and request_interval:
+            time.sleep(max(0.0, request_interval - (time.time() - last_request)))
+        last_request = time.time()
+
+        distances = fetch_matrix_tile(api_key, locations, sources, destinations, base_url=base_url)
+        stats["requests"] += 1
+        if distances is None:
+            stats["failed_tiles"] += 1
+            continue
+
+        source_pos = {idx: pos for pos, idx in enumerate(sources)}
+        dest_pos = {idx: pos for pos, idx in enumerate(destinations)}
+        entries = [
+            {
+                "route_id": route_ids[(i, j)],
+                "distance_miles": distances[source_pos[i]][dest_pos[j]] * METERS_TO_MILES,
+                "start": locations[i],
+                "end": locations[j],
+            }
+            for i, j in missing
+            if distances[source_pos[i]][dest_pos[j]] is not None
+        ]
+        route_cache.put_many(entries)
+        stats["pairs_fetched"] += len(entries)
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Prefetch done: {stats['pairs_fetched']} fetched, "
+          f"{stats['pairs_cached']} already cached, {stats['requests']} matrix requests")
+    return stats
+
+
+@traced()
+def road_distance_matrix(locations, use_scheduled_time=True, route_cache=None):
+    """
+    Distance matrix in road miles, read from the route cache filled by prefetch_route_distances.
+
+    Pairs without a cached road distance (e.g. a failed tile, or a phlebotomist the prefetch
+    did not pick) use the straight-line distance scaled by the median road/straight-line
+    ratio of the cached pairs, so they are not favoured for being shorter on paper. With no
+    cached pairs at all this is the plain straight-line matrix.
+
+    Args:
+        locations: List of (latitude, longitude) tuples
+        use_scheduled_time: Routing mode used in route ID generation
+        route_cache: RouteCache to read (defaults to the shared cache)
+
+    Returns:
+        N x N array of miles
+    """
+    route_cache = route_cache if route_cache is not None else get_route_cache()
+    straight = distance_matrix(locations)
+    pairs = [(i, j) for i in range(len(locations)) for j in range(i + 1, len(locations))]
+    if not pairs:
+        return straight
+
+    route_ids = [generate_route_id(locations[i], locations[j], use_scheduled_time) for i, j in pairs]
+    route_cache.warm(route_ids)
+    road = np.array([route_cache.get_distance(route_id) for route_id in route_ids], dtype=float)
+    known = ~np.isnan(road)
+    if not known.any():
+        return straight
+
+    rows, cols = np.array(pairs).T
+    straight_pairs = straight[rows, cols]
+    ratios = road[known & (straight_pairs > 0)] / straight_pairs[known & (straight_pairs > 0)]
+    detour = float(np.median(ratios)) if len(ratios) else 1.0
+    road = np.where(known, road, straight_pairs * detour)
+
+    matrix = np.zeros_like(straight)
+    matrix[rows, cols] = road
+    matrix[cols, rows] = road
+    # Unknown coordinates stay NaN, as in the straight-line matrix
+    matrix[np.isnan(straight)] = np.nan
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🛣 Road distances for {int(known.sum())} of {len(pairs)} pairs, "
+          f"detour factor {detour:.2f} for the rest")
+    return matrix
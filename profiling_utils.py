@@ -0,0 +1,313 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Profile every assignment run when set: "1"/"spans" for timed spans and counters,
+# "cprofile" or "pyinstrument" to also write a full call profile next to the JSON
+PROFILE_ENV_VAR = "ASSIGNMENT_PROFILE"
+
+PROFILE_MODES = ("spans", "cprofile", "pyinstrument")
+
+# Where run profiles are written
+PROFILE_DIR = "profiles"
+
+# Spans listed in the one-line summary printed after a run
+PROFILE_SUMMARY_SPANS = 5
+
+# The profile collecting spans for the current run, and the path of the open span.
+# Context variables keep concurrent runs (e.g. background jobs) apart. Threads only
+# see them when work is submitted through contextvars.copy_context().run; other
+# processes never do, so stages run there are listed under "not_covered".
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+_current_path = contextvars.ContextVar("current_span_path", default="")
+
+
+class RunProfile:
+    """Timed spans and counters collected during one run."""
+
+    def __init__(self, name, meta=None, mode="spans"):
+        self.name = name
+        self.meta = dict(meta or {})
+        self.mode = mode
+        self.started_at = datetime.now()
+        self.wall_seconds = None
+        self.spans = {}
+        self.counters = {}
+        self.not_covered = {}
+        self.files = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, path, seconds):
+        with self._lock:
+            entry = self.spans.get(path)
+            if entry is None:
+                entry = self.spans[path] = {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            entry["count"] += 1
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def mark_not_covered(self, stage, reason):
+        with self._lock:
+            self.not_covered[stage] = reason
+
+    def span_table(self):
+        """
+        Spans keyed by path, with self time: total minus time spent in child spans.
+
+        Self time of a stage is where code that has no span of its own (e.g. the
+        greedy assignment loop) shows up.
+        """
+        table = {path: dict(entry) for path, entry in self.spans.items()}
+        for path, entry in table.items():
+            entry["self_seconds"] = entry["total_seconds"]
+        for path, entry in self.spans.items():
+            parent = path.rpartition("/")[0]
+            if parent in table:
+                table[parent]["self_seconds"] -= entry["total_seconds"]
+        for entry in table.values():
+            for key in ("total_seconds", "self_seconds", "max_seconds"):
+                entry[key] = round(max(0.0, entry[key]), 6)
+        return dict(sorted(table.items()))
+
+    def to_dict(self):
+        return {
+            "run": self.name,
+            "mode": self.mode,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(self.wall_seconds, 6) if self.wall_seconds is not None else None,
+            "meta": self.meta,
+            "spans": self.span_table(),
+            "counters": dict(sorted(self.counters.items())),
+            "not_covered": self.not_covered,
+            "files": self.files,
+        }
+
+
+class _NullSpan:
+    """Returned by span() when nothing is being profiled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profile", "name", "path", "start", "token")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        parent = _current_path.get()
+        self.path = f"{parent}/{self.name}" if parent else self.name
+        self.token = _current_path.set(self.path)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add_span(self.path, time.perf_counter() - self.start)
+        _current_path.reset(self.token)
+        return False
+
+
+def span(name):
+    """
+    Time a block as a named span of the current run profile.
+
+    Usage: ``with span("connect_redis"): ...``. Costs one context variable lookup
+    when no profile is active.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return _NULL_SPAN
+    return _Span(profile, name)
+
+
+def traced(name=None):
+    """Decorator recording every call of a function as a span (named after it by default)."""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with _Span(profile, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, amount=1):
+    """Add to a counter of the current run profile, if one is active."""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.count(name, amount)
+
+
+def not_covered(stage, reason):
+    """
+    Record in the current run profile that a stage's spans and counters were not collected.
+
+    Use it for work handed to other processes, which the profile's context
+    variables cannot follow; the caller's span still times the whole stage.
+    """
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.mark_not_covered(stage, reason)
+
+
+def resolve_profile_mode(mode=None):
+    """
+    Normalize a profile setting to one of PROFILE_MODES, or None when profiling is off.
+
+    Args:
+        mode: True/False, a mode name, or None to read the PROFILE_ENV_VAR environment variable
+
+    Returns:
+        "spans", "cprofile", "pyinstrument" or None
+    """
+    if mode is None:
+        mode = os.environ.get(PROFILE_ENV_VAR, "")
+    if mode is True:
+        return "spans"
+    if not mode:
+        return None
+    mode = str(mode).strip().lower()
+    if mode in ("0", "false", "off", "no"):
+        return None
+    if mode in ("1", "true", "on", "yes"):
+        return "spans"
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode: {mode}")
+    return mode
+
+
+def _start_call_profiler(mode):
+    """Start cProfile or pyinstrument for the calling thread; returns the profiler or None."""
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler is already active
+            print(f"Warning: cProfile unavailable - {e}. Recording spans only.")
+            return None
+        return profiler
+    if mode == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("Warning: pyinstrument is not installed. Recording spans only.")
+            return None
+        profiler = Profiler()
+        profiler.start()
+        return profiler
+    return None
+
+
+def _stop_call_profiler(profiler, mode, base_path):
+    """Stop the profiler and write its output; returns the output path or None."""
+    if profiler is None:
+        return None
+    if mode == "cprofile":
+        profiler.disable()
+        path = f"{base_path}.prof"
+        profiler.dump_stats(path)
+        return path
+    profiler.stop()
+    path = f"{base_path}.html"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    return path
+
+
+def _stats_delta(before, after):
+    return {
+        key: value - before.get(key, 0)
+        for key, value in after.items()
+        if isinstance(value, (int, float)) and value != before.get(key, 0)
+    }
+
+
+@contextmanager
+def profile_run(name, meta=None, mode=None, stats_sources=None, output_dir=PROFILE_DIR):
+    """
+    Profile one run: collect spans and counters, then write them as a JSON file.
+
+    Does nothing (and yields None) when profiling is off.
+
+    Args:
+        name: Run name, also the root span and the output file prefix
+        meta: JSON-serializable details of the run (date, city, mode, ...)
+        mode: Profile mode for resolve_profile_mode (None reads the environment)
+        stats_sources: Dict of name -> callable returning a stats dict; the change in each
+            numeric stat over the run is recorded as a "<name>.<stat>" counter. These
+            stats are process-wide, so runs profiled concurrently see each other's activity;
+            counters recorded with ``count`` are per run.
+        output_dir: Directory for the profile files
+
+    Yields:
+        The RunProfile, or None
+    """
+    mode = resolve_profile_mode(mode)
+    if mode is None:
+        yield None
+        return
+
+    profile = RunProfile(name, meta, mode)
+    stats_sources = stats_sources or {}
+    before = {source: dict(get_stats()) for source, get_stats in stats_sources.items()}
+    os.makedirs(output_dir, exist_ok=True)
+    base_path = os.path.join(output_dir, f"{name}_{profile.started_at.strftime('%Y%m%d_%H%M%S_%f')}")
+
+    profiler = _start_call_profiler(mode)
+    profile_token = _current_profile.set(profile)
+    path_token = _current_path.set("")
+    start = time.perf_counter()
+    try:
+        with _Span(profile, name):
+            yield profile
+    finally:
+        profile.wall_seconds = time.perf_counter() - start
+        _current_path.reset(path_token)
+        _current_profile.reset(profile_token)
+        call_profile_path = _stop_call_profiler(profiler, mode, base_path)
+        if call_profile_path:
+            profile.files[mode] = call_profile_path
+
+        for source, get_stats in stats_sources.items():
+            for stat, delta in _stats_delta(before[source], get_stats()).items():
+                profile.counters[f"{source}.{stat}"] = profile.counters.get(f"{source}.{stat}", 0) + delta
+
+        json_path = f"{base_path}.json"
+        profile.files["json"] = json_path
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(profile.to_dict(), f, indent=2, default=str)
+
+        slowest = sorted(profile.span_table().items(), key=lambda item: item[1]["self_seconds"], reverse=True)
+        summary = ", ".join(f"{path.rsplit('/', 1)[-1]} {entry['self_seconds']:.2f}s"
+                            for path, entry in slowest[:PROFILE_SUMMARY_SPANS])
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 📊 Profile of {name} ({profile.wall_seconds:.2f}s) "
+              f"written to {json_path}. Most self time: {summary}")
+        for stage, reason in profile.not_covered.items():
+            print(f"⚠ Profile does not cover {stage}: {reason}")
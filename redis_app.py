@@ -7,6 +7,7 @@ import folium
 from streamlit_folium import st_folium
 from LogHandler import setup_logger
 import final_utils_upd as utils
+from assignment_jobs import follow_assignment_job, submit_assignment_job
 from redis_utils import initialize_redis, initialize_ors_client
 
 load_dotenv()
@@ -34,6 +35,32 @@ st.set_page_config(
     layout="wide"
 )
 
+def store_assignment_result(assignment_map, assigned_phlebs, assigned_patients, selected_date, selected_city,
+                            use_scheduled_time):
+    """Save a finished assignment and keep it in session state"""
+    # Save the results
+    saved_files = utils.save_assignment_results(
+        assignment_map,
+        assigned_phlebs,
+        assigned_patients,
+        selected_date,
+        selected_city,
+        use_scheduled_time,
+        phleb_df=st.session_state.phleb_df,
+    )
+    
+    logger.info(f"Saved assignment results to files: {saved_files}")
+    
+    # Store results in session state
+    st.session_state.assignment_map = assignment_map
+    st.session_state.assigned_phlebs = assigned_phlebs
+    st.session_state.assigned_patients = assigned_patients
+    st.session_state.saved_files = saved_files
+    st.session_state.results_generated = True
+    st.session_state.use_scheduled_time = use_scheduled_time
+    
+    st.success(f"Successfully assigned {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists!")
+
 def main():
     st.title("MOS Margam")
     
@@ -48,10 +75,12 @@ def main():
         )
         
         if st.session_state.trips_df is not None:
-            st.session_state.dates = utils.get_available_dates(st.session_state.trips_df)
+            # Index trips by (date, city) once so per-selection lookups are O(1)
+            st.session_state.trip_store = utils.TripStore(st.session_state.trips_df)
+            st.session_state.dates = utils.get_available_dates(st.session_state.trip_store)
             logger.info(f"Found {len(st.session_state.dates)} available dates in data")
             
-            st.session_state.date_city_map = utils.get_cities_by_date(st.session_state.trips_df)
+            st.session_state.date_city_map = utils.get_cities_by_date(st.session_state.trip_store)
             logger.info(f"Mapped {len(st.session_state.date_city_map)} dates to their respective cities")
             
             logger.info("Data loaded successfully")
@@ -87,6 +116,8 @@ def main():
     # Initialize session state variables if they don't exist
     if 'trips_df' not in st.session_state:
         st.session_state.trips_df = None
+    if 'trip_store' not in st.session_state:
+        st.session_state.trip_store = None
     if 'phleb_df' not in st.session_state:
         st.session_state.phleb_df = None
     if 'workload_df' not in st.session_state:
@@ -232,7 +263,7 @@ def main():
             # Calculate phlebotomists needed
             phlebs_needed = utils.phlebs_required_asper_workload(
                 st.session_state.workload_df,
-                st.session_state.trips_df,
+                st.session_state.trip_store,
                 selected_date,
                 selected_city
             )
@@ -352,59 +383,29 @@ def main():
                         st.session_state.phleb_df["PhlebotomistID.1"].astype(str).isin(st.session_state.selected_phlebs)
                     ]
                     
-                    with st.spinner("Optimizing assignments and routes..."):
-                        
-                        phleb_df_to_consider = selected_phleb_df if len(selected_phleb_df) > 0 else st.session_state.phleb_df
-                        
-                        if len(phleb_df_to_consider) != len(selected_phleb_df):
-                            st.write("No Phlebotomist was found with same city. Nearest Phleb will be considered by default.")
-                            st.write("Prefer selecting phlebs to consider them for this order(s)")
-                        
-                        # Process the assignments with the selected routing approach
-                        assignment_map, assigned_phlebs, assigned_patients = utils.process_city_assignments(
-                            st.session_state.trips_df,
-                            phleb_df_to_consider,
-                            st.session_state.workload_df,
-                            selected_date,
-                            selected_city,
-                            api_key,
-                            use_scheduled_time,
-                            redis_host=redis_host,
-                            redis_port=redis_port
-                        )
-                        
-                        print(assigned_phlebs)
-                        
-                        if assignment_map is None:
-                            logger.error(f"Failed to generate assignments for {selected_city} on {selected_date.strftime('%Y-%m-%d')}")
-                            st.error("Failed to generate assignments. Please check the data.")
-                        else:
-                            logger.info(f"Successfully generated assignments: {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists")
-                            
-                            # Save the results
-                            saved_files = utils.save_assignment_results(
-                                assignment_map,
-                                assigned_phlebs,
-                                assigned_patients,
-                                selected_date,
-                                selected_city,
-                                use_scheduled_time,
-                                phleb_df=st.session_state.phleb_df,
-                            )
-                            
-                            logger.info(f"Saved assignment results to files: {saved_files}")
-                            
-                            # Store results in session state
-                            st.session_state.assignment_map = assignment_map
-                            print("LINE: 335\n", assigned_phlebs)
-                            st.session_state.assigned_phlebs = assigned_phlebs
-                            print("LINE: 336\n", st.session_state.assigned_phlebs)
-                            st.session_state.assigned_patients = assigned_patients
-                            st.session_state.saved_files = saved_files
-                            st.session_state.results_generated = True
-                            st.session_state.use_scheduled_time = use_scheduled_time
-                            
-                            st.success(f"Successfully assigned {len(assigned_patients)} patients to {len(assigned_phlebs)} phlebotomists!")
+                    phleb_df_to_consider = selected_phleb_df if len(selected_phleb_df) > 0 else st.session_state.phleb_df
+                    
+                    if len(phleb_df_to_consider) != len(selected_phleb_df):
+                        st.write("No Phlebotomist was found with same city. Nearest Phleb will be considered by default.")
+                        st.write("Prefer selecting phlebs to consider them for this order(s)")
+
+                    # Run the assignment in the background so the session stays responsive;
+                    # an identical request that is already running or finished is joined instead
+                    job = submit_assignment_job(
+                        st.session_state.trip_store,
+                        phleb_df_to_consider,
+                        st.session_state.workload_df,
+                        selected_date,
+                        selected_city,
+                        api_key,
+                        use_scheduled_time,
+                        phleb_ids=st.session_state.selected_phlebs,
+                        redis_host=redis_host,
+                        redis_port=redis_port
+                    )
+                    st.session_state.assignment_job_id = job.job_id
+                    # A retried failed job reuses its dedupe ID, so forget which job was applied
+                    st.session_state.applied_job_id = None
             else:
                 # Only log warning once per date-city combination
                 if 'last_no_phlebs_needed_key' not in st.session_state or st.session_state.last_no_phlebs_needed_key != date_city_key:
@@ -413,6 +414,9 @@ def main():
                 
                 st.warning(f"Could not determine the number of phlebotomists needed for {selected_city} on {selected_date}.")
         
+        # Follow the background assignment job, and apply its result once it finishes
+        follow_assignment_job(store_assignment_result, logger)
+        
         # Display results if available
         if 'assignment_map' in st.session_state and st.session_state.assignment_map is not None:
             # Only log once when results are first displayed or regenerated
@@ -464,7 +468,7 @@ def main():
             map_container = st.container()
             with map_container:
                 if 'map_rendered' not in st.session_state:
-                    html_temp = st.session_state.assignment_map.get_root().render()
+                    html_temp = utils.render_map_html(st.session_state.assignment_map)
                     st.components.v1.html(html_temp, height=800)
                     logger.info("Rendered route map in UI")
                     st.session_state.map_rendered = True
@@ -303,47 +303,140 @@ from openrouteservice import client
 import time
 import json
 import traceback
+import hashlib
+import uuid
 from datetime import datetime
 
+from profiling_utils import traced
+
+PHLEB_GEO_KEY = 'phlebotomists'
+PHLEB_FINGERPRINT_KEY = 'phlebotomists:fingerprint'
+
 def initialize_redis(host='localhost', port=6379, db=0):
     """Initialize Redis connection."""
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Initializing Redis connection to {host}:{port}")
     return redis.Redis(host=host, port=port, db=db, decode_responses=True)
 
-def load_phlebotomists_to_redis(redis_conn, phleb_df):
+_binary_connections = {}
+
+def binary_redis(redis_conn):
+    """
+    Return a client on the same server as redis_conn that reads and writes raw bytes.
+    
+    initialize_redis connects with decode_responses=True, which cannot read packed or
+    compressed values. The bytes-mode twin is created once per server and reused.
+    
+    Args:
+        redis_conn: Redis connection from initialize_redis
+        
+    Returns:
+        Redis client with decode_responses=False
+    """
+    pool = redis_conn.connection_pool
+    if not pool.connection_kwargs.get('decode_responses'):
+        return redis_conn
+    server = tuple(pool.connection_kwargs.get(name) for name in ('host', 'port', 'db', 'username', 'path'))
+    if server not in _binary_connections:
+        kwargs = dict(pool.connection_kwargs, decode_responses=False)
+        _binary_connections[server] = redis.Redis(
+            connection_pool=redis.ConnectionPool(connection_class=pool.connection_class, **kwargs)
+        )
+    return _binary_connections[server]
+
+def phleb_roster_fingerprint(phleb_df):
+    """
+    Compute a content fingerprint of the phlebotomist columns stored in Redis.
+    
+    Args:
+        phleb_df: DataFrame with phlebotomist information
+        
+    Returns:
+        Hex digest that changes whenever an ID, name, city or coordinate changes
+    """
+    columns = [col for col in ["PhlebotomistID.1", "Name", "City", "PhlebotomistLatitude", "PhlebotomistLongitude"]
+               if col in phleb_df.columns]
+    row_hashes = pd.util.hash_pandas_object(phleb_df[columns], index=False).to_numpy()
+    return hashlib.sha256(row_hashes.tobytes()).hexdigest()
+
+@traced()
+def load_phlebotomists_to_redis(redis_conn, phleb_df, force=False):
     """
     Load phlebotomists data into Redis geospatial index.
     
+    The roster fingerprint is stored next to the index, so an unchanged roster
+    is skipped after a single round-trip. A changed roster is written to a temporary
+    key and RENAMEd over the live index in one MULTI/EXEC round-trip, so readers
+    always see either the old or the new index, never an empty one. The phleb:{id}
+    hashes of phlebotomists dropped from the roster are deleted in the same
+    transaction, which is retried if another loader swaps the index in meanwhile.
+    
     Args:
         redis_conn: Redis connection
         phleb_df: DataFrame with phlebotomist information
+        force: Reload even if the stored fingerprint matches
+        
+    Returns:
+        True if the index was (re)loaded, False if it was already up to date
     """
+    fingerprint = phleb_roster_fingerprint(phleb_df)
+    
+    # Check the stored fingerprint and that the index still exists in one round-trip
+    check = redis_conn.pipeline(transaction=False)
+    check.get(PHLEB_FINGERPRINT_KEY)
+    check.exists(PHLEB_GEO_KEY)
+    stored_fingerprint, index_exists = check.execute()
+    if not force and stored_fingerprint == fingerprint and index_exists:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Phlebotomist index already up to date, skipping reload")
+        return False
+    
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Loading {len(phleb_df)} phlebotomists to Redis...")
     
-    # Clear existing geospatial data
-    redis_conn.delete('phlebotomists')
+    located = phleb_df.dropna(subset=["PhlebotomistLatitude", "PhlebotomistLongitude"])
+    phleb_ids = located["PhlebotomistID.1"].astype(str).tolist()
+    lats = located["PhlebotomistLatitude"].astype(float).tolist()
+    lons = located["PhlebotomistLongitude"].astype(float).tolist()
+    names = located["Name"].tolist() if "Name" in located.columns else [''] * len(located)
+    cities = located["City"].tolist() if "City" in located.columns else [''] * len(located)
+    
+    # Build the new index under a unique key so concurrent loaders don't collide
+    tmp_key = f'{PHLEB_GEO_KEY}:tmp:{uuid.uuid4().hex}'
     
-    # Add phlebotomists to geospatial index
-    for idx, phleb in phleb_df.iterrows():
-        phleb_id = str(phleb["PhlebotomistID.1"])
-        lat = phleb["PhlebotomistLatitude"]
-        lon = phleb["PhlebotomistLongitude"]
-        
-        # Store phlebotomist location in geospatial index
-        redis_conn.geoadd('phlebotomists', (lon, lat, phleb_id))
-        
-        # Store phlebotomist data as hash
-        phleb_data = {
-            'id': phleb_id,
-            'name': phleb.get('Name', ''),
-            'city': phleb.get('City', ''),
-            'latitude': str(lat),
-            'longitude': str(lon)
-        }
-        redis_conn.hset(f'phleb:{phleb_id}', mapping=phleb_data)
+    def swap_in(pipe):
+        # Members of the index being replaced; hashes of those no longer on the roster go with it
+        previous_ids = {member.decode() if isinstance(member, bytes) else member
+                        for member in pipe.zrange(PHLEB_GEO_KEY, 0, -1)}
+        dropped_ids = previous_ids - set(phleb_ids)
+        pipe.multi()
+        if dropped_ids:
+            pipe.delete(*[f'phleb:{phleb_id}' for phleb_id in dropped_ids])
+        if phleb_ids:
+            geo_values = []
+            for phleb_id, lat, lon in zip(phleb_ids, lats, lons):
+                geo_values.extend((lon, lat, phleb_id))
+            pipe.geoadd(tmp_key, geo_values)
+        
+            for phleb_id, lat, lon, name, city in zip(phleb_ids, lats, lons, names, cities):
+                # Store phlebotomist data as hash
+                pipe.hset(f'phleb:{phleb_id}', mapping={
+                    'id': phleb_id,
+                    'name': name,
+                    'city': city,
+                    'latitude': str(lat),
+                    'longitude': str(lon)
+                })
+        
+            # Atomically swap the new index in
+            pipe.rename(tmp_key, PHLEB_GEO_KEY)
+        else:
+            pipe.delete(PHLEB_GEO_KEY)
+        pipe.set(PHLEB_FINGERPRINT_KEY, fingerprint)
+    
+    redis_conn.transaction(swap_in, PHLEB_GEO_KEY)
     
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Successfully loaded phlebotomists to Redis")
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Successfully loaded {len(phleb_ids)} phlebotomists to Redis")
+    return True
 
+@traced()
 def get_nearby_phlebotomists(redis_conn, lat, lon, radius_miles=30):
     """
     Get phlebotomists within radius_miles of the given coordinates.
@@ -364,7 +457,7 @@ def get_nearby_phlebotomists(redis_conn, lat, lon, radius_miles=30):
     
     # Get phlebotomists within radius with distances
     nearby_phlebs = redis_conn.georadius(
-        'phlebotomists', 
+        PHLEB_GEO_KEY, 
         lon, 
         lat, 
         radius_meters, 
@@ -378,10 +471,11 @@ def get_nearby_phlebotomists(redis_conn, lat, lon, radius_miles=30):
     # Return as list of (id, distance_miles, [lon, lat])
     return [(phleb_id, dist/1609.34, coords) for phleb_id, dist, coords in nearby_phlebs]
 
+@traced()
 def calculate_route_distance(ors_client, start_coords, end_coords, use_scheduled_time=True):
     """
     Calculate the driving distance between two points using OpenRouteService.
-    Uses the same caching logic as route_utils.py
+    Uses the same route cache as route_utils.py
     
     Args:
         ors_client: OpenRouteService client (can be None to use ORS API key from env)
@@ -396,158 +490,66 @@ def calculate_route_distance(ors_client, start_coords, end_coords, use_scheduled
     print(f"[{datetime.now().strftime('%H:%M:%S')}] Start: {start_coords}, End: {end_coords}")
     
     from route_utils import (
-        load_geojson, 
         generate_route_id, 
-        find_route_in_geojson,
-        save_geojson,
+        calculate_route_distance as calculate_polyline_distance,
         ORSKEY
     )
+    from route_cache import get_route_cache
+    from routing_client import fetch_routes
     
     try:
-        # Load GeoJSON data
-        geojson_data = load_geojson()
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Loaded GeoJSON with {len(geojson_data['features'])} existing routes")
+        route_cache = get_route_cache()
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Route cache holds {len(route_cache)} routes")
         
         # Generate route_id using the same format as route_utils
         route_id = generate_route_id(start_coords, end_coords, use_scheduled_time)
         print(f"[{datetime.now().strftime('%H:%M:%S')}] Generated route_id: {route_id}")
         
-        # Check if route exists in GeoJSON cache
-        existing_route_coords = find_route_in_geojson(route_id, geojson_data)
+        # Check if route exists in the route cache (single O(1) lookup for geometry and distance)
+        cached_route = route_cache.get(route_id)
         
-        if existing_route_coords:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Route found in local GeoJSON cache!")
+        if cached_route:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Route found in route cache!")
             
-            # Find the feature to get the distance
-            for feature in geojson_data["features"]:
-                if feature["properties"]["route_id"] == route_id:
-                    if "distance_miles" in feature["properties"]:
-                        cached_distance = feature["properties"]["distance_miles"]
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Using cached distance: {cached_distance} miles")
-                        return cached_distance
-                    else:
-                        # Calculate distance from coordinates if not stored
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️  No distance in cache, calculating from coordinates...")
-                        from geopy.distance import geodesic
-                        total_distance = 0
-                        for i in range(len(existing_route_coords) - 1):
-                            point1 = (existing_route_coords[i][1], existing_route_coords[i][0])
-                            point2 = (existing_route_coords[i+1][1], existing_route_coords[i+1][0])
-                            total_distance += geodesic(point1, point2).miles
-                        
-                        # Update the feature with calculated distance
-                        feature["properties"]["distance_miles"] = round(total_distance, 2)
-                        save_geojson(geojson_data)
-                        print(f"[{datetime.now().strftime('%H:%M:%S')}] 💾 Updated cache with calculated distance: {round(total_distance, 2)} miles")
-                        return total_distance
+            if cached_route["distance_miles"] is not None:
+                cached_distance = cached_route["distance_miles"]
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Using cached distance: {cached_distance} miles")
+                return cached_distance
+            elif cached_route["polyline"]:
+                # Calculate distance from coordinates if not stored
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️  No distance in cache, calculating from coordinates...")
+                total_distance = calculate_polyline_distance(route_cache.get_geometry(route_id))
+                
+                # Update the cached route with calculated distance
+                route_cache.put(route_id, distance_miles=total_distance)
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] 💾 Updated cache with calculated distance: {round(total_distance, 2)} miles")
+                return total_distance
 
         # Route not found in cache, fetch from OpenRouteService
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔍 Route not found in GeoJSON cache. Fetching from OpenRouteService...")
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] 🔍 Route not found in route cache. Fetching from OpenRouteService...")
         
-        # Use the same logic as route_utils.py get_route function
-        api_key = ORSKEY if ors_client is None else ors_client.key
+        # Use the same pooled, rate-limited client as route_utils.py get_route
+        api_key = ORSKEY if ors_client is None else getattr(ors_client, "_key", None)
         
         if api_key is None:
             print("⚠ API key is missing!")
             return 0
         
-        # Convert to ORS format [longitude, latitude]
-        start_coords_ors = [float(start_coords[1]), float(start_coords[0])]
-        end_coords_ors = [float(end_coords[1]), float(end_coords[0])]
-        
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 📡 Calling ORS Distance Matrix API...")
-        
-        # Step 1: Get Distance using ORS Distance Matrix API (same as route_utils.py)
-        import requests
-        matrix_url = "https://api.openrouteservice.org/v2/matrix/driving-car"
-        matrix_body = {
-            "locations": [start_coords_ors, end_coords_ors],
-            "metrics": ["distance"],
-            "units": "m"
-        }
-        
-        matrix_headers = {
-            "Authorization": api_key,
-            "Content-Type": "application/json"
-        }
-
-        matrix_response = requests.post(matrix_url, json=matrix_body, headers=matrix_headers)
-
-        if matrix_response.status_code != 200:
-            print(f"⚠ Distance Matrix API request failed: {matrix_response.status_code} {matrix_response.reason}")
-            print(f"Response content: {matrix_response.text[:500]}...")
-            # Fallback to geodesic
-            from geopy.distance import geodesic
-            return geodesic(start_coords, end_coords).miles
-
-        matrix_data = matrix_response.json()
-        
-        # Extract distance (same logic as route_utils.py)
-        route_distance_m = 0
-        if "distances" in matrix_data and len(matrix_data["distances"]) > 0:
-            route_distance_m = matrix_data["distances"][0][1]
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Got distance from matrix API: {route_distance_m} meters")
-        else:
-            print(f"⚠ Could not find distances in matrix response")
-            from geopy.distance import geodesic
-            route_distance_m = geodesic(start_coords, end_coords).meters
-        
-        route_distance_miles = route_distance_m * 0.000621371
-        
         print(f"[{datetime.now().strftime('%H:%M:%S')}] 📡 Calling ORS Directions API...")
         
-        # Step 2: Get Route using ORS Directions API (same as route_utils.py)
-        directions_url = "https://api.openrouteservice.org/v2/directions/driving-car/geojson"
-        directions_body = {"coordinates": [start_coords_ors, end_coords_ors]}
-
-        directions_headers = {
-            "Authorization": api_key,
-            "Content-Type": "application/json"
-        }
-
-        response = requests.post(directions_url, json=directions_body, headers=directions_headers)
-
-        if response.status_code == 200:
-            route_data = response.json()
-            
-            if "features" in route_data and route_data["features"]:
-                feature = route_data["features"][0]
-                
-                if "geometry" in feature and "coordinates" in feature["geometry"]:
-                    route_coords = feature["geometry"]["coordinates"]
-                    
-                    if not route_coords or len(route_coords) < 2:
-                        print(f"⚠ Invalid or empty route coordinates")
-                        route_coords = [start_coords_ors, end_coords_ors]
-                    
-                    # Store new route in GeoJSON with distance (same as route_utils.py)
-                    new_feature = {
-                        "type": "Feature",
-                        "geometry": {"type": "LineString", "coordinates": route_coords},
-                        "properties": {
-                            "route_id": route_id,
-                            "start": start_coords,
-                            "end": end_coords,
-                            "distance_miles": round(route_distance_miles, 2)
-                        }
-                    }
-                    geojson_data["features"].append(new_feature)
-                    save_geojson(geojson_data)
-                    
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Route cached with {len(route_coords)} points and {round(route_distance_miles, 2)} miles")
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] 💾 Total routes in cache: {len(geojson_data['features'])}")
-                    
-                    return route_distance_miles
-                else:
-                    print(f"⚠ Could not find coordinates in route response")
-            else:
-                print(f"⚠ No features found in route response")
-        else:
-            print(f"⚠ Directions API request failed: {response.status_code}")
+        # A single directions request gives both the distance and the geometry, and caches them
+        result = fetch_routes([(start_coords, end_coords)], api_key, use_scheduled_time)[0]
         
-        # If we get here, return the distance we calculated from matrix API
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Using distance from matrix API: {round(route_distance_miles, 2)} miles")
-        return route_distance_miles
+        if result is not None:
+            route_coords, route_distance_miles = result
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ Route cached with {len(route_coords)} points and {round(route_distance_miles, 2)} miles")
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] 💾 Total routes in cache: {len(route_cache)}")
+            return route_distance_miles
+        
+        # If we get here, the route could not be fetched; fall back to geodesic
+        from geopy.distance import geodesic
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️  Directions request failed, using geodesic distance")
+        return geodesic(start_coords, end_coords).miles
         
     except Exception as e:
         print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ Error calculating route distance: {e}")
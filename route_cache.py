@@ -0,0 +1,449 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows
+    fcntl = None
+
+from polyline_utils import POLYLINE_PRECISION, decode_polyline, encode_polyline, simplify_polyline
+
+ROUTE_CACHE_FILE = "routes_cache.jsonl"
+LEGACY_GEOJSON_FILE = "routes.geojson"
+
+# Compact once superseded records outnumber live ones and exceed this floor
+COMPACTION_MIN_STALE = 1000
+
+# Largest deviation allowed in the simplified level-of-detail copy, in degrees (about 5 m)
+SIMPLIFIED_TOLERANCE_DEGREES = 5e-5
+
+# A route another replica might have added is looked up in Redis again after this long
+SHARED_MISS_TTL_SECONDS = 60
+
+# Forget remembered shared misses once there are this many
+SHARED_MISS_LIMIT = 100000
+
+# Record fields written together whenever a route gets a geometry
+_GEOMETRY_FIELDS = ("polyline", "polyline_simplified")
+
+
+def _inherit_fields(record, existing):
+    """Fill a new record's missing fields from the one it supersedes (a new geometry replaces the pair)."""
+    for field, value in existing.items():
+        if record["polyline"] is not None and field in _GEOMETRY_FIELDS:
+            continue
+        if record.get(field) is None:
+            record[field] = value
+
+
+class RouteCache:
+    """
+    Route cache keyed by ``route_utils.generate_route_id``.
+
+    All records live in an in-memory dict, so lookups are O(1). Every write is a
+    single line appended to a JSON-lines log, so writes stay O(1) no matter how
+    many segments are cached. Updating a route appends a new record, which
+    supersedes the old one. ``compact()`` rewrites the log so it holds only the
+    latest record for each route.
+
+    Several processes (batch workers, app replicas) may share one log. Appends
+    hold a shared file lock and compaction an exclusive one, and compaction
+    re-reads the log first, so routes other processes appended are kept.
+    Without flock (Windows) the log is never compacted automatically.
+
+    Each record is a dict with ``route_id``, ``polyline`` (encoded geometry or
+    None), ``polyline_simplified`` (encoded level-of-detail copy or None),
+    ``distance_miles`` (float or None), ``start`` and ``end``. Geometries are
+    kept encoded in memory and on disk and are only decoded by
+    ``get_geometry``, so distance lookups never pay for them.
+
+    With a shared store attached (``attach_shared``), this becomes the
+    in-process tier in front of Redis: a local miss is looked up in Redis, and
+    the hit is kept locally; every write also goes to Redis, so a route fetched
+    by any replica is free for all of them. ``stats`` counts lookups served
+    locally, routes served from Redis, and lookups missed by both.
+    """
+
+    def __init__(self, log_path=ROUTE_CACHE_FILE, legacy_geojson_path=LEGACY_GEOJSON_FILE,
+                 auto_compact=True, store_simplified=True):
+        self.log_path = log_path
+        self.legacy_geojson_path = legacy_geojson_path
+        self.auto_compact = auto_compact
+        self.store_simplified = store_simplified
+        self._index = {}
+        self._stale_records = 0
+        self._lock = threading.Lock()
+        self.shared = None
+        self.shared_server = None
+        self.stats = {"hits": 0, "shared_hits": 0, "misses": 0}
+        self._shared_misses = {}
+        self._load()
+
+    def _encode_geometry(self, coordinates):
+        """Return (polyline, simplified polyline) for a ``[lon, lat]`` list; (None, None) without one."""
+        if not coordinates:
+            return None, None
+        polyline = encode_polyline(coordinates)
+        if not self.store_simplified:
+            return polyline, None
+        lat_lon = [[lat, lon] for lon, lat in coordinates]
+        simplified = encode_polyline([[lon, lat] for lat, lon in simplify_polyline(lat_lon, SIMPLIFIED_TOLERANCE_DEGREES)])
+        # Only keep the copy when it is actually smaller
+        return polyline, simplified if len(simplified) < len(polyline) else None
+
+    def _from_coordinates(self, route_id, coordinates, distance_miles, start, end):
+        """Build a record, encoding a raw ``[lon, lat]`` geometry."""
+        polyline, simplified = self._encode_geometry(coordinates)
+        return {
+            "route_id": route_id,
+            "polyline": polyline,
+            "polyline_simplified": simplified,
+            "distance_miles": round(float(distance_miles), 2) if distance_miles is not None else None,
+            "start": list(start) if start is not None else None,
+            "end": list(end) if end is not None else None,
+        }
+
+    @contextmanager
+    def _log_lock(self, exclusive=False):
+        """Hold the cross-process lock on the log: shared for appends, exclusive for compaction."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.log_path}.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_log(self):
+        """
+        Read every record in the log, latest last.
+
+        Returns:
+            Tuple of (dict of route_id to latest record, superseded record count, legacy record count)
+        """
+        records = {}
+        stale_records = legacy_records = 0
+        with open(self.log_path, "r") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted write; skip it
+                    print(f"⚠ Skipping corrupt route cache record in {self.log_path}")
+                    continue
+                if "coordinates" in record:
+                    # Written before geometries were stored as polylines
+                    record = self._from_coordinates(
+                        record["route_id"], record["coordinates"], record.get("distance_miles"),
+                        record.get("start"), record.get("end"),
+                    )
+                    legacy_records += 1
+                if record["route_id"] in records:
+                    stale_records += 1
+                records[record["route_id"]] = record
+        return records, stale_records, legacy_records
+
+    def _load(self):
+        """Rebuild the in-memory index from the log, importing the legacy GeoJSON file on first use."""
+        if os.path.exists(self.log_path):
+            self._index, self._stale_records, legacy_records = self._read_log()
+            if legacy_records:
+                print(f"Converted {legacy_records} route cache records to encoded polylines")
+                self.compact()
+            return
+
+        if self.legacy_geojson_path and os.path.exists(self.legacy_geojson_path):
+            try:
+                with open(self.legacy_geojson_path, "r") as file:
+                    features = json.load(file).get("features", [])
+            except json.JSONDecodeError:
+                print(f"⚠ Invalid JSON in {self.legacy_geojson_path}. Starting with an empty route cache.")
+                features = []
+
+            for feature in features:
+                props = feature.get("properties", {})
+                if "route_id" not in props:
+                    continue
+                self._index[props["route_id"]] = self._from_coordinates(
+                    props["route_id"], (feature.get("geometry") or {}).get("coordinates"),
+                    props.get("distance_miles"), props.get("start"), props.get("end"),
+                )
+            if self._index:
+                print(f"Imported {len(self._index)} routes from {self.legacy_geojson_path}")
+                self.compact()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, route_id):
+        return route_id in self._index
+
+    def attach_shared(self, redis_conn):
+        """
+        Put a Redis-backed shared tier behind this cache.
+
+        Attaching again to the same server keeps the existing store, so callers can
+        attach every time they open a connection.
+
+        Args:
+            redis_conn: Redis connection from ``redis_utils.initialize_redis``
+        """
+        from shared_route_store import SharedRouteStore
+
+        settings = redis_conn.connection_pool.connection_kwargs
+        server = (settings.get("host"), settings.get("port"), settings.get("db"))
+        if self.shared is None or self.shared_server != server:
+            self.shared = SharedRouteStore(redis_conn)
+            self.shared_server = server
+            self._shared_misses.clear()
+
+    def _remember(self, records):
+        """Keep records fetched from the shared tier locally (index and log, not Redis)."""
+        with self._lock, self._log_lock():
+            with open(self.log_path, "a") as file:
+                for record in records:
+                    existing = self._index.get(record["route_id"])
+                    if existing is not None:
+                        self._stale_records += 1
+                        _inherit_fields(record, existing)
+                    self._index[record["route_id"]] = record
+                    file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def _held(self, route_id, geometry=False):
+        """True if the local index can answer for route_id (with a geometry, when one is wanted)."""
+        record = self._index.get(route_id)
+        return record is not None and (not geometry or bool(record["polyline"]))
+
+    def _missing_shared(self, route_ids, geometry=False):
+        """Route IDs not held locally and not recently found missing from Redis."""
+        now = time.monotonic()
+        return [
+            route_id for route_id in route_ids
+            if not self._held(route_id, geometry)
+            and now - self._shared_misses.get(route_id, -SHARED_MISS_TTL_SECONDS) >= SHARED_MISS_TTL_SECONDS
+        ]
+
+    def _fetch_shared(self, route_ids):
+        """Look route IDs up in Redis, keeping hits locally and remembering misses."""
+        found = self.shared.get_many(route_ids)
+        self._remember(found.values())
+        if len(self._shared_misses) > SHARED_MISS_LIMIT:
+            self._shared_misses.clear()
+        now = time.monotonic()
+        for route_id in route_ids:
+            if route_id not in found:
+                self._shared_misses[route_id] = now
+        return found
+
+    def warm(self, route_ids, geometry=False):
+        """
+        Pull every listed route the shared tier has into the local cache, in pipelined batches.
+
+        Call this before a run looks up many routes, so misses don't each cost a round trip.
+
+        Args:
+            route_ids: Iterable of route IDs
+            geometry: Also ask for routes held locally without a geometry (e.g. prefetched distances)
+
+        Returns:
+            Number of routes fetched from Redis
+        """
+        if self.shared is None:
+            return 0
+        missing = self._missing_shared(dict.fromkeys(route_ids), geometry)
+        if not missing:
+            return 0
+        found = self._fetch_shared(missing)
+        self.stats["shared_hits"] += len(found)
+        return len(found)
+
+    def _lookup(self, route_id, geometry=False):
+        """
+        Find a record locally, then in the shared tier, counting where it came from.
+
+        With geometry set, a local record without one (e.g. a distance from the
+        prefetch matrix) is not enough: the shared tier is asked for the geometry
+        another replica may already have fetched. Returns whatever is held locally
+        when neither tier has a geometry.
+        """
+        if self._held(route_id, geometry):
+            self.stats["hits"] += 1
+            return self._index[route_id]
+        if self.shared is not None and self._missing_shared([route_id], geometry):
+            if route_id in self._fetch_shared([route_id]):
+                if self._held(route_id, geometry):
+                    self.stats["shared_hits"] += 1
+                    return self._index[route_id]
+                # Redis only has a distance too; don't ask again for a while
+                self._shared_misses[route_id] = time.monotonic()
+        self.stats["misses"] += 1
+        return self._index.get(route_id)
+
+    def get(self, route_id):
+        """Return the cached record for route_id (geometry still encoded), or None."""
+        return self._lookup(route_id)
+
+    def get_geometry(self, route_id, simplified=False):
+        """
+        Decode the cached geometry for route_id.
+
+        Args:
+            route_id: Key from ``generate_route_id``
+            simplified: Return the level-of-detail copy when one is stored
+
+        Returns:
+            List of ``[lon, lat]`` pairs, or None when no geometry is cached
+        """
+        record = self._lookup(route_id, geometry=True)
+        if not record or not record["polyline"]:
+            return None
+        encoded = (simplified and record.get("polyline_simplified")) or record["polyline"]
+        return decode_polyline(encoded, POLYLINE_PRECISION)
+
+    def get_distance(self, route_id):
+        """Return the cached driving distance in miles for route_id, or None."""
+        record = self._lookup(route_id)
+        return record["distance_miles"] if record else None
+
+    def put(self, route_id, coordinates=None, distance_miles=None, start=None, end=None):
+        """
+        Insert or update a route and append it to the log.
+
+        Fields passed as None keep their previously cached value. This lets a
+        distance-only entry be upgraded with a geometry later, and vice versa.
+        The geometry is encoded (with a simplified copy) before it is stored; a
+        new geometry replaces both the old polyline and its simplified copy.
+
+        Args:
+            route_id: Key from ``generate_route_id``
+            coordinates: Route geometry as a list of ``[lon, lat]`` pairs (optional)
+            distance_miles: Driving distance in miles (optional)
+            start: (latitude, longitude) of the start point (optional)
+            end: (latitude, longitude) of the end point (optional)
+
+        Returns:
+            The stored record
+        """
+        return self.put_many([{
+            "route_id": route_id, "coordinates": coordinates, "distance_miles": distance_miles,
+            "start": start, "end": end,
+        }])[0]
+
+    def put_many(self, entries):
+        """
+        Insert or update several routes with one log write and one shared-tier round trip.
+
+        Args:
+            entries: Iterable of dicts with ``route_id`` and any of the optional ``put`` arguments
+
+        Returns:
+            List of the stored records
+        """
+        records = []
+        with self._lock, self._log_lock():
+            with open(self.log_path, "a") as file:
+                for entry in entries:
+                    route_id = entry["route_id"]
+                    existing = self._index.get(route_id)
+                    record = self._from_coordinates(
+                        route_id, entry.get("coordinates"), entry.get("distance_miles"),
+                        entry.get("start"), entry.get("end"),
+                    )
+                    if existing is not None:
+                        self._stale_records += 1
+                        _inherit_fields(record, existing)
+
+                    self._index[route_id] = record
+                    self._shared_misses.pop(route_id, None)
+                    file.write(json.dumps(record, separators=(",", ":")) + "\n")
+                    records.append(record)
+
+            needs_compaction = (
+                self.auto_compact
+                and fcntl is not None
+                and self._stale_records >= COMPACTION_MIN_STALE
+                and self._stale_records > len(self._index)
+            )
+
+        if self.shared is not None and records:
+            self.shared.put_many(records)
+        if needs_compaction:
+            self.compact()
+        return records
+
+    def compact(self):
+        """
+        Rewrite the log so it holds only the latest record for each route.
+
+        The log is re-read under the exclusive lock first, so records other
+        processes appended since this one loaded survive (and join the index).
+        """
+        with self._lock, self._log_lock(exclusive=True):
+            if os.path.exists(self.log_path):
+                self._index.update(self._read_log()[0])
+            tmp_path = f"{self.log_path}.tmp"
+            with open(tmp_path, "w") as file:
+                for record in self._index.values():
+                    file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.log_path)
+            self._stale_records = 0
+
+    def to_geojson(self, simplified=False):
+        """Return the cache contents as a GeoJSON FeatureCollection (routes with geometry only)."""
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "LineString", "coordinates": decode_polyline(
+                        (simplified and record.get("polyline_simplified")) or record["polyline"], POLYLINE_PRECISION
+                    )},
+                    "properties": {
+                        "route_id": record["route_id"],
+                        "start": record["start"],
+                        "end": record["end"],
+                        "distance_miles": record["distance_miles"],
+                    },
+                }
+                for record in self._index.values()
+                if record["polyline"]
+            ],
+        }
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache():
+    """Return the process-wide RouteCache, creating it on first use."""
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache()
+    return _route_cache
+
+
+def attach_shared_route_cache(redis_conn):
+    """
+    Back the process-wide route cache with Redis so app replicas share routes.
+
+    Args:
+        redis_conn: Redis connection from ``redis_utils.initialize_redis``
+
+    Returns:
+        The process-wide RouteCache
+    """
+    route_cache = get_route_cache()
+    route_cache.attach_shared(redis_conn)
+    return route_cache
@@ -0,0 +1,115 @@
+import numpy as np
+
+from profiling_utils import traced
+
+# Improving moves applied to one route at most. A move budget (rather than a clock)
+# keeps results identical across machines and between serial and pooled runs.
+ROUTE_IMPROVEMENT_MAX_MOVES = 200
+
+# Longest run of consecutive stops Or-opt will relocate
+OR_OPT_MAX_SEGMENT = 3
+
+# Ignore "improvements" smaller than floating-point noise
+IMPROVEMENT_TOLERANCE = 1e-9
+
+
+def route_length(dist, route):
+    """Length of an open route (start -> ... -> last stop) over a distance matrix."""
+    route = np.asarray(route)
+    return float(dist[route[:-1], route[1:]].sum()) if len(route) > 1 else 0.0
+
+
+def _respects_precedence(route, precedence):
+    """Check that every constrained stop comes after all of the stops it depends on."""
+    if not precedence:
+        return True
+    position = {stop: pos for pos, stop in enumerate(route)}
+    return all(
+        position[stop] > max((position[before] for before in required), default=-1)
+        for stop, required in precedence.items()
+    )
+
+
+def _two_opt_pass(dist, route, precedence):
+    """Apply the first improving segment reversal found. Returns True if the route changed."""
+    last = len(route) - 1
+    for i in range(1, last):
+        for j in range(i + 1, last + 1):
+            # Reversing route[i..j] replaces edges (i-1, i) and (j, j+1); the route end is open
+            delta = dist[route[i - 1], route[j]] - dist[route[i - 1], route[i]]
+            if j < last:
+                delta += dist[route[i], route[j + 1]] - dist[route[j], route[j + 1]]
+            if delta < -IMPROVEMENT_TOLERANCE:
+                candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                if _respects_precedence(candidate, precedence):
+                    route[:] = candidate
+                    return True
+    return False
+
+
+def _or_opt_pass(dist, route, precedence):
+    """Apply the first improving relocation of a 1-3 stop segment. Returns True if the route changed."""
+    last = len(route) - 1
+    for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+        for i in range(1, last - length + 2):
+            j = i + length - 1
+            prev_stop, first, end = route[i - 1], route[i], route[j]
+            next_stop = route[j + 1] if j < last else None
+
+            # Cost removed by cutting the segment out and closing the gap
+            removed = dist[prev_stop, first]
+            if next_stop is not None:
+                removed += dist[end, next_stop] - dist[prev_stop, next_stop]
+
+            rest = route[:i] + route[j + 1:]
+            for k in range(len(rest)):
+                if k == i - 1:
+                    continue
+                # Insert the segment between rest[k] and rest[k + 1] (or at the open end)
+                added = dist[rest[k], first]
+                if k + 1 < len(rest):
+                    added += dist[end, rest[k + 1]] - dist[rest[k], rest[k + 1]]
+                if added - removed < -IMPROVEMENT_TOLERANCE:
+                    candidate = rest[:k + 1] + route[i:j + 1] + rest[k + 1:]
+                    if _respects_precedence(candidate, precedence):
+                        route[:] = candidate
+                        return True
+    return False
+
+
+@traced()
+def improve_route(dist, route, precedence=None, max_moves=ROUTE_IMPROVEMENT_MAX_MOVES):
+    """
+    Shorten an open route with 2-opt and Or-opt local search.
+
+    The first stop (the phlebotomist's start) stays fixed and the route does not
+    return to it. Moves are applied until neither 2-opt nor Or-opt finds an
+    improvement, or max_moves moves have been applied. Moves that would put a stop
+    before one of its required predecessors (e.g. a dropoff before its
+    patients) are rejected.
+
+    Args:
+        dist: Square distance matrix indexed by stop
+        route: Initial stop order, starting with the fixed start stop
+        precedence: Optional dict mapping a stop to the stops that must come before it
+        max_moves: Maximum number of improving moves to apply
+
+    Returns:
+        Tuple of (improved route list, initial length, improved length)
+    """
+    dist = np.asarray(dist, dtype=float)
+    route = [int(stop) for stop in route]
+    initial_length = route_length(dist, route)
+    if len(route) < 3:
+        return route, initial_length, initial_length
+
+    for _ in range(max_moves):
+        if not (_two_opt_pass(dist, route, precedence) or _or_opt_pass(dist, route, precedence)):
+            break
+
+    return route, initial_length, route_length(dist, route)
+
+
+def percent_saved(initial_length, improved_length):
+    """Percentage of the initial route length removed by improvement."""
+    return round(100 * (initial_length - improved_length) / initial_length, 2) if initial_length else 0.0
@@ -10,9 +10,13 @@ import os
 import time
 from dotenv import load_dotenv
 import openrouteservice
+from distance_utils import pairwise_distance, point_distance
+from route_cache import get_route_cache
+from profiling_utils import count, traced
 load_dotenv()
 MAPSAPI = os.getenv("MAP")
 ORSKEY = os.getenv("KEY")
+ORS_BASE_URL = os.getenv("ORS_BASE_URL", "https://api.openrouteservice.org")
 gmaps = googlemaps.Client(key=MAPSAPI)
 
 GEOJSON_FILE = "routes.geojson"
@@ -59,135 +63,36 @@ def find_route_in_geojson(route_id, geojson_data):
     
     return None
 
+@traced()
 def get_route(start, end, api_key, use_scheduled_time=True):
-    """Get route between two points, checking GeoJSON first before using ORS API."""
-    import json
-    import requests
-    
-    geojson_data = load_geojson()
+    """Get route between two points, checking the route cache first before using ORS API."""
+    route_cache = get_route_cache()
     
     # Generate route_id
     route_id = generate_route_id(start, end, use_scheduled_time)
     
-    # Check if route exists in GeoJSON
-    existing_route = find_route_in_geojson(route_id, geojson_data)
+    # Check if route exists in the cache (O(1) index lookup)
+    existing_route = route_cache.get_geometry(route_id)
     if existing_route:
-        print(f"✅ Route found in local GeoJSON: {route_id}")
+        print(f"✅ Route found in route cache: {route_id}")
         return existing_route
 
     # If route not found, fetch from OpenRouteService
-    print(f"🔍 Route not found in GeoJSON. Fetching from OpenRouteService...")
+    print(f"🔍 Route not found in route cache. Fetching from OpenRouteService...")
 
     if api_key is None:
         print("⚠ API key is missing!")
         return []
 
+    # One pooled, rate-limited directions request returns both the geometry and the distance,
+    # and stores them in the route cache
+    from routing_client import fetch_routes
     try:
-        start_coords = [float(start[1]), float(start[0])]
-        end_coords = [float(end[1]), float(end[0])]
-
-        # Step 1: Get Distance using ORS Distance Matrix API
-        matrix_url = "https://api.openrouteservice.org/v2/matrix/driving-car"
-        matrix_body = {
-            "locations": [start_coords, end_coords],
-            "metrics": ["distance"],  # Requesting only distance
-            "units": "m"
-        }
-        
-        matrix_headers = {
-            "Authorization": api_key,
-            "Content-Type": "application/json"
-        }
-
-        matrix_response = requests.post(matrix_url, json=matrix_body, headers=matrix_headers)
-
-        if matrix_response.status_code != 200:
-            print(f"⚠ Distance Matrix API request failed: {matrix_response.status_code} {matrix_response.reason}")
-            print(f"Response content: {matrix_response.text[:500]}...")
-            return []
-
-        matrix_data = matrix_response.json()
-        
-        # Debug matrix response if needed
-        # print(f"Matrix response: {json.dumps(matrix_data, indent=2)}")
-        
-        # More robust handling of distance extraction
-        route_distance_m = 0
-        if "distances" in matrix_data and len(matrix_data["distances"]) > 0:
-            route_distance_m = matrix_data["distances"][0][1]  # Distance in meters
-        else:
-            print(f"⚠ Could not find distances in matrix response: {json.dumps(matrix_data, indent=2)[:300]}...")
-            # Try alternative ways to extract distance
-            if "durations" in matrix_data and len(matrix_data["durations"]) > 0:
-                print("Using estimated distance based on durations")
-                # Estimate distance based on duration (assuming average speed of 50 km/h)
-                route_distance_m = matrix_data["durations"][0][1] * (50 * 1000 / 3600)  # meters
-            else:
-                print("⚠ No distance information available. Using fallback straight-line distance.")
-                from geopy.distance import geodesic
-                route_distance_m = geodesic(
-                    (start[0], start[1]), 
-                    (end[0], end[1])
-                ).meters
-        
-        route_distance_miles = route_distance_m * 0.000621371  # Convert meters to miles
-
-        # Step 2: Get Route using ORS Directions API
-        directions_url = "https://api.openrouteservice.org/v2/directions/driving-car/geojson"
-        directions_body = {"coordinates": [start_coords, end_coords]}
-
-        directions_headers = {
-            "Authorization": api_key,
-            "Content-Type": "application/json"
-        }
-
-        response = requests.post(directions_url, json=directions_body, headers=directions_headers)
-
-        if response.status_code == 200:
-            route_data = response.json()
-            
-            # Debug directions response if needed
-            # print(f"Directions response: {json.dumps(route_data, indent=2)[:500]}...")
-            
-            # More robust handling of route extraction
-            if "features" in route_data and route_data["features"]:
-                feature = route_data["features"][0]
-                
-                if "geometry" in feature and "coordinates" in feature["geometry"]:
-                    route_coords = feature["geometry"]["coordinates"]
-                    
-                    # Check if coordinates are valid
-                    if not route_coords or len(route_coords) < 2:
-                        print(f"⚠ Invalid or empty route coordinates: {route_coords}")
-                        # Fall back to straight line coordinates
-                        route_coords = [start_coords, end_coords]
-                    
-                    # Store new route in GeoJSON with distance
-                    new_feature = {
-                        "type": "Feature",
-                        "geometry": {"type": "LineString", "coordinates": route_coords},
-                        "properties": {
-                            "route_id": route_id,
-                            "start": start,
-                            "end": end,
-                            "distance_miles": round(route_distance_miles, 2)  # Store rounded distance
-                        }
-                    }
-                    geojson_data["features"].append(new_feature)
-                    save_geojson(geojson_data)
-                    
-                    print(f"✅ Route successfully created with {len(route_coords)} points and {round(route_distance_miles, 2)} miles")
-                    return route_coords
-                else:
-                    print(f"⚠ Could not find coordinates in route response")
-                    print(f"Feature structure: {json.dumps(feature, indent=2)[:300]}...")
-            else:
-                print(f"⚠ No features found in route response")
-                print(f"Response structure: {json.dumps(route_data, indent=2)[:300]}...")
-        else:
-            print(f"⚠ Directions API request failed: {response.status_code} {response.reason}")
-            print(f"Response content: {response.text[:500]}...")
-
+        result = fetch_routes([(start, end)], api_key, use_scheduled_time)[0]
+        if result is not None:
+            route_coords, route_distance_miles = result
+            print(f"✅ Route successfully created with {len(route_coords)} points and {round(route_distance_miles, 2)} miles")
+            return route_coords
     except Exception as e:
         import traceback
         print(f"⚠ Error fetching route: {e}")
@@ -199,14 +104,11 @@ def get_route(start, end, api_key, use_scheduled_time=True):
 
 def calculate_route_distance(route_coords):
     """Calculate the total distance of a route based on its coordinates."""
-    total_distance = 0
     if len(route_coords) < 2:
         return 0
-    for i in range(len(route_coords) - 1):
-        point1 = (route_coords[i][1], route_coords[i][0])
-        point2 = (route_coords[i+1][1], route_coords[i+1][0])
-        total_distance += geodesic(point1, point2).miles
-    return total_distance
+    # Route coordinates are [lon, lat]; swap to (lat, lon) and sum all legs at once
+    points = [(lat, lon) for lon, lat in route_coords]
+    return float(pairwise_distance(points[:-1], points[1:]).sum())
 
 # def calculate_distance(point1, point2):
 #     """Calculate the distance between two geo points in miles."""
@@ -231,11 +133,12 @@ def calculate_route_distance(route_coords):
 #     """Calculate the distance between two geo points in miles."""
 #     return geodesic(point1, point2).miles
 
+@traced()
 def calculate_distance(point1, point2, ors_client=None):
     """
     Calculate the distance between two geographic points.
     Uses OpenRouteService for driving distance if available, 
-    otherwise falls back to geodesic distance.
+    otherwise falls back to straight-line (haversine) distance.
 
     Args:
         point1: (latitude, longitude) of first point
@@ -245,10 +148,9 @@ def calculate_distance(point1, point2, ors_client=None):
     Returns:
         Distance in miles
     """
-    # Fall back to geodesic distance if no client
+    # Fall back to straight-line distance if no client
     if not ors_client:
-        from geopy.distance import geodesic
-        return geodesic(point1, point2).miles
+        return point_distance(point1, point2)
     
     try:
         print("Trying ORS for distance calculation...")
@@ -256,6 +158,7 @@ def calculate_distance(point1, point2, ors_client=None):
         coords = [[float(point1[1]), float(point1[0])], [float(point2[1]), float(point2[0])]]
         
         # Use matrix service for more accurate distance calculation
+        count("http.ors_matrix")
         matrix_response = ors_client.distance_matrix(
             locations=coords,
             metrics=['distance'],
@@ -279,8 +182,7 @@ def calculate_distance(point1, point2, ors_client=None):
     
     # Final fallback to geodesic distance
     print("Falling back to straight-line distance calculation")
-    from geopy.distance import geodesic
-    return geodesic(point1, point2).miles
+    return point_distance(point1, point2)
 
 def plot_routes_on_map(routes, stops):
     """Plot multiple routes on a Folium map with a legend and checkboxes."""
@@ -0,0 +1,329 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from functools import partial
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from profiling_utils import count, traced
+from route_cache import get_route_cache
+from route_utils import generate_route_id, ORS_BASE_URL
+
+# ORS standard plan: 40 directions requests per minute
+ORS_DIRECTIONS_PER_MINUTE = 40
+
+# Requests the token bucket lets through back to back before pacing kicks in
+ORS_REQUEST_BURST = 5
+
+# Requests in flight at once (also the size of the HTTP connection pool)
+ROUTING_MAX_CONCURRENCY = 4
+
+# Retries for 429s, 5xx responses and connection errors, with exponential backoff between them
+ROUTING_MAX_RETRIES = 5
+ROUTING_BACKOFF_SECONDS = 1.0
+ROUTING_MAX_BACKOFF_SECONDS = 60.0
+
+ROUTING_TIMEOUT_SECONDS = 30
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+METERS_TO_MILES = 0.000621371
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every request a client makes, from any thread or event loop.
+
+    ``reserve()`` takes a token and returns how long the caller must wait before
+    using it, so callers sleep outside the lock. ``pause()`` holds back every
+    token until a provider-imposed cool-down has passed.
+    """
+
+    def __init__(self, rate_per_minute=ORS_DIRECTIONS_PER_MINUTE, burst=ORS_REQUEST_BURST):
+        self.interval = 60.0 / rate_per_minute
+        # How far ahead of schedule a request may run, which is what allows the burst
+        self.tolerance = (max(1, burst) - 1) * self.interval
+        self._next_due = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            due = max(self._next_due, now)
+            self._next_due = due + self.interval
+            return max(0.0, due - self.tolerance - now)
+
+    def pause(self, seconds):
+        """Hold back every token for at least seconds."""
+        with self._lock:
+            self._next_due = max(self._next_due, time.monotonic() + seconds + self.tolerance)
+
+
+def _retry_after_seconds(response):
+    """Seconds from a Retry-After header (delta or HTTP date), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_reversed(cached_start, start, end):
+    """True if a cached leg starts nearer to this leg's end than to its start."""
+    to_start = (cached_start[0] - start[0]) ** 2 + (cached_start[1] - start[1]) ** 2
+    to_end = (cached_start[0] - end[0]) ** 2 + (cached_start[1] - end[1]) ** 2
+    return to_end < to_start
+
+
+class AsyncRoutingClient:
+    """
+    asyncio client for ORS directions, backed by the route cache.
+
+    Requests go through one pooled ``requests.Session`` run on a small thread
+    pool, so connections are reused across legs and across calls. An asyncio
+    semaphore bounds how many are in flight, a token bucket paces them to the
+    ORS plan, and 429/5xx responses are retried with exponential backoff
+    (honouring Retry-After). Each cache miss costs a single directions request,
+    which returns both the geometry and the road distance.
+    """
+
+    def __init__(self, api_key, base_url=ORS_BASE_URL, profile="driving-car",
+                 max_concurrency=ROUTING_MAX_CONCURRENCY, requests_per_minute=ORS_DIRECTIONS_PER_MINUTE,
+                 burst=ORS_REQUEST_BURST, max_retries=ROUTING_MAX_RETRIES,
+                 backoff_seconds=ROUTING_BACKOFF_SECONDS, max_backoff_seconds=ROUTING_MAX_BACKOFF_SECONDS,
+                 timeout=ROUTING_TIMEOUT_SECONDS, route_cache=None):
+        self.base_url = base_url
+        self.profile = profile
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout = timeout
+        self.route_cache = route_cache if route_cache is not None else get_route_cache()
+        self.bucket = TokenBucket(requests_per_minute, burst)
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0, "cache_hits": 0}
+
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": api_key, "Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ors")
+        # One semaphore per event loop, e.g. for background jobs each calling asyncio.run at once;
+        # the thread pool above bounds requests in flight across all of them
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _semaphore(self):
+        """The concurrency limit for the running event loop (asyncio primitives are per loop)."""
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def _backoff(self, attempt):
+        """Exponential backoff with full jitter for the given retry attempt."""
+        return random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+
+    async def _post(self, path, body):
+        """POST to ORS with pacing and retries. Returns the decoded JSON, or None on failure."""
+        loop = asyncio.get_running_loop()
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.bucket.reserve())
+            async with self._semaphore():
+                self._count("requests")
+                count("http.ors_directions")
+                try:
+                    # Copy the context so the request is attributed to the caller's run profile
+                    response = await loop.run_in_executor(
+                        self._executor,
+                        partial(contextvars.copy_context().run, self.session.post, url, json=body, timeout=self.timeout),
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    response, error = None, f"{e.__class__.__name__}: {e}"
+                else:
+                    error = f"{response.status_code} {response.reason}"
+
+            if response is not None and response.status_code == 200:
+                return response.json()
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                print(f"⚠ ORS request failed: {error}. Response content: {response.text[:300]}...")
+                break
+            if attempt == self.max_retries:
+                print(f"⚠ ORS request failed after {attempt + 1} attempts: {error}")
+                break
+
+            delay = self._backoff(attempt)
+            if response is not None and response.status_code == 429:
+                self._count("rate_limited")
+                delay = max(delay, _retry_after_seconds(response) or 0.0)
+                # Every request shares the quota, so hold them all back
+                self.bucket.pause(delay)
+            self._count("retries")
+            await asyncio.sleep(delay)
+
+        self._count("failed")
+        return None
+
+    async def get_route(self, start, end, use_scheduled_time=True):
+        """
+        Route one leg, using the route cache when it already has the geometry.
+
+        Args:
+            start: (latitude, longitude) of the start point
+            end: (latitude, longitude) of the end point
+            use_scheduled_time: Routing mode used in route ID generation
+
+        Returns:
+            Tuple of (coordinates as [lon, lat] pairs from start to end, distance in miles),
+            or None if the leg could not be routed
+        """
+        route_id = generate_route_id(start, end, use_scheduled_time)
+        coordinates = self.route_cache.get_geometry(route_id)
+        distance_miles = self.route_cache.get_distance(route_id)
+        if coordinates and distance_miles is not None:
+            self._count("cache_hits")
+            record = self.route_cache.get(route_id)
+            # Route IDs ignore direction; flip geometry cached for the reverse leg
+            if record["start"] is not None and _is_reversed(record["start"], start, end):
+                coordinates = coordinates[::-1]
+            return coordinates, distance_miles
+
+        start_coords = [float(start[1]), float(start[0])]
+        end_coords = [float(end[1]), float(end[0])]
+        data = await self._post(f"/v2/directions/{self.profile}/geojson", {"coordinates": [start_coords, end_coords]})
+        features = (data or {}).get("features") or []
+        if not features:
+            return None
+
+        feature = features[0]
+        coordinates = (feature.get("geometry") or {}).get("coordinates") or []
+        if len(coordinates) < 2:
+            coordinates = [start_coords, end_coords]
+        if distance_miles is None:
+            summary = (feature.get("properties") or {}).get("summary") or {}
+            if summary.get("distance") is None:
+                return None
+            distance_miles = summary["distance"] * METERS_TO_MILES
+
+        # Return the distance as cached, so fresh and cached legs agree
+        record = self.route_cache.put(route_id, coordinates=coordinates, distance_miles=distance_miles, start=start, end=end)
+        return coordinates, record["distance_miles"]
+
+    async def get_routes(self, pairs, use_scheduled_time=True):
+        """
+        Route many legs concurrently.
+
+        Legs that share a route ID (including a leg and its reverse) are only requested once.
+
+        Args:
+            pairs: Iterable of ((lat, lon), (lat, lon)) start/end pairs
+            use_scheduled_time: Routing mode used in route ID generation
+
+        Returns:
+            List aligned with pairs of (coordinates, distance_miles) tuples, or None
+            for legs that could not be routed
+        """
+        pairs = [(tuple(start), tuple(end)) for start, end in pairs]
+        by_route_id = {}
+        for pair in pairs:
+            by_route_id.setdefault(generate_route_id(*pair, use_scheduled_time), []).append(pair)
+        self.route_cache.warm(by_route_id, geometry=True)
+        first = [route_pairs[0] for route_pairs in by_route_id.values()]
+        fetched = set(first)
+        rest = [pair for pair in dict.fromkeys(pairs) if pair not in fetched]
+
+        # Fetch one leg per route ID, then serve the others (e.g. reverse legs) from the cache
+        by_pair = {}
+        for batch in (first, rest):
+            results = await asyncio.gather(*(self.get_route(start, end, use_scheduled_time) for start, end in batch))
+            by_pair.update(zip(batch, results))
+        return [by_pair[pair] for pair in pairs]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_routing_client(api_key, base_url=ORS_BASE_URL):
+    """Return the process-wide routing client for an API key, so the pool and rate limit are shared."""
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = AsyncRoutingClient(api_key, base_url=base_url)
+                _clients[key] = client
+    return client
+
+
+def routing_stats():
+    """Request statistics summed over every routing client in this process."""
+    totals = {}
+    for client in list(_clients.values()):
+        for stat, value in client.stats.items():
+            totals[stat] = totals.get(stat, 0) + value
+    return totals
+
+
+@traced()
+def fetch_routes(pairs, api_key, use_scheduled_time=True, client=None):
+    """
+    Blocking wrapper around ``get_routes`` for synchronous callers.
+
+    Args:
+        pairs: List of ((lat, lon), (lat, lon)) start/end pairs
+        api_key: OpenRouteService API key
+        use_scheduled_time: Routing mode used in route ID generation
+        client: AsyncRoutingClient to use (defaults to the shared client for api_key)
+
+    Returns:
+        List aligned with pairs of (coordinates, distance_miles) tuples or None
+    """
+    client = client if client is not None else get_routing_client(api_key)
+    pairs = list(pairs)
+    if not pairs:
+        return []
+
+    start = time.perf_counter()
+    requests_before = client.stats["requests"]
+    coroutine = client.get_routes(pairs, use_scheduled_time)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        results = asyncio.run(coroutine)
+    else:
+        # Called from inside an event loop; run ours on a separate thread, in this context
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            results = executor.submit(contextvars.copy_context().run, asyncio.run, coroutine).result()
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 🛣️ Routed {len(pairs)} legs with "
+          f"{client.stats['requests'] - requests_before} ORS requests in {time.perf_counter() - start:.2f}s")
+    return results
@@ -0,0 +1,145 @@
+import struct
+import threading
+import time
+from datetime import datetime
+
+import redis
+
+from profiling_utils import count
+from redis_utils import binary_redis
+
+# Redis key prefix for shared route records (one hash per route)
+SHARED_ROUTE_PREFIX = "route:"
+
+# Shared routes expire after this long without being written again
+SHARED_ROUTE_TTL_SECONDS = 30 * 24 * 3600
+
+# Route IDs fetched per pipeline round trip when warming the local cache
+SHARED_FETCH_CHUNK = 1000
+
+# After a Redis error, skip the shared tier for this long instead of failing every lookup
+SHARED_RETRY_SECONDS = 30
+
+# Packed hash fields: distance as float32 miles, start/end as four float64 degrees
+_DISTANCE = struct.Struct("<f")
+_ENDPOINTS = struct.Struct("<4d")
+
+
+def encode_shared_record(record):
+    """
+    Pack the known fields of a route record into a Redis hash mapping.
+
+    Fields that are None are left out, so writing a distance-only record never
+    clears a geometry another replica already stored, and vice versa.
+    """
+    fields = {}
+    if record.get("distance_miles") is not None:
+        fields["d"] = _DISTANCE.pack(record["distance_miles"])
+    if record.get("polyline"):
+        fields["p"] = record["polyline"].encode("ascii")
+    if record.get("polyline_simplified"):
+        fields["s"] = record["polyline_simplified"].encode("ascii")
+    if record.get("start") is not None and record.get("end") is not None:
+        fields["e"] = _ENDPOINTS.pack(*record["start"], *record["end"])
+    return fields
+
+
+def decode_shared_record(route_id, fields):
+    """Rebuild a route cache record from a Redis hash, or None for an empty hash."""
+    if not fields:
+        return None
+    endpoints = _ENDPOINTS.unpack(fields[b"e"]) if b"e" in fields else None
+    return {
+        "route_id": route_id,
+        "polyline": fields[b"p"].decode("ascii") if b"p" in fields else None,
+        "polyline_simplified": fields[b"s"].decode("ascii") if b"s" in fields else None,
+        "distance_miles": round(_DISTANCE.unpack(fields[b"d"])[0], 2) if b"d" in fields else None,
+        "start": list(endpoints[:2]) if endpoints else None,
+        "end": list(endpoints[2:]) if endpoints else None,
+    }
+
+
+class SharedRouteStore:
+    """
+    Route records shared by every app replica through Redis.
+
+    Each route is one hash (``route:<route_id>``) of compact binary fields, with a
+    TTL that is refreshed on every write. Redis errors are counted and reported,
+    never raised, and the store stands down for ``SHARED_RETRY_SECONDS``, so an
+    unavailable server only costs cache hits.
+    """
+
+    def __init__(self, redis_conn, prefix=SHARED_ROUTE_PREFIX, ttl_seconds=SHARED_ROUTE_TTL_SECONDS):
+        # Values are packed bytes, which the decode_responses connection cannot read
+        self.client = binary_redis(redis_conn)
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.errors = 0
+        self._errors_lock = threading.Lock()
+        self._retry_at = 0.0
+
+    def _key(self, route_id):
+        return f"{self.prefix}{route_id}"
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._retry_at
+
+    def _failed(self, action, error):
+        with self._errors_lock:
+            self.errors += 1
+            first = self.errors == 1
+            self._retry_at = time.monotonic() + SHARED_RETRY_SECONDS
+        if first:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] ⚠️ Shared route cache {action} failed: {error}")
+
+    def get_many(self, route_ids):
+        """
+        Fetch route records in pipelined chunks.
+
+        Args:
+            route_ids: Iterable of route IDs
+
+        Returns:
+            Dict of route_id -> record for the routes found
+        """
+        route_ids = list(route_ids)
+        found = {}
+        if not self.available:
+            return found
+        for offset in range(0, len(route_ids), SHARED_FETCH_CHUNK):
+            chunk = route_ids[offset:offset + SHARED_FETCH_CHUNK]
+            try:
+                pipe = self.client.pipeline(transaction=False)
+                for route_id in chunk:
+                    pipe.hgetall(self._key(route_id))
+                count("redis.shared_route_round_trips")
+                results = pipe.execute()
+            except redis.RedisError as e:
+                self._failed("read", e)
+                break
+            for route_id, fields in zip(chunk, results):
+                record = decode_shared_record(route_id, fields)
+                if record is not None:
+                    found[route_id] = record
+        return found
+
+    def put_many(self, records):
+        """Write route records (known fields only) and refresh their TTL in one round trip."""
+        if not self.available:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for record in records:
+                fields = encode_shared_record(record)
+                if fields:
+                    key = self._key(record["route_id"])
+                    if "p" in fields and "s" not in fields:
+                        # A new geometry without a simplified copy must not keep the old route's copy
+                        pipe.hdel(key, "s")
+                    pipe.hset(key, mapping=fields)
+                    pipe.expire(key, self.ttl_seconds)
+            count("redis.shared_route_round_trips")
+            pipe.execute()
+        except redis.RedisError as e:
+            self._failed("write", e)
@@ -0,0 +1,156 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from distance_utils import EARTH_RADIUS_MILES
+
+PHLEB_COORD_COLUMNS = ["PhlebotomistLatitude", "PhlebotomistLongitude"]
+
+
+class PhlebSpatialIndex:
+    """
+    Haversine BallTree over phlebotomist home locations.
+
+    The tree is built once per phlebotomist roster. After that, k-nearest and
+    radius queries take O(log N) instead of scanning every phlebotomist. One
+    sub-index per city is built lazily, so "phlebotomists in this city, nearest
+    first" also avoids a full scan.
+
+    Query results are ``(positions, distances)``. ``positions`` are row
+    positions into the DataFrame the index was built from, for use with
+    ``iloc``. ``distances`` are in miles, nearest first.
+    """
+
+    def __init__(self, phleb_df):
+        coords = phleb_df[PHLEB_COORD_COLUMNS].to_numpy(dtype=float)
+        valid = ~np.isnan(coords).any(axis=1)
+
+        self.size = len(phleb_df)
+        self._positions = np.flatnonzero(valid)
+        self._missing_positions = np.flatnonzero(~valid)
+        self._tree = BallTree(np.radians(coords[valid]), metric="haversine") if valid.any() else None
+
+        self._coords = coords
+        self._cities = phleb_df["City"].to_numpy() if "City" in phleb_df.columns else None
+        self._city_indexes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _query_point(lat, lon):
+        return np.radians([[lat, lon]])
+
+    @staticmethod
+    def _ordered(positions, distances):
+        """Order results by distance, breaking ties by roster position like a stable full sort."""
+        order = np.lexsort((positions, distances))
+        return positions[order], distances[order] * EARTH_RADIUS_MILES
+
+    def query_nearest(self, lat, lon, k):
+        """
+        Find the k phlebotomists nearest to a point.
+
+        Args:
+            lat: Latitude of the query point
+            lon: Longitude of the query point
+            k: Number of neighbours to return (capped at the roster size)
+
+        Returns:
+            Tuple of (positions, distances_miles) arrays, nearest first
+        """
+        if self._tree is None or k <= 0:
+            return np.empty(0, dtype=int), np.empty(0)
+        k = min(int(k), len(self._positions))
+        distances, indices = self._tree.query(self._query_point(lat, lon), k=k)
+        return self._ordered(self._positions[indices[0]], distances[0])
+
+    def query_radius(self, lat, lon, radius_miles):
+        """
+        Find every phlebotomist within radius_miles of a point.
+
+        Args:
+            lat: Latitude of the query point
+            lon: Longitude of the query point
+            radius_miles: Search radius in miles
+
+        Returns:
+            Tuple of (positions, distances_miles) arrays, nearest first
+        """
+        if self._tree is None:
+            return np.empty(0, dtype=int), np.empty(0)
+        indices, distances = self._tree.query_radius(
+            self._query_point(lat, lon), r=radius_miles / EARTH_RADIUS_MILES,
+            return_distance=True, sort_results=True
+        )
+        return self._ordered(self._positions[indices[0]], distances[0])
+
+    def _city_index(self, city):
+        """Return the (positions, tree) pair for one city, building it on first use."""
+        with self._lock:
+            if city not in self._city_indexes:
+                positions = np.flatnonzero(self._cities == city) if self._cities is not None else np.empty(0, dtype=int)
+                positions = positions[~np.isnan(self._coords[positions]).any(axis=1)]
+                tree = BallTree(np.radians(self._coords[positions]), metric="haversine") if len(positions) else None
+                self._city_indexes[city] = (positions, tree)
+            return self._city_indexes[city]
+
+    def query_city(self, city, lat, lon, k=None):
+        """
+        Find phlebotomists based in a city, nearest to a point first.
+
+        Args:
+            city: City name as it appears in the roster's ``City`` column
+            lat: Latitude of the query point
+            lon: Longitude of the query point
+            k: Maximum number to return (defaults to all in the city)
+
+        Returns:
+            Tuple of (positions, distances_miles) arrays, nearest first
+        """
+        positions, tree = self._city_index(city)
+        if tree is None:
+            return np.empty(0, dtype=int), np.empty(0)
+        k = len(positions) if k is None else min(int(k), len(positions))
+        distances, indices = tree.query(self._query_point(lat, lon), k=k)
+        return self._ordered(positions[indices[0]], distances[0])
+
+    def city_missing_positions(self, city):
+        """Row positions of phlebotomists in a city that have no coordinates."""
+        if self._cities is None:
+            return np.empty(0, dtype=int)
+        return self._missing_positions[self._cities[self._missing_positions] == city]
+
+
+_phleb_indexes = {}
+_phleb_indexes_lock = threading.Lock()
+
+
+def _roster_fingerprint(phleb_df):
+    """Hash the ID, city and coordinate columns so an edited roster gets a fresh index."""
+    columns = [column for column in ["PhlebotomistID.1", "City"] + PHLEB_COORD_COLUMNS if column in phleb_df.columns]
+    return int(pd.util.hash_pandas_object(phleb_df[columns], index=False).sum())
+
+
+def get_phleb_index(phleb_df):
+    """
+    Return the spatial index for a phlebotomist roster, building it only the first time.
+
+    The index is cached by roster contents, not by DataFrame identity. Copies of
+    the same roster, like the ones Streamlit reruns hand back, reuse the same tree.
+
+    Args:
+        phleb_df: DataFrame with phlebotomist information
+
+    Returns:
+        PhlebSpatialIndex for the roster
+    """
+    key = (len(phleb_df), _roster_fingerprint(phleb_df))
+    index = _phleb_indexes.get(key)
+    if index is None:
+        with _phleb_indexes_lock:
+            index = _phleb_indexes.get(key)
+            if index is None:
+                index = PhlebSpatialIndex(phleb_df)
+                _phleb_indexes[key] = index
+    return index
@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules live at the repository root rather than in an installed package
+sys.path.insert(0, REPO_ROOT)
+
+# route_utils builds its Google Maps and ORS clients at import time
+os.environ.setdefault("MAP", "AIzaTestKeyForOfflineTests")
+os.environ.setdefault("KEY", "test-ors-key")
+
+# assignment_utils and final_utils_upd import each other; the apps always load final_utils_upd first
+import final_utils_upd  # noqa: E402,F401
+
+
+@pytest.fixture(autouse=True)
+def _run_in_tmp_dir(tmp_path, monkeypatch):
+    """Keep route caches, geocode caches and profiles written during a test out of the repository."""
+    monkeypatch.chdir(tmp_path)
+
+
+class StubORS:
+    """
+    Local stand-in for the OpenRouteService matrix and directions endpoints.
+
+    Road distances are the haversine distance times ROAD_FACTOR. Responses queued in
+    ``scripted`` (status, headers) are served first, one per request, before the
+    normal ones; every request is recorded in ``requests`` as (path, body).
+    """
+
+    ROAD_FACTOR = 1.3
+
+    def __init__(self):
+        self.requests = []
+        self.scripted = []
+        self.lock = threading.Lock()
+
+    def road_meters(self, start, end):
+        from distance_utils import point_distance
+        # Coordinates arrive as ORS [lon, lat]
+        return point_distance((start[1], start[0]), (end[1], end[0]), unit="km") * 1000 * self.ROAD_FACTOR
+
+    def respond(self, path, body):
+        with self.lock:
+            self.requests.append((path, body))
+            if self.scripted:
+                status, headers = self.scripted.pop(0)
+                return status, headers, {"error": "scripted failure"}
+        if path.startswith("/v2/matrix/"):
+            locations = body["locations"]
+            distances = [[self.road_meters(locations[s], locations[d]) for d in body["destinations"]]
+                         for s in body["sources"]]
+            return 200, {}, {"distances": distances}
+        if path.startswith("/v2/directions/"):
+            start, end = body["coordinates"]
+            middle = [(start[0] + end[0]) / 2, (start[1] + end[1]) / 2]
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": [start, middle, end]},
+                "properties": {"summary": {"distance": self.road_meters(start, end)}},
+            }
+            return 200, {}, {"type": "FeatureCollection", "features": [feature]}
+        return 404, {}, {"error": "unknown endpoint"}
+
+
+@pytest.fixture
+def stub_ors():
+    """Run a StubORS on a local port; yields it with ``url`` set to its base URL."""
+    stub = StubORS()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status, headers, payload = stub.respond(self.path, body)
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    stub.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def bundled_data(monkeypatch, tmp_path):
+    """
+    The bundled req8425 trips, roster and workload frames, ready to plan offline.
+
+    Dropoff grouping reads All_Dropoffs.csv from the working directory, and target
+    cities resolve to the centroid of their patients instead of calling Nominatim.
+    """
+    import shutil
+
+    import pandas as pd
+
+    import assignment_utils
+
+    shutil.copy(os.path.join(REPO_ROOT, "All_Dropoffs.csv"), tmp_path)
+    trips = pd.read_csv(os.path.join(REPO_ROOT, "req8425.csv"))
+    trips["ScheduledDtm"] = pd.to_datetime(trips["ScheduledDtm"])
+    phlebs = pd.read_csv(os.path.join(REPO_ROOT, "phlebotomists_with_city.csv"))
+    workload = pd.read_csv(os.path.join(REPO_ROOT, "avg_workload_per_city_per_phleb.csv"))
+    centroids = trips.groupby("City")[["PatientLatitude", "PatientLongitude"]].mean()
+    monkeypatch.setattr(assignment_utils, "geocode_city", lambda name: tuple(centroids.loc[name]))
+    return trips, phlebs, workload
@@ -0,0 +1,69 @@
+import pandas as pd
+
+from assignment_utils import apply_assignment_delta
+
+DROPOFFS = pd.DataFrame({
+    "LabID": [1], "Clinic": ["Central Lab"], "Address": ["1 Main St"], "City": ["Philadelphia"],
+    "State": ["PA"], "Zipcode": ["19103"], "Latitude": [40.5], "Longitude": [-75.0],
+})
+
+
+def _patient(patient_id, latitude, scheduled, phleb_id=None, order=None, label=None):
+    row = {
+        "PatientSysID": patient_id, "PatientLatitude": latitude, "PatientLongitude": -75.0,
+        "ScheduledDtm": pd.Timestamp(scheduled), "WorkloadPoints": 1, "DropOffLocation": "1",
+        "PatientState": "PA", "PatientZip": "19103", "City": "Philadelphia",
+    }
+    if phleb_id is not None:
+        row.update({"AssignedPhlebID": phleb_id, "TripOrderInDay": order, "PreferredTime": row["ScheduledDtm"],
+                    "index": label})
+    return row
+
+
+def _assignment():
+    phlebs = pd.DataFrame({
+        "PhlebotomistID.1": ["A", "B"],
+        "PhlebotomistName": ["Near", "Far"],
+        "PhlebotomistLatitude": [40.0, 41.0],
+        "PhlebotomistLongitude": [-75.0, -75.0],
+        "assigned_patients": [[10, 11], [12]],
+        "current_workload": [2, 1],
+        "current_location": [(40.02, -75.0), (41.01, -75.0)],
+        "total_distance": [2.0, 1.0],
+    })
+    patients = pd.DataFrame([
+        _patient("p0", 40.01, "2025-08-04 08:00", "A", 1, 10),
+        _patient("p1", 40.02, "2025-08-04 09:00", "A", 2, 11),
+        _patient("p2", 41.01, "2025-08-04 08:30", "B", 1, 12),
+    ])
+    return phlebs, patients
+
+
+def test_reschedule_and_add_in_one_delta_keep_their_own_assignments():
+    phlebs, patients = _assignment()
+    added = pd.DataFrame([_patient("p3", 41.02, "2025-08-04 08:45")])
+
+    new_phlebs, new_patients = apply_assignment_delta(
+        phlebs, patients, added_patients=added, rescheduled={"p1": "2025-08-04 10:00"}, dropoffs_df=DROPOFFS,
+    )
+
+    assigned = new_patients.set_index("PatientSysID")["AssignedPhlebID"].to_dict()
+    assert assigned == {"p0": "A", "p1": "A", "p2": "B", "p3": "B"}
+    assert new_patients.index.is_unique
+    assert new_patients.set_index("PatientSysID").loc["p1", "ScheduledDtm"] == pd.Timestamp("2025-08-04 10:00")
+
+    # Trip labels are kept for existing patients; the added patient has none
+    labels = new_patients.set_index("PatientSysID")["index"]
+    assert labels[["p0", "p1", "p2"]].tolist() == [10, 11, 12]
+    assert pd.isna(labels["p3"])
+    workloads = new_phlebs.set_index("PhlebotomistID.1")["current_workload"].to_dict()
+    assert workloads == {"A": 2, "B": 2}
+
+
+def test_cancelled_patient_leaves_route():
+    phlebs, patients = _assignment()
+
+    new_phlebs, new_patients = apply_assignment_delta(phlebs, patients, removed_ids=["p2"], dropoffs_df=DROPOFFS)
+
+    assert set(new_patients["PatientSysID"]) == {"p0", "p1"}
+    assert new_phlebs["PhlebotomistID.1"].tolist() == ["A"]
@@ -0,0 +1,105 @@
+import logging
+import time
+from datetime import date
+from unittest import mock
+
+import assignment_jobs
+import assignment_utils
+import final_utils_upd as utils
+from assignment_jobs import AssignmentJob, AssignmentJobQueue
+
+
+def _wait(job, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if job.done:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job.job_id} did not finish")
+
+
+def test_identical_requests_share_one_run():
+    queue = AssignmentJobQueue(max_workers=1)
+    calls = []
+
+    def work(value, progress_callback):
+        calls.append(value)
+        progress_callback(0.5, "halfway")
+        return value * 2
+
+    first = _wait(queue.submit("job", work, {}, 21))
+    second = queue.submit("job", work, {}, 21)
+
+    assert second is first
+    assert first.result == 42 and first.progress == 1.0
+    assert calls == [21]
+
+
+def test_failed_job_is_retried_as_a_new_submission_under_the_same_id():
+    queue = AssignmentJobQueue(max_workers=1)
+    attempts = []
+
+    def flaky(progress_callback):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("ORS unavailable")
+        return "ok"
+
+    failed = _wait(queue.submit("job", flaky, {}))
+    retried = _wait(queue.submit("job", flaky, {}))
+
+    assert failed.status == "failed" and "ORS unavailable" in failed.error
+    assert retried is not failed
+    assert retried.job_id == failed.job_id
+    assert retried.status == "done" and retried.result == "ok"
+
+
+def test_sessions_with_different_data_get_separate_jobs(bundled_data, monkeypatch):
+    trips, phlebs, workload = bundled_data
+    monkeypatch.setattr(assignment_jobs, "get_job_queue", lambda: queue)
+    monkeypatch.setattr(utils, "process_city_assignments",
+                        lambda trips, *args, progress_callback, **kwargs: len(trips))
+    queue = AssignmentJobQueue(max_workers=1)
+    edited = trips.copy()
+    edited.loc[edited["City"] == "Peabody", "WorkloadPoints"] += 1
+
+    def submit(trips_df, **kwargs):
+        return _wait(assignment_jobs.submit_assignment_job(trips_df, phlebs, workload, "2025-04-08", "Peabody",
+                                                           **kwargs))
+
+    first = submit(trips)
+
+    assert submit(trips.copy()) is first
+    assert submit(edited) is not first
+    assert submit(trips, redis_host="redis.internal") is not first
+    assert submit(trips, api_key="other-key") is not first
+    # Trips of other cities are not part of the run
+    assert submit(trips[trips["City"] != "Santa Clara"]) is first
+
+
+def test_background_job_keeps_messages_the_run_would_have_shown(bundled_data, monkeypatch):
+    trips, phlebs, workload = bundled_data
+    monkeypatch.setattr(assignment_utils, "geocode_city", lambda city: None)
+    queue = AssignmentJobQueue(max_workers=1)
+
+    job = _wait(queue.submit("job", utils.process_city_assignments, {}, trips, phlebs, workload,
+                             "2025-04-08", "Peabody", redis_port=1), timeout=30)
+
+    assert job.status == "done" and job.result[0] is None
+    assert job.messages == [("error", "Could not find coordinates for Peabody."),
+                            ("error", "No phlebotomists available in Peabody")]
+
+
+def test_applying_a_job_reports_its_messages_without_storing_an_empty_result():
+    job = AssignmentJob("job", {"date": date(2025, 4, 8), "city": "Peabody", "use_scheduled_time": True})
+    job.status = "done"
+    job.result = (None, None, None)
+    job.messages = [("warning", "No phlebotomists found in Peabody. Returning nearby phlebotomists.")]
+    logger = logging.getLogger("test_assignment_jobs")
+    stored = []
+
+    with mock.patch.object(logger, "warning") as warning, mock.patch.object(logger, "error") as error:
+        assignment_jobs.apply_assignment_job(job, lambda *result: stored.append(result), logger)
+
+    assert "No phlebotomists found in Peabody" in warning.call_args.args[0]
+    assert "Failed to generate assignments" in error.call_args.args[0]
+    assert stored == []
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+from functools import lru_cache
+
+import pandas as pd
+import pytest
+
+import assignment_utils
+from conftest import REPO_ROOT
+
+# Greedy assignments for every (date, city) of the bundled trip CSVs, recorded with the
+# row-by-row implementation that preceded the NumPy engine. Keys are
+# "<csv>|<date>|<city>|<patients>"; patients map trip labels to [phlebotomist, trip order]
+# and phlebs map IDs to [assigned trip labels, workload, total distance].
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), "data", "greedy_assignments_pre_numpy.json")
+
+with open(GOLDEN_PATH, encoding="utf-8") as f:
+    GOLDEN = json.load(f)
+
+
+@lru_cache(maxsize=None)
+def _trips(csv_name):
+    trips = pd.read_csv(os.path.join(REPO_ROOT, csv_name))
+    trips["ScheduledDtm"] = pd.to_datetime(trips["ScheduledDtm"])
+    return trips
+
+
+@lru_cache(maxsize=None)
+def _reference_frames():
+    phlebs = pd.read_csv(os.path.join(REPO_ROOT, "phlebotomists_with_city.csv"))
+    workload = pd.read_csv(os.path.join(REPO_ROOT, "avg_workload_per_city_per_phleb.csv"))
+    return phlebs, workload
+
+
+@pytest.mark.parametrize("case", list(GOLDEN))
+def test_greedy_engine_matches_previous_implementation(case, monkeypatch, tmp_path):
+    # Dropoff grouping reads All_Dropoffs.csv from the working directory
+    shutil.copy(os.path.join(REPO_ROOT, "All_Dropoffs.csv"), tmp_path)
+    csv_name, date_str, city, _ = case.split("|")
+    trips = _trips(csv_name)
+    phlebs, workload = _reference_frames()
+
+    # The golden run geocoded each city to the centroid of its patients, without the network
+    centroids = trips.groupby("City")[["PatientLatitude", "PatientLongitude"]].mean()
+    monkeypatch.setattr(assignment_utils, "geocode_city",
+                        lambda name: tuple(centroids.loc[name]) if name in centroids.index else None)
+
+    assigned_phlebs, assigned_patients = assignment_utils.assign_patients_to_phlebotomists(
+        trips, phlebs.copy(), workload, date_str, city
+    )
+
+    expected = GOLDEN[case]
+    patients = {
+        str(label): [row.AssignedPhlebID, int(row.TripOrderInDay)] for label, row in assigned_patients.iterrows()
+    }
+    assert patients == expected["patients"]
+    phleb_results = {
+        row["PhlebotomistID.1"]: [[int(label) for label in row["assigned_patients"]], float(row["current_workload"]),
+                                  round(float(row["total_distance"]), 9)]
+        for _, row in assigned_phlebs.iterrows()
+    }
+    assert phleb_results == expected["phlebs"]
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import batch_assign
+import redis_utils
+from conftest import REPO_ROOT
+from trip_store import TripStore
+
+DATA_FILES = ["req8425.csv", "phlebotomists_with_city.csv", "avg_workload_per_city_per_phleb.csv",
+              "All_Dropoffs.csv"]
+
+
+@pytest.fixture
+def trip_store():
+    trips = pd.read_csv(os.path.join(REPO_ROOT, "req8425.csv"))
+    trips["ScheduledDtm"] = pd.to_datetime(trips["ScheduledDtm"])
+    return TripStore(trips)
+
+
+def test_pairs_are_filtered_and_largest_first(trip_store):
+    pairs = batch_assign.select_pairs(trip_store, "2025-04-08", "2025-04-08",
+                                      cities=["Peabody", "Santa Clara", "Woburn", "Atlantis"])
+
+    assert pairs == [("2025-04-08", "Santa Clara"), ("2025-04-08", "Peabody"), ("2025-04-08", "Woburn")]
+    assert all(date >= "2025-04-09" for date, _ in batch_assign.select_pairs(trip_store, start_date="2025-04-09"))
+
+
+def _run_main(directory, workers):
+    """Run the batch CLI from its own directory, with the bundled data and no ORS key."""
+    os.makedirs(directory)
+    for name in DATA_FILES:
+        shutil.copy(os.path.join(REPO_ROOT, name), directory)
+    os.chdir(directory)
+    results = batch_assign.main([
+        "--trips", "req8425.csv", "--start-date", "2025-04-08", "--end-date", "2025-04-08",
+        "--cities", "Peabody", "Santa Clara", "--workers", str(workers),
+    ])
+    files = sorted(os.listdir(os.path.join(directory, "GeneratedFiles")))
+    patients = {name: pd.read_csv(os.path.join(directory, "GeneratedFiles", name))
+                for name in files if name.endswith("_patients.csv")}
+    return results, files, patients
+
+
+def test_serial_and_pooled_runs_write_the_same_results(tmp_path, monkeypatch):
+    # Without a key no ORS request is made; cities geocode from the centroids seeded from the bundled CSVs
+    monkeypatch.delenv("KEY", raising=False)
+
+    def no_redis(*args, **kwargs):
+        raise ConnectionError("no Redis in tests")
+
+    # Fail fast instead of waiting out the connection retries (worker processes inherit this when forked)
+    monkeypatch.setattr(redis_utils, "initialize_redis", no_redis)
+
+    serial, serial_files, serial_patients = _run_main(tmp_path / "serial", workers=1)
+    pooled, pooled_files, pooled_patients = _run_main(tmp_path / "pooled", workers=2)
+
+    def counts(results):
+        return sorted((result["date"], result["city"], result["patients"], result["phlebs"], result["error"])
+                      for result in results)
+
+    assert counts(serial) == counts(pooled) == [("2025-04-08", "Peabody", 3, 2, None),
+                                                ("2025-04-08", "Santa Clara", 4, 1, None)]
+    assert serial_files == pooled_files
+    assert len(serial_files) == 6
+    for name, patients in serial_patients.items():
+        pd.testing.assert_frame_equal(patients, pooled_patients[name])
@@ -0,0 +1,127 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import REPO_ROOT
+from distance_utils import distance_matrix
+from dropoff_index import DropoffIndex
+
+TRIP_FILES = ["req8425.csv", "trip0804.csv", "sample-test-data.csv"]
+
+
+@pytest.fixture(scope="module")
+def dropoffs():
+    return pd.read_csv(os.path.join(REPO_ROOT, "All_Dropoffs.csv"))
+
+
+@pytest.fixture(scope="module")
+def trips():
+    return pd.concat([pd.read_csv(os.path.join(REPO_ROOT, name)) for name in TRIP_FILES], ignore_index=True)
+
+
+def _assignment_lookup(dropoffs, patient):
+    """The per-patient filters assign_patients_to_phlebotomists applied before the index."""
+    if not isinstance(patient["DropOffLocation"], str):
+        return -1
+    matches = dropoffs[dropoffs["Clinic"].str.lower() == patient["DropOffLocation"].lower()]
+    if matches.empty:
+        return -1
+    state_matches = matches[matches["State"].str.lower() == patient["PatientState"].lower()]
+    if not state_matches.empty:
+        matches = state_matches
+    zip_matches = matches[matches["Zipcode"] == patient["PatientZip"]]
+    if not zip_matches.empty:
+        matches = zip_matches
+    return _nearest(dropoffs, matches, patient)
+
+
+def _route_lookup(dropoffs, patient):
+    """The per-patient filters optimize_routes applied before the index."""
+    if pd.isna(patient["DropOffLocation"]):
+        return -1
+    matches = dropoffs[dropoffs["Clinic"].str.lower() == patient["DropOffLocation"].lower()]
+    for patient_column, dropoff_column in (("PatientState", "State"), ("City", "City")):
+        if pd.notna(patient[patient_column]) and not matches.empty:
+            narrowed = matches[matches[dropoff_column] == patient[patient_column]]
+            if not narrowed.empty:
+                matches = narrowed
+    if pd.notna(patient["PatientZip"]) and not matches.empty:
+        narrowed = matches[matches["Zipcode"] == int(patient["PatientZip"])]
+        if not narrowed.empty:
+            matches = narrowed
+    return _nearest(dropoffs, matches, patient) if not matches.empty else -1
+
+
+def _nearest(dropoffs, matches, patient):
+    distances = distance_matrix((patient["PatientLatitude"], patient["PatientLongitude"]),
+                                matches[["Latitude", "Longitude"]].to_numpy())[0]
+    return dropoffs.index.get_loc(matches.index[int(np.argmin(distances))])
+
+
+@pytest.mark.parametrize("levels, lookup", [(("state", "zip"), _assignment_lookup),
+                                            (("state", "city", "zip"), _route_lookup)])
+def test_index_matches_the_per_patient_lookup_on_bundled_trips(dropoffs, trips, levels, lookup):
+    positions, distances = DropoffIndex(dropoffs).nearest(trips, levels)
+
+    expected = [lookup(dropoffs, patient) for _, patient in trips.iterrows()]
+    assert positions.tolist() == expected
+    # Bundled trips cover clinics in other cases ("Labcorp", "QUEST"), misspelt and missing clinics
+    assert (positions >= 0).any() and (positions < 0).any()
+    assert np.isnan(distances[positions < 0]).all()
+
+
+def _patients(**columns):
+    base = {"DropOffLocation": ["quest"], "PatientState": ["MA"], "PatientZip": [1801], "City": ["Woburn"],
+            "PatientLatitude": [42.48], "PatientLongitude": [-71.15]}
+    base.update({name: [value] for name, value in columns.items()})
+    return pd.DataFrame(base)
+
+
+@pytest.fixture
+def clinics():
+    return pd.DataFrame({
+        "LabID": ["Q1", "Q2", "Q3", "L1"],
+        "Clinic": ["Quest", "Quest", "Quest", "LabCorp"],
+        "Address": [""] * 4,
+        "City": ["Woburn", "Burlington", "Hartford", "Woburn"],
+        "State": ["MA", "MA", "CT", "MA"],
+        "Zipcode": [1801, 1803, 6103, 1801],
+        "Latitude": [42.48, 42.50, 41.76, 42.48],
+        "Longitude": [-71.15, -71.20, -72.68, -71.15],
+    })
+
+
+def test_clinic_is_matched_case_insensitively(clinics):
+    positions, _ = DropoffIndex(clinics).nearest(_patients(DropOffLocation="  QUEST "))
+
+    assert positions.tolist() == [0]
+
+
+def test_state_and_zip_narrow_before_the_nearest_is_taken(clinics):
+    index = DropoffIndex(clinics)
+    # The Hartford site is the only Quest in CT, however far away it is
+    in_ct = _patients(PatientState="ct", PatientZip=99999)
+    # Zip 01803 picks Burlington over the closer Woburn site
+    in_burlington = _patients(PatientZip="01803")
+
+    assert index.nearest(in_ct)[0].tolist() == [2]
+    assert index.nearest(in_burlington)[0].tolist() == [1]
+    assert index.nearest(in_burlington, levels=("state",))[0].tolist() == [0]
+
+
+def test_levels_without_a_matching_dropoff_are_skipped(clinics):
+    positions, _ = DropoffIndex(clinics).nearest(_patients(PatientState="NY", PatientZip=10001))
+
+    assert positions.tolist() == [0]
+
+
+def test_patients_without_a_known_clinic_have_no_dropoff(clinics):
+    patients = pd.concat([_patients(DropOffLocation="Labcrop"), _patients(DropOffLocation=None)])
+
+    positions, distances = DropoffIndex(clinics).nearest(patients)
+
+    assert positions.tolist() == [-1, -1]
+    assert np.isnan(distances).all()
+    assert DropoffIndex(clinics.iloc[:0]).nearest(_patients())[0].tolist() == [-1]
@@ -0,0 +1,90 @@
+import os
+
+import pandas as pd
+import pytest
+
+import geocode_cache
+from conftest import REPO_ROOT
+from geocode_cache import GeocodeCache
+
+SEED_SOURCES = [(os.path.join(REPO_ROOT, "req8425.csv"), "City", "PatientLatitude", "PatientLongitude")]
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Answers for the network geocoder, recording every query sent to it."""
+    answers = {}
+    queries = []
+
+    def geocode_online(self, query):
+        queries.append(query)
+        return answers.get(query)
+
+    monkeypatch.setattr(GeocodeCache, "_geocode_online", geocode_online)
+    return answers, queries
+
+
+def _cache(tmp_path, **kwargs):
+    return GeocodeCache(db_path=str(tmp_path / "geocode_cache.sqlite"), **kwargs)
+
+
+def test_bundled_cities_resolve_from_the_seeded_store(tmp_path, lookups):
+    _, queries = lookups
+    cache = _cache(tmp_path, seed_sources=SEED_SOURCES)
+    trips = pd.read_csv(SEED_SOURCES[0][0])
+    woburn = trips.loc[trips["City"] == "Woburn", ["PatientLatitude", "PatientLongitude"]].mean()
+
+    assert cache.get("  WOBURN ") == pytest.approx(tuple(woburn))
+    assert cache.get("Woburn") == cache.get("woburn")
+    assert cache.stats == {"lru_hits": 2, "disk_hits": 1, "network_lookups": 0}
+    assert queries == []
+
+
+def test_entries_persist_and_a_filled_store_is_not_reseeded(tmp_path, lookups):
+    cache = _cache(tmp_path, seed_sources=SEED_SOURCES)
+    cache.put("Woburn", 1.0, 2.0)
+    seeded = len(cache)
+
+    reopened = _cache(tmp_path, seed_sources=SEED_SOURCES)
+
+    assert len(reopened) == seeded
+    assert reopened.get("woburn") == (1.0, 2.0)
+
+
+def test_network_results_are_stored_and_unknown_places_only_remembered(tmp_path, lookups):
+    answers, queries = lookups
+    answers["Springfield"] = (39.8, -89.6)
+    cache = _cache(tmp_path, seed_sources=None)
+
+    assert cache.get("Springfield") == (39.8, -89.6)
+    assert cache.get("Atlantis") is None
+    assert cache.get("Atlantis") is None
+    assert queries == ["Springfield", "Atlantis"]
+
+    reopened = _cache(tmp_path, seed_sources=None)
+    assert reopened.get("springfield") == (39.8, -89.6)
+    assert reopened.get("Atlantis") is None
+    assert queries == ["Springfield", "Atlantis", "Atlantis"]
+
+
+def test_network_errors_are_retried(tmp_path, monkeypatch):
+    attempts = []
+
+    def failing(self, query):
+        attempts.append(query)
+        return geocode_cache._MISS
+
+    monkeypatch.setattr(GeocodeCache, "_geocode_online", failing)
+    cache = _cache(tmp_path, seed_sources=None)
+
+    assert cache.get("Springfield") is None
+    assert cache.get("Springfield") is None
+    assert attempts == ["Springfield", "Springfield"]
+
+
+def test_offline_cache_never_calls_the_geocoder(tmp_path, lookups):
+    _, queries = lookups
+    cache = _cache(tmp_path, seed_sources=None, allow_network=False)
+
+    assert cache.get("Springfield") is None
+    assert queries == []
@@ -0,0 +1,116 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from history_store import (HISTORY_INDEX_KEY, clear_history, history_data_key, history_key, list_history, load_history,
+                           load_history_map, save_history)
+
+
+class Exploding:
+    """Unpickling this runs code, which is what loading history must never do."""
+
+    def __reduce__(self):
+        return (pytest.fail, ("history payload was unpickled",))
+
+
+@pytest.fixture
+def redis_conn():
+    return fakeredis.FakeRedis()
+
+
+def _frames():
+    phlebs = pd.DataFrame({
+        "PhlebotomistID.1": ["A", "B"],
+        "assigned_patients": [[0, 2], [1]],
+        "current_workload": [2.0, 1.0],
+    })
+    phlebs.attrs["assignment_report"] = {"greedy_miles": 12.5, "moves": np.int64(3), "selected_mode": "optimal"}
+    patients = pd.DataFrame({
+        "AssignedPhlebID": ["A", "B", "A"],
+        "PatientID": [101, "P-7", None],
+        "ScheduledDtm": pd.to_datetime(["2025-04-08 08:00", "2025-04-08 09:00", "2025-04-08 10:00"]),
+    })
+    return phlebs, patients
+
+
+def test_round_trips_frames_attrs_and_map(redis_conn):
+    phlebs, patients = _frames()
+    save_history(redis_conn, "2025-04-08", "Peabody", "<html>map</html>", phlebs, patients, True)
+
+    history = load_history(redis_conn, "2025-04-08", "Peabody")
+
+    pd.testing.assert_frame_equal(history["assigned_phlebs"], phlebs)
+    assert history["assigned_phlebs"].attrs == {
+        "assignment_report": {"greedy_miles": 12.5, "moves": 3, "selected_mode": "optimal"}
+    }
+    # A column mixing numbers and strings is saved as strings instead of being pickled
+    assert history["assigned_patients"]["PatientID"].tolist() == ["101", "P-7", None]
+    assert history["patients_format"] == "arrow"
+    assert history["use_scheduled_time"] is True
+    assert load_history_map(redis_conn, "2025-04-08", "Peabody") == "<html>map</html>"
+
+
+def test_attrs_that_are_not_json_fail_loudly(redis_conn):
+    phlebs, patients = _frames()
+    phlebs.attrs["model"] = object()
+
+    with pytest.raises(TypeError):
+        save_history(redis_conn, "2025-04-08", "Peabody", "", phlebs, patients, True)
+
+
+def test_never_unpickles_legacy_payloads(redis_conn):
+    phlebs, patients = _frames()
+    save_history(redis_conn, "2025-04-08", "Peabody", "", phlebs, patients, True)
+    redis_conn.hset(history_key("2025-04-08", "Peabody"), "patients_format", "pickle")
+    redis_conn.set(history_data_key("2025-04-08", "Peabody", "patients"), pickle.dumps(Exploding()))
+
+    assert load_history(redis_conn, "2025-04-08", "Peabody") is None
+
+
+def _save_days(redis_conn, cities, days):
+    phlebs, patients = _frames()
+    for day in days:
+        for city in cities:
+            save_history(redis_conn, f"2025-04-{day:02d}", city, "", phlebs, patients, True)
+
+
+def test_pages_are_newest_first_and_skip_expired_items(redis_conn):
+    _save_days(redis_conn, ["Peabody"], range(1, 8))
+    # Items whose metadata expired are dropped from the index while a page is filled
+    redis_conn.delete(history_key("2025-04-06", "Peabody"), history_key("2025-04-04", "Peabody"))
+
+    first, total = list_history(redis_conn, offset=0, limit=3)
+    second, total_after = list_history(redis_conn, offset=3, limit=3)
+
+    assert [item["date"] for item in first] == ["2025-04-07", "2025-04-05", "2025-04-03"]
+    assert [item["date"] for item in second] == ["2025-04-02", "2025-04-01"]
+    assert first[0] == {"date": "2025-04-07", "city": "Peabody", "key": history_key("2025-04-07", "Peabody")}
+    assert total == total_after == 5
+    assert redis_conn.zcard(HISTORY_INDEX_KEY) == 5
+
+
+def test_cities_with_colons_keep_their_name(redis_conn):
+    _save_days(redis_conn, ["Site: North"], [8])
+
+    items, _ = list_history(redis_conn)
+
+    assert [(item["date"], item["city"]) for item in items] == [("2025-04-08", "Site: North")]
+
+
+def test_clear_removes_indexed_and_unindexed_items_only(redis_conn):
+    _save_days(redis_conn, ["Peabody", "Woburn"], range(1, 4))
+    # Saved before the index existed, and a payload whose metadata already expired
+    redis_conn.set(history_key("2025-03-01", "Peabody"), "{}")
+    redis_conn.set(history_data_key("2025-03-02", "Peabody", "map"), b"")
+    redis_conn.set("route:cached", "kept")
+
+    cleared = clear_history(redis_conn, batch_size=4)
+
+    assert cleared == 7
+    assert redis_conn.keys("history*") == []
+    assert redis_conn.get("route:cached") == b"kept"
+    assert list_history(redis_conn) == ([], 0)
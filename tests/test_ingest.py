@@ -0,0 +1,58 @@
+import json
+import os
+
+import pandas as pd
+
+from ingest_utils import MANIFEST_FILE, load_trips, trips_dataset_path
+
+
+def _write_export(path):
+    pd.DataFrame({
+        "ScheduledDtm": ["2025-04-08 08:00", "2025-04-08 09:30", "2025-04-09 10:00"],
+        "City": ["New York", "Boston", "New York"],
+        "PatientSysID": ["P1", "P2", "P3"],
+        "PatientLatitude": [40.7128, 42.3601, 40.730611],
+        "PatientLongitude": [-74.0060, -71.0589, -73.935242],
+        "PhlebotomistLatitude": [40.6782, 42.3736, 40.758896],
+        "PhlebotomistLongitude": [-73.9442, -71.1097, -73.985130],
+        "Notes": ["a", "b", "c"],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_coordinates_round_trip_exactly(tmp_path):
+    csv_path = _write_export(tmp_path / "trips.csv")
+
+    trips = load_trips(csv_path).sort_values("PatientSysID")
+
+    assert trips["PatientLatitude"].tolist() == [40.7128, 42.3601, 40.730611]
+    assert trips["PhlebotomistLongitude"].tolist() == [-73.9442, -71.1097, -73.985130]
+    assert trips["PatientSysID"].tolist() == ["P1", "P2", "P3"]
+
+
+def test_loads_only_requested_columns_and_partitions(tmp_path):
+    csv_path = _write_export(tmp_path / "trips.csv")
+
+    trips = load_trips(
+        csv_path, columns=["PatientSysID", "City", "PhlebotomistID.1"], dates="2025-04-08", cities=["New York"]
+    )
+
+    # Columns missing from this export are skipped rather than failing the load
+    assert list(trips.columns) == ["PatientSysID", "City"]
+    assert trips["PatientSysID"].tolist() == ["P1"]
+
+
+def test_reconverts_datasets_from_an_older_schema(tmp_path):
+    csv_path = _write_export(tmp_path / "trips.csv")
+    load_trips(csv_path)
+    manifest_path = os.path.join(trips_dataset_path(csv_path), MANIFEST_FILE)
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    manifest.pop("schema_version")
+    with open(manifest_path, "w") as file:
+        json.dump(manifest, file)
+
+    load_trips(csv_path)
+
+    with open(manifest_path) as file:
+        assert "schema_version" in json.load(file)
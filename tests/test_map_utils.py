@@ -0,0 +1,132 @@
+import json
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import assignment_utils
+import map_utils
+from distance_utils import point_distance
+
+
+@pytest.fixture
+def peabody_routes(bundled_data):
+    trips, phlebs, workload = bundled_data
+    assigned_phlebs, assigned_patients = assignment_utils.assign_patients_to_phlebotomists(
+        trips, phlebs, workload, "2025-04-08", "Peabody"
+    )
+    assigned_phlebs = assigned_phlebs.reset_index()
+    patients = assignment_utils.optimize_routes(assigned_phlebs, assigned_patients.reset_index())
+    map_utils._route_fragments.clear()
+    yield assigned_phlebs, patients
+    map_utils._route_fragments.clear()
+
+
+def _fake_router(monkeypatch, failing):
+    """Route every leg as a straight line with 2x its length, or fail every leg while failing[0] is set."""
+    calls = []
+
+    def fetch_routes(legs, api_key, use_scheduled_time=True):
+        calls.append(list(legs))
+        if failing[0]:
+            return [None] * len(legs)
+        return [([[start[1], start[0]], [end[1], end[0]]], 2 * point_distance(start, end))
+                for start, end in legs]
+
+    monkeypatch.setattr(map_utils, "fetch_routes", fetch_routes)
+    return calls
+
+
+def test_fragments_with_failed_legs_are_routed_again(peabody_routes, monkeypatch):
+    assigned_phlebs, patients = peabody_routes
+    failing = [True]
+    calls = _fake_router(monkeypatch, failing)
+
+    _, fallback_miles = map_utils.create_assignment_map(assigned_phlebs, patients, "2025-04-08", "Peabody",
+                                                        api_key="test-key", return_distances=True)
+    failing[0] = False
+    _, routed_miles = map_utils.create_assignment_map(assigned_phlebs, patients, "2025-04-08", "Peabody",
+                                                      api_key="test-key", return_distances=True)
+
+    assert len(calls) == 2 and calls[1] == calls[0]
+    for phleb_id, miles in routed_miles.items():
+        assert miles == pytest.approx(2 * fallback_miles[phleb_id])
+
+
+def test_fully_routed_fragments_are_reused(peabody_routes, monkeypatch):
+    assigned_phlebs, patients = peabody_routes
+    calls = _fake_router(monkeypatch, [False])
+
+    _, first = map_utils.create_assignment_map(assigned_phlebs, patients, "2025-04-08", "Peabody",
+                                               api_key="test-key", return_distances=True)
+    _, second = map_utils.create_assignment_map(assigned_phlebs, patients, "2025-04-08", "Peabody",
+                                                api_key="test-key", return_distances=True)
+
+    # Nothing is left to route the second time
+    assert calls[0] and calls[1:] == [[]]
+    assert second == first
+
+
+@pytest.fixture
+def day_routes(bundled_data):
+    """Assigned and optimized routes of every city on 2025-04-08, drawn as one map."""
+    trips, phlebs, workload = bundled_data
+    all_phlebs, all_patients = [], []
+    for city in trips.loc[trips["ScheduledDtm"].dt.date == pd.Timestamp("2025-04-08").date(), "City"].unique():
+        assigned_phlebs, assigned_patients = assignment_utils.assign_patients_to_phlebotomists(
+            trips, phlebs, workload, "2025-04-08", city
+        )
+        if assigned_patients.empty:
+            continue
+        assigned_phlebs = assigned_phlebs.reset_index(drop=True)
+        all_phlebs.append(assigned_phlebs)
+        all_patients.append(assignment_utils.optimize_routes(assigned_phlebs, assigned_patients))
+    map_utils._route_fragments.clear()
+    yield pd.concat(all_phlebs).drop_duplicates("PhlebotomistID.1"), pd.concat(all_patients)
+    map_utils._route_fragments.clear()
+
+
+def _road_router(monkeypatch):
+    """Route every leg along 60 points, like the dense geometry ORS returns."""
+    def fetch_routes(legs, api_key, use_scheduled_time=True):
+        routes = []
+        for start, end in legs:
+            steps = np.linspace(0, 1, 60)
+            lats = start[0] + (end[0] - start[0]) * steps + 1e-5 * np.sin(40 * steps)
+            lons = start[1] + (end[1] - start[1]) * steps
+            routes.append(([[lon, lat] for lat, lon in zip(lats.tolist(), lons.tolist())],
+                           1.3 * point_distance(start, end)))
+        return routes
+
+    monkeypatch.setattr(map_utils, "fetch_routes", fetch_routes)
+
+
+def _compact_layers(html):
+    """Features of each compact GeoJSON layer in a rendered page."""
+    decoder = json.JSONDecoder()
+    return {match.group(1): decoder.raw_decode(html, match.end())[0]["features"]
+            for match in re.finditer(r'compactLayer\("(\w+)", ', html)}
+
+
+def test_compact_map_keeps_every_marker_in_a_fraction_of_the_html(day_routes, monkeypatch):
+    assigned_phlebs, patients = day_routes
+    _road_router(monkeypatch)
+
+    def render(compact):
+        m = map_utils.create_assignment_map(assigned_phlebs, patients, "2025-04-08", "All",
+                                            api_key="test-key", compact=compact)
+        return map_utils.render_map_html(m)
+
+    full = render(False)
+    compact = render(True)
+
+    expected = {"patients": len(patients), "phlebs": len(assigned_phlebs),
+                "dropoffs": int(patients["DropOffClinicLoc"].notna().sum())}
+    assert expected["dropoffs"] > 0
+    assert {kind: full.count(f'"cluster": "{kind}"') for kind in expected} == expected
+    layers = _compact_layers(compact)
+    assert {kind: len(layers[kind]) for kind in expected} == expected
+    assert sorted(feature["properties"]["rows"][0][1] for feature in layers["patients"]) == \
+        sorted(str(patient_id) for patient_id in patients["UserReqID"])
+    assert len(full) > 3 * len(compact)
@@ -0,0 +1,109 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import assignment_utils
+import optimal_assignment
+from optimal_assignment import compare_assignment_miles, solve_capacitated_assignment
+
+
+def _chained_miles(assignment, home_distances, patient_distances):
+    """Route miles of an assignment with each route visiting its patients in position order."""
+    miles = 0.0
+    for phleb_pos in set(assignment):
+        route = [patient_pos for patient_pos, owner in enumerate(assignment) if owner == phleb_pos]
+        miles += home_distances[route[0], phleb_pos]
+        miles += sum(patient_distances[a, b] for a, b in zip(route, route[1:]))
+    return miles
+
+
+def _instance(num_patients, num_phlebs, seed):
+    rng = np.random.default_rng(seed)
+    homes = rng.uniform(0, 10, (num_phlebs, 2))
+    patients = rng.uniform(0, 10, (num_patients, 2))
+    home_distances = np.linalg.norm(patients[:, None] - homes[None], axis=2)
+    patient_distances = np.linalg.norm(patients[:, None] - patients[None], axis=2)
+    return home_distances, patient_distances
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_solution_has_the_fewest_chained_route_miles(seed):
+    home_distances, patient_distances = _instance(6, 3, seed)
+
+    assignment = solve_capacitated_assignment(home_distances, patient_distances, np.ones(6), capacity=100)
+
+    best = min(_chained_miles(candidate, home_distances, patient_distances)
+               for candidate in itertools.product(range(3), repeat=6))
+    assert (assignment >= 0).all()
+    assert _chained_miles(assignment, home_distances, patient_distances) == pytest.approx(best)
+
+
+def test_routes_are_cut_at_capacity_and_continued_by_a_free_phlebotomist():
+    # Four patients in a row next to home 0; home 1 is far away
+    home_distances = np.array([[1.0, 20.0], [1.5, 20.0], [2.0, 20.0], [2.5, 20.0]])
+    patient_distances = np.full((4, 4), 0.5)
+
+    unlimited = solve_capacitated_assignment(home_distances, patient_distances, np.full(4, 5.0), capacity=100)
+    capped = solve_capacitated_assignment(home_distances, patient_distances, np.full(4, 5.0), capacity=10)
+
+    assert unlimited.tolist() == [0, 0, 0, 0]
+    assert capped.tolist() == [0, 0, 1, 1]
+
+
+def test_patients_beyond_every_free_phlebotomist_are_left_unassigned():
+    home_distances = np.array([[1.0], [1.5], [2.0]])
+    patient_distances = np.full((3, 3), 0.5)
+
+    assignment = solve_capacitated_assignment(home_distances, patient_distances, np.full(3, 5.0), capacity=10)
+
+    assert assignment.tolist() == [0, 0, -1]
+
+
+def test_each_patient_is_connected_to_its_k_nearest_homes_and_earlier_patients(monkeypatch):
+    home_distances, patient_distances = _instance(8, 5, seed=0)
+    graphs = []
+    solve = optimal_assignment.min_weight_full_bipartite_matching
+
+    def recording_solve(graph):
+        graphs.append(graph)
+        return solve(graph)
+
+    monkeypatch.setattr(optimal_assignment, "min_weight_full_bipartite_matching", recording_solve)
+    solve_capacitated_assignment(home_distances, patient_distances, np.ones(8), capacity=100, k=2)
+
+    graph = graphs[0].tocsr()
+    for patient_pos in range(8):
+        columns = set(graph.indices[graph.indptr[patient_pos]:graph.indptr[patient_pos + 1]])
+        homes = set(np.argsort(home_distances[patient_pos])[:2])
+        earlier = set(5 + np.argsort(patient_distances[:patient_pos, patient_pos])[:2])
+        assert columns == homes | earlier | {5 + 8 + patient_pos}
+
+
+def test_dropoff_affinity_keeps_a_group_on_one_route():
+    # Separate routes are 0.1 mi shorter, unless both patients share a dropoff
+    home_distances = np.array([[1.0, 3.0], [3.0, 1.0]])
+    patient_distances = np.array([[0.0, 1.1], [1.1, 0.0]])
+
+    separate = solve_capacitated_assignment(home_distances, patient_distances, np.ones(2), capacity=100)
+    grouped = solve_capacitated_assignment(home_distances, patient_distances, np.ones(2), capacity=100,
+                                           dropoff_groups=[[0, 1]])
+
+    assert separate.tolist() == [0, 1]
+    assert grouped.tolist() == [0, 0]
+
+
+@pytest.mark.parametrize("city", ["Woburn", "Peabody", "Santa Clara", "Lake Forest"])
+def test_optimal_mode_is_not_worse_than_greedy(bundled_data, city):
+    trips, phlebs, workload = bundled_data
+
+    def assign(mode):
+        return assignment_utils.assign_patients_to_phlebotomists(trips, phlebs.copy(), workload, "2025-04-08", city,
+                                                                 assignment_mode=mode)
+
+    greedy = assign("greedy")
+    optimal = assign("optimal")
+
+    assert optimal[1]["AssignedPhlebID"].notna().all()
+    assert len(optimal[1]) == len(greedy[1])
+    assert compare_assignment_miles(greedy, optimal)["miles_saved"] >= 0
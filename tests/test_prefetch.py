@@ -0,0 +1,113 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import assignment_utils
+import route_cache as route_cache_module
+from conftest import REPO_ROOT, StubORS
+from distance_utils import distance_matrix
+from prefetch_utils import collect_run_coordinates, matrix_tiles, prefetch_route_distances, road_distance_matrix
+from route_cache import RouteCache
+
+# The route cache keeps distances to a hundredth of a mile
+CACHE_ROUNDING_MILES = 0.005
+
+LOCATIONS = [(40.0 + 0.01 * i, -75.0 - 0.013 * (i % 3)) for i in range(6)]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return RouteCache(log_path=str(tmp_path / "routes_cache.jsonl"), legacy_geojson_path=str(tmp_path / "none.geojson"))
+
+
+def _prefetch(stub, cache, locations=LOCATIONS):
+    return prefetch_route_distances(locations, "test-key", route_cache=cache, max_elements=9,
+                                    base_url=stub.url, request_interval=0)
+
+
+def test_prefetch_requests_each_tile_once(stub_ors, cache):
+    stats = _prefetch(stub_ors, cache)
+
+    assert len(stub_ors.requests) == len(matrix_tiles(len(LOCATIONS), 9)) == 3
+    assert all(path == "/v2/matrix/driving-car" for path, _ in stub_ors.requests)
+    assert stats["pairs_fetched"] == 15 and stats["failed_tiles"] == 0
+
+    again = _prefetch(stub_ors, cache)
+    assert again["requests"] == 0 and again["pairs_cached"] == 15
+    assert len(stub_ors.requests) == 3
+
+
+def test_road_distance_matrix_reads_prefetched_distances(stub_ors, cache):
+    _prefetch(stub_ors, cache)
+
+    road = road_distance_matrix(LOCATIONS, route_cache=cache)
+
+    np.testing.assert_allclose(road, distance_matrix(LOCATIONS) * StubORS.ROAD_FACTOR,
+                               atol=CACHE_ROUNDING_MILES + 1e-6)
+
+
+def test_failed_tile_is_filled_with_the_detour_factor(stub_ors, cache):
+    stub_ors.scripted.append((500, {}))
+
+    stats = _prefetch(stub_ors, cache)
+    road = road_distance_matrix(LOCATIONS, route_cache=cache)
+
+    assert stats["failed_tiles"] == 1 and stats["pairs_fetched"] < 15
+    np.testing.assert_allclose(road, distance_matrix(LOCATIONS) * StubORS.ROAD_FACTOR,
+                               atol=CACHE_ROUNDING_MILES + 1e-6)
+
+
+def test_road_distance_matrix_without_cached_pairs_is_straight_line(cache):
+    np.testing.assert_array_equal(road_distance_matrix(LOCATIONS, route_cache=cache), distance_matrix(LOCATIONS))
+
+
+def _bundled_run(monkeypatch, tmp_path):
+    shutil.copy(os.path.join(REPO_ROOT, "All_Dropoffs.csv"), tmp_path)
+    trips = pd.read_csv(os.path.join(REPO_ROOT, "req8425.csv"))
+    trips["ScheduledDtm"] = pd.to_datetime(trips["ScheduledDtm"])
+    phlebs = pd.read_csv(os.path.join(REPO_ROOT, "phlebotomists_with_city.csv"))
+    workload = pd.read_csv(os.path.join(REPO_ROOT, "avg_workload_per_city_per_phleb.csv"))
+    centroids = trips.groupby("City")[["PatientLatitude", "PatientLongitude"]].mean()
+    monkeypatch.setattr(assignment_utils, "geocode_city", lambda name: tuple(centroids.loc[name]))
+    return trips, phlebs, workload
+
+
+def test_collect_run_coordinates_includes_phlebs_patients_and_dropoffs(monkeypatch, tmp_path):
+    trips, phlebs, _ = _bundled_run(monkeypatch, tmp_path)
+    patients = trips[(trips["City"] == "Peabody") & (trips["ScheduledDtm"].dt.date == pd.Timestamp("2025-04-08").date())]
+
+    coordinates = collect_run_coordinates(trips, phlebs, "2025-04-08", "Peabody")
+
+    rounded = {(round(lat, 5), round(lon, 5)) for lat, lon in coordinates}
+    assert len(rounded) == len(coordinates)
+    for lat, lon in zip(patients["PatientLatitude"], patients["PatientLongitude"]):
+        assert (round(lat, 5), round(lon, 5)) in rounded
+    for lat, lon in zip(phlebs.loc[phlebs["City"] == "Peabody", "PhlebotomistLatitude"],
+                        phlebs.loc[phlebs["City"] == "Peabody", "PhlebotomistLongitude"]):
+        assert (round(lat, 5), round(lon, 5)) in rounded
+    dropoffs = pd.read_csv(os.path.join(REPO_ROOT, "All_Dropoffs.csv"))
+    dropoff_coordinates = {(round(lat, 5), round(lon, 5)) for lat, lon in zip(dropoffs["Latitude"], dropoffs["Longitude"])}
+    assert rounded & dropoff_coordinates
+
+
+def test_assignment_scores_candidates_in_prefetched_road_miles(stub_ors, cache, monkeypatch, tmp_path):
+    trips, phlebs, workload = _bundled_run(monkeypatch, tmp_path)
+    monkeypatch.setattr(route_cache_module, "_route_cache", cache)
+    straight_phlebs, straight_patients = assignment_utils.assign_patients_to_phlebotomists(
+        trips, phlebs, workload, "2025-04-08", "Peabody"
+    )
+
+    locations = list(straight_phlebs["current_location"].map(tuple))
+    locations += list(zip(straight_patients["PatientLatitude"], straight_patients["PatientLongitude"]))
+    prefetch_route_distances(locations, "test-key", route_cache=cache, base_url=stub_ors.url, request_interval=0)
+    road_phlebs, road_patients = assignment_utils.assign_patients_to_phlebotomists(
+        trips, phlebs, workload, "2025-04-08", "Peabody", road_distances=True
+    )
+
+    # Every road distance is the straight-line one scaled alike, so the choices are the same
+    pd.testing.assert_series_equal(road_patients["AssignedPhlebID"], straight_patients["AssignedPhlebID"])
+    np.testing.assert_allclose(road_phlebs["total_distance"], straight_phlebs["total_distance"] * StubORS.ROAD_FACTOR,
+                               rtol=0.01)
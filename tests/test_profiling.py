@@ -0,0 +1,57 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from profiling_utils import count, not_covered, profile_run, span
+from route_cache import RouteCache
+from routing_client import AsyncRoutingClient, fetch_routes
+
+LEGS = [((40.0, -75.0), (40.02, -75.03)), ((40.1, -75.1), (40.12, -75.13))]
+
+
+@pytest.fixture
+def client(stub_ors, tmp_path):
+    cache = RouteCache(log_path=str(tmp_path / "routes_cache.jsonl"), legacy_geojson_path=None)
+    client = AsyncRoutingClient("test-key", base_url=stub_ors.url, route_cache=cache, requests_per_minute=60000,
+                                burst=100)
+    yield client
+    client.close()
+
+
+def test_ors_requests_are_attributed_to_each_concurrent_run(client, tmp_path):
+    profiles = {}
+
+    def run(name, leg):
+        with profile_run(name, mode="spans", output_dir=str(tmp_path)) as profile:
+            profiles[name] = profile
+
+            async def from_event_loop():
+                # fetch_routes hands the work to a separate thread when a loop is already running
+                return fetch_routes([leg], "test-key", client=client)
+
+            asyncio.run(from_event_loop())
+
+    threads = [threading.Thread(target=run, args=(f"run{i}", leg)) for i, leg in enumerate(LEGS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name in ("run0", "run1"):
+        assert profiles[name].counters["http.ors_directions"] == 1
+        assert profiles[name].spans[f"{name}/fetch_routes"]["count"] == 1
+
+
+def test_profile_lists_stages_it_does_not_cover(tmp_path):
+    with profile_run("run", mode="spans", output_dir=str(tmp_path)) as profile:
+        with span("optimize_routes"):
+            count("routes")
+            not_covered("optimize_routes/improve_route", "ran in 2 route worker processes")
+
+    with open(profile.files["json"]) as file:
+        written = json.load(file)
+    assert written["not_covered"] == {"optimize_routes/improve_route": "ran in 2 route worker processes"}
+    assert written["counters"] == {"routes": 1}
+    assert "run/optimize_routes" in written["spans"]
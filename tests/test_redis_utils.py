@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from redis_utils import PHLEB_GEO_KEY, get_nearby_phlebotomists, load_phlebotomists_to_redis
+
+
+@pytest.fixture
+def redis_conn():
+    # initialize_redis connects with decode_responses=True
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def _roster(ids):
+    coordinates = {"A": (42.36, -71.06), "B": (42.37, -71.10), "C": (40.71, -74.01)}
+    return pd.DataFrame({
+        "PhlebotomistID.1": ids,
+        "PhlebotomistLatitude": [coordinates[phleb_id][0] for phleb_id in ids],
+        "PhlebotomistLongitude": [coordinates[phleb_id][1] for phleb_id in ids],
+        "City": ["Boston" if phleb_id != "C" else "New York" for phleb_id in ids],
+    })
+
+
+def test_unchanged_roster_is_not_reloaded(redis_conn):
+    assert load_phlebotomists_to_redis(redis_conn, _roster(["A", "B"])) is True
+    assert load_phlebotomists_to_redis(redis_conn, _roster(["A", "B"])) is False
+    assert load_phlebotomists_to_redis(redis_conn, _roster(["A", "B"]), force=True) is True
+
+
+def test_reload_drops_phlebotomists_removed_from_roster(redis_conn):
+    load_phlebotomists_to_redis(redis_conn, _roster(["A", "B", "C"]))
+
+    load_phlebotomists_to_redis(redis_conn, _roster(["A", "C"]))
+
+    assert set(redis_conn.zrange(PHLEB_GEO_KEY, 0, -1)) == {"A", "C"}
+    assert redis_conn.hgetall("phleb:B") == {}
+    assert redis_conn.hgetall("phleb:A")["city"] == "Boston"
+    # The temporary build key was renamed over the live index
+    assert redis_conn.keys(f"{PHLEB_GEO_KEY}:tmp:*") == []
+
+
+def test_nearby_lookup_reads_the_loaded_index(redis_conn):
+    load_phlebotomists_to_redis(redis_conn, _roster(["A", "B", "C"]))
+
+    nearby = get_nearby_phlebotomists(redis_conn, 42.36, -71.06, radius_miles=10)
+
+    assert sorted(phleb_id for phleb_id, _, _ in nearby) == ["A", "B"]
+    assert min(miles for _, miles, _ in nearby) == pytest.approx(0, abs=0.01)
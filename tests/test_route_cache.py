@@ -0,0 +1,67 @@
+import pytest
+
+from route_cache import RouteCache
+
+LEG = [[-71.06, 42.36], [-71.05, 42.37], [-71.04, 42.38]]
+
+
+def test_compaction_keeps_routes_appended_by_other_processes(tmp_path):
+    log_path = str(tmp_path / "routes_cache.jsonl")
+    ours = RouteCache(log_path=log_path, legacy_geojson_path=None)
+    ours.put("a", coordinates=LEG, distance_miles=1.0)
+    ours.put("a", distance_miles=1.5)
+
+    # Another worker sharing the log appends a route this instance never loaded
+    theirs = RouteCache(log_path=log_path, legacy_geojson_path=None)
+    theirs.put("b", coordinates=LEG[::-1], distance_miles=2.0)
+
+    ours.compact()
+
+    reloaded = RouteCache(log_path=log_path, legacy_geojson_path=None)
+    assert reloaded.get_distance("a") == 1.5
+    assert reloaded.get_distance("b") == 2.0
+    assert ours.get_distance("b") == 2.0
+    with open(log_path) as file:
+        assert len(file.readlines()) == 2
+
+
+def test_updates_keep_previously_cached_fields(tmp_path):
+    cache = RouteCache(log_path=str(tmp_path / "routes_cache.jsonl"), legacy_geojson_path=None)
+    cache.put("a", distance_miles=1.234)
+    cache.put("a", coordinates=LEG, start=(42.36, -71.06), end=(42.38, -71.04))
+
+    assert cache.get_distance("a") == 1.23
+    assert cache.get_geometry("a") == LEG
+
+
+def test_new_geometry_replaces_simplified_copy(tmp_path):
+    cache = RouteCache(log_path=str(tmp_path / "routes_cache.jsonl"), legacy_geojson_path=None)
+    # Many points along a straight line simplify to two, so A gets a simplified copy
+    geometry_a = [[-71.0 + step * 1e-4, 42.0] for step in range(50)]
+    # Two points cannot be simplified any further, so B gets none
+    geometry_b = [[-72.0, 43.0], [-72.1, 43.1]]
+    cache.put("a", coordinates=geometry_a, distance_miles=1.0)
+    assert cache.get("a")["polyline_simplified"] is not None
+
+    cache.put("a", coordinates=geometry_b)
+
+    assert cache.get_geometry("a", simplified=True) == geometry_b
+    assert cache.get_distance("a") == 1.0
+    reloaded = RouteCache(log_path=str(tmp_path / "routes_cache.jsonl"), legacy_geojson_path=None)
+    assert reloaded.get_geometry("a", simplified=True) == geometry_b
+
+
+def test_new_geometry_replaces_simplified_copy_in_shared_tier(tmp_path):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    geometry_a = [[-71.0 + step * 1e-4, 42.0] for step in range(50)]
+    geometry_b = [[-72.0, 43.0], [-72.1, 43.1]]
+    writer = RouteCache(log_path=str(tmp_path / "writer.jsonl"), legacy_geojson_path=None)
+    writer.attach_shared(fakeredis.FakeRedis(server=server))
+    writer.put("a", coordinates=geometry_a, distance_miles=1.0)
+    writer.put("a", coordinates=geometry_b)
+
+    reader = RouteCache(log_path=str(tmp_path / "reader.jsonl"), legacy_geojson_path=None)
+    reader.attach_shared(fakeredis.FakeRedis(server=server))
+
+    assert reader.get_geometry("a", simplified=True) == geometry_b
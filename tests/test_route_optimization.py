@@ -0,0 +1,73 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import assignment_utils
+from conftest import REPO_ROOT
+from distance_utils import distance_matrix
+from profiling_utils import profile_run
+from route_improvement import improve_route, route_length
+
+
+def _grid_route():
+    # Stops on a line visited out of order: 0 -> 3 -> 1 -> 4 -> 2
+    points = [(40.0, -75.0 + 0.01 * step) for step in range(5)]
+    return distance_matrix(points), [0, 3, 1, 4, 2]
+
+
+def test_improve_route_untangles_route_and_keeps_start():
+    dist, route = _grid_route()
+
+    improved, initial, final = improve_route(dist, route)
+
+    assert improved == [0, 1, 2, 3, 4]
+    assert final < initial
+    assert final == route_length(dist, improved)
+
+
+def test_improve_route_is_bounded_by_moves_and_deterministic():
+    dist, route = _grid_route()
+
+    assert improve_route(dist, route, max_moves=0)[0] == route
+    one_move = improve_route(dist, route, max_moves=1)[0]
+    assert one_move != route
+    assert improve_route(dist, route, max_moves=1)[0] == one_move
+
+
+def test_improve_route_respects_precedence():
+    dist, route = _grid_route()
+
+    # Stop 1 may only be visited after stop 4
+    improved, _, _ = improve_route(dist, route, precedence={1: [4]})
+
+    assert improved.index(1) > improved.index(4)
+
+
+def test_pooled_route_optimization_matches_serial(monkeypatch, tmp_path):
+    shutil.copy(os.path.join(REPO_ROOT, "All_Dropoffs.csv"), tmp_path)
+    trips = pd.read_csv(os.path.join(REPO_ROOT, "req8425.csv"))
+    trips["ScheduledDtm"] = pd.to_datetime(trips["ScheduledDtm"])
+    phlebs = pd.read_csv(os.path.join(REPO_ROOT, "phlebotomists_with_city.csv"))
+    workload = pd.read_csv(os.path.join(REPO_ROOT, "avg_workload_per_city_per_phleb.csv"))
+    centroids = trips.groupby("City")[["PatientLatitude", "PatientLongitude"]].mean()
+    monkeypatch.setattr(assignment_utils, "geocode_city", lambda name: tuple(centroids.loc[name]))
+
+    assigned_phlebs, assigned_patients = assignment_utils.assign_patients_to_phlebotomists(
+        trips, phlebs, workload, "2025-04-08", "Peabody"
+    )
+    assigned_phlebs = assigned_phlebs.reset_index()
+    assigned_patients = assigned_patients.reset_index()
+    assert assigned_phlebs["PhlebotomistID.1"].nunique() > 1
+
+    serial = assignment_utils.optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=False)
+    with profile_run("pooled", mode="spans", output_dir=str(tmp_path)) as profile:
+        pooled = assignment_utils.optimize_routes(assigned_phlebs, assigned_patients, use_scheduled_time=False,
+                                                  max_workers=2)
+
+    pd.testing.assert_frame_equal(serial, pooled, check_exact=True)
+    assert serial.attrs["route_improvement"] == pooled.attrs["route_improvement"]
+    assert np.all(serial["TripOrderInDay"].notna())
+    # Route workers are other processes, so the profile says it has no spans from them
+    assert list(profile.not_covered) == ["optimize_routes/improve_route"]
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import StubORS
+from distance_utils import point_distance
+from route_cache import RouteCache
+from routing_client import AsyncRoutingClient, fetch_routes
+
+START = (40.0, -75.0)
+END = (40.02, -75.03)
+
+
+@pytest.fixture
+def client(stub_ors, tmp_path):
+    cache = RouteCache(log_path=str(tmp_path / "routes_cache.jsonl"), legacy_geojson_path=str(tmp_path / "none.geojson"))
+    client = AsyncRoutingClient("test-key", base_url=stub_ors.url, route_cache=cache, requests_per_minute=60000,
+                                burst=100, backoff_seconds=0.01, max_retries=3)
+    yield client
+    client.close()
+
+
+def test_routes_leg_and_reports_road_miles(client, stub_ors):
+    (coordinates, miles), = fetch_routes([(START, END)], "test-key", client=client)
+
+    assert coordinates[0] == [START[1], START[0]] and coordinates[-1] == [END[1], END[0]]
+    assert miles == pytest.approx(point_distance(START, END) * StubORS.ROAD_FACTOR, abs=0.006)
+    assert [path for path, _ in stub_ors.requests] == ["/v2/directions/driving-car/geojson"]
+
+
+def test_reverse_and_repeated_legs_are_requested_once(client, stub_ors):
+    forward, backward, again = fetch_routes([(START, END), (END, START), (START, END)], "test-key", client=client)
+
+    assert len(stub_ors.requests) == 1
+    # The reverse leg is the cached geometry flipped, at polyline precision
+    assert backward[0] == [pytest.approx(point, abs=1e-5) for point in forward[0][::-1]]
+    assert again == forward and backward[1] == forward[1]
+
+    # Later calls are served from the route cache
+    fetch_routes([(END, START)], "test-key", client=client)
+    assert len(stub_ors.requests) == 1
+
+
+def test_rate_limit_honours_retry_after(client, stub_ors):
+    stub_ors.scripted.append((429, {"Retry-After": "0.3"}))
+
+    start = time.perf_counter()
+    result, = fetch_routes([(START, END)], "test-key", client=client)
+
+    assert result is not None
+    assert time.perf_counter() - start >= 0.3
+    assert client.stats["rate_limited"] == 1 and client.stats["retries"] == 1 and client.stats["requests"] == 2
+
+
+def test_server_errors_are_retried(client, stub_ors):
+    stub_ors.scripted.extend([(503, {}), (502, {})])
+
+    result, = fetch_routes([(START, END)], "test-key", client=client)
+
+    assert result is not None
+    assert client.stats["retries"] == 2 and client.stats["failed"] == 0
+    assert len(stub_ors.requests) == 3
+
+
+def test_gives_up_after_max_retries_and_on_client_errors(client, stub_ors):
+    stub_ors.scripted.extend([(500, {})] * 4 + [(400, {})])
+
+    assert fetch_routes([(START, END)], "test-key", client=client) == [None]
+    assert len(stub_ors.requests) == 4
+
+    # 4xx other than 429 is not retried
+    assert fetch_routes([(START, END)], "test-key", client=client) == [None]
+    assert len(stub_ors.requests) == 5
+    assert client.stats["failed"] == 2
+
+
+def test_each_event_loop_keeps_its_own_semaphore(client):
+    both_started = threading.Barrier(2)
+    kept = []
+
+    async def use_semaphore():
+        first = client._semaphore()
+        # The other loop creates its semaphore in the meantime
+        await asyncio.get_running_loop().run_in_executor(None, both_started.wait)
+        kept.append(client._semaphore() is first)
+
+    threads = [threading.Thread(target=asyncio.run, args=(use_semaphore(),)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert kept == [True, True]
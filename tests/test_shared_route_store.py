@@ -0,0 +1,79 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from route_cache import RouteCache
+from routing_client import AsyncRoutingClient, fetch_routes
+from route_utils import generate_route_id
+from shared_route_store import SharedRouteStore, decode_shared_record, encode_shared_record
+
+START = (40.0, -75.0)
+END = (40.02, -75.03)
+LEG = [[-75.0, 40.0], [-75.01, 40.01], [-75.03, 40.02]]
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def _replica(tmp_path, server, name):
+    cache = RouteCache(log_path=str(tmp_path / f"{name}.jsonl"), legacy_geojson_path=None)
+    cache.attach_shared(fakeredis.FakeRedis(server=server))
+    return cache
+
+
+def test_record_round_trips_through_packed_hash():
+    record = {"route_id": "a", "polyline": "abc", "polyline_simplified": None, "distance_miles": 1.23,
+              "start": [40.0, -75.0], "end": [40.02, -75.03]}
+
+    fields = encode_shared_record(record)
+
+    assert set(fields) == {"d", "p", "e"}
+    assert decode_shared_record("a", {key.encode(): value for key, value in fields.items()}) == record
+    assert decode_shared_record("a", {}) is None
+
+
+def test_route_fetched_by_one_replica_is_a_hit_for_another(tmp_path, server):
+    _replica(tmp_path, server, "first").put("a", coordinates=LEG, distance_miles=2.0)
+
+    second = _replica(tmp_path, server, "second")
+    assert second.warm(["a", "b"]) == 1
+    assert second.get_geometry("a") == LEG
+    assert second.stats == {"hits": 1, "shared_hits": 1, "misses": 0}
+    # Kept locally, so it survives without Redis
+    assert RouteCache(log_path=str(tmp_path / "second.jsonl"), legacy_geojson_path=None).get_distance("a") == 2.0
+
+
+def test_geometry_lookup_looks_past_a_local_distance_only_record(tmp_path, server):
+    _replica(tmp_path, server, "first").put("a", coordinates=LEG, distance_miles=2.0)
+    second = _replica(tmp_path, server, "second")
+    # The prefetch matrix only cached a distance here
+    second.put("a", distance_miles=2.1)
+
+    assert second.get_geometry("a") == LEG
+    assert second.get_distance("a") == 2.1
+
+
+def test_routing_client_uses_geometry_from_the_shared_tier(tmp_path, server, stub_ors):
+    route_id = generate_route_id(START, END)
+    _replica(tmp_path, server, "first").put(route_id, coordinates=LEG, distance_miles=2.0, start=START, end=END)
+    second = _replica(tmp_path, server, "second")
+    second.put(route_id, distance_miles=2.0)
+    client = AsyncRoutingClient("test-key", base_url=stub_ors.url, route_cache=second)
+    try:
+        (coordinates, miles), = fetch_routes([(START, END)], "test-key", client=client)
+    finally:
+        client.close()
+
+    assert coordinates == LEG and miles == 2.0
+    assert stub_ors.requests == []
+
+
+def test_unavailable_redis_stands_down_instead_of_raising(server):
+    store = SharedRouteStore(fakeredis.FakeRedis(server=server))
+    server.connected = False
+
+    assert store.get_many(["a"]) == {}
+    store.put_many([{"route_id": "a", "distance_miles": 1.0}])
+    assert store.errors == 1 and not store.available
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import REPO_ROOT
+from distance_utils import distance_matrix
+from spatial_index import PhlebSpatialIndex, get_phleb_index
+
+# Boston, Los Angeles and somewhere with no phlebotomists nearby
+QUERY_POINTS = [(42.36, -71.06), (34.05, -118.24), (39.74, -104.99)]
+
+
+@pytest.fixture(scope="module")
+def roster():
+    return pd.read_csv(os.path.join(REPO_ROOT, "phlebotomists_with_city.csv"))
+
+
+def _scan(roster, lat, lon):
+    """Every phlebotomist by distance, ties in roster order: the full scan the index replaces."""
+    distances = distance_matrix((lat, lon), roster[["PhlebotomistLatitude", "PhlebotomistLongitude"]].to_numpy())[0]
+    order = np.argsort(distances, kind="stable")
+    return order, distances[order]
+
+
+@pytest.mark.parametrize("point", QUERY_POINTS)
+def test_nearest_matches_a_full_scan(roster, point):
+    positions, distances = PhlebSpatialIndex(roster).query_nearest(*point, k=10)
+
+    expected_positions, expected_distances = _scan(roster, *point)
+    assert positions.tolist() == expected_positions[:10].tolist()
+    np.testing.assert_allclose(distances, expected_distances[:10])
+
+
+@pytest.mark.parametrize("point", QUERY_POINTS)
+def test_radius_matches_a_full_scan(roster, point):
+    positions, distances = PhlebSpatialIndex(roster).query_radius(*point, 30)
+
+    expected_positions, expected_distances = _scan(roster, *point)
+    within = expected_distances <= 30
+    assert positions.tolist() == expected_positions[within].tolist()
+    np.testing.assert_allclose(distances, expected_distances[within])
+
+
+def test_city_query_only_returns_that_city_nearest_first(roster):
+    index = PhlebSpatialIndex(roster)
+
+    positions, distances = index.query_city("Los Angeles", 34.05, -118.24)
+
+    in_city = np.flatnonzero(roster["City"] == "Los Angeles")
+    assert sorted(positions.tolist()) == in_city.tolist()
+    assert (np.diff(distances) >= 0).all()
+    assert index.query_city("Atlantis", 34.05, -118.24)[0].size == 0
+
+
+def test_phlebotomists_without_coordinates_are_kept_aside(roster):
+    edited = roster.copy()
+    edited.loc[3, "PhlebotomistLatitude"] = np.nan
+    index = PhlebSpatialIndex(edited)
+
+    positions, _ = index.query_city(edited.loc[3, "City"], 34.05, -118.24)
+
+    assert 3 not in positions.tolist()
+    assert index.city_missing_positions(edited.loc[3, "City"]).tolist() == [3]
+    everyone, _ = index.query_nearest(34.05, -118.24, k=len(edited))
+    assert len(everyone) == len(edited) - 1 and 3 not in everyone.tolist()
+
+
+def test_index_is_shared_by_copies_of_a_roster_and_rebuilt_when_it_changes(roster):
+    index = get_phleb_index(roster)
+    moved = roster.copy()
+    moved.loc[0, "PhlebotomistLatitude"] += 0.1
+
+    assert get_phleb_index(roster.copy()) is index
+    assert get_phleb_index(moved) is not index
@@ -0,0 +1,79 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_utils
+from conftest import REPO_ROOT
+from trip_store import TripStore, select_trips
+
+TRIP_FILES = ["req8425.csv", "trip0804.csv", "sample-test-data.csv"]
+
+
+@pytest.fixture(scope="module", params=TRIP_FILES)
+def trips(request):
+    trips = pd.read_csv(os.path.join(REPO_ROOT, request.param))
+    trips["ScheduledDtm"] = pd.to_datetime(trips["ScheduledDtm"])
+    return trips
+
+
+def _mask(trips, target_date, target_city):
+    """The boolean-mask filter the store replaces."""
+    return trips[(trips["City"] == target_city) & (trips["ScheduledDtm"].dt.date == target_date)]
+
+
+def test_every_selection_matches_the_mask_filter(trips):
+    store = TripStore(trips)
+
+    pairs = trips[["ScheduledDtm", "City"]].dropna()
+    for target_date, target_city in set(zip(pairs["ScheduledDtm"].dt.date, pairs["City"])):
+        pd.testing.assert_frame_equal(store.get(target_date, target_city), _mask(trips, target_date, target_city))
+        pd.testing.assert_frame_equal(select_trips(store, target_date, target_city),
+                                      select_trips(trips, target_date, target_city))
+    assert sum(len(store.get_date(day)) for day in store.dates()) == len(pairs)
+
+
+def test_dates_and_cities_match_the_dataframe_helpers(trips):
+    store = TripStore(trips)
+
+    assert data_utils.get_available_dates(store) == data_utils.get_available_dates(trips)
+    assert data_utils.get_available_cities(store) == data_utils.get_available_cities(trips.dropna(subset=["City"]))
+    assert data_utils.get_cities_by_date(store) == data_utils.get_cities_by_date(trips.copy())
+
+
+def test_dates_are_accepted_in_any_form(trips):
+    store = TripStore(trips)
+    day = store.dates()[0]
+    city = store.cities(day)[0]
+    expected = store.get(day, city)
+
+    for value in (str(day), pd.Timestamp(day), datetime.datetime.combine(day, datetime.time(23, 59))):
+        pd.testing.assert_frame_equal(store.get(value, city), expected)
+
+
+def test_rows_without_a_date_or_city_are_never_selected():
+    trips = pd.DataFrame({
+        "ScheduledDtm": ["2025-04-08 09:00", None, "2025-04-08 10:00", "2025-04-09 08:00", "2025-04-08 07:00"],
+        "City": ["Woburn", "Woburn", None, "Peabody", "Woburn"],
+        "PatientId": [1, 2, 3, 4, 5],
+    }, index=[10, 11, 12, 13, 14])
+
+    store = TripStore(trips)
+
+    # String timestamps are parsed; rows keep their original order and labels
+    assert store.get("2025-04-08", "Woburn")["PatientId"].tolist() == [1, 5]
+    assert store.get("2025-04-08", "Woburn").index.tolist() == [10, 14]
+    assert store.get_date("2025-04-08")["PatientId"].tolist() == [1, 5]
+    assert store.cities_by_date() == {"2025-04-08": ["Woburn"], "2025-04-09": ["Peabody"]}
+    assert store.get("2025-04-10", "Woburn").empty
+    assert store.get("2025-04-08", np.nan).empty
+
+
+def test_empty_trips_have_no_dates():
+    store = TripStore(pd.DataFrame({"ScheduledDtm": pd.to_datetime([]), "City": []}))
+
+    assert len(store) == 0
+    assert store.dates() == [] and store.cities() == []
+    assert store.get("2025-04-08", "Woburn").empty
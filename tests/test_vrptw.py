@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import assignment_utils
+from assignment_utils import estimate_draw_time
+from vrptw import solve_vrptw, time_windows
+
+# estimate_travel_time: 30 mph
+MINUTES_PER_MILE = 2
+
+
+def _solve(home_miles, patient_miles, windows, service, **kwargs):
+    window_start, window_end = (np.array(bound, dtype=float) for bound in zip(*windows))
+    return solve_vrptw(home_miles, patient_miles, window_start, window_end, np.asarray(service, dtype=float),
+                       MINUTES_PER_MILE, **kwargs)
+
+
+def test_windows_surround_the_scheduled_time():
+    scheduled = pd.Series(pd.to_datetime(["2025-04-08 09:00", "2025-04-08 13:30"]))
+
+    day_start, window_start, window_end = time_windows(scheduled)
+
+    assert day_start == pd.Timestamp("2025-04-08")
+    assert window_start.tolist() == [510, 780]
+    assert window_end.tolist() == [570, 840]
+
+
+def test_visit_that_cannot_be_reached_in_its_window_goes_to_another_phlebotomist():
+    # Patient 1 is 100 mi (200 min) from patient 0, but due right after it
+    home_miles = [[1.0, 50.0], [50.0, 60.0]]
+    patient_miles = [[0.0, 100.0], [100.0, 0.0]]
+
+    routes, starts, lates, unserved = _solve(home_miles, patient_miles, [(0, 60), (30, 90)], [30, 30])
+
+    assert routes == [[0], [1]]
+    assert starts.tolist() == [0, 30]
+    assert lates.tolist() == [0, 0] and unserved == []
+
+
+def test_draw_time_delays_the_next_visit():
+    workloads = np.array([40.0, 10.0])
+    service = estimate_draw_time(workloads)
+
+    routes, starts, lates, _ = _solve([[1.0, 1.0]], [[0.0, 5.0], [5.0, 0.0]], [(0, 30), (0, 200)], service)
+
+    assert routes == [[0, 1]]
+    # Draw time of patient 0 (30 + 40 min), then 5 mi of travel
+    assert starts.tolist() == [0, 70 + 5 * MINUTES_PER_MILE]
+
+
+def test_lateness_within_the_hard_limit_is_penalised_against_extra_miles():
+    # Serving patient 1 after patient 0 starts it 20 minutes late; phleb 1 lives 5 mi further away
+    home_miles = [[1.0, 1.0], [100.0, 6.0]]
+    patient_miles = [[0.0, 1.0], [1.0, 0.0]]
+    windows = [(0, 30), (30, 50)]
+
+    costly = _solve(home_miles, patient_miles, windows, [68, 30])
+    cheap = _solve(home_miles, patient_miles, windows, [68, 30], penalty_per_minute=0.1)
+
+    assert costly[0] == [[0], [1]]
+    assert cheap[0] == [[0, 1], []]
+    assert cheap[2].tolist() == [0, 20] and cheap[3] == []
+
+
+def test_visit_past_the_hard_limit_is_scheduled_late_and_reported_unserved():
+    windows = [(0, 5), (10, 20)]
+
+    routes, starts, lates, unserved = _solve([[1.0, 1.0]], [[0.0, 1.0], [1.0, 0.0]], windows, [100, 100])
+
+    assert routes == [[0, 1]]
+    assert lates.tolist() == [0, 82] and unserved == [1]
+
+
+def test_workload_capacity_limits_each_route():
+    home_miles = [[1.0, 1.0, 1.0], [30.0, 30.0, 30.0]]
+    patient_miles = np.ones((3, 3)) - np.eye(3)
+    windows = [(0, 1000)] * 3
+
+    routes, _, _, _ = _solve(home_miles, patient_miles, windows, [10, 10, 10], workloads=[5, 5, 5], capacity=10)
+
+    assert sorted(len(route) for route in routes) == [1, 2]
+    assert len(routes[0]) == 2
+
+
+def test_shift_start_times_the_drive_to_the_first_visit():
+    windows = [(0, 60)]
+
+    _, unlimited, _, _ = _solve([[45.0]], [[0.0]], windows, [30])
+    _, starts, lates, _ = _solve([[45.0]], [[0.0]], windows, [30], shift_start=0)
+
+    assert unlimited.tolist() == [0]
+    assert starts.tolist() == [90] and lates.tolist() == [30]
+
+
+def test_planned_visits_leave_time_for_each_draw(bundled_data):
+    trips, phlebs, workload = bundled_data
+
+    _, patients = assignment_utils.assign_patients_to_phlebotomists(
+        trips, phlebs, workload, "2025-04-08", "Santa Clara", assignment_mode="vrptw"
+    )
+
+    assert patients["AssignedPhlebID"].notna().all()
+    for _, route in patients.sort_values("PlannedDtm").groupby("AssignedPhlebID"):
+        gaps = route["PlannedDtm"].diff().dt.total_seconds().to_numpy()[1:] / 60
+        draw_minutes = estimate_draw_time(route["WorkloadPoints"].to_numpy(dtype=float))[:-1]
+        assert (gaps >= draw_minutes - 1e-6).all()
@@ -1,5 +1,5 @@
 import pandas as pd
-from geopy.distance import geodesic
+from distance_utils import pairwise_distance
 
 def create_trips_csv(input_file, output_file):
     # Load the dataset
@@ -21,13 +21,11 @@ def create_trips_csv(input_file, output_file):
     # Extract date only (ignoring time)
     trips_df['TripDate'] = trips_df['ScheduledDtm'].dt.date  
 
-    # Calculate distance in miles
-    def calculate_distance(row):
-        phleb_location = (row['PhlebotomistLatitude'], row['PhlebotomistLongitude'])
-        patient_location = (row['PatientLatitude'], row['PatientLongitude'])
-        return round(geodesic(phleb_location, patient_location).miles, 2)
-
-    trips_df['DistanceMiles'] = trips_df.apply(calculate_distance, axis=1)
+    # Calculate distance in miles for every trip in one vectorized call
+    trips_df['DistanceMiles'] = pairwise_distance(
+        trips_df[['PhlebotomistLatitude', 'PhlebotomistLongitude']].to_numpy(),
+        trips_df[['PatientLatitude', 'PatientLongitude']].to_numpy()
+    ).round(2)
 
     # Sort by PhlebotomistID, Date, and ScheduledDtm
     trips_df = trips_df.sort_values(by=['PhlebotomistID.1', 'TripDate', 'ScheduledDtm'])
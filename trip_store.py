@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+
+def _to_date(value):
+    """Normalize a date, datetime, Timestamp or string to a datetime.date."""
+    return pd.to_datetime(value).date()
+
+
+class TripStore:
+    """
+    Trips frame with a precomputed (date, city) -> row-slice index.
+
+    At construction, rows are stably sorted by scheduled day and then city, so
+    every (date, city) selection and every date is one contiguous block.
+    ``get`` and ``get_date`` are then a dict lookup plus an ``iloc`` slice,
+    whatever the size of the history. Within a block, rows keep their original
+    order and index labels, so results match the boolean-mask filter they
+    replace.
+
+    The store is a snapshot. Build a new one if the underlying trips change.
+    """
+
+    def __init__(self, trips_df):
+        if not pd.api.types.is_datetime64_any_dtype(trips_df["ScheduledDtm"]):
+            trips_df = trips_df.assign(ScheduledDtm=pd.to_datetime(trips_df["ScheduledDtm"]))
+        scheduled = trips_df["ScheduledDtm"]
+        day_values = scheduled.dt.normalize().to_numpy(dtype="datetime64[ns]").astype("int64")
+        city_codes, city_names = pd.factorize(trips_df["City"], sort=True)
+
+        order = np.lexsort((city_codes, day_values))
+        self.df = trips_df.iloc[order]
+
+        sorted_days = day_values[order]
+        sorted_cities = city_codes[order]
+        valid = (sorted_days != np.iinfo("int64").min) & (sorted_cities >= 0)
+
+        # Block boundaries wherever the (day, city) key changes
+        changes = np.flatnonzero((np.diff(sorted_days) != 0) | (np.diff(sorted_cities) != 0)) + 1
+        starts = np.concatenate(([0], changes)) if len(order) else np.empty(0, dtype=int)
+        stops = np.concatenate((changes, [len(order)])) if len(order) else np.empty(0, dtype=int)
+
+        self._slices = {}
+        self._date_slices = {}
+        self._date_cities = {}
+        for start, stop in zip(starts, stops):
+            if not valid[start]:
+                continue
+            day = pd.Timestamp(sorted_days[start]).date()
+            city = city_names[sorted_cities[start]]
+            self._slices[(day, city)] = (start, stop)
+            date_start, _ = self._date_slices.get(day, (start, stop))
+            self._date_slices[day] = (date_start, stop)
+            self._date_cities.setdefault(day, []).append(city)
+
+    def __len__(self):
+        return len(self.df)
+
+    def get(self, target_date, target_city):
+        """
+        Return the trips for one city on one date.
+
+        Args:
+            target_date: Date to select (date, datetime or string)
+            target_city: City to select
+
+        Returns:
+            DataFrame slice, empty if there are no trips
+        """
+        start, stop = self._slices.get((_to_date(target_date), target_city), (0, 0))
+        return self.df.iloc[start:stop]
+
+    def get_date(self, target_date):
+        """Return all trips scheduled on one date."""
+        start, stop = self._date_slices.get(_to_date(target_date), (0, 0))
+        return self.df.iloc[start:stop]
+
+    def dates(self):
+        """Sorted list of dates that have trips."""
+        return sorted(self._date_slices)
+
+    def cities(self, target_date=None):
+        """Sorted list of cities, optionally limited to one date."""
+        if target_date is None:
+            return sorted({city for _, city in self._slices})
+        return list(self._date_cities.get(_to_date(target_date), []))
+
+    def cities_by_date(self):
+        """Mapping of date strings to sorted lists of cities."""
+        return {str(date): list(cities) for date, cities in sorted(self._date_cities.items())}
+
+
+def select_trips(trips, target_date, target_city):
+    """
+    Select trips for one city on one date from a TripStore or a plain DataFrame.
+
+    Args:
+        trips: TripStore or DataFrame with ScheduledDtm and City columns
+        target_date: Date to select
+        target_city: City to select
+
+    Returns:
+        DataFrame of matching trips
+    """
+    if isinstance(trips, TripStore):
+        return trips.get(target_date, target_city)
+    return trips[
+        (trips["City"] == target_city) &
+        (trips["ScheduledDtm"].dt.date == _to_date(target_date))
+    ]
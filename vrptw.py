@@ -0,0 +1,174 @@
+import numpy as np
+
+from profiling_utils import traced
+
+# Service window around each patient's ScheduledDtm, in minutes
+TIME_WINDOW_BEFORE_MINUTES = 30
+TIME_WINDOW_AFTER_MINUTES = 30
+
+# Starting later than the window end costs this many "miles" per minute (soft penalty)...
+LATENESS_PENALTY_PER_MINUTE = 1.0
+
+# ...and starting more than this many minutes after the window end is not allowed (hard limit)
+MAX_LATENESS_MINUTES = 60
+
+
+def time_windows(scheduled, before=TIME_WINDOW_BEFORE_MINUTES, after=TIME_WINDOW_AFTER_MINUTES):
+    """
+    Build service windows around scheduled times.
+
+    Args:
+        scheduled: Series of scheduled datetimes
+        before: Minutes a visit may start before its scheduled time
+        after: Minutes a visit may start after its scheduled time without penalty
+
+    Returns:
+        Tuple of (day_start, window_start, window_end): the midnight of the earliest
+        scheduled day, and window bounds as float arrays of minutes since day_start
+    """
+    day_start = scheduled.min().normalize()
+    minutes = ((scheduled - day_start).dt.total_seconds() / 60).to_numpy(dtype=float)
+    return day_start, minutes - before, minutes + after
+
+
+class _Route:
+    """One phlebotomist's visiting order with its cached lateness penalty and workload."""
+
+    def __init__(self):
+        self.stops = []
+        self.penalty = 0.0
+        self.workload = 0.0
+
+
+def _simulate(stops, vehicle_home_miles, patient_miles, window_start, window_end, service, minutes_per_mile,
+              shift_start, penalty_per_minute, max_lateness):
+    """
+    Walk a route and return (penalty, start_minutes, late_minutes), or None if a stop breaks the hard limit.
+
+    The phlebotomist leaves home at shift_start, or without a shift start in time to reach the
+    first stop at its window start, and waits whenever they arrive at a stop before its window opens.
+    """
+    starts = []
+    lates = []
+    penalty = 0.0
+    finish = None
+    prev = None
+    for stop in stops:
+        if prev is None:
+            arrival = window_start[stop]
+            if shift_start is not None:
+                arrival = shift_start + vehicle_home_miles[stop] * minutes_per_mile
+        else:
+            arrival = finish + patient_miles[prev, stop] * minutes_per_mile
+        start = max(arrival, window_start[stop])
+        late = max(0.0, start - window_end[stop])
+        if late > max_lateness:
+            return None
+        penalty += late * penalty_per_minute
+        starts.append(start)
+        lates.append(late)
+        finish = start + service[stop]
+        prev = stop
+    return penalty, starts, lates
+
+
+def _insertion_miles(route_stops, vehicle_home_miles, patient_miles, patient, position):
+    """Extra miles from inserting patient into route_stops at position (route ends are open)."""
+    before = route_stops[position - 1] if position > 0 else None
+    after = route_stops[position] if position < len(route_stops) else None
+    added = vehicle_home_miles[patient] if before is None else patient_miles[before, patient]
+    if after is not None:
+        added += patient_miles[patient, after]
+        added -= vehicle_home_miles[after] if before is None else patient_miles[before, after]
+    return added
+
+
+@traced()
+def solve_vrptw(home_miles, patient_miles, window_start, window_end, service_minutes, minutes_per_mile,
+                workloads=None, capacity=np.inf, shift_start=None,
+                penalty_per_minute=LATENESS_PENALTY_PER_MINUTE, max_lateness=MAX_LATENESS_MINUTES):
+    """
+    Jointly assign and sequence patients for a fleet of phlebotomists under time windows.
+
+    Patients are taken in order of window start and each is inserted at the cheapest
+    feasible position in any route. The cost of an insertion is the extra miles plus the
+    soft lateness penalty it adds across the route. An insertion is feasible if every stop
+    in the new route starts no later than max_lateness after its window end, and the
+    phlebotomist's workload stays within capacity.
+
+    Without a shift start, each phlebotomist is assumed to leave home in time to start
+    their first visit when its window opens, so the drive to the first stop never makes
+    it late. With a shift start, the drive from home is timed from shift_start.
+
+    A patient that fits no route is inserted at its cheapest position with the hard limit
+    lifted. It is returned in the unserved list so callers can flag it.
+
+    Args:
+        home_miles: (F, P) miles from each phlebotomist's home to each patient
+        patient_miles: (P, P) miles between patients
+        window_start: (P,) earliest service start, in minutes
+        window_end: (P,) latest on-time service start, in minutes
+        service_minutes: (P,) draw time per patient, in minutes
+        minutes_per_mile: Travel time per mile
+        workloads: Optional (P,) workload points per patient
+        capacity: Workload cap per phlebotomist (scalar or (F,) array)
+        shift_start: Earliest time phlebotomists leave home, in minutes (None: no limit)
+        penalty_per_minute: Cost in miles per minute of lateness past the window end
+        max_lateness: Hard limit on lateness past the window end, in minutes
+
+    Returns:
+        Tuple of (routes, start_minutes, late_minutes, unserved): routes holds one list of
+        patient positions per phlebotomist, in visiting order
+    """
+    home_miles = np.asarray(home_miles, dtype=float)
+    patient_miles = np.asarray(patient_miles, dtype=float)
+    num_phlebs, num_patients = home_miles.shape
+    workloads = np.zeros(num_patients) if workloads is None else np.asarray(workloads, dtype=float)
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=float), (num_phlebs,))
+    simulate_args = (window_start, window_end, service_minutes, minutes_per_mile, shift_start, penalty_per_minute)
+
+    routes = [_Route() for _ in range(num_phlebs)]
+    unserved = []
+
+    def best_insertion(patient, lateness_limit, respect_capacity):
+        best = None
+        for phleb_pos, route in enumerate(routes):
+            if not np.isfinite(home_miles[phleb_pos, patient]):
+                continue
+            if respect_capacity and route.workload + workloads[patient] > capacity[phleb_pos]:
+                continue
+            for position in range(len(route.stops) + 1):
+                added_miles = _insertion_miles(route.stops, home_miles[phleb_pos], patient_miles, patient, position)
+                if best is not None and added_miles >= best[0]:
+                    continue
+                stops = route.stops[:position] + [patient] + route.stops[position:]
+                result = _simulate(stops, home_miles[phleb_pos], patient_miles, *simulate_args, lateness_limit)
+                if result is None:
+                    continue
+                cost = added_miles + result[0] - route.penalty
+                if best is None or cost < best[0]:
+                    best = (cost, phleb_pos, stops, result[0])
+        return best
+
+    for patient in np.argsort(window_start, kind="stable"):
+        best = best_insertion(patient, max_lateness, True)
+        if best is None:
+            unserved.append(int(patient))
+            best = best_insertion(patient, np.inf, False)
+        if best is None:
+            continue
+        _, phleb_pos, stops, penalty = best
+        route = routes[phleb_pos]
+        route.stops = stops
+        route.penalty = penalty
+        route.workload += workloads[patient]
+
+    start_minutes = np.full(num_patients, np.nan)
+    late_minutes = np.full(num_patients, np.nan)
+    for phleb_pos, route in enumerate(routes):
+        if route.stops:
+            _, starts, lates = _simulate(route.stops, home_miles[phleb_pos], patient_miles, *simulate_args, np.inf)
+            start_minutes[route.stops] = starts
+            late_minutes[route.stops] = lates
+
+    return [[int(stop) for stop in route.stops] for route in routes], start_minutes, late_minutes, unserved
@@ -1,12 +1,14 @@
 import pandas as pd
 
+from trip_store import select_trips
+
 def phlebs_required_asper_workload(workload_df, city_orders_df, target_date, target_city):
     """
     Calculate the number of phlebotomists needed based on workload points.
     
     Args:
         workload_df: DataFrame with city workload information
-        city_orders_df: DataFrame with all patient orders
+        city_orders_df: DataFrame or TripStore with all patient orders
         target_date: Date to analyze
         target_city: City to analyze
         
@@ -17,10 +19,7 @@ def phlebs_required_asper_workload(workload_df, city_orders_df, target_date, tar
         target_date = pd.to_datetime(target_date).date()
     
     # Filter data for the given city and date
-    filtered_patients = city_orders_df[
-        (city_orders_df["City"] == target_city) & 
-        (city_orders_df["ScheduledDtm"].dt.date == target_date)
-    ]
+    filtered_patients = select_trips(city_orders_df, target_date, target_city)
     
     if filtered_patients.empty:
         print("Filtered Patients empty in PRAPW function...")